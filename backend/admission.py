@@ -0,0 +1,298 @@
+import asyncio
+import fnmatch
+import ipaddress
+import json
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
+from starlette.datastructures import Headers
+
+
+logger = logging.getLogger(__name__)
+
+# Honoured only when the peer is one of the configured trusted proxies
+FORWARDED_FOR_HEADER = "x-forwarded-for"
+
+# Idle in-memory buckets are swept once the table grows past this
+MAX_MEMORY_BUCKETS = 100000
+BUCKET_IDLE_SECONDS = 300
+
+
+class AdmissionRule(BaseModel):
+    """One limit. Every rule whose methods and path pattern match a request applies.
+
+    path is a glob over the request path ("/api/projects/*/expenses").
+    rate/burst form a token bucket per client; concurrency caps requests in
+    flight on this worker, with up to `queue` more waiting `queue_timeout`
+    seconds for a slot.
+    """
+    name: str
+    path: str
+    methods: Optional[List[str]] = None
+    rate: Optional[float] = Field(default=None, gt=0)
+    burst: Optional[int] = Field(default=None, ge=1)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    queue: int = Field(default=0, ge=0)
+    queue_timeout: float = Field(default=5.0, ge=0)
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+        return fnmatch.fnmatchcase(path, self.path)
+
+    def capacity(self) -> float:
+        return float(self.burst or max(math.ceil(self.rate), 1))
+
+
+# Only per-worker concurrency caps by default. Rate limits are per client
+# address, so they are opt-in through ADMISSION_RULES: behind an ingress
+# without TRUSTED_PROXIES every client would share one bucket.
+DEFAULT_ADMISSION_RULES = [
+    AdmissionRule(name="uploads", path="/api/documents/upload", methods=["POST"], concurrency=4, queue=16, queue_timeout=10),
+    AdmissionRule(name="imports", path="/api/imports/*", methods=["POST"], concurrency=2, queue=4, queue_timeout=10),
+    AdmissionRule(name="exports", path="/api/exports/*", concurrency=2, queue=8, queue_timeout=10),
+    AdmissionRule(name="analytics", path="/api/analytics/*", concurrency=2, queue=8, queue_timeout=5),
+]
+
+
+def load_rules(raw: Optional[str]) -> List[AdmissionRule]:
+    """Rules from a JSON list (ADMISSION_RULES), falling back to the defaults"""
+    if not raw:
+        return list(DEFAULT_ADMISSION_RULES)
+    return [AdmissionRule(**rule) for rule in json.loads(raw)]
+
+
+class MemoryBucketStore:
+    """Token buckets held in this process"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    async def take(self, rule: AdmissionRule, client: str, now: Optional[float] = None) -> float:
+        """Take one token; returns 0 when allowed, else seconds until a token frees up"""
+        now = time.monotonic() if now is None else now
+        capacity = rule.capacity()
+        key = (rule.name, client)
+        tokens, last = self.buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - last) * rule.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            if len(self.buckets) > MAX_MEMORY_BUCKETS:
+                self._sweep(now)
+            return 0.0
+        self.buckets[key] = (tokens, now)
+        return (1 - tokens) / rule.rate
+
+    async def refund(self, rule: AdmissionRule, client: str):
+        """Give back a token taken for a request another rule then rejected"""
+        key = (rule.name, client)
+        if key in self.buckets:
+            tokens, last = self.buckets[key]
+            self.buckets[key] = (min(rule.capacity(), tokens + 1), last)
+
+    def reset(self):
+        self.buckets.clear()
+
+    def _sweep(self, now: float):
+        # A bucket idle long enough to refill completely is the same as no bucket
+        self.buckets = {
+            key: (tokens, last) for key, (tokens, last) in self.buckets.items()
+            if now - last < BUCKET_IDLE_SECONDS
+        }
+
+
+class MongoBucketStore:
+    """Token buckets shared by every worker, updated atomically in Mongo"""
+
+    def __init__(self, collection: Callable[[], Any]):
+        self.collection = collection
+
+    async def take(self, rule: AdmissionRule, client: str, now: Optional[float] = None) -> float:
+        capacity = rule.capacity()
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$last", "$$NOW"]}]}, 1000]}
+        refilled = {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rule.rate]}]}]}
+        doc = await self.collection().find_one_and_update(
+            {"_id": f"{rule.name}:{client}"},
+            [
+                {"$set": {"tokens": refilled, "last": "$$NOW"}},
+                {"$set": {
+                    "allowed": {"$gte": ["$tokens", 1]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    # Expired by the TTL index once the bucket would be full again anyway
+                    "expires_at": {"$add": ["$$NOW", int(capacity / rule.rate * 1000) + 1000]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return 0.0
+        return (1 - doc["tokens"]) / rule.rate
+
+    async def refund(self, rule: AdmissionRule, client: str):
+        await self.collection().update_one(
+            {"_id": f"{rule.name}:{client}"},
+            [{"$set": {"tokens": {"$min": [rule.capacity(), {"$add": ["$tokens", 1]}]}}}],
+        )
+
+    def reset(self):
+        # Shared buckets are left to refill under the new rules rather than wiped
+        # once per worker as each one applies the change
+        pass
+
+
+async def ensure_bucket_ttl_index(collection):
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+class ConcurrencyGate:
+    """At most `limit` holders, `queue` waiters, and a bounded wait"""
+
+    def __init__(self, limit: int, queue: int, timeout: float):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.queue = queue
+        self.timeout = timeout
+        self.waiting = 0
+
+    async def acquire(self) -> bool:
+        if not self.semaphore.locked():
+            await self.semaphore.acquire()
+            return True
+        if self.waiting >= self.queue:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self.semaphore.release()
+
+
+class AdmissionController:
+    """Current rules, rate limit buckets and concurrency gates"""
+
+    def __init__(self, rules: List[AdmissionRule], store=None):
+        self.store = store or MemoryBucketStore()
+        self.rules: List[AdmissionRule] = []
+        self.gates: Dict[str, ConcurrencyGate] = {}
+        self.configure([rule.model_dump() for rule in rules])
+
+    def configure(self, rules: List[Dict[str, Any]]):
+        """Swap in a new rule set; requests in flight keep the gate they hold"""
+        self.rules = [AdmissionRule(**rule) for rule in rules]
+        self.store.reset()
+        self.gates = {
+            rule.name: ConcurrencyGate(rule.concurrency, rule.queue, rule.queue_timeout)
+            for rule in self.rules if rule.concurrency
+        }
+
+    def matching(self, method: str, path: str) -> List[AdmissionRule]:
+        return [rule for rule in self.rules if rule.matches(method, path)]
+
+
+def parse_proxies(raw: Optional[str]) -> List[ipaddress._BaseNetwork]:
+    """Networks from a comma-separated list of addresses or CIDRs (TRUSTED_PROXIES)"""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in (raw or "").split(",") if part.strip()]
+
+
+def _trusted(address: str, proxies: List[ipaddress._BaseNetwork]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_identity(scope, trusted_proxies: List[ipaddress._BaseNetwork] = ()) -> str:
+    """The peer address; behind trusted proxies, the last X-Forwarded-For hop they didn't add.
+
+    Nothing the client sends is taken on its own word: forwarded addresses
+    count only when the peer is a proxy we run, and each trusted hop can
+    only vouch for the one before it.
+    """
+    client = scope.get("client")
+    address = client[0] if client else None
+    if address and trusted_proxies and _trusted(address, trusted_proxies):
+        forwarded = Headers(scope=scope).get(FORWARDED_FOR_HEADER) or ""
+        for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+            address = hop
+            if not _trusted(hop, trusted_proxies):
+                break
+    return f"ip:{address}" if address else "ip:unknown"
+
+
+class AdmissionMiddleware:
+    """Reject or queue requests that exceed their rate limit or concurrency cap with 429"""
+
+    def __init__(self, app, controller: AdmissionController, trusted_proxies: List[ipaddress._BaseNetwork] = ()):
+        self.app = app
+        self.controller = controller
+        self.trusted_proxies = list(trusted_proxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rules = self.controller.matching(scope["method"], scope["path"])
+        if not rules:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_identity(scope, self.trusted_proxies)
+        taken: List[AdmissionRule] = []
+        for rule in rules:
+            if not rule.rate:
+                continue
+            try:
+                wait = await self.controller.store.take(rule, client)
+            except Exception:
+                # Fail open: a broken shared backend must not take the API down
+                logger.exception("Rate limit backend failed for rule %s", rule.name)
+                continue
+            if wait > 0:
+                # A rejected request costs nothing under the rules it passed
+                await self._refund(taken, client)
+                await self._reject(send, f"Rate limit exceeded for {rule.name}", wait)
+                return
+            taken.append(rule)
+
+        held: List[ConcurrencyGate] = []
+        try:
+            for rule in rules:
+                gate = self.controller.gates.get(rule.name)
+                if gate is None:
+                    continue
+                if not await gate.acquire():
+                    await self._reject(send, f"Too many concurrent {rule.name} requests", max(rule.queue_timeout, 1))
+                    return
+                held.append(gate)
+            await self.app(scope, receive, send)
+        finally:
+            for gate in held:
+                gate.release()
+
+    async def _refund(self, rules: List[AdmissionRule], client: str):
+        for rule in rules:
+            try:
+                await self.controller.store.refund(rule, client)
+            except Exception:
+                logger.exception("Rate limit backend failed to refund rule %s", rule.name)
+
+    @staticmethod
+    async def _reject(send, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(max(math.ceil(retry_after), 1)).encode("latin-1")),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,369 @@
+import numpy as np
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Any
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Fields pulled from Mongo for portfolio analytics - keep these projections tight
+PROJECT_ANALYTICS_FIELDS = {"_id": 0, "id": 1, "name": 1, "budget": 1, "currency": 1, "start_date": 1, "end_date": 1, "stage": 1}
+
+# Columns of portfolio_expense_pipeline rows; all but project_id arrive packed as arrays
+PORTFOLIO_PACKED_FIELDS = ["expense_type", "currency", "date", "amount", "count"]
+
+ANALYTICS_BATCH_SIZE = 50000
+# Packed documents hold one project-month of rows each
+PORTFOLIO_BATCH_SIZE = 1000
+
+# pandas is imported inside the functions that use it; it is the single most
+# expensive import in the backend and only the analytics endpoints need it
+
+
+class ColumnBuffer:
+    """Accumulates Mongo documents into per-field column lists"""
+
+    def __init__(self, fields: List[str]):
+        self.fields = fields
+        self.columns: Dict[str, list] = {field: [] for field in fields}
+
+    def extend(self, docs: List[dict]):
+        for field in self.fields:
+            self.columns[field].extend(doc.get(field) for doc in docs)
+
+    def extend_packed(self, docs: List[dict]):
+        """Documents holding many rows as parallel arrays; fields missing from them are taken from their _id"""
+        for doc in docs:
+            size = len(doc["amount"])
+            for field in self.fields:
+                values = doc.get(field)
+                if isinstance(values, list):
+                    self.columns[field].extend(values)
+                else:
+                    self.columns[field].extend([doc["_id"].get(field)] * size)
+
+
+async def _read_columns(cursor, buffer: ColumnBuffer, batch_size: int, packed: bool = False) -> Dict[str, list]:
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        if packed:
+            buffer.extend_packed(batch)
+        else:
+            buffer.extend(batch)
+    return buffer.columns
+
+
+async def load_columns(collection, query: dict, projection: dict, batch_size: int = ANALYTICS_BATCH_SIZE) -> Dict[str, list]:
+    """Read a projected cursor in batches into columnar lists"""
+    fields = [k for k, v in projection.items() if v and k != "_id"]
+    cursor = collection.find(query, projection).batch_size(batch_size)
+    return await _read_columns(cursor, ColumnBuffer(fields), batch_size)
+
+
+def portfolio_expense_pipeline() -> List[dict]:
+    """Expense totals and counts per (project, type, currency, day), packed into one document per project-month.
+
+    Mongo does the summing, so the rows are as many as there are distinct
+    days a project spent on, not expenses; packing them as arrays keeps
+    the documents decoded here to one per project-month.
+    """
+    day = {"$substrCP": [{"$ifNull": ["$date", ""]}, 0, 10]}
+    return [
+        {"$group": {
+            "_id": {"project_id": "$project_id", "expense_type": "$expense_type", "currency": "$currency", "day": day},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"project_id": "$_id.project_id", "month": {"$substrCP": ["$_id.day", 0, 7]}},
+            "expense_type": {"$push": {"$ifNull": ["$_id.expense_type", None]}},
+            "currency": {"$push": {"$ifNull": ["$_id.currency", None]}},
+            "date": {"$push": "$_id.day"},
+            "amount": {"$push": "$amount"},
+            "count": {"$push": "$count"},
+        }},
+    ]
+
+
+async def load_portfolio_expenses(collection, batch_size: int = PORTFOLIO_BATCH_SIZE) -> Dict[str, list]:
+    """Columns of portfolio_expense_pipeline rows, for build_expense_arrays"""
+    cursor = collection.aggregate(portfolio_expense_pipeline(), allowDiskUse=True, batchSize=batch_size)
+    return await _read_columns(cursor, ColumnBuffer(["project_id"] + PORTFOLIO_PACKED_FIELDS), batch_size, packed=True)
+
+
+def parse_days(values: list) -> np.ndarray:
+    """Parse ISO date strings into datetime64[D] using the stored calendar date.
+
+    Datetimes are stored in UTC (prepare_for_mongo writes them so and
+    backfill_utc rewrites older ones), so the first ten characters are the
+    UTC day. Anything that does not fit the fast path (missing values,
+    datetime objects) goes through pandas.
+    """
+    if not values:
+        return np.array([], dtype="datetime64[D]")
+    try:
+        return np.array(values, dtype="S10").astype("datetime64[D]")
+    except (TypeError, ValueError, UnicodeEncodeError):
+        import pandas as pd
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format="ISO8601", errors="coerce")
+        return parsed.dt.tz_localize(None).to_numpy().astype("datetime64[D]")
+
+
+def _to_utc(values) -> "pd.Series":
+    import pandas as pd
+    return pd.to_datetime(pd.Series(values, dtype=object), utc=True, format="ISO8601", errors="coerce")
+
+
+class ExpenseArrays:
+    """Expense columns encoded as numpy arrays for vectorized aggregation.
+
+    A row is one expense or, with count, the sum of that many.
+    """
+
+    def __init__(self, project_codes, project_keys, type_codes, type_keys, amount, day, currency_codes=None, currency_keys=(),
+                 count=None):
+        self.project_codes = project_codes
+        self.project_keys = project_keys
+        self.type_codes = type_codes
+        self.type_keys = type_keys
+        self.amount = amount
+        self.day = day
+        # Codes into currency_keys; -1 where the amount is in its project's currency
+        self.currency_codes = np.full(len(amount), -1, dtype=np.int64) if currency_codes is None else currency_codes
+        self.currency_keys = list(currency_keys)
+        self.count = np.ones(len(amount), dtype=np.int64) if count is None else count
+
+    def __len__(self):
+        return len(self.amount)
+
+    def project_index(self, project_ids) -> np.ndarray:
+        """Map each expense onto a position in project_ids (-1 when unknown)"""
+        import pandas as pd
+        lookup = pd.Index(project_ids).get_indexer(self.project_keys)
+        if len(self.project_codes) == 0:
+            return np.array([], dtype=np.int64)
+        return np.where(self.project_codes >= 0, lookup[self.project_codes], -1)
+
+
+def build_expense_arrays(columns: Dict[str, list]) -> ExpenseArrays:
+    """Encode expense columns as integer codes, float amounts and days"""
+    import pandas as pd
+    project_codes, project_keys = pd.factorize(np.asarray(columns.get("project_id", []), dtype=object))
+    type_values = columns.get("expense_type", [])
+    type_codes, type_keys = pd.factorize(np.asarray(type_values, dtype=object))
+    type_keys = [str(k) for k in type_keys]
+    missing_type = type_codes < 0
+    if missing_type.any():
+        # Untyped rows are reported as "other", matching ExpenseType.OTHER
+        if "other" not in type_keys:
+            type_keys.append("other")
+        type_codes[missing_type] = type_keys.index("other")
+    try:
+        amount = np.asarray(columns.get("amount", []), dtype=np.float64)
+    except (TypeError, ValueError):
+        amount = pd.to_numeric(np.asarray(columns.get("amount", []), dtype=object), errors="coerce")
+    amount = np.nan_to_num(np.asarray(amount, dtype=np.float64))
+    currency_codes, currency_keys = None, ()
+    if columns.get("currency"):
+        currency_codes, currency_keys = pd.factorize(np.asarray(columns["currency"], dtype=object))
+    return ExpenseArrays(
+        project_codes=project_codes,
+        project_keys=np.asarray(project_keys, dtype=object),
+        type_codes=type_codes,
+        type_keys=type_keys,
+        amount=amount,
+        day=parse_days(columns.get("date", [])),
+        currency_codes=currency_codes,
+        currency_keys=currency_keys,
+        count=np.asarray(columns["count"], dtype=np.int64) if "count" in columns else None,
+    )
+
+
+class ExpenseArrayCache:
+    """Built portfolio expense arrays, reused while the version they were loaded at is current.
+
+    The version is taken before loading, so a write that lands during the
+    load leaves the arrays under a version nobody asks for again.
+    """
+
+    def __init__(self):
+        self.version: Any = None
+        self.arrays: Optional[ExpenseArrays] = None
+
+    def get(self, version) -> Optional[ExpenseArrays]:
+        return self.arrays if self.arrays is not None and self.version == version else None
+
+    def put(self, version, arrays: ExpenseArrays):
+        self.version, self.arrays = version, arrays
+
+
+def build_project_frame(columns: Dict[str, list], default_currency: Optional[str] = None) -> "pd.DataFrame":
+    """Build a typed project frame indexed by project id; projects without a currency get default_currency"""
+    import pandas as pd
+    ids = columns.get("id", [])
+    frame = pd.DataFrame({
+        "id": pd.Series(ids, dtype=object),
+        "name": pd.Series(columns.get("name", []), dtype=object),
+        "stage": pd.Series(columns.get("stage", []), dtype=object),
+        "budget": pd.to_numeric(pd.Series(columns.get("budget", []), dtype=object), errors="coerce"),
+        "currency": pd.Series(columns.get("currency") or [None] * len(ids), dtype=object),
+        "start_date": _to_utc(columns.get("start_date", [])),
+        "end_date": _to_utc(columns.get("end_date", [])),
+    })
+    frame["budget"] = frame["budget"].fillna(0.0).astype(np.float64)
+    frame["currency"] = frame["currency"].where(frame["currency"].notna(), default_currency)
+    return frame.set_index("id")
+
+
+def _iso_or_none(value) -> Optional[str]:
+    import pandas as pd
+    return None if pd.isna(value) else value.isoformat()
+
+
+def _grouped_sum(codes: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    if size == 0:
+        return np.zeros(0)
+    return np.bincount(codes, weights=weights, minlength=size)[:size]
+
+
+def compute_portfolio(projects: "pd.DataFrame", expenses: ExpenseArrays, now: Optional[datetime] = None,
+                      fx=None) -> Dict[str, Any]:
+    """Compute per-project burn rate, budget variance, spend by type and monthly series.
+
+    With an fx rate table, each expense is converted at its date's rate:
+    into its project's currency for the per-project figures, and into the
+    table's base currency for the portfolio totals. Budgets are converted
+    to the base at the latest rate. Without one, amounts are summed as
+    stored.
+    """
+    import pandas as pd
+    now = pd.Timestamp(now or datetime.now(timezone.utc))
+    if now.tzinfo is None:
+        now = now.tz_localize("UTC")
+
+    project_ids = projects.index
+    n_projects = len(project_ids)
+    n_types = len(expenses.type_keys)
+    project_pos = expenses.project_index(project_ids)
+    known = project_pos >= 0
+
+    budget = projects["budget"].to_numpy()
+    project_currency = projects["currency"].to_numpy(dtype=object)
+    amount = base_amount = expenses.amount
+    budget_base = budget
+    unconverted = np.zeros(len(expenses), dtype=bool)
+    if fx is not None:
+        # Project and base currencies join the expense currency codes, so every row converts by integer lookups
+        vocabulary = {key: code for code, key in enumerate(expenses.currency_keys)}
+        project_targets = np.array([vocabulary.setdefault(c, len(vocabulary)) for c in project_currency], dtype=np.int64)
+        base_code = vocabulary.setdefault(fx.base, len(vocabulary))
+        keys = list(vocabulary)
+        # One conversion pass over all rows; expenses without a currency are in their project's
+        target = np.full(len(expenses), base_code, dtype=np.int64)
+        target[known] = project_targets[project_pos[known]]
+        source = np.where(expenses.currency_codes >= 0, expenses.currency_codes, target)
+        amount, unconverted = fx.convert_codes(expenses.amount, source, target, keys, expenses.day)
+        base_amount, base_unconverted = fx.convert_codes(
+            expenses.amount, source, np.full(len(expenses), base_code, dtype=np.int64), keys, expenses.day
+        )
+        unconverted |= base_unconverted
+        amount = np.where(unconverted, 0.0, amount)
+        base_amount = np.where(unconverted, 0.0, base_amount)
+        budget_base, _ = fx.convert(budget, project_currency, np.full(n_projects, np.datetime64("NaT"), dtype="datetime64[D]"), fx.base)
+    counted = known & unconverted
+    unconverted_count = np.bincount(project_pos[counted], weights=expenses.count[counted], minlength=n_projects)[:n_projects]
+
+    spent = _grouped_sum(project_pos[known], amount[known], n_projects)
+    variance = budget - spent
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage_used = np.where(budget > 0, spent / budget * 100, 0.0)
+
+    # Burn rate is spend per elapsed day, capped to the project window
+    start = projects["start_date"]
+    end = projects["end_date"]
+    elapsed_end = end.where(end < now, now)
+    elapsed_days = ((elapsed_end - start).dt.total_seconds() / 86400).to_numpy()
+    elapsed_days = np.where(np.isnan(elapsed_days), 0.0, np.maximum(elapsed_days, 0.0))
+    duration_days = ((end - start).dt.total_seconds() / 86400).to_numpy()
+    duration_days = np.where(np.isnan(duration_days), 0.0, np.maximum(duration_days, 0.0))
+    burn_rate = np.where(elapsed_days >= 1, spent / np.maximum(elapsed_days, 1), spent)
+    projected_total = np.where(duration_days > 0, burn_rate * duration_days, spent)
+
+    # Spend by type as a projects x types matrix
+    by_type = _grouped_sum(
+        project_pos[known] * n_types + expenses.type_codes[known],
+        amount[known],
+        n_projects * n_types
+    ).reshape(n_projects, n_types) if n_types else np.zeros((n_projects, 0))
+
+    # Monthly series as a projects x months matrix
+    dated = known & ~np.isnat(expenses.day)
+    months = expenses.day[dated].astype("datetime64[M]")
+    month_keys: List[str] = []
+    by_month = np.zeros((n_projects, 0))
+    portfolio_monthly = np.zeros(0)
+    if len(months):
+        first_month = months.min()
+        month_offsets = (months - first_month).astype(np.int64)
+        n_months = int(month_offsets.max()) + 1
+        month_keys = [str(first_month + i) for i in range(n_months)]
+        by_month = _grouped_sum(
+            project_pos[dated] * n_months + month_offsets,
+            amount[dated],
+            n_projects * n_months
+        ).reshape(n_projects, n_months)
+        portfolio_monthly = _grouped_sum(month_offsets, base_amount[dated], n_months)
+    month_counts = np.zeros((n_projects, len(month_keys)), dtype=bool)
+    if len(months):
+        month_counts[project_pos[dated], month_offsets] = True
+
+    names = projects["name"].to_numpy()
+    stages = projects["stage"].to_numpy()
+    project_rows = []
+    for i, project_id in enumerate(project_ids):
+        project_rows.append({
+            "project_id": project_id,
+            "name": names[i],
+            "stage": stages[i],
+            "currency": project_currency[i],
+            "budget": float(budget[i]),
+            "total_expenses": float(spent[i]),
+            "budget_variance": float(variance[i]),
+            "percentage_used": float(percentage_used[i]),
+            "burn_rate_per_day": float(burn_rate[i]),
+            "projected_total": float(projected_total[i]),
+            "projected_variance": float(budget[i] - projected_total[i]),
+            "start_date": _iso_or_none(start.iat[i]),
+            "end_date": _iso_or_none(end.iat[i]),
+            "spend_by_type": {
+                expenses.type_keys[t]: float(by_type[i, t]) for t in np.flatnonzero(by_type[i])
+            },
+            "monthly_spend": [
+                {"month": month_keys[m], "amount": float(by_month[i, m])} for m in np.flatnonzero(month_counts[i])
+            ],
+            "unconverted_expenses": int(unconverted_count[i]),
+        })
+
+    total_spent = float(base_amount.sum())
+    total_budget = float(budget_base.sum())
+    portfolio_by_type = _grouped_sum(expenses.type_codes, base_amount, n_types)
+
+    return {
+        "generated_at": now.isoformat(),
+        "totals": {
+            "projects": int(n_projects),
+            "expenses": int(expenses.count.sum()),
+            "currency": fx.base if fx is not None else None,
+            "budget": total_budget,
+            "total_expenses": total_spent,
+            "budget_variance": total_budget - total_spent,
+            "unconverted_expenses": int(expenses.count[unconverted].sum()),
+            "spend_by_type": {key: float(portfolio_by_type[t]) for t, key in enumerate(expenses.type_keys)},
+            "monthly_spend": [
+                {"month": key, "amount": float(portfolio_monthly[m])} for m, key in enumerate(month_keys)
+            ],
+        },
+        "projects": project_rows,
+    }
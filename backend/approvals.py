@@ -0,0 +1,180 @@
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from revisions import REV_FIELD
+
+
+PENDING = "pending_approval"
+APPROVED = "approved"
+REJECTED = "rejected"
+DRAFT = "draft"
+
+APPROVAL_DECISIONS = ("approve", "reject")
+
+# Documents that may be (re)submitted for approval
+SUBMITTABLE_STATUSES = (DRAFT, REJECTED)
+
+# Largest batch one bulk decision accepts
+MAX_BATCH_SIZE = 1000
+
+# Each approver's queue: only pending documents are indexed, oldest submission first
+QUEUE_INDEX = [("current_approver", 1), ("submitted_at", 1), ("id", 1)]
+QUEUE_INDEX_FILTER = {"status": PENDING}
+
+
+def history_entry(action: str, by: str, step: int, at: str, comment: Optional[str] = None) -> Dict[str, Any]:
+    return {"action": action, "by": by, "step": step, "at": at, "comment": comment}
+
+
+def submit_update(approvers: List[str], submitted_by: str, at: str) -> Dict[str, Any]:
+    """Start (or restart, after a rejection) the approval chain at its first approver"""
+    return {
+        "$set": {
+            "status": PENDING,
+            "approvers": approvers,
+            "approval_step": 0,
+            "current_approver": approvers[0],
+            "submitted_by": submitted_by,
+            "submitted_at": at,
+            "approved_by": None,
+            "approved_at": None,
+        },
+        "$push": {"approval_history": history_entry("submitted", submitted_by, 0, at)},
+        "$inc": {REV_FIELD: 1},
+    }
+
+
+def direct_approve_update(approver: str, at: str, comment: Optional[str] = None) -> Dict[str, Any]:
+    """Approve a document that was never sent through an approval chain"""
+    return {
+        "$set": {"status": APPROVED, "current_approver": None, "approved_by": approver, "approved_at": at},
+        "$push": {"approval_history": history_entry("approved", approver, 0, at, comment)},
+        "$inc": {REV_FIELD: 1},
+    }
+
+
+def approve_update(approver: str, at: str, comment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Pipeline update passing a document to its next approver, or approving it after the last one.
+
+    Written as a pipeline so one update serves documents at different
+    steps of different-length chains, which lets a batch go out as a
+    single bulk_write. User-supplied values are $literal so a leading "$"
+    is never read as a field path.
+    """
+    next_step = {"$add": ["$approval_step", 1]}
+    last = {"$gte": [next_step, {"$size": "$approvers"}]}
+    return [{"$set": {
+        "approval_history": {"$concatArrays": [
+            {"$ifNull": ["$approval_history", []]},
+            [{"action": "approved", "by": {"$literal": approver}, "step": "$approval_step", "at": at, "comment": {"$literal": comment}}],
+        ]},
+        "status": {"$cond": [last, APPROVED, PENDING]},
+        "current_approver": {"$cond": [last, None, {"$arrayElemAt": ["$approvers", next_step]}]},
+        "approved_by": {"$cond": [last, {"$literal": approver}, None]},
+        "approved_at": {"$cond": [last, at, None]},
+        "approval_step": next_step,
+        REV_FIELD: {"$add": [{"$ifNull": [f"${REV_FIELD}", 1]}, 1]},
+    }}]
+
+
+def reject_update(approver: str, at: str, comment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Pipeline update rejecting a document at whatever step it is; resubmitting starts over"""
+    return [{"$set": {
+        "approval_history": {"$concatArrays": [
+            {"$ifNull": ["$approval_history", []]},
+            [{"action": "rejected", "by": {"$literal": approver}, "step": "$approval_step", "at": at, "comment": {"$literal": comment}}],
+        ]},
+        "status": REJECTED,
+        "current_approver": None,
+        REV_FIELD: {"$add": [{"$ifNull": [f"${REV_FIELD}", 1]}, 1]},
+    }}]
+
+
+def unsubmitted() -> Dict[str, Any]:
+    """Documents with no approval chain, which a single approval approves outright"""
+    return {"status": {"$in": list(SUBMITTABLE_STATUSES)}, "approvers": {"$in": [None, []]}}
+
+
+def awaiting(approver: str) -> Dict[str, Any]:
+    """Documents waiting on this approver; matches the queue index's partial filter"""
+    return {"status": PENDING, "current_approver": approver}
+
+
+class ApprovalWorkflow:
+    """Multi-step approval of documents.
+
+    A submitted document carries its ordered approvers, the step it is at
+    and the approver it waits on (current_approver), which a partial index
+    turns into a per-approver queue. Every decision is guarded by that
+    field, so an approver can only act on documents currently waiting on
+    them, and appends to the document's approval_history in the same
+    write. Documents never submitted keep the original one-step approval
+    through approve_directly().
+    """
+
+    def __init__(self, db: Callable[[], Any]):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db().documents.create_index(QUEUE_INDEX, partialFilterExpression=QUEUE_INDEX_FILTER)
+
+    async def submit(self, document_id: str, approvers: List[str], submitted_by: str) -> Optional[dict]:
+        """The submitted document's id and project_id; None when it is missing or not in a submittable status"""
+        if not approvers:
+            raise ValueError("At least one approver is required")
+        at = datetime.now(timezone.utc).isoformat()
+        return await self.db().documents.find_one_and_update(
+            {"id": document_id, "status": {"$in": list(SUBMITTABLE_STATUSES)}},
+            submit_update(list(approvers), submitted_by, at),
+            {"_id": 0, "id": 1, "project_id": 1}
+        )
+
+    async def approve_directly(self, document_id: str, approver: str, comment: Optional[str] = None) -> Optional[dict]:
+        """The approved document's id and project_id; None when it is missing or has an approval chain"""
+        at = datetime.now(timezone.utc).isoformat()
+        return await self.db().documents.find_one_and_update(
+            {"id": document_id, **unsubmitted()},
+            direct_approve_update(approver, at, comment),
+            {"_id": 0, "id": 1, "project_id": 1}
+        )
+
+    async def decide(self, document_ids: List[str], approver: str, decision: str,
+                     comment: Optional[str] = None) -> Dict[str, List[str]]:
+        """Approve or reject a batch of documents in one bulk_write.
+
+        Returns the ids that were decided and those skipped because they
+        were not waiting on this approver, and the project of each decided one.
+        """
+        if decision not in APPROVAL_DECISIONS:
+            raise ValueError(f"Invalid decision. Must be one of: {list(APPROVAL_DECISIONS)}")
+        document_ids = list(dict.fromkeys(document_ids))
+        if not document_ids or len(document_ids) > MAX_BATCH_SIZE:
+            raise ValueError(f"Between 1 and {MAX_BATCH_SIZE} documents must be given")
+
+        collection = self.db().documents
+        queue = awaiting(approver)
+        eligible = {
+            row["id"]: row.get("project_id") for row in
+            await collection.find({**queue, "id": {"$in": document_ids}}, {"id": 1, "project_id": 1}).to_list(None)
+        }
+        at = datetime.now(timezone.utc).isoformat()
+        update = approve_update(approver, at, comment) if decision == "approve" else reject_update(approver, at, comment)
+        decided = [document_id for document_id in document_ids if document_id in eligible]
+        if decided:
+            # The guard is repeated in each filter, so a concurrent decision can't be applied twice
+            result = await collection.bulk_write(
+                [UpdateOne({**queue, "id": document_id}, update) for document_id in decided], ordered=False
+            )
+            if result.modified_count != len(decided):
+                # Someone got to some of them first; ours are the ones carrying this decision
+                ours = {
+                    row["id"] for row in await collection.find(
+                        {"id": {"$in": decided}, "approval_history": {"$elemMatch": {"by": approver, "at": at}}}, {"id": 1}
+                    ).to_list(None)
+                }
+                decided = [document_id for document_id in decided if document_id in ours]
+        decided_ids = set(decided)
+        skipped = [document_id for document_id in document_ids if document_id not in decided_ids]
+        return {"decided": decided, "skipped": skipped, "project_ids": {document_id: eligible[document_id] for document_id in decided}}
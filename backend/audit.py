@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from starlette.datastructures import Headers
+
+
+logger = logging.getLogger(__name__)
+
+# A batch is written once this many events are buffered, or this long after its first event
+AUDIT_FLUSH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 1.0
+
+# Events buffered at most; past that, handlers wait for the writer rather than grow the buffer
+AUDIT_BUFFER_SIZE = 10000
+
+# How long a handler waits for room in a full buffer before the event is dropped
+AUDIT_ENQUEUE_TIMEOUT_SECONDS = 0.5
+
+# Pause before retrying a batch the database refused
+AUDIT_RETRY_SECONDS = 1.0
+
+# One collection per month, so old months can be dropped whole
+AUDIT_COLLECTION_PREFIX = "audit_log_"
+AUDIT_PARTITION_FORMAT = "%Y_%m"
+
+AUDIT_INDEXES = [
+    [("entity", 1), ("entity_id", 1), ("at", -1)],
+    [("project_id", 1), ("at", -1)],
+]
+
+DUPLICATE_KEY = 11000
+
+# Failures worth retrying: the database was unreachable or asked for a retry. Anything
+# else (an unencodable event, a validation error) fails the same way every time
+TRANSIENT_ERRORS = (ConnectionFailure, ConnectionError, TimeoutError)
+RETRYABLE_LABELS = ("RetryableWriteError", "TransientTransactionError")
+
+# Who the current request acts for, from its X-User-Id header
+current_actor: ContextVar[Optional[str]] = ContextVar("audit_actor", default=None)
+
+
+def partition_name(at: datetime) -> str:
+    return AUDIT_COLLECTION_PREFIX + at.strftime(AUDIT_PARTITION_FORMAT)
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, PyMongoError) and any(error.has_error_label(label) for label in RETRYABLE_LABELS)
+
+
+class ActorMiddleware:
+    """Make the request's X-User-Id available to audit events recorded while handling it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_actor.set(Headers(scope=scope).get("x-user-id"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_actor.reset(token)
+
+
+class AuditLog:
+    """Append-only record of who changed what, written off the request path.
+
+    Handlers call record(), which only appends to an in-memory buffer; a
+    single writer task drains it with one insert_many per batch into the
+    month's collection. The buffer is bounded: when the database falls
+    behind and it fills, record() waits for room for a short while and
+    then drops the event (counted in `dropped`) instead of stalling the
+    request indefinitely. A batch the database can't take for good is
+    logged and dropped too, rather than retried forever.
+
+    The batch being written is kept in `batch` until it is written, so
+    flush() on shutdown still writes it after the writer is cancelled.
+    """
+
+    def __init__(self, db: Callable[[], Any], flush_size: int = AUDIT_FLUSH_SIZE,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS, buffer_size: int = AUDIT_BUFFER_SIZE):
+        self.db = db
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(buffer_size)
+        self.full = asyncio.Event()
+        self.partitions = set()
+        self.batch: List[dict] = []
+        self.written = 0
+        self.dropped = 0
+
+    async def record(self, action: str, entity: str, entity_id: Optional[str], project_id: Optional[str] = None,
+                     changes: Optional[Dict[str, Any]] = None, actor: Optional[str] = None):
+        event = {
+            "at": datetime.now(timezone.utc),
+            "actor": actor or current_actor.get(),
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "project_id": project_id,
+            # A copy, without the _id insert_one adds to the caller's dict
+            "changes": {k: v for k, v in changes.items() if k != "_id"} if changes else None,
+        }
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(event), AUDIT_ENQUEUE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning("Audit buffer full, dropped %s %s %s", action, entity, entity_id)
+                return
+        if self.queue.qsize() >= self.flush_size:
+            self.full.set()
+
+    def _drain(self, batch: List[dict]) -> List[dict]:
+        while len(batch) < self.flush_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def run(self):
+        """Writer loop: a batch goes out when it reaches flush_size or flush_seconds after its first event"""
+        while True:
+            self.batch = [await self.queue.get()]
+            try:
+                await asyncio.wait_for(self.full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            self._drain(self.batch)
+            while True:
+                try:
+                    await self.write(self.batch)
+                    break
+                except Exception as e:
+                    if not is_transient(e):
+                        self.dropped += len(self.batch)
+                        logger.exception("Dropped %d audit events the database refused", len(self.batch))
+                        break
+                    # Keep the batch; the bounded buffer pushes back on handlers meanwhile
+                    logger.exception("Failed to write %d audit events, retrying", len(self.batch))
+                    await asyncio.sleep(AUDIT_RETRY_SECONDS)
+            self.batch = []
+
+    async def flush(self):
+        """Write everything buffered now, including a batch the cancelled writer held, e.g. on shutdown"""
+        if self.batch:
+            # Events of it that made it before the cancel already have their _id
+            await self.write(self.batch)
+            self.batch = []
+        while not self.queue.empty():
+            await self.write(self._drain([]))
+
+    async def write(self, batch: List[dict]):
+        by_partition: Dict[str, List[dict]] = {}
+        for event in batch:
+            by_partition.setdefault(partition_name(event["at"]), []).append(event)
+        db = self.db()
+        for name, events in by_partition.items():
+            if name not in self.partitions:
+                for keys in AUDIT_INDEXES:
+                    await db[name].create_index(keys)
+                self.partitions.add(name)
+            try:
+                await db[name].insert_many(events, ordered=False)
+            except BulkWriteError as e:
+                # A retried batch: the events that made it the first time already have their _id
+                if any(error.get("code") != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                    raise
+        self.written += len(batch)
+
+    async def query(self, filter: Dict[str, Any], limit: int, before: Optional[datetime] = None) -> List[dict]:
+        """Newest events matching filter, walking the monthly collections from the latest back"""
+        db = self.db()
+        names = sorted(
+            await db.list_collection_names(filter={"name": {"$regex": f"^{AUDIT_COLLECTION_PREFIX}"}}),
+            reverse=True
+        )
+        if before is not None:
+            filter = {**filter, "at": {"$lt": before}}
+            names = [name for name in names if name <= partition_name(before)]
+        events: List[dict] = []
+        for name in names:
+            remaining = limit - len(events)
+            if remaining <= 0:
+                break
+            events.extend(await db[name].find(filter, {"_id": 0}).sort("at", -1).limit(remaining).to_list(remaining))
+        return events
@@ -0,0 +1,224 @@
+import re
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from analytics import parse_days
+
+
+# Resources that are booked for a period; vendors and materials are bought, not booked
+CAPACITY_TYPES = ("team_member", "equipment")
+
+# A pool (one person, one machine) is over-allocated above this combined share
+POOL_CAPACITY = 1.0
+OVERALLOCATION_TOLERANCE = 1e-6
+
+FULL_TIME_HOURS_PER_WEEK = 40.0
+FULL_TIME_DAYS_PER_WEEK = 5.0
+PART_TIME_SHARE = 0.5
+
+RESOURCE_CAPACITY_FIELDS = {"_id": 0, "id": 1, "name": 1, "type": 1, "availability": 1, "project_id": 1}
+PROJECT_CAPACITY_FIELDS = {"_id": 0, "id": 1, "name": 1, "start_date": 1, "end_date": 1}
+
+# Dates and times ("until 2025-12-31", "from 9:00") are not amounts
+_DATE_OR_TIME = re.compile(r"\d{1,4}[-/]\d{1,2}(?:[-/]\d{1,4})?|\d{1,2}\.\d{1,2}\.\d{2,4}|\d{1,2}:\d{2}")
+_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)\s*(%|h(?:ours?|rs?)?\b|d(?:ays?)?\b)?", re.IGNORECASE)
+
+
+def pool_key(resource_type: str, name: str) -> str:
+    """Resources with the same type and name on different projects are one person or machine"""
+    return f"{resource_type}:{' '.join((name or '').split()).casefold()}"
+
+
+def allocation_share(availability: Optional[str]) -> float:
+    """Share of a full-time resource that a free-form availability books.
+
+    "Full-time", "Available" and anything unrecognised book all of it;
+    "Part-time" half; "60%", "24 hours/week" and "2 days/week" what they
+    say, and a bare fraction like "0.25" itself. Numbers in dates and
+    times are ignored. "On-demand" and "as needed" book nothing up front.
+    """
+    text = (availability or "").strip().lower()
+    if not text:
+        return 1.0
+    if "on-demand" in text or "on demand" in text or "as needed" in text:
+        return 0.0
+    text = _DATE_OR_TIME.sub(" ", text)
+    amount = _AMOUNT.search(text)
+    if amount:
+        value, unit = float(amount.group(1)), (amount.group(2) or "").lower()
+        if unit == "%":
+            return value / 100.0
+        if unit.startswith("h"):
+            per_day = "day" in text[amount.end():]
+            return value / (FULL_TIME_HOURS_PER_WEEK / FULL_TIME_DAYS_PER_WEEK if per_day else FULL_TIME_HOURS_PER_WEEK)
+        if unit.startswith("d"):
+            return value / FULL_TIME_DAYS_PER_WEEK
+        if value <= 1:
+            return value
+    if "part" in text:
+        return PART_TIME_SHARE
+    return 1.0
+
+
+def _iso(day) -> str:
+    return str(np.datetime64(int(day), "D"))
+
+
+class CapacityTimeline:
+    """Every capacity pool's booked share over time, from one sweep over all allocations.
+
+    An allocation is a resource on a project: it books its pool for the
+    project's dates, inclusive. Start and end events of all pools are
+    sorted together by (pool, day); the running sum of their deltas is the
+    pool's load on each segment between consecutive events, and it returns
+    to zero at every pool boundary, so one cumsum covers all pools.
+    Segments are the pool's timeline; conflicts and utilization are
+    array operations over them.
+    """
+
+    def __init__(self, pools: List[Dict[str, Any]], allocations: Dict[str, np.ndarray],
+                 segments: Dict[str, np.ndarray]):
+        self.pools = pools
+        self.allocations = allocations
+        self.segments = segments
+        self.pool_index = {pool["key"]: i for i, pool in enumerate(pools)}
+
+    @classmethod
+    def build(cls, resources: List[dict], projects: List[dict]) -> "CapacityTimeline":
+        project_ids = [project["id"] for project in projects]
+        starts = dict(zip(project_ids, parse_days([project.get("start_date") for project in projects])))
+        ends = dict(zip(project_ids, parse_days([project.get("end_date") for project in projects])))
+        project_names = {project["id"]: project.get("name") for project in projects}
+
+        pools: List[Dict[str, Any]] = []
+        pool_index: Dict[str, int] = {}
+        rows = []
+        for resource in resources:
+            start, end = starts.get(resource.get("project_id")), ends.get(resource.get("project_id"))
+            share = allocation_share(resource.get("availability"))
+            if start is None or np.isnat(start) or np.isnat(end) or end < start or share <= 0:
+                continue
+            key = pool_key(resource.get("type"), resource.get("name"))
+            if key not in pool_index:
+                pool_index[key] = len(pools)
+                pools.append({"key": key, "name": resource.get("name"), "type": resource.get("type")})
+            rows.append((pool_index[key], start, end + np.timedelta64(1, "D"), share,
+                         resource["id"], resource["project_id"], project_names.get(resource["project_id"])))
+        # Grouped by pool, so a pool's allocations are one slice
+        rows.sort(key=lambda row: row[0])
+
+        allocations = {
+            "pool": np.array([row[0] for row in rows], dtype=np.int64),
+            "start": np.array([row[1] for row in rows], dtype="datetime64[D]"),
+            "end": np.array([row[2] for row in rows], dtype="datetime64[D]"),
+            "share": np.array([row[3] for row in rows], dtype=np.float64),
+            "resource_id": np.array([row[4] for row in rows], dtype=object),
+            "project_id": np.array([row[5] for row in rows], dtype=object),
+            "project_name": np.array([row[6] for row in rows], dtype=object),
+        }
+        return cls(pools, allocations, cls._sweep(allocations))
+
+    @staticmethod
+    def _sweep(allocations: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        pool = np.concatenate([allocations["pool"], allocations["pool"]])
+        day = np.concatenate([allocations["start"], allocations["end"]]).astype(np.int64)
+        delta = np.concatenate([allocations["share"], -allocations["share"]])
+        if not len(pool):
+            empty = np.array([], dtype=np.int64)
+            return {"pool": empty, "start": empty, "end": empty, "load": np.array([], dtype=np.float64)}
+
+        order = np.lexsort((day, pool))
+        pool, day, delta = pool[order], day[order], delta[order]
+        # Events on the same pool and day collapse into one
+        boundary = np.ones(len(pool), dtype=bool)
+        boundary[1:] = (pool[1:] != pool[:-1]) | (day[1:] != day[:-1])
+        first = np.flatnonzero(boundary)
+        pool, day = pool[first], day[first]
+        load = np.round(np.cumsum(np.add.reduceat(delta, first)), 9)
+
+        # Segment i runs from event i to event i + 1 of the same pool
+        same_pool = pool[:-1] == pool[1:]
+        keep = same_pool & (load[:-1] > 0)
+        return {"pool": pool[:-1][keep], "start": day[:-1][keep], "end": day[1:][keep], "load": load[:-1][keep]}
+
+    def _window(self, start: Optional[date], end: Optional[date]):
+        """Segment mask and clipped bounds for [start, end], inclusive days"""
+        lower = self.segments["start"] if start is None else np.maximum(self.segments["start"], np.datetime64(start, "D").astype(np.int64))
+        upper = self.segments["end"] if end is None else np.minimum(self.segments["end"], np.datetime64(end, "D").astype(np.int64) + 1)
+        return upper > lower, lower, upper
+
+    def conflicts(self, start: Optional[date] = None, end: Optional[date] = None,
+                  resource_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Periods where a pool is booked past its capacity, by pool and then date"""
+        mask, lower, upper = self._window(start, end)
+        mask &= self.segments["load"] > POOL_CAPACITY + OVERALLOCATION_TOLERANCE
+        conflicts = []
+        allocations = self.allocations
+        for i in np.flatnonzero(mask):
+            pool = self.pools[self.segments["pool"][i]]
+            if resource_type and pool["type"] != resource_type:
+                continue
+            segment_start, segment_end = lower[i], upper[i]
+            first = np.searchsorted(allocations["pool"], self.segments["pool"][i], side="left")
+            last = np.searchsorted(allocations["pool"], self.segments["pool"][i], side="right")
+            overlapping = first + np.flatnonzero(
+                (allocations["start"][first:last].astype(np.int64) < segment_end)
+                & (allocations["end"][first:last].astype(np.int64) > segment_start)
+            )
+            conflicts.append({
+                "resource": pool["name"],
+                "type": pool["type"],
+                "start": _iso(segment_start),
+                "end": _iso(segment_end - 1),
+                "load": float(self.segments["load"][i]),
+                "capacity": POOL_CAPACITY,
+                "allocations": [
+                    {
+                        "resource_id": allocations["resource_id"][j],
+                        "project_id": allocations["project_id"][j],
+                        "project_name": allocations["project_name"][j],
+                        "share": float(allocations["share"][j]),
+                    }
+                    for j in overlapping
+                ],
+            })
+        return conflicts
+
+    def utilization(self, start: date, end: date, resource_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Average and peak booked share of every pool over [start, end], busiest first"""
+        days = (np.datetime64(end, "D") - np.datetime64(start, "D")).astype(np.int64) + 1
+        if days < 1:
+            raise ValueError("End must not be before start")
+        mask, lower, upper = self._window(start, end)
+        pools = self.segments["pool"][mask]
+        size = len(self.pools)
+        booked = np.bincount(pools, weights=self.segments["load"][mask] * (upper - lower)[mask], minlength=size)
+        peak = np.zeros(size)
+        np.maximum.at(peak, pools, self.segments["load"][mask])
+
+        results = []
+        for index in np.argsort(-booked, kind="stable"):
+            pool = self.pools[index]
+            if resource_type and pool["type"] != resource_type:
+                continue
+            results.append({
+                "resource": pool["name"],
+                "type": pool["type"],
+                "utilization": round(float(booked[index] / days), 4),
+                "peak_load": float(peak[index]),
+                "over_allocated": bool(peak[index] > POOL_CAPACITY + OVERALLOCATION_TOLERANCE),
+            })
+        return results
+
+    def timeline(self, resource_type: str, name: str) -> Optional[List[Dict[str, Any]]]:
+        """A pool's load segments in order, or None for an unknown pool"""
+        index = self.pool_index.get(pool_key(resource_type, name))
+        if index is None:
+            return None
+        mask = self.segments["pool"] == index
+        return [
+            {"start": _iso(start), "end": _iso(end - 1), "load": float(load)}
+            for start, end, load in zip(self.segments["start"][mask], self.segments["end"][mask], self.segments["load"][mask])
+        ]
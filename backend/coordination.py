@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+
+logger = logging.getLogger(__name__)
+
+# Capped so the event log never grows; a worker that falls this far behind resyncs
+CACHE_EVENTS_COLLECTION = "cache_events"
+CACHE_EVENTS_SIZE_BYTES = 32 * 1024 * 1024
+
+# Events written per insert_many by the publisher
+PUBLISH_BATCH_SIZE = 500
+
+# Pause before re-opening a tailable cursor that died
+TAIL_RETRY_SECONDS = 1.0
+
+
+class SharedCache:
+    """Proxy that applies write methods locally and broadcasts them to other workers.
+
+    Reads and every method not listed in `methods` (rebuilds, lookups) pass
+    straight through to the wrapped cache.
+    """
+
+    def __init__(self, bus: "CacheEventBus", name: str, target, methods: Tuple[str, ...]):
+        self._bus = bus
+        self._name = name
+        self._target = target
+        self._methods = set(methods)
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if attr not in self._methods:
+            return value
+
+        def broadcast(*args, **kwargs):
+            result = value(*args, **kwargs)
+            self._bus.publish(self._name, attr, args, kwargs)
+            return result
+        return broadcast
+
+    def __len__(self):
+        return len(self._target)
+
+
+class CacheEventBus:
+    """Keeps per-worker in-process caches in step through a capped Mongo collection.
+
+    Each worker publishes its cache writes as events and tails the
+    collection for everyone's events. Idempotent caches (replay_own=True)
+    re-apply their own events too, so every worker ends up applying writes
+    in the same log order and converges even when two workers race on the
+    same entity. If the tail is lost, the resync callbacks rebuild from the
+    database. replay_as maps a method to the one other workers apply
+    instead, for writes that are only safe to apply where they happened.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.worker_id = uuid.uuid4().hex
+        self.targets: Dict[str, Tuple[Any, bool, Dict[str, str]]] = {}
+        self.resync_callbacks: List[Callable[[], Awaitable[None]]] = []
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: List[dict] = []
+        self.applied = 0
+
+    def share(self, name: str, target, methods: Tuple[str, ...], replay_own: bool = True,
+              replay_as: Optional[Dict[str, str]] = None):
+        """Register a cache; returns the cache itself when coordination is off"""
+        self.targets[name] = (target, replay_own, replay_as or {})
+        if not self.enabled:
+            return target
+        return SharedCache(self, name, target, methods)
+
+    def on_resync(self, callback: Callable[[], Awaitable[None]]):
+        self.resync_callbacks.append(callback)
+
+    def publish(self, name: str, method: str, args: tuple, kwargs: dict):
+        event = {"worker": self.worker_id, "cache": name, "method": method, "args": list(args), "kwargs": kwargs}
+        if self.queue is None:
+            # Writes before start() are flushed once the publisher runs
+            self.pending.append(event)
+        else:
+            self.queue.put_nowait(event)
+
+    def apply(self, event: dict):
+        """Apply one event from the log to the matching local cache"""
+        registered = self.targets.get(event.get("cache"))
+        if registered is None:
+            return
+        target, replay_own, replay_as = registered
+        own = event.get("worker") == self.worker_id
+        if own and not replay_own:
+            return
+        method = event["method"] if own else replay_as.get(event["method"], event["method"])
+        try:
+            getattr(target, method)(*event.get("args", []), **event.get("kwargs", {}))
+            self.applied += 1
+        except Exception:
+            logger.exception("Failed to apply cache event %s.%s", event.get("cache"), event.get("method"))
+
+    async def start(self, db) -> List[asyncio.Task]:
+        """Create the event log if needed and start the publisher and tailer tasks"""
+        if not self.enabled:
+            return []
+        try:
+            await db.create_collection(CACHE_EVENTS_COLLECTION, capped=True, size=CACHE_EVENTS_SIZE_BYTES)
+        except CollectionInvalid:
+            pass
+        collection = db[CACHE_EVENTS_COLLECTION]
+        self.queue = asyncio.Queue()
+        for event in self.pending:
+            self.queue.put_nowait(event)
+        self.pending = []
+        marker = await self._log_end(collection)
+        return [
+            asyncio.create_task(self._publish_loop(collection)),
+            asyncio.create_task(self._tail_loop(collection, marker)),
+        ]
+
+    @staticmethod
+    async def _log_end(collection):
+        last = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        return last["_id"] if last else None
+
+    async def _publish_loop(self, collection):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < PUBLISH_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await collection.insert_many(batch, ordered=True)
+            except Exception:
+                logger.exception("Failed to publish %d cache events", len(batch))
+
+    async def _tail_loop(self, collection, marker):
+        """Follow the capped collection in insertion order from `marker` onwards"""
+        while True:
+            try:
+                # ObjectIds from different workers aren't ordered, so skip up to
+                # the marker by position instead of filtering on _id
+                skipping = marker is not None
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for event in cursor:
+                        if skipping:
+                            skipping = event["_id"] != marker
+                            continue
+                        marker = event["_id"]
+                        self.apply(event)
+                    if skipping:
+                        # Caught up without meeting the marker: it rolled out of the capped log
+                        raise LookupError("cache event log position lost")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache event tail interrupted; resyncing caches")
+                marker = await self._resync(collection)
+            await asyncio.sleep(TAIL_RETRY_SECONDS)
+
+    async def _resync(self, collection):
+        marker = None
+        try:
+            marker = await self._log_end(collection)
+            for callback in self.resync_callbacks:
+                await callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to resync caches")
+        return marker
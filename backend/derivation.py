@@ -0,0 +1,126 @@
+import re
+
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+
+# Resource types that carry a cost-derived expense, and the expense type each gets
+RESOURCE_EXPENSE_TYPES = {
+    "vendor": "vendor",
+    "equipment": "equipment",
+    "material": "material",
+}
+EXPENSE_RESOURCE_TYPES = {expense_type: resource_type for resource_type, expense_type in RESOURCE_EXPENSE_TYPES.items()}
+
+# "Equipment: " style prefixes of derived expense descriptions
+TYPE_LABELS = {resource_type: resource_type.replace('_', ' ').title() for resource_type in RESOURCE_EXPENSE_TYPES}
+DESCRIPTION_PREFIXES = {expense_type: f"{TYPE_LABELS[resource_type]}: " for resource_type, expense_type in RESOURCE_EXPENSE_TYPES.items()}
+
+
+def _value(member) -> Any:
+    return getattr(member, "value", member)
+
+
+def describe(resource_type, name: str) -> str:
+    return f"{TYPE_LABELS[_value(resource_type)]}: {name}"
+
+
+def derive_expenses(resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Expense fields for every resource that gets a derived expense, in input order.
+
+    Vendors, equipment and materials with a positive cost_per_unit get one,
+    priced cost_per_unit * allocated_amount (or cost_per_unit alone when
+    nothing is allocated). The fields carry the derived_from_resource link
+    and the structured resource_name, so nothing downstream has to parse
+    the description.
+    """
+    if not resources:
+        return []
+    types = [_value(resource["type"]) for resource in resources]
+    costs = np.array([resource.get("cost_per_unit") for resource in resources], dtype=float)
+    allocated = np.array([resource.get("allocated_amount") or 0.0 for resource in resources], dtype=float)
+
+    derivable = np.fromiter((t in RESOURCE_EXPENSE_TYPES for t in types), dtype=bool, count=len(types))
+    # None costs become NaN, which fails the comparison
+    with np.errstate(invalid="ignore"):
+        selected = np.flatnonzero(derivable & (costs > 0))
+    amounts = np.where(allocated > 0, costs * allocated, costs)
+
+    return [
+        {
+            "description": describe(types[i], resources[i]["name"]),
+            "amount": float(amounts[i]),
+            "expense_type": RESOURCE_EXPENSE_TYPES[types[i]],
+            "project_id": resources[i]["project_id"],
+            "resource_id": resources[i]["id"],
+            "resource_name": resources[i]["name"],
+            "derived_from_resource": True,
+        }
+        for i in selected
+    ]
+
+
+def derive_expense(resource: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    derived = derive_expenses([resource])
+    return derived[0] if derived else None
+
+
+def resource_name_for(expense: Dict[str, Any], changed: Dict[str, Any]) -> Optional[str]:
+    """New name for the linked resource after an expense edit, if the edit renames it.
+
+    An explicit resource_name wins. Otherwise a new description renames the
+    resource: a derived expense's description minus its own type prefix. An
+    expense entered by hand keeps the original rule of naming the resource
+    after whatever follows its first ": ". Expenses written before the
+    derived_from_resource flag existed (and not yet backfilled) have their
+    own type prefix stripped, since derived ones carried it.
+    """
+    if changed.get("resource_name"):
+        return changed["resource_name"]
+    if "description" not in changed:
+        return None
+    description = changed["description"]
+    if expense.get("derived_from_resource", True):
+        prefix = DESCRIPTION_PREFIXES.get(_value(changed.get("expense_type", expense.get("expense_type"))))
+        if prefix and description.startswith(prefix):
+            return description[len(prefix):]
+        return description
+    return description.split(": ", 1)[1] if ": " in description else description
+
+
+def resource_sync_updates(expense: Dict[str, Any], changed: Dict[str, Any], resource: Dict[str, Any]) -> Dict[str, Any]:
+    """Resource fields to change so a linked resource follows an edited expense"""
+    resource_updates = {}
+    name = resource_name_for(expense, changed)
+    if name is not None:
+        resource_updates["name"] = name
+    if "expense_type" in changed:
+        resource_type = EXPENSE_RESOURCE_TYPES.get(_value(changed["expense_type"]))
+        if resource_type:
+            resource_updates["type"] = resource_type
+    if "amount" in changed:
+        allocated_amount = resource.get("allocated_amount", 1.0)
+        resource_updates["cost_per_unit"] = changed["amount"] / allocated_amount if allocated_amount > 0 else changed["amount"]
+    return resource_updates
+
+
+async def backfill_derived_flags(db, embedded_field: str = "expense"):
+    """Flag expenses written before derived_from_resource existed.
+
+    Derived expenses were the linked ones labelled with their own type
+    prefix ("Vendor: Acme" on a vendor expense); every other one was
+    entered by hand.
+    """
+    for collection, field in ((db.expenses, ""), (db.resources, f"{embedded_field}.")):
+        unflagged = {f"{field}derived_from_resource": {"$exists": False}, f"{field}id": {"$exists": True}}
+        for expense_type, prefix in DESCRIPTION_PREFIXES.items():
+            await collection.update_many(
+                {
+                    **unflagged,
+                    f"{field}resource_id": {"$nin": [None, ""]},
+                    f"{field}expense_type": expense_type,
+                    f"{field}description": {"$regex": f"^{re.escape(prefix)}"},
+                },
+                {"$set": {f"{field}derived_from_resource": True}}
+            )
+        await collection.update_many(unflagged, {"$set": {f"{field}derived_from_resource": False}})
@@ -0,0 +1,171 @@
+import functools
+import importlib.util
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from revisions import REV_FIELD
+
+
+# Old versions are stored as a delta only when it is at most this fraction of the full file
+DELTA_MAX_RATIO = 0.5
+
+# bsdiff holds both versions and its suffix array in memory; bigger files stay whole
+DELTA_MAX_BYTES = 64 * 1024 * 1024
+
+DELTA_SUFFIX = ".delta"
+
+
+@functools.lru_cache(maxsize=None)
+def deltas_supported() -> bool:
+    return importlib.util.find_spec("bsdiff4") is not None
+
+
+def document_key(document: Dict[str, Any]) -> str:
+    """Storage key of a document's blob; older records only have the local path, which maps to the same key"""
+    return f"{document['project_id']}/{document['filename']}"
+
+
+def version_group(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Query for every version of a document: same project, folder and name"""
+    return {"project_id": document["project_id"], "folder_path": document["folder_path"], "name": document["name"]}
+
+
+def make_delta(base_path: str, target_path: str, delta_path: str) -> Optional[int]:
+    """Write a patch that rebuilds target from base, if it is small enough to be worth it.
+
+    Returns the patch size, or None when the target should stay whole.
+    Runs in a pool process.
+    """
+    import bsdiff4
+
+    target_size = os.path.getsize(target_path)
+    if max(os.path.getsize(base_path), target_size) > DELTA_MAX_BYTES:
+        return None
+    with open(base_path, "rb") as f:
+        base = f.read()
+    with open(target_path, "rb") as f:
+        target = f.read()
+    delta = bsdiff4.diff(base, target)
+    if len(delta) > target_size * DELTA_MAX_RATIO:
+        return None
+    with open(delta_path, "wb") as f:
+        f.write(delta)
+    return len(delta)
+
+
+def apply_delta(base_path: str, delta_path: str, target_path: str):
+    """Rebuild a version from the one it was diffed against. Runs in a pool process."""
+    import bsdiff4
+
+    bsdiff4.file_patch(base_path, target_path, delta_path)
+
+
+def _flag(value: bool) -> Dict[str, Any]:
+    return {"$set": {"is_latest": value}, "$inc": {REV_FIELD: 1}}
+
+
+class DocumentVersions:
+    """Latest-version flags, version history and delta storage for documents.
+
+    Every upload is its own document; the versions of a file are the
+    documents sharing its project, folder and name. The newest carries
+    is_latest so current listings are a plain filter. With deltas on,
+    when a new version arrives the one before it is replaced by a reverse
+    delta against it, so the current version is always stored whole and
+    older ones are rebuilt by walking the chain forward.
+    """
+
+    def __init__(self, db: Callable[[], Any], storage, pool, deltas: bool = False):
+        self.db = db
+        self.storage = storage
+        self.pool = pool
+        self.deltas = deltas and deltas_supported()
+
+    async def mark_latest(self, document: Dict[str, Any]):
+        """Make a just-inserted version the latest, unless a newer one beat it in"""
+        collection = self.db().documents
+        group = version_group(document)
+        await collection.update_many({**group, "version": {"$lt": document["version"]}, "is_latest": True}, _flag(False))
+        # A concurrent upload of a higher version may have run its update before this insert
+        if await collection.find_one({**group, "version": {"$gt": document["version"]}}, {"_id": 1}):
+            await collection.update_one({"id": document["id"]}, _flag(False))
+
+    async def refresh_latest(self, match: Dict[str, Any]) -> int:
+        """Recompute is_latest for every version group matched, e.g. after folders merge; returns changes"""
+        collection = self.db().documents
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"version": -1}},
+            {"$group": {"_id": {"folder_path": "$folder_path", "name": "$name"}, "id": {"$first": "$id"}}},
+        ]
+        latest = [row["id"] for row in await collection.aggregate(pipeline).to_list(None)]
+        cleared = await collection.update_many({**match, "id": {"$nin": latest}, "is_latest": {"$ne": False}}, _flag(False))
+        set_ = await collection.update_many({"id": {"$in": latest}, "is_latest": {"$ne": True}}, _flag(True))
+        return cleared.modified_count + set_.modified_count
+
+    async def backfill(self) -> int:
+        """Set is_latest on documents uploaded before it existed, one project at a time"""
+        changed = 0
+        for project_id in await self.db().documents.distinct("project_id", {"is_latest": {"$exists": False}}):
+            changed += await self.refresh_latest({"project_id": project_id})
+        return changed
+
+    async def history(self, document: Dict[str, Any]) -> List[dict]:
+        """Every version of a document, newest first"""
+        cursor = self.db().documents.find(version_group(document)).sort("version", -1)
+        return await cursor.to_list(None)
+
+    async def previous(self, document: Dict[str, Any]) -> Optional[dict]:
+        return await self.db().documents.find_one(
+            {**version_group(document), "version": {"$lt": document["version"]}}, sort=[("version", -1)]
+        )
+
+    @asynccontextmanager
+    async def local_copy(self, document: Dict[str, Any]) -> AsyncIterator[Path]:
+        """A local file with the version's full content, rebuilt from deltas if need be"""
+        base_id = document.get("delta_base_id")
+        if not base_id:
+            async with self.storage.local_copy(document_key(document)) as path:
+                yield path
+            return
+        base = await self.db().documents.find_one({"id": base_id})
+        if base is None:
+            raise FileNotFoundError(document_key(document))
+        async with self.local_copy(base) as base_path, \
+                self.storage.local_copy(document_key(document) + DELTA_SUFFIX) as delta_path:
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / document["filename"]
+                await self.pool.run(apply_delta, str(base_path), str(delta_path), str(path))
+                yield path
+
+    async def deltify(self, previous: Dict[str, Any], current: Dict[str, Any]) -> Optional[int]:
+        """Replace the previous version's blob with a delta against the current one; returns its size.
+
+        The delta is written and recorded before the full blob goes, and
+        only one upload can claim a given previous version.
+        """
+        # The current version may itself have been superseded and diffed by now
+        current = await self.db().documents.find_one({"id": current["id"]})
+        if current is None or previous.get("delta_base_id"):
+            return None
+        key = document_key(previous)
+        delta_key = key + DELTA_SUFFIX
+        async with self.local_copy(current) as base, self.storage.local_copy(key) as target:
+            with tempfile.TemporaryDirectory() as directory:
+                delta_path = Path(directory) / "delta"
+                size = await self.pool.run(make_delta, str(base), str(target), str(delta_path))
+                if size is None:
+                    return None
+                await self.storage.put_file(str(delta_path), delta_key)
+        result = await self.db().documents.update_one(
+            {"id": previous["id"], "delta_base_id": None},
+            {"$set": {"delta_base_id": current["id"], "stored_size": size}, "$inc": {REV_FIELD: 1}}
+        )
+        if result.modified_count == 0:
+            await self.storage.delete(delta_key)
+            return None
+        await self.storage.delete(key)
+        return size
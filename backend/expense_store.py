@@ -0,0 +1,253 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from revisions import REV_FIELD, bump
+
+
+EXPENSE_STORAGE_MODES = ("collection", "embedded")
+
+# Read-only view over standalone expenses plus the ones embedded on resources
+EXPENSES_VIEW = "expenses_all"
+
+# Resource field holding its derived expense in embedded mode
+EMBEDDED_FIELD = "expense"
+EMBEDDED_REV = f"{EMBEDDED_FIELD}.{REV_FIELD}"
+
+# Raised by create on a name that is already taken
+NAMESPACE_EXISTS = 48
+
+
+def rejected_documents(error: BulkWriteError) -> Dict[int, str]:
+    """Index and message of each document an unordered insert_many rejected; the rest were written"""
+    return {
+        write_error["index"]: write_error.get("errmsg", "Write failed")
+        for write_error in error.details.get("writeErrors", [])
+    }
+
+
+def expenses_view_pipeline() -> List[Dict[str, Any]]:
+    return [{"$unionWith": {"coll": "resources", "pipeline": [
+        {"$match": {EMBEDDED_FIELD: {"$type": "object"}}},
+        {"$replaceWith": {"$mergeObjects": [f"${EMBEDDED_FIELD}", {"embedded": True}]}},
+    ]}}]
+
+
+class ExpenseStore:
+    """Where an expense linked to a resource is written.
+
+    In "collection" mode every expense is a row in `expenses` and changing a
+    resource with a derived expense touches both collections. In "embedded"
+    mode the expense derived from (or created with) a resource lives on the
+    resource document under `expense`, so those flows only ever write one
+    document. Reads then go through the `expenses_all` view, which unions the
+    embedded expenses with the standalone ones and marks them embedded.
+
+    Every write takes the session of the surrounding transaction (or None);
+    deletes given a deletion_id go to the trash instead.
+    Switching modes needs no migration: rows already in `expenses` stay
+    readable and are folded into the resource the next time it is repriced.
+    """
+
+    def __init__(self, db: Callable[[], Any], mode: str = "collection", trash=None):
+        if mode not in EXPENSE_STORAGE_MODES:
+            raise ValueError(f"Invalid expense storage mode. Must be one of: {list(EXPENSE_STORAGE_MODES)}")
+        self.db = db
+        self.mode = mode
+        self.trash = trash
+
+    @property
+    def embedded(self) -> bool:
+        return self.mode == "embedded"
+
+    def reads(self):
+        """Collection (or view) every expense read goes through"""
+        return self.db()[EXPENSES_VIEW] if self.embedded else self.db().expenses
+
+    async def ensure_view(self):
+        if not self.embedded:
+            return
+        db = self.db()
+        try:
+            await db.create_collection(EXPENSES_VIEW, viewOn="expenses", pipeline=expenses_view_pipeline())
+        except OperationFailure as e:
+            if e.code != NAMESPACE_EXISTS:
+                raise
+            await db.command("collMod", EXPENSES_VIEW, viewOn="expenses", pipeline=expenses_view_pipeline())
+        await db.resources.create_index(f"{EMBEDDED_FIELD}.id", sparse=True)
+
+    async def find_expense(self, expense_id: str, session=None) -> Optional[dict]:
+        """Point lookup on the base collections; views can't be read inside a transaction"""
+        db = self.db()
+        expense = await db.expenses.find_one({"id": expense_id}, session=session)
+        if expense is not None or not self.embedded:
+            return expense
+        resource = await db.resources.find_one({f"{EMBEDDED_FIELD}.id": expense_id}, {EMBEDDED_FIELD: 1}, session=session)
+        if resource is None:
+            return None
+        return {**resource[EMBEDDED_FIELD], "embedded": True}
+
+    async def insert_resource(self, resource_data: dict, expense_data: Optional[dict], session=None):
+        db = self.db()
+        if expense_data is not None and self.embedded:
+            await db.resources.insert_one({**resource_data, EMBEDDED_FIELD: expense_data}, session=session)
+            return
+        await db.resources.insert_one(resource_data, session=session)
+        if expense_data is not None:
+            await db.expenses.insert_one(expense_data, session=session)
+
+    async def insert_resources(self, resource_docs: List[dict], expense_docs: List[dict]) -> Dict[int, str]:
+        """Bulk variant for imports; each expense_doc belongs to the resource named by its resource_id.
+
+        Returns the index and error of each resource that wasn't written;
+        everything else was, with its expense. A resource whose expense is
+        rejected is removed again, so a row is imported whole or not at all.
+        """
+        db = self.db()
+        if self.embedded:
+            by_resource = {e["resource_id"]: e for e in expense_docs}
+            try:
+                await db.resources.insert_many(
+                    [{**r, EMBEDDED_FIELD: by_resource[r["id"]]} if r["id"] in by_resource else r for r in resource_docs],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                return rejected_documents(e)
+            return {}
+        try:
+            await db.resources.insert_many(resource_docs, ordered=False)
+            rejected = {}
+        except BulkWriteError as e:
+            rejected = rejected_documents(e)
+        # Only the expenses of resources that were written
+        positions = {r["id"]: i for i, r in enumerate(resource_docs) if i not in rejected}
+        expense_docs = [e for e in expense_docs if e["resource_id"] in positions]
+        if expense_docs:
+            try:
+                await db.expenses.insert_many(expense_docs, ordered=False)
+            except BulkWriteError as e:
+                orphans = []
+                for index, message in rejected_documents(e).items():
+                    orphans.append(expense_docs[index]["resource_id"])
+                    rejected[positions[orphans[-1]]] = message
+                await db.resources.delete_many({"id": {"$in": orphans}})
+        return rejected
+
+    async def replace_derived(self, resource_id: str, expense_data: Optional[dict], session=None):
+        """Replace every expense linked to a resource with expense_data (or none)"""
+        db = self.db()
+        if self.embedded:
+            change = {"$set": {EMBEDDED_FIELD: expense_data}} if expense_data is not None else {"$unset": {EMBEDDED_FIELD: ""}}
+            await db.resources.update_one({"id": resource_id}, change, session=session)
+            # Rows written before the switch to embedded mode
+            await db.expenses.delete_many({"resource_id": resource_id}, session=session)
+            return
+        await db.expenses.delete_many({"resource_id": resource_id}, session=session)
+        if expense_data is not None:
+            await db.expenses.insert_one(expense_data, session=session)
+
+    async def relabel_derived(self, resource_id: str, expense_set: dict, session=None):
+        """Set fields on the expense derived from a resource, wherever it is stored"""
+        db = self.db()
+        if self.embedded:
+            await db.resources.update_one(
+                {"id": resource_id, f"{EMBEDDED_FIELD}.derived_from_resource": True},
+                bump({"$set": {f"{EMBEDDED_FIELD}.{field}": value for field, value in expense_set.items()}}, EMBEDDED_REV),
+                session=session
+            )
+        await db.expenses.update_many(
+            {"resource_id": resource_id, "derived_from_resource": True}, bump({"$set": expense_set}), session=session
+        )
+
+    async def update_expense(self, expense: dict, expense_set: dict, resource_set: Optional[dict], expected: Optional[int] = None,
+                             session=None, resource_id: Optional[str] = None) -> bool:
+        """Update an expense found by find_expense, and resource_id's resource with resource_set if given.
+
+        resource_id is the resource the expense links to after the update,
+        which is not expense["resource_id"] when the update relinks it; an
+        embedded expense then moves with it (see _move_embedded). With
+        expected set the expense is only updated at that revision; False
+        means it was not (or no longer) there at it.
+        """
+        db = self.db()
+        relinked_to = expense_set.get("resource_id", expense.get("resource_id"))
+        if expense.get("embedded") and relinked_to != expense.get("resource_id"):
+            return await self._move_embedded(expense, expense_set, resource_set, expected, session, relinked_to)
+        if expense.get("embedded"):
+            query = {f"{EMBEDDED_FIELD}.id": expense["id"]}
+            if expected is not None:
+                query[EMBEDDED_REV] = expected
+            change = bump({"$set": {f"{EMBEDDED_FIELD}.{field}": value for field, value in expense_set.items()}}, EMBEDDED_REV)
+            if resource_set:
+                change = bump({**change, "$set": {**change["$set"], **resource_set}})
+            result = await db.resources.update_one(query, change, session=session)
+            return result.matched_count > 0
+        query = {"id": expense["id"]}
+        if expected is not None:
+            query[REV_FIELD] = expected
+        result = await db.expenses.update_one(query, bump({"$set": expense_set}), session=session)
+        if result.matched_count == 0:
+            return False
+        if resource_set and resource_id:
+            await db.resources.update_one({"id": resource_id}, bump({"$set": resource_set}), session=session)
+        return True
+
+    async def _move_embedded(self, expense: dict, expense_set: dict, resource_set: Optional[dict], expected: Optional[int],
+                             session, resource_id: Optional[str]) -> bool:
+        """Relink an embedded expense: take it off its resource and onto resource_id's.
+
+        A resource holds one embedded expense, so when the new one already
+        has its own (or the expense is unlinked) it becomes a row in
+        `expenses` instead, which the view reads the same way.
+        """
+        db = self.db()
+        query = {f"{EMBEDDED_FIELD}.id": expense["id"]}
+        if expected is not None:
+            query[EMBEDDED_REV] = expected
+        previous = await db.resources.find_one_and_update(
+            query, bump({"$unset": {EMBEDDED_FIELD: ""}}), projection={"_id": 0, EMBEDDED_FIELD: 1},
+            return_document=ReturnDocument.BEFORE, session=session
+        )
+        if previous is None:
+            return False
+        moved = {**previous[EMBEDDED_FIELD], **expense_set}
+        moved[REV_FIELD] = previous[EMBEDDED_FIELD].get(REV_FIELD, 1) + 1
+        if resource_id:
+            result = await db.resources.update_one(
+                {"id": resource_id, EMBEDDED_FIELD: {"$not": {"$type": "object"}}},
+                bump({"$set": {EMBEDDED_FIELD: moved, **(resource_set or {})}}), session=session
+            )
+            if result.matched_count:
+                return True
+            if resource_set:
+                await db.resources.update_one({"id": resource_id}, bump({"$set": resource_set}), session=session)
+        await db.expenses.insert_one(moved, session=session)
+        return True
+
+    async def pin_currency(self, project_id: str, currency: str, session=None):
+        """Give a project's expenses without a currency (they were in the project's) this one explicitly"""
+        db = self.db()
+        await db.expenses.update_many(
+            {"project_id": project_id, "currency": None}, bump({"$set": {"currency": currency}}), session=session
+        )
+        await db.resources.update_many(
+            {"project_id": project_id, EMBEDDED_FIELD: {"$type": "object"}, f"{EMBEDDED_FIELD}.currency": None},
+            bump({"$set": {f"{EMBEDDED_FIELD}.currency": currency}}, EMBEDDED_REV), session=session
+        )
+
+    async def delete_resource(self, resource_id: str, deletion_id: Optional[str] = None, session=None) -> bool:
+        """Delete a resource with every expense linked to it, into the trash when given a deletion_id"""
+        if not await self._remove("resources", {"id": resource_id}, deletion_id, session):
+            return False
+        await self._remove("expenses", {"resource_id": resource_id}, deletion_id, session)
+        return True
+
+    async def delete_expense(self, expense_id: str, deletion_id: Optional[str] = None, session=None) -> bool:
+        return await self._remove("expenses", {"id": expense_id}, deletion_id, session) > 0
+
+    async def _remove(self, collection: str, query: dict, deletion_id: Optional[str], session) -> int:
+        if deletion_id is not None and self.trash is not None:
+            return len(await self.trash.move(collection, query, deletion_id, session))
+        result = await self.db()[collection].delete_many(query, session=session)
+        return result.deleted_count
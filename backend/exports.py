@@ -0,0 +1,155 @@
+import csv
+import io
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from timestamps import range_bound
+
+
+EXPORT_BATCH_SIZE = 5000
+
+# Rows per Parquet row group; bounds memory held by the writer at any time
+PARQUET_ROW_GROUP_SIZE = 50000
+
+EXPENSE_EXPORT_COLUMNS = ["id", "project_id", "resource_id", "expense_type", "description", "amount", "currency", "date", "created_at"]
+EXPENSE_EXPORT_FIELDS = {"_id": 0, **{column: 1 for column in EXPENSE_EXPORT_COLUMNS}}
+
+
+def build_expense_export_query(
+    project_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    expense_type: Optional[str] = None,
+) -> dict:
+    """Mongo filter for an expense export.
+
+    Dates are ISO 8601 dates or datetimes, compared in UTC against the
+    stored strings; a date-only end_date includes that whole day. Raises
+    ValueError for dates that don't parse.
+    """
+    query: Dict[str, object] = {}
+    if project_id:
+        query["project_id"] = project_id
+    if expense_type:
+        query["expense_type"] = expense_type
+    date_range = {}
+    for param, raw, upper in (("start_date", start_date, False), ("end_date", end_date, True)):
+        if not raw:
+            continue
+        try:
+            operator, value = range_bound(raw, upper)
+        except ValueError:
+            raise ValueError(f"Invalid {param}. Must be an ISO 8601 date or datetime")
+        date_range[operator] = value
+    if date_range:
+        query["date"] = date_range
+    return query
+
+
+async def iter_batches(cursor, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            break
+        yield batch
+
+
+async def stream_csv(cursor, columns: List[str] = EXPENSE_EXPORT_COLUMNS, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encode cursor rows as CSV, one chunk per cursor batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+
+    async for batch in iter_batches(cursor, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row.get(column) for column in columns] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class ChunkSink:
+    """Write-only file object that hands written bytes back to a generator"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def expense_arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("id", pa.string()),
+        ("project_id", pa.string()),
+        ("resource_id", pa.string()),
+        ("expense_type", pa.string()),
+        ("description", pa.string()),
+        ("amount", pa.float64()),
+        ("currency", pa.string()),
+        ("date", pa.timestamp("us", tz="UTC")),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+
+def _parse_timestamp(value):
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _record_batch(rows: List[dict], schema):
+    import pyarrow as pa
+    arrays = []
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_timestamp(field.type):
+            values = [_parse_timestamp(v) for v in values]
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def stream_parquet(cursor, batch_size: int = EXPORT_BATCH_SIZE, row_group_size: int = PARQUET_ROW_GROUP_SIZE) -> AsyncIterator[bytes]:
+    """Encode cursor rows as Parquet, flushing bytes after every row group"""
+    import pyarrow.parquet as pq
+
+    schema = expense_arrow_schema()
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    pending: List[dict] = []
+    try:
+        async for batch in iter_batches(cursor, batch_size):
+            pending.extend(batch)
+            while len(pending) >= row_group_size:
+                writer.write_batch(_record_batch(pending[:row_group_size], schema), row_group_size=row_group_size)
+                pending = pending[row_group_size:]
+                yield sink.drain()
+        if pending:
+            writer.write_batch(_record_batch(pending, schema), row_group_size=row_group_size)
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,143 @@
+from typing import Any, Callable, Dict, Iterable, List
+
+from revisions import REV_FIELD
+
+
+ROOT_FOLDER = "/"
+
+# Serves exact-folder listings, subtree prefix scans, the per-folder rollup and version lookups
+FOLDER_INDEX = [("project_id", 1), ("folder_path", 1), ("name", 1), ("version", -1)]
+
+
+def normalize_folder(path: str) -> str:
+    """Canonical folder path: leading slash, no trailing or doubled slashes ("/a/b", or "/" for the root)"""
+    segments = [segment for segment in (path or "").replace("\\", "/").split("/") if segment not in ("", ".")]
+    if ".." in segments:
+        raise ValueError("Folder path may not contain '..'")
+    return "/" + "/".join(segments)
+
+
+def subtree_filter(folder: str) -> Dict[str, Any]:
+    """Match a folder and everything below it.
+
+    Paths are materialized on each document, so the subtree is the folder
+    itself plus the range of paths starting with "folder/" ("0" sorts right
+    after "/"). Both are bounded scans of the folder index.
+    """
+    if folder == ROOT_FOLDER:
+        return {}
+    return {"$or": [
+        {"folder_path": folder},
+        {"folder_path": {"$gte": folder + "/", "$lt": folder + "0"}},
+    ]}
+
+
+def ancestors(folder: str) -> List[str]:
+    """The folder and every folder above it, root first"""
+    if folder == ROOT_FOLDER:
+        return [ROOT_FOLDER]
+    segments = folder.strip("/").split("/")
+    return [ROOT_FOLDER] + ["/" + "/".join(segments[:i]) for i in range(1, len(segments) + 1)]
+
+
+def folder_tree(folder: str, direct: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Roll per-folder_path totals up into a summary of every folder under `folder`.
+
+    `direct` rows are {"_id": folder_path, "count": n, "size": bytes} for
+    the documents directly in each folder. Every folder gets its own
+    totals and those of its whole subtree, including folders that only
+    exist because something below them has documents.
+    """
+    folders: Dict[str, Dict[str, Any]] = {}
+    depth = len(ancestors(folder)) - 1
+    for row in direct:
+        for path in ancestors(row["_id"])[depth:]:
+            entry = folders.get(path)
+            if entry is None:
+                entry = folders[path] = {
+                    "path": path,
+                    "name": path.rsplit("/", 1)[-1] or ROOT_FOLDER,
+                    "document_count": 0,
+                    "size": 0,
+                    "total_document_count": 0,
+                    "total_size": 0,
+                }
+            entry["total_document_count"] += row["count"]
+            entry["total_size"] += row["size"]
+            if path == row["_id"]:
+                entry["document_count"] += row["count"]
+                entry["size"] += row["size"]
+    return sorted(folders.values(), key=lambda entry: entry["path"])
+
+
+def move_update(source: str, target: str) -> List[Dict[str, Any]]:
+    """Pipeline update that re-roots a folder_path in `source`'s subtree under `target`"""
+    return [{"$set": {
+        "folder_path": {"$concat": [target, {"$substrCP": ["$folder_path", len(source), {"$strLenCP": "$folder_path"}]}]},
+        REV_FIELD: {"$add": [{"$ifNull": [f"${REV_FIELD}", 1]}, 1]},
+    }}]
+
+
+class FolderIndex:
+    """Folders of a project's documents, derived from each document's folder_path.
+
+    There is no folder collection: a folder exists while something is in
+    it. Listing a subtree, summarising it and moving it are each one
+    query against the documents collection.
+    """
+
+    def __init__(self, db: Callable[[], Any]):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db().documents.create_index(FOLDER_INDEX)
+
+    async def normalize_stored(self) -> int:
+        """Rewrite folder paths stored before they were normalized ("/plans/", "plans"); returns how many changed"""
+        collection = self.db().documents
+        changed = 0
+        for path in await collection.distinct("folder_path"):
+            if not isinstance(path, str):
+                continue
+            try:
+                canonical = normalize_folder(path)
+            except ValueError:
+                continue
+            if canonical != path:
+                result = await collection.update_many(
+                    {"folder_path": path}, {"$set": {"folder_path": canonical}, "$inc": {REV_FIELD: 1}}
+                )
+                changed += result.modified_count
+        return changed
+
+    def documents(self, project_id: str, folder: str, recursive: bool = False, latest_only: bool = True):
+        """Cursor over a folder's documents, or its whole subtree, in tree order"""
+        query = {"project_id": project_id}
+        query.update(subtree_filter(folder) if recursive else {"folder_path": folder})
+        if latest_only:
+            query["is_latest"] = True
+        return self.db().documents.find(query).sort([("folder_path", 1), ("name", 1)])
+
+    async def tree(self, project_id: str, folder: str = ROOT_FOLDER) -> List[Dict[str, Any]]:
+        """Document counts and sizes for every folder under `folder`, current versions only as listed"""
+        pipeline = [
+            {"$match": {"project_id": project_id, "is_latest": True, **subtree_filter(folder)}},
+            {"$group": {"_id": "$folder_path", "count": {"$sum": 1}, "size": {"$sum": {"$ifNull": ["$file_size", 0]}}}},
+        ]
+        rows = await self.db().documents.aggregate(pipeline).to_list(None)
+        return folder_tree(folder, rows)
+
+    async def move(self, project_id: str, source: str, target: str, session=None) -> int:
+        """Move (or rename) a folder with everything in it; returns how many documents moved.
+
+        Moving onto an existing folder merges the two. Raises ValueError for
+        the root folder and for moves into the folder's own subtree.
+        """
+        if ROOT_FOLDER in (source, target):
+            raise ValueError("The root folder cannot be moved or replaced")
+        if target == source or target.startswith(source + "/"):
+            raise ValueError("A folder cannot be moved into itself")
+        result = await self.db().documents.update_many(
+            {"project_id": project_id, **subtree_filter(source)}, move_update(source, target), session=session
+        )
+        return result.modified_count
@@ -0,0 +1,210 @@
+import numpy as np
+from datetime import datetime, timezone, date
+from typing import Dict, Optional, Any
+
+from analytics import parse_days
+
+
+# Fields needed to rebuild a project's daily spend buckets
+EXPENSE_FORECAST_FIELDS = {"_id": 0, "amount": 1, "currency": 1, "date": 1}
+
+# Two-sided 95% band around the fitted cumulative spend line
+CONFIDENCE_Z = 1.96
+
+
+def to_day(value) -> Optional[np.datetime64]:
+    """Convert a datetime/date/ISO string into a datetime64[D] (UTC calendar day)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return np.datetime64(value.date(), "D")
+    if isinstance(value, date):
+        return np.datetime64(value, "D")
+    day = parse_days([value])[0]
+    return None if np.isnat(day) else day
+
+
+class DailySpend:
+    """Per-day spend buckets for one project, anchored at the project start day"""
+
+    def __init__(self, origin: np.datetime64, amounts: Optional[np.ndarray] = None):
+        self.origin = origin
+        self.amounts = amounts if amounts is not None else np.zeros(1)
+
+    @classmethod
+    def from_columns(cls, origin: np.datetime64, amount: list, dates: list) -> "DailySpend":
+        amounts = np.nan_to_num(np.asarray(amount, dtype=np.float64))
+        if len(amounts) == 0:
+            return cls(origin)
+        offsets = (parse_days(dates) - origin).astype(np.int64)
+        # Undated or pre-start expenses count towards the first day
+        offsets = np.where(offsets < 0, 0, offsets)
+        return cls(origin, np.bincount(offsets, weights=amounts))
+
+    def add(self, day: Optional[np.datetime64], amount: float):
+        offset = 0 if day is None else max(int((day - self.origin).astype(np.int64)), 0)
+        if offset >= len(self.amounts):
+            self.amounts = np.concatenate([self.amounts, np.zeros(offset - len(self.amounts) + 1)])
+        self.amounts[offset] += amount
+
+    def through(self, days: int) -> np.ndarray:
+        """Daily amounts for the first `days` days, folding later spend into the last day"""
+        if days <= 0:
+            return np.zeros(0)
+        if len(self.amounts) <= days:
+            return np.concatenate([self.amounts, np.zeros(days - len(self.amounts))])
+        clipped = self.amounts[:days].copy()
+        clipped[-1] += self.amounts[days:].sum()
+        return clipped
+
+
+def fit_cumulative(cumulative: np.ndarray):
+    """Least-squares fit of cumulative spend against day index.
+
+    Returns (intercept, slope, residual standard error, mean x, Sxx) so
+    prediction intervals can be evaluated over any future day grid.
+    """
+    n = len(cumulative)
+    x = np.arange(n, dtype=np.float64)
+    if n < 2:
+        total = float(cumulative[-1]) if n else 0.0
+        return 0.0, total, 0.0, 0.0, 0.0
+    x_mean = x.mean()
+    y_mean = cumulative.mean()
+    sxx = float(((x - x_mean) ** 2).sum())
+    slope = float(((x - x_mean) * (cumulative - y_mean)).sum() / sxx)
+    intercept = float(y_mean - slope * x_mean)
+    residuals = cumulative - (intercept + slope * x)
+    dof = max(n - 2, 1)
+    sigma = float(np.sqrt((residuals ** 2).sum() / dof))
+    return intercept, slope, sigma, float(x_mean), sxx
+
+
+def compute_forecast(spend: DailySpend, budget: float, end_day: np.datetime64, today: np.datetime64) -> Dict[str, Any]:
+    """Project the cumulative spend curve to the project end date"""
+    observed_days = int((today - spend.origin).astype(np.int64)) + 1
+    total_days = max(int((end_day - spend.origin).astype(np.int64)) + 1, observed_days, 1)
+
+    daily = spend.through(max(observed_days, 0))
+    cumulative = np.cumsum(daily)
+    spent = float(cumulative[-1]) if len(cumulative) else 0.0
+    intercept, slope, sigma, x_mean, sxx = fit_cumulative(cumulative)
+    n = len(cumulative)
+
+    x = np.arange(total_days, dtype=np.float64)
+    # Anchor the projection at today's actual spend so the curve is continuous
+    last_x = max(n - 1, 0)
+    projected = spent + slope * (x - last_x)
+    projected[:n] = cumulative
+    if n >= 2 and sxx > 0:
+        spread = CONFIDENCE_Z * sigma * np.sqrt(1 + 1 / n + (x - x_mean) ** 2 / sxx)
+    else:
+        spread = np.zeros(total_days)
+    spread = np.where(x < n, 0.0, spread)
+    lower = np.maximum(projected - spread, spent if n else 0.0)
+    upper = projected + spread
+
+    days = spend.origin + np.arange(total_days).astype("timedelta64[D]")
+
+    def first_day_at_or_over(curve):
+        hits = np.flatnonzero(curve >= budget) if budget > 0 else np.array([], dtype=np.int64)
+        return str(days[hits[0]]) if len(hits) else None
+
+    exhaustion = first_day_at_or_over(projected)
+    if exhaustion is None and budget > 0 and slope > 0:
+        # Past the project window - extrapolate the line analytically
+        offset = int(np.ceil(last_x + (budget - spent) / slope))
+        exhaustion = str(spend.origin + np.timedelta64(offset, "D"))
+
+    return {
+        "budget": float(budget),
+        "total_expenses": spent,
+        "daily_burn_rate": slope,
+        "projected_total": float(projected[-1]),
+        "projected_variance": float(budget - projected[-1]),
+        "estimated_exhaustion_date": exhaustion,
+        "exhaustion_window": {
+            "earliest": first_day_at_or_over(upper),
+            "latest": first_day_at_or_over(lower),
+        },
+        "confidence_level": 0.95,
+        "curve": [
+            {
+                "date": str(days[i]),
+                "actual": float(cumulative[i]) if i < n else None,
+                "projected": float(projected[i]),
+                "lower": float(lower[i]),
+                "upper": float(upper[i]),
+            }
+            for i in range(total_days)
+        ],
+    }
+
+
+class ForecastCache:
+    """Per-project spend buckets and forecast results.
+
+    New expenses are folded into the cached buckets with record_expense, so a
+    forecast only needs the vectorized fit rerun. Edits and deletes can change
+    history arbitrarily and drop the project through invalidate.
+    """
+
+    def __init__(self):
+        self.spend: Dict[str, DailySpend] = {}
+        self.results: Dict[str, tuple] = {}
+        self.versions: Dict[str, int] = {}
+        self.epoch = 0
+        # Every change to any project's expenses; caches over the whole portfolio key on it
+        self.changes = 0
+
+    def version(self, project_id: str) -> tuple:
+        """Snapshot taken before loading buckets from the database"""
+        return (self.epoch, self.versions.get(project_id, 0))
+
+    def _bump(self, project_id: str):
+        self.versions[project_id] = self.versions.get(project_id, 0) + 1
+        self.changes += 1
+        self.results.pop(project_id, None)
+
+    def get_spend(self, project_id: str) -> Optional[DailySpend]:
+        return self.spend.get(project_id)
+
+    def put_spend(self, project_id: str, spend: DailySpend, version: tuple):
+        # A write landed while the buckets were loading, so they may already include it
+        if self.version(project_id) != version:
+            return
+        self.spend[project_id] = spend
+        self.results.pop(project_id, None)
+
+    def get_result(self, project_id: str, key: tuple) -> Optional[Dict[str, Any]]:
+        cached = self.results.get(project_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        return None
+
+    def put_result(self, project_id: str, key: tuple, result: Dict[str, Any]):
+        if project_id in self.spend:
+            self.results[project_id] = (key, result)
+
+    def record_expense(self, project_id: str, expense_date, amount: float):
+        self._bump(project_id)
+        spend = self.spend.get(project_id)
+        if spend is not None:
+            spend.add(to_day(expense_date), amount)
+
+    def record_remote_expense(self, project_id: str, expense_date=None, amount: float = 0.0):
+        """Another worker's expense: a load here may already include it, so reload instead of adding"""
+        self.invalidate(project_id)
+
+    def invalidate(self, project_id: str):
+        self.spend.pop(project_id, None)
+        self._bump(project_id)
+
+    def clear(self):
+        """Drop everything, including loads still in flight for any project"""
+        self.epoch += 1
+        self.changes += 1
+        self.spend.clear()
+        self.results.clear()
@@ -0,0 +1,247 @@
+import csv
+import logging
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from analytics import parse_days
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CURRENCY = "USD"
+
+# Rate files are CSVs with date, currency and rate columns; rate is units of the currency per unit of the base
+FX_RATE_FILE_PATTERN = "*.csv"
+FX_RATE_COLUMNS = ("date", "currency", "rate")
+
+_CURRENCY = re.compile(r"^[A-Z]{3}$")
+
+
+def normalize_currency(value: Optional[str]) -> Optional[str]:
+    """Upper-case ISO 4217 code; None stays None (the amount is in its project's currency)"""
+    if value is None:
+        return None
+    code = value.strip().upper()
+    if not _CURRENCY.match(code):
+        raise ValueError(f"Invalid currency '{value}'. Must be a three-letter ISO 4217 code")
+    return code
+
+
+def read_rate_files(directory: Path) -> Tuple[List[str], List[str], List[float], List[str]]:
+    """Date, currency and rate columns from every rate file in directory, in file name order"""
+    dates: List[str] = []
+    currencies: List[str] = []
+    rates: List[float] = []
+    sources: List[str] = []
+    if not directory.is_dir():
+        return dates, currencies, rates, sources
+    for path in sorted(directory.glob(FX_RATE_FILE_PATTERN)):
+        with path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            missing = [column for column in FX_RATE_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                logger.warning("Skipping FX rate file %s without columns %s", path.name, missing)
+                continue
+            for row in reader:
+                try:
+                    rate = float(row["rate"])
+                    currency = normalize_currency(row["currency"])
+                except (TypeError, ValueError):
+                    continue
+                dates.append((row["date"] or "").strip())
+                currencies.append(currency)
+                rates.append(rate)
+        sources.append(path.name)
+    return dates, currencies, rates, sources
+
+
+class FxRateTable:
+    """Exchange rates against one base currency, one column per calendar day.
+
+    Quotes are spread into a (currency, day) matrix and each currency's
+    last quote is carried forward over weekends and gaps (its first quote
+    covers the days before it), so converting any number of amounts is
+    two index lookups: the currency's row and the day's column. Days
+    outside the table use its first or last column; undated amounts use
+    the last. Row 0 is the base currency at 1.0.
+    """
+
+    def __init__(self, base: str, currencies: List[str], first_day: Optional[np.datetime64], rates: np.ndarray,
+                 sources: Tuple[str, ...] = ()):
+        self.base = base
+        self.currencies = currencies
+        self.row_index = {currency: row for row, currency in enumerate(currencies)}
+        self.first_day = first_day
+        self.rates = rates
+        self.sources = sources
+        self.loaded_at = datetime.now(timezone.utc)
+
+    @classmethod
+    def empty(cls, base: str = DEFAULT_CURRENCY) -> "FxRateTable":
+        return cls(base, [base], None, np.ones((1, 1)))
+
+    @classmethod
+    def from_quotes(cls, base: str, dates: List[str], currencies: List[str], rates: List[float],
+                    sources: Tuple[str, ...] = ()) -> "FxRateTable":
+        days = parse_days(dates)
+        values = np.asarray(rates, dtype=np.float64)
+        codes = np.asarray(currencies, dtype=object)
+        valid = ~np.isnat(days) & np.isfinite(values) & (values > 0) & (codes != base)
+        days, values, codes = days[valid], values[valid], codes[valid]
+        if not len(days):
+            return cls(base, [base], None, np.ones((1, 1)), sources)
+
+        keys, rows = np.unique(codes.astype(str), return_inverse=True)
+        first_day = days.min()
+        columns = (days - first_day).astype(np.int64)
+        matrix = np.full((len(keys) + 1, int(columns.max()) + 1), np.nan)
+        matrix[0] = 1.0
+        # Later quotes for the same day win
+        matrix[rows + 1, columns] = values
+
+        quoted = ~np.isnan(matrix)
+        last_quote = np.maximum.accumulate(np.where(quoted, np.arange(matrix.shape[1]), 0), axis=1)
+        first_quote = quoted.argmax(axis=1)
+        every_row = np.arange(matrix.shape[0])[:, None]
+        filled = matrix[every_row, last_quote]
+        filled = np.where(np.isnan(filled), matrix[every_row[:, 0], first_quote][:, None], filled)
+        return cls(base, [base] + [str(key) for key in keys], first_day, filled, sources)
+
+    @classmethod
+    def load(cls, directory, base: str = DEFAULT_CURRENCY) -> "FxRateTable":
+        dates, currencies, rates, sources = read_rate_files(Path(directory))
+        return cls.from_quotes(base, dates, currencies, rates, tuple(sources))
+
+    def knows(self, currency: str) -> bool:
+        return currency in self.row_index
+
+    def _key_rows(self, keys) -> np.ndarray:
+        """Row of each currency code in keys, then a trailing -1 that code -1 indexes"""
+        return np.array([self.row_index.get(str(key).upper(), -1) for key in keys] + [-1], dtype=np.int64)
+
+    def _columns(self, days: np.ndarray) -> np.ndarray:
+        last = self.rates.shape[1] - 1
+        if self.first_day is None:
+            return np.zeros(len(days), dtype=np.int64)
+        undated = np.isnat(days)
+        columns = np.clip((days - self.first_day).astype(np.int64), 0, last)
+        columns[undated] = last
+        return columns
+
+    def convert(self, amounts, currencies, days, targets) -> Tuple[np.ndarray, np.ndarray]:
+        """Amounts in targets at each day's rate, and a mask of those that could not be converted.
+
+        currencies and targets are per-row arrays or single codes; a None
+        currency means the amount is already in its target. Unconvertible
+        amounts come back as 0.
+        """
+        import pandas as pd
+        amounts = np.asarray(amounts, dtype=np.float64)
+        size = len(amounts)
+        targets = np.broadcast_to(np.asarray(targets, dtype=object), (size,))
+        currencies = np.broadcast_to(np.asarray(currencies, dtype=object), (size,))
+        # One vocabulary for both sides, so equal currencies get equal codes
+        codes, keys = pd.factorize(np.concatenate([targets, currencies]))
+        target_codes, currency_codes = codes[:size], codes[size:]
+        sources = np.where(currency_codes < 0, target_codes, currency_codes)
+        return self.convert_codes(amounts, sources, target_codes, keys, days)
+
+    def convert_codes(self, amounts, sources: np.ndarray, targets: np.ndarray, keys, days) -> Tuple[np.ndarray, np.ndarray]:
+        """convert() with currencies given as integer codes into keys, for columns already encoded"""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        size = len(amounts)
+        moving = sources != targets
+        if not moving.any():
+            return amounts.copy(), np.zeros(size, dtype=bool)
+
+        key_rows = self._key_rows(keys)
+        from_rows = key_rows[sources[moving]]
+        to_rows = key_rows[targets[moving]]
+        columns = self._columns(np.asarray(days, dtype="datetime64[D]")[moving])
+        known = (from_rows >= 0) & (to_rows >= 0)
+        factor = np.zeros(len(from_rows))
+        factor[known] = (
+            self.rates[to_rows[known], columns[known]] / self.rates[from_rows[known], columns[known]]
+        )
+        converted = amounts.copy()
+        converted[moving] *= factor
+        unconverted = np.zeros(size, dtype=bool)
+        unconverted[np.flatnonzero(moving)[~known]] = True
+        return converted, unconverted
+
+    def describe(self) -> Dict[str, Any]:
+        last_day = None if self.first_day is None else self.first_day + np.timedelta64(self.rates.shape[1] - 1, "D")
+        return {
+            "base": self.base,
+            "currencies": sorted(self.currencies),
+            "first_day": None if self.first_day is None else str(self.first_day),
+            "last_day": None if last_day is None else str(last_day),
+            "sources": list(self.sources),
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+class FxRates:
+    """The current rate table, reloaded from its directory on demand.
+
+    on_reload runs after every load, for caches holding converted amounts.
+    """
+
+    def __init__(self, directory, base: str = DEFAULT_CURRENCY, on_reload: Optional[Callable[[], Any]] = None):
+        self.directory = Path(directory)
+        self.base = base
+        self.on_reload = on_reload
+        self.table = FxRateTable.empty(base)
+
+    def load(self) -> FxRateTable:
+        self.table = FxRateTable.load(self.directory, self.base)
+        if self.on_reload is not None:
+            self.on_reload()
+        return self.table
+
+    def reload(self) -> FxRateTable:
+        """load(), as an event other workers replay"""
+        return self.load()
+
+
+def spend_by_currency_pipeline(match: dict, by_project: bool = False) -> List[dict]:
+    """Expense totals per (currency, day), and per project with by_project: the rows a conversion needs, summed by Mongo"""
+    key = {"currency": "$currency", "day": {"$substrCP": [{"$ifNull": ["$date", ""]}, 0, 10]}}
+    if by_project:
+        key["project_id"] = "$project_id"
+    return [
+        {"$match": match},
+        {"$group": {"_id": key, "amount": {"$sum": "$amount"}}},
+    ]
+
+
+def convert_columns(columns: Dict[str, list], table: FxRateTable, currency: str) -> np.ndarray:
+    """Amount column of loaded expense rows in currency; unconvertible rows count as 0"""
+    amounts = np.nan_to_num(np.asarray(columns["amount"], dtype=np.float64))
+    converted, _ = table.convert(amounts, columns.get("currency") or None, parse_days(columns["date"]), currency)
+    return converted
+
+
+def convert_spend(groups: List[dict], table: FxRateTable, currency: str,
+                  project_currencies: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Total of spend_by_currency_pipeline rows in currency, with what could not be converted.
+
+    Rows without a currency are already in currency, or with
+    project_currencies (rows grouped by_project) in their project's.
+    """
+    amounts = [group.get("amount") or 0.0 for group in groups]
+    currencies = [group["_id"].get("currency") for group in groups]
+    if project_currencies is not None:
+        currencies = [
+            code or project_currencies.get(group["_id"].get("project_id")) for code, group in zip(currencies, groups)
+        ]
+    days = parse_days([group["_id"].get("day") or None for group in groups])
+    converted, unconverted = table.convert(amounts, currencies, days, currency)
+    missing: Dict[str, float] = {}
+    for i in np.flatnonzero(unconverted):
+        missing[currencies[i]] = missing.get(currencies[i], 0.0) + float(amounts[i])
+    return {"total": float(converted.sum()), "unconverted": missing}
@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Callable, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import Headers
+
+from responses import MSGPACK_MEDIA_TYPE, encode_json, encode_msgpack, msgpack, response_format
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+# How long a stored response can be replayed; also the TTL index expiry
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+# A claim whose owner hasn't renewed it for this long belongs to a worker that
+# died mid-request; owners renew several times per period for as long as the
+# request runs, so long imports and uploads keep their key
+IDEMPOTENCY_LOCK_SECONDS = 60
+HEARTBEATS_PER_LOCK = 4
+
+# Responses larger than this are not stored; the key is released instead
+MAX_STORED_RESPONSE_BYTES = 1024 * 1024
+
+# Headers recomputed or added on replay rather than stored
+UNSTORED_HEADERS = {b"content-length", b"idempotent-replayed"}
+
+
+async def ensure_ttl_index(collection, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+    await collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _client(headers: Headers) -> str:
+    """Who sent the request, so two clients can't replay each other's keys"""
+    authorization = headers.get("authorization")
+    if authorization:
+        # Hashed so credentials never land in the collection
+        return "auth:" + hashlib.sha256(authorization.encode("latin-1")).hexdigest()[:32]
+    user = headers.get("x-user-id")
+    return f"user:{user}" if user else "anonymous"
+
+
+def _fingerprint():
+    """Hash of the request body; the path and query string are in the record id"""
+    return hashlib.sha256()
+
+
+MEDIA_TYPES = {"json": "application/json", "msgpack": MSGPACK_MEDIA_TYPE}
+
+
+def _transcode(record, wanted: str):
+    """The stored headers and body re-encoded for the format this retry negotiated.
+
+    Only bodies APIResponse rendered in the negotiated format are re-encoded;
+    anything else (files, plain errors) replays as stored.
+    """
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+    stored = record.get("format", "json")
+    content_type = dict(headers).get(b"content-type", b"").decode("latin-1").split(";")[0].strip()
+    if stored == wanted or msgpack is None or content_type != MEDIA_TYPES[stored]:
+        return headers, record["body"]
+    if stored == "msgpack":
+        content = msgpack.unpackb(record["body"])
+        body = encode_json(content)
+    else:
+        content = json.loads(record["body"])
+        body = encode_msgpack(content)
+    headers = [(name, value) for name, value in headers if name.lower() != b"content-type"]
+    headers.append((b"content-type", MEDIA_TYPES[wanted].encode("latin-1")))
+    return headers, body
+
+
+def _error(status: int, detail: str, headers: Optional[List[tuple]] = None):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    return status, [(b"content-type", b"application/json"), *(headers or [])], body
+
+
+class IdempotencyMiddleware:
+    """Replay the first response for POST requests that carry an Idempotency-Key.
+
+    The first request with a key claims it with an insert into a TTL-indexed
+    collection, runs, and stores its response. Retries with the same key and
+    body get that response back without running the endpoint again. A retry
+    with a different body gets 422, and one that arrives while the first is
+    still running gets 409. Failed requests (exceptions and 5xx) release the
+    key so the client can try again. Keys are scoped to the client (its
+    Authorization or X-User-Id header), the path and the query string.
+
+    Runs inside ContentNegotiationMiddleware, so the stored body is in the
+    format the first request negotiated; a retry with a different Accept gets
+    it re-encoded rather than the first request's format.
+    """
+
+    def __init__(self, app, collection: Callable[[], object], ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, path_prefix: str = "/api/",
+                 lock_seconds: float = IDEMPOTENCY_LOCK_SECONDS):
+        self.app = app
+        self.collection = collection
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.lock = timedelta(seconds=lock_seconds)
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self._respond(send, *_error(400, f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"))
+            return
+
+        collection = self.collection()
+        target = scope["path"]
+        if scope.get("query_string"):
+            target += "?" + scope["query_string"].decode("latin-1")
+        record_id = f"{_client(headers)} {scope['method']} {target} {key}"
+        if not await self._claim(collection, record_id):
+            await self._replay(collection, record_id, receive, send)
+            return
+
+        fingerprint = _fingerprint()
+
+        async def hashing_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                fingerprint.update(message.get("body", b""))
+            return message
+
+        capture = _ResponseCapture(send)
+        heartbeat = asyncio.create_task(self._heartbeat(collection, record_id))
+        try:
+            await self.app(scope, hashing_receive, capture.send)
+        except BaseException:
+            heartbeat.cancel()
+            await self._release(collection, record_id)
+            raise
+        heartbeat.cancel()
+
+        if capture.status is None or capture.status >= 500 or capture.too_large:
+            await self._release(collection, record_id)
+            return
+        try:
+            await collection.update_one({"_id": record_id}, {"$set": {
+                "state": "completed",
+                "fingerprint": fingerprint.hexdigest(),
+                "format": response_format.get(),
+                "status": capture.status,
+                "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in capture.headers if name.lower() not in UNSTORED_HEADERS],
+                "body": bytes(capture.body),
+            }})
+        except Exception:
+            # The response already went out; leave the claim to expire as abandoned
+            logger.exception("Failed to store response for idempotency key %s", record_id)
+
+    async def _claim(self, collection, record_id: str) -> bool:
+        """Insert the in-progress marker; False when the key is already taken"""
+        for _ in range(2):
+            now = datetime.now(timezone.utc)
+            try:
+                await collection.insert_one({"_id": record_id, "state": "in_progress", "created_at": now})
+                return True
+            except DuplicateKeyError:
+                existing = await collection.find_one({"_id": record_id})
+                if existing is None:
+                    continue
+                created_at = _aware(existing["created_at"])
+                renewed_at = _aware(existing.get("renewed_at") or existing["created_at"])
+                expired = now - created_at > self.ttl
+                abandoned = existing["state"] == "in_progress" and now - renewed_at > self.lock
+                if not (expired or abandoned):
+                    return False
+                # The TTL monitor hasn't caught up yet, or the owner died; take the key over
+                await collection.delete_one({"_id": record_id, "created_at": existing["created_at"]})
+        return False
+
+    async def _heartbeat(self, collection, record_id: str):
+        """Renew the claim while the request runs so it isn't taken over as abandoned"""
+        interval = self.lock.total_seconds() / HEARTBEATS_PER_LOCK
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await collection.update_one(
+                    {"_id": record_id, "state": "in_progress"}, {"$set": {"renewed_at": datetime.now(timezone.utc)}}
+                )
+            except Exception:
+                logger.warning("Failed to renew idempotency key %s", record_id, exc_info=True)
+
+    async def _release(self, collection, record_id: str):
+        try:
+            await collection.delete_one({"_id": record_id, "state": "in_progress"})
+        except Exception:
+            logger.exception("Failed to release idempotency key %s", record_id)
+
+    async def _replay(self, collection, record_id: str, receive, send):
+        fingerprint = _fingerprint()
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            fingerprint.update(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        record = await collection.find_one({"_id": record_id})
+        if record is None or record["state"] == "in_progress":
+            await self._respond(send, *_error(409, "A request with this Idempotency-Key is still in progress", [(b"retry-after", b"1")]))
+            return
+        if record["fingerprint"] != fingerprint.hexdigest():
+            await self._respond(send, *_error(422, "Idempotency-Key was already used with a different request body"))
+            return
+        headers, body = _transcode(record, response_format.get())
+        headers.append((b"idempotent-replayed", b"true"))
+        await self._respond(send, record["status"], headers, body)
+
+    @staticmethod
+    async def _respond(send, status: int, headers: List[tuple], body: bytes):
+        headers = [*headers, (b"content-length", str(len(body)).encode("latin-1"))]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+class _ResponseCapture:
+    def __init__(self, send):
+        self._send = send
+        self.status: Optional[int] = None
+        self.headers: List[tuple] = []
+        self.body = bytearray()
+        self.too_large = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            self.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body" and not self.too_large:
+            self.body.extend(message.get("body", b""))
+            if len(self.body) > MAX_STORED_RESPONSE_BYTES:
+                self.too_large = True
+                self.body = bytearray()
+        await self._send(message)
@@ -0,0 +1,154 @@
+import csv
+import io
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+
+# Rows validated and written per bulk insert
+IMPORT_CHUNK_SIZE = 1000
+
+# Cap on row errors echoed back so a bad file can't blow up the response
+MAX_REPORTED_ERRORS = 1000
+
+SUPPORTED_IMPORT_SUFFIXES = (".csv", ".xlsx")
+
+
+class ImportFileError(ValueError):
+    """The upload can't be read as the file type its name claims"""
+
+
+def _clean_value(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def clean_row(row: Dict[Any, Any]) -> Dict[str, Any]:
+    """Drop blank cells and unnamed overflow columns so model defaults apply"""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None or not str(key).strip():
+            continue
+        value = _clean_value(value)
+        if value is not None:
+            cleaned[str(key).strip()] = value
+    return cleaned
+
+
+def iter_csv_rows(binary_file) -> Iterator[Dict[str, Any]]:
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        for row in csv.DictReader(text):
+            yield clean_row(row)
+    except UnicodeDecodeError:
+        raise ImportFileError("CSV file must be UTF-8 encoded")
+    except csv.Error as e:
+        raise ImportFileError(f"Invalid CSV file: {e}")
+
+
+def iter_xlsx_rows(binary_file) -> Iterator[Dict[str, Any]]:
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    try:
+        workbook = load_workbook(binary_file, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile, KeyError, OSError) as e:
+        raise ImportFileError(f"Invalid XLSX file: {e}")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(cell).strip() if cell is not None else None for cell in header]
+        for values in rows:
+            yield clean_row(dict(zip(header, values)))
+    finally:
+        workbook.close()
+
+
+def open_row_reader(filename: Optional[str], binary_file) -> Iterator[Dict[str, Any]]:
+    """Pick a streaming row reader from the upload's file extension"""
+    suffix = Path(filename or "").suffix.lower()
+    if suffix == ".csv":
+        return iter_csv_rows(binary_file)
+    if suffix == ".xlsx":
+        return iter_xlsx_rows(binary_file)
+    raise ValueError(f"Unsupported file type. Must be one of: {list(SUPPORTED_IMPORT_SUFFIXES)}")
+
+
+def number_rows(rows: Iterator[Dict[str, Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Non-blank rows with their spreadsheet row numbers (the header is row 1)"""
+    return ((row_number, row) for row_number, row in enumerate(rows, start=2) if row)
+
+
+def read_chunk(numbered_rows: Iterator[Tuple[int, Dict[str, Any]]], size: int = IMPORT_CHUNK_SIZE) -> List[Tuple[int, Dict[str, Any]]]:
+    chunk = []
+    for item in numbered_rows:
+        chunk.append(item)
+        if len(chunk) >= size:
+            break
+    return chunk
+
+
+def validate_chunk(model, chunk: List[Tuple[int, Dict[str, Any]]], defaults: Optional[Dict[str, Any]] = None):
+    """Validate a chunk of rows against a create model.
+
+    Returns (valid, errors) where valid is a list of (row_number, model)
+    pairs and errors is a list of row-level error records.
+    """
+    valid = []
+    errors = []
+    for row_number, row in chunk:
+        if defaults:
+            row = {**defaults, **row}
+        try:
+            valid.append((row_number, model(**row)))
+        except ValidationError as e:
+            errors.append({
+                "row": row_number,
+                "errors": [
+                    {"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]}
+                    for error in e.errors()
+                ],
+            })
+    return valid, errors
+
+
+class ImportReport:
+    """Row counts and row-level errors for one import request"""
+
+    def __init__(self, entity: str):
+        self.entity = entity
+        self.total_rows = 0
+        self.imported = 0
+        self.expenses_created = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def add_errors(self, errors: List[dict]):
+        self.failed += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def add_rejected(self, rejected: Dict[int, str], valid: List[Tuple[int, Any]]):
+        """Rows of valid the database refused, by their index in it"""
+        self.add_errors([
+            {"row": valid[index][0], "errors": [{"field": "row", "message": message}]}
+            for index, message in sorted(rejected.items())
+        ])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "entity": self.entity,
+            "total_rows": self.total_rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "expenses_created": self.expenses_created,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
@@ -0,0 +1,193 @@
+import logging
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from timestamps import range_bound
+
+
+logger = logging.getLogger(__name__)
+
+# Largest page a list endpoint returns, matching the previous to_list(1000) cap
+MAX_LIST_LIMIT = 1000
+
+# Query parameters every list endpoint understands besides its filters
+RESERVED_PARAMS = ("sort", "fields", "limit", "skip")
+
+RANGE_SUFFIXES = {
+    "number": (("_min", "$gte"), ("_max", "$lte")),
+    "datetime": (("_from", "$gte"), ("_to", "$lte")),
+}
+
+TRUE_VALUES = {"true", "1", "yes"}
+FALSE_VALUES = {"false", "0", "no"}
+
+
+class ListQuerySpec:
+    """Filterable, sortable and projectable fields of one list endpoint.
+
+    filters maps a stored field to its kind:
+      "enum"      field=a,b            -> $in over the allowed choices
+      "string"    field=a,b            -> exact match / $in
+      "bool"      field=true|false
+      "number"    field_min / field_max -> $gte / $lte
+      "datetime"  field_from / field_to -> $gte / $lte on the stored UTC string;
+                  a date-only field_to covers that whole day ($lt the next one)
+    """
+
+    def __init__(self, fields: List[str], filters: Dict[str, str], choices: Optional[Dict[str, List[str]]] = None,
+                 sortable: Optional[List[str]] = None, default_sort: Optional[List[Tuple[str, int]]] = None):
+        self.fields = list(fields)
+        self.filters = dict(filters)
+        self.choices = choices or {}
+        self.sortable = list(sortable or fields)
+        self.default_sort = default_sort or []
+
+        # query parameter -> (field, mongo operator or None for equality)
+        self.params: Dict[str, Tuple[str, Optional[str]]] = {}
+        for field, kind in self.filters.items():
+            if kind in RANGE_SUFFIXES:
+                for suffix, operator in RANGE_SUFFIXES[kind]:
+                    self.params[field + suffix] = (field, operator)
+            else:
+                self.params[field] = (field, None)
+
+    def allowed_params(self) -> List[str]:
+        return sorted(self.params) + list(RESERVED_PARAMS)
+
+
+def _parse_filter_value(spec: ListQuerySpec, param: str, field: str, raw: str):
+    kind = spec.filters[field]
+    if kind == "bool":
+        value = raw.strip().lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        raise ValueError(f"Invalid value for {param}. Must be true or false")
+    if kind == "number":
+        try:
+            return float(raw)
+        except ValueError:
+            raise ValueError(f"Invalid value for {param}. Must be a number")
+    values = [value.strip() for value in raw.split(",") if value.strip()]
+    if not values:
+        raise ValueError(f"Invalid value for {param}. Must not be empty")
+    if kind == "enum":
+        allowed = spec.choices[field]
+        invalid = [value for value in values if value not in allowed]
+        if invalid:
+            raise ValueError(f"Invalid value for {param}. Must be one of: {allowed}")
+    return values[0] if len(values) == 1 else {"$in": values}
+
+
+def build_filter(spec: ListQuerySpec, params: Mapping[str, str], base: Optional[dict] = None) -> dict:
+    """Mongo filter from request query parameters.
+
+    Parameters that aren't filters of this endpoint are ignored (and
+    logged), as they were before filtering existed; they never touch base.
+    """
+    query: Dict[str, Any] = dict(base or {})
+    for param, raw in params.items():
+        if param in RESERVED_PARAMS:
+            continue
+        if param not in spec.params:
+            logger.debug("Ignoring unknown query parameter %r; filters are %s", param, spec.allowed_params())
+            continue
+        field, operator = spec.params[param]
+        if spec.filters[field] == "datetime":
+            try:
+                operator, value = range_bound(raw, upper=operator == "$lte")
+            except ValueError:
+                raise ValueError(f"Invalid value for {param}. Must be an ISO 8601 date or datetime")
+        else:
+            value = _parse_filter_value(spec, param, field, raw)
+        if operator is None:
+            query[field] = value
+        else:
+            query.setdefault(field, {})[operator] = value
+    return query
+
+
+def parse_sort(spec: ListQuerySpec, sort: Optional[str]) -> List[Tuple[str, int]]:
+    """Parse "-date,amount" into [("date", -1), ("amount", 1)]"""
+    if not sort:
+        return list(spec.default_sort)
+    keys = []
+    seen = set()
+    for item in sort.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        direction = -1 if item.startswith("-") else 1
+        field = item.lstrip("+-")
+        if field not in spec.sortable:
+            raise ValueError(f"Invalid sort field '{field}'. Must be one of: {spec.sortable}")
+        if field not in seen:
+            seen.add(field)
+            keys.append((field, direction))
+    # A unique tiebreaker keeps paging with skip stable
+    if keys and "id" not in seen:
+        keys.append(("id", 1))
+    return keys
+
+
+def parse_fields(spec: ListQuerySpec, fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Mongo projection for fields=a,b; None means the full document"""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in requested if field not in spec.fields]
+    if invalid:
+        raise ValueError(f"Invalid fields {invalid}. Must be among: {spec.fields}")
+    projection = {"_id": 0, "id": 1}
+    projection.update({field: 1 for field in requested})
+    return projection
+
+
+def parse_page(limit: Optional[int], skip: Optional[int]) -> Tuple[int, int]:
+    if limit is None:
+        limit = MAX_LIST_LIMIT
+    if limit < 1 or limit > MAX_LIST_LIMIT:
+        raise ValueError(f"Invalid limit. Must be between 1 and {MAX_LIST_LIMIT}")
+    skip = skip or 0
+    if skip < 0:
+        raise ValueError("Invalid skip. Must not be negative")
+    return limit, skip
+
+
+class ListQuery:
+    """A validated list request ready to run against a collection"""
+
+    def __init__(self, filter: dict, sort: List[Tuple[str, int]], projection: Optional[Dict[str, int]], limit: int, skip: int):
+        self.filter = filter
+        self.sort = sort
+        self.projection = projection
+        self.limit = limit
+        self.skip = skip
+
+    @classmethod
+    def parse(cls, spec: ListQuerySpec, params: Mapping[str, str], base: Optional[dict] = None) -> "ListQuery":
+        def to_int(name):
+            raw = params.get(name)
+            if raw is None:
+                return None
+            try:
+                return int(raw)
+            except ValueError:
+                raise ValueError(f"Invalid {name}. Must be an integer")
+
+        limit, skip = parse_page(to_int("limit"), to_int("skip"))
+        return cls(
+            build_filter(spec, params, base),
+            parse_sort(spec, params.get("sort")),
+            parse_fields(spec, params.get("fields")),
+            limit,
+            skip,
+        )
+
+    def cursor(self, collection):
+        cursor = collection.find(self.filter, self.projection)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        if self.skip:
+            cursor = cursor.skip(self.skip)
+        return cursor.limit(self.limit)
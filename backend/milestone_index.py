@@ -0,0 +1,175 @@
+import bisect
+import re
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+
+
+# Fields needed to index open milestones
+MILESTONE_INDEX_FIELDS = {"_id": 0, "id": 1, "title": 1, "project_id": 1, "due_date": 1}
+
+DURATION_PATTERN = re.compile(r"^\s*(\d+)\s*([hdw]?)\s*$")
+DURATION_UNITS = {"h": "hours", "d": "days", "w": "weeks", "": "days"}
+
+
+def parse_within(value: str) -> timedelta:
+    """Parse a window such as "7d", "12h", "2w" or a bare number of days"""
+    match = DURATION_PATTERN.match(value or "")
+    if not match:
+        raise ValueError("Invalid window. Use a number followed by h, d or w (e.g. 7d)")
+    amount, unit = match.groups()
+    return timedelta(**{DURATION_UNITS[unit.lower()]: int(amount)})
+
+
+def due_timestamp(value) -> Optional[float]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class DeadlineIndex:
+    """Open milestones kept sorted by due date, globally and per project/manager.
+
+    Each view is a sorted list of (due_timestamp, milestone_id) so overdue
+    and upcoming queries are a bisect plus a slice of the k matching rows.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.managers: Dict[str, str] = {}
+        self.views: Dict[str, List[Tuple[float, str]]] = {}
+        self.ready = False
+        self.refreshed_at: Optional[datetime] = None
+        self._replay: Optional[List[tuple]] = None
+
+    @staticmethod
+    def _view_keys(entry: Dict[str, Any]) -> List[str]:
+        keys = ["all", f"project:{entry['project_id']}"]
+        if entry.get("manager_id"):
+            keys.append(f"manager:{entry['manager_id']}")
+        return keys
+
+    def set_manager(self, project_id: str, manager_id: Optional[str]):
+        if manager_id:
+            self.managers[project_id] = manager_id
+
+    def add(self, milestone: Dict[str, Any]):
+        if self._replay is not None:
+            self._replay.append(("add", milestone))
+        self._discard(milestone["id"])
+        due = due_timestamp(milestone.get("due_date"))
+        if due is None:
+            return
+        entry = {
+            "id": milestone["id"],
+            "title": milestone.get("title"),
+            "project_id": milestone.get("project_id"),
+            "manager_id": self.managers.get(milestone.get("project_id")),
+            "due": due,
+        }
+        self.entries[entry["id"]] = entry
+        for key in self._view_keys(entry):
+            bisect.insort(self.views.setdefault(key, []), (due, entry["id"]))
+
+    def remove(self, milestone_id: str):
+        if self._replay is not None:
+            self._replay.append(("remove", milestone_id))
+        self._discard(milestone_id)
+
+    def _discard(self, milestone_id: str):
+        entry = self.entries.pop(milestone_id, None)
+        if entry is None:
+            return
+        item = (entry["due"], milestone_id)
+        for key in self._view_keys(entry):
+            view = self.views.get(key, [])
+            position = bisect.bisect_left(view, item)
+            if position < len(view) and view[position] == item:
+                view.pop(position)
+            if not view:
+                self.views.pop(key, None)
+
+    def begin_rebuild(self):
+        """Start recording writes so they survive the swap in rebuild"""
+        self._replay = []
+
+    def abort_rebuild(self):
+        self._replay = None
+
+    def rebuild(self, milestones: List[Dict[str, Any]], managers: Dict[str, str]):
+        """Replace the index contents from a full scan of open milestones"""
+        replay, self._replay = self._replay or [], None
+        entries: Dict[str, Dict[str, Any]] = {}
+        views: Dict[str, List[Tuple[float, str]]] = {}
+        for milestone in milestones:
+            due = due_timestamp(milestone.get("due_date"))
+            if due is None:
+                continue
+            entry = {
+                "id": milestone["id"],
+                "title": milestone.get("title"),
+                "project_id": milestone.get("project_id"),
+                "manager_id": managers.get(milestone.get("project_id")),
+                "due": due,
+            }
+            entries[entry["id"]] = entry
+            for key in self._view_keys(entry):
+                views.setdefault(key, []).append((due, entry["id"]))
+        for view in views.values():
+            view.sort()
+        self.entries = entries
+        self.managers = dict(managers)
+        self.views = views
+        # Writes that raced with the scan may or may not be in it; apply them again
+        for op in replay:
+            if op[0] == "add":
+                self.add(op[1])
+            else:
+                self.remove(op[1])
+        self.ready = True
+        self.refreshed_at = datetime.now(timezone.utc)
+
+    def _view(self, project_id: Optional[str], manager_id: Optional[str]) -> List[Tuple[float, str]]:
+        if project_id:
+            view = self.views.get(f"project:{project_id}", [])
+            if manager_id:
+                return [item for item in view if self.entries[item[1]]["manager_id"] == manager_id]
+            return view
+        if manager_id:
+            return self.views.get(f"manager:{manager_id}", [])
+        return self.views.get("all", [])
+
+    def _row(self, milestone_id: str, now_ts: float) -> Dict[str, Any]:
+        entry = self.entries[milestone_id]
+        return {
+            "id": entry["id"],
+            "title": entry["title"],
+            "project_id": entry["project_id"],
+            "manager_id": entry["manager_id"],
+            "due_date": datetime.fromtimestamp(entry["due"], timezone.utc).isoformat(),
+            "days_until_due": round((entry["due"] - now_ts) / 86400, 2),
+        }
+
+    def count_overdue(self, now: datetime, project_id: Optional[str] = None, manager_id: Optional[str] = None) -> int:
+        return bisect.bisect_left(self._view(project_id, manager_id), (now.timestamp(), ""))
+
+    def overdue(self, now: datetime, project_id: Optional[str] = None, manager_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Open milestones past due, most overdue first"""
+        now_ts = now.timestamp()
+        view = self._view(project_id, manager_id)
+        end = min(bisect.bisect_left(view, (now_ts, "")), limit)
+        return [self._row(milestone_id, now_ts) for _, milestone_id in view[:end]]
+
+    def upcoming(self, now: datetime, within: timedelta, project_id: Optional[str] = None, manager_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Open milestones due between now and now + within, soonest first"""
+        now_ts = now.timestamp()
+        view = self._view(project_id, manager_id)
+        start = bisect.bisect_left(view, (now_ts, ""))
+        end = min(bisect.bisect_right(view, ((now + within).timestamp(), "\uffff")), start + limit)
+        return [self._row(milestone_id, now_ts) for _, milestone_id in view[start:end]]
@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional
+
+
+# Longest edge of image and PDF thumbnails, in pixels
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 80
+
+# Text previews are the start of the file, cut at a line break
+TEXT_SNIPPET_BYTES = 4096
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+PDF_EXTENSIONS = {".pdf"}
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".tsv", ".json", ".log", ".xml", ".yaml", ".yml"}
+
+PREVIEW_MEDIA_TYPES = {
+    "image": "image/jpeg",
+    "pdf": "image/jpeg",
+    "text": "text/plain; charset=utf-8",
+}
+
+# Modules each kind of preview needs; kinds whose modules are missing are skipped
+PREVIEW_REQUIREMENTS = {
+    "image": ("PIL",),
+    "pdf": ("PIL", "pypdfium2"),
+    "text": (),
+}
+
+
+def preview_kind(filename: str) -> Optional[str]:
+    """The preview a file gets, or None when its type has none or the libraries are missing"""
+    extension = Path(filename).suffix.lower()
+    if extension in IMAGE_EXTENSIONS:
+        kind = "image"
+    elif extension in PDF_EXTENSIONS:
+        kind = "pdf"
+    elif extension in TEXT_EXTENSIONS:
+        kind = "text"
+    else:
+        return None
+    return kind if _supported(kind) else None
+
+
+@functools.lru_cache(maxsize=None)
+def _supported(kind: str) -> bool:
+    return all(importlib.util.find_spec(module) is not None for module in PREVIEW_REQUIREMENTS[kind])
+
+
+def preview_path(file_path: Path, kind: str) -> Path:
+    """Previews are stored beside the blob they were made from"""
+    suffix = ".preview.txt" if kind == "text" else ".preview.jpg"
+    return file_path.with_name(file_path.name + suffix)
+
+
+def _save_thumbnail(image, target: Path):
+    from PIL import Image
+
+    image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    if image.mode != "RGB":
+        # Flatten transparency onto white rather than black
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    image.save(target, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+
+
+def _image_preview(source: Path, target: Path):
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        # Lets JPEG decode at a reduced scale instead of full resolution
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = ImageOps.exif_transpose(image)
+        _save_thumbnail(image, target)
+
+
+def _pdf_preview(source: Path, target: Path):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(str(source))
+    try:
+        page = pdf[0]
+        width, height = page.get_size()
+        # Render straight at thumbnail scale; the page is never rasterised full size
+        bitmap = page.render(scale=THUMBNAIL_SIZE / max(width, height, 1))
+        _save_thumbnail(bitmap.to_pil(), target)
+    finally:
+        pdf.close()
+
+
+def _text_preview(source: Path, target: Path):
+    with open(source, "rb") as f:
+        head = f.read(TEXT_SNIPPET_BYTES + 1)
+    if len(head) > TEXT_SNIPPET_BYTES:
+        head = head[:TEXT_SNIPPET_BYTES]
+        if b"\n" in head:
+            head = head[:head.rindex(b"\n") + 1]
+    target.write_text(head.decode("utf-8", errors="replace"), encoding="utf-8")
+
+
+PREVIEW_BUILDERS = {
+    "image": _image_preview,
+    "pdf": _pdf_preview,
+    "text": _text_preview,
+}
+
+
+def generate_preview(file_path: str, kind: str) -> Dict[str, object]:
+    """Build the preview for one blob. Runs in a pool process."""
+    source = Path(file_path)
+    target = preview_path(source, kind)
+    partial = target.with_name(target.name + ".part")
+    try:
+        PREVIEW_BUILDERS[kind](source, partial)
+        os.replace(partial, target)
+    finally:
+        partial.unlink(missing_ok=True)
+    return {"path": str(target), "media_type": PREVIEW_MEDIA_TYPES[kind], "size": target.stat().st_size}
+
+
+class PreviewPool:
+    """Process pool for preview rendering and other CPU-bound blob work, so it never holds up the event loop.
+
+    Created on first use in each worker process. Uses spawn, since forking
+    a process that already runs the Mongo client's threads is unsafe.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    async def generate(self, file_path: str, kind: str) -> Dict[str, object]:
+        return await self.run(generate_preview, file_path, kind)
+
+    async def run(self, fn, *args):
+        """Run a module-level function in the pool"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        except BrokenProcessPool:
+            # A render crashed its process; start a fresh pool for the next one
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,284 @@
+import json
+import zlib
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - MessagePack is opt-in
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - br is skipped in negotiation
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is skipped in negotiation
+    zstandard = None
+
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+# Bodies smaller than this go out uncompressed; the framing overhead isn't worth it
+COMPRESSION_MINIMUM_SIZE = 1024
+
+# Levels tuned for per-request latency rather than maximum ratio
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# Content types that are already compressed or gain too little to spend CPU on
+INCOMPRESSIBLE_TYPES = (
+    "image/", "video/", "audio/",
+    "application/zip", "application/gzip", "application/x-7z-compressed",
+    "application/vnd.apache.parquet", "application/pdf",
+)
+
+# Set per request by ContentNegotiationMiddleware and read when a response renders
+response_format: ContextVar[str] = ContextVar("response_format", default="json")
+
+
+def _msgpack_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+
+def encode_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default, datetime=False)
+
+
+class APIResponse(JSONResponse):
+    """Default response class for api_router routes.
+
+    Encodes with orjson (stdlib json when it isn't installed), or as
+    MessagePack when the client negotiated it through the Accept header.
+    """
+
+    def init_headers(self, headers=None):
+        super().init_headers(headers)
+        if msgpack is not None:
+            self.headers.add_vary_header("Accept")
+
+    def render(self, content: Any) -> bytes:
+        if response_format.get() == "msgpack":
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return encode_msgpack(content)
+        return encode_json(content)
+
+
+def parse_quality_list(value: str) -> Dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into {token: q}"""
+    qualities: Dict[str, float] = {}
+    for item in value.split(","):
+        parts = [part.strip() for part in item.split(";")]
+        token = parts[0].lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(raw)
+                except ValueError:
+                    q = 0.0
+        qualities[token] = max(q, qualities.get(token, 0.0))
+    return qualities
+
+
+def wants_msgpack(accept: str) -> bool:
+    if msgpack is None or not accept:
+        return False
+    qualities = parse_quality_list(accept)
+    msgpack_q = max((qualities.get(media_type, 0.0) for media_type in MSGPACK_MEDIA_TYPES), default=0.0)
+    json_q = max(qualities.get("application/json", 0.0), qualities.get("*/*", 0.0), qualities.get("application/*", 0.0))
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+
+class ContentNegotiationMiddleware:
+    """Pick JSON or MessagePack for the request from its Accept header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = response_format.set("msgpack" if wants_msgpack(Headers(scope=scope).get("accept", "")) else "json")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_format.reset(token)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encoders() -> List[type]:
+    """Encoders in server preference order, limited to installed codecs"""
+    encoders = []
+    if zstandard is not None:
+        encoders.append(ZstdEncoder)
+    if brotli is not None:
+        encoders.append(BrotliEncoder)
+    encoders.append(GzipEncoder)
+    return encoders
+
+
+def choose_encoder(accept_encoding: str, encoders: List[type]) -> Optional[type]:
+    """Highest-q coding the client accepts; ties go to the server's preference"""
+    if not accept_encoding:
+        return None
+    qualities = parse_quality_list(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    best: Tuple[float, Optional[type]] = (0.0, None)
+    for encoder in encoders:
+        q = qualities.get(encoder.name, wildcard)
+        if q > best[0]:
+            best = (q, encoder)
+    return best[1]
+
+
+class CompressionMiddleware:
+    """Negotiated gzip/br/zstd response compression with a size threshold.
+
+    Single-message bodies are compressed only past minimum_size; streamed
+    bodies are compressed chunk by chunk and flushed so clients still see
+    data as it is produced.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE, encoders: Optional[List[type]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = encoders if encoders is not None else available_encoders()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoder_class = choose_encoder(Headers(scope=scope).get("accept-encoding", ""), self.encoders)
+        if encoder_class is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(send, encoder_class, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoder_class, minimum_size: int):
+        self._send = send
+        self.encoder_class = encoder_class
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        if self.start_message["status"] in (204, 206, 304):
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return not content_type.startswith(INCOMPRESSIBLE_TYPES)
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            if self.start_message is not None:
+                await self._send(self.start_message)
+                self.start_message = None
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            if not self._compressible(headers) or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self._send(self.start_message)
+                self.start_message = None
+                await self._send(message)
+                return
+
+            self.encoder = self.encoder_class()
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                body = self.encoder.compress(body)
+            else:
+                body = self.encoder.compress(body) + self.encoder.finish()
+                headers["Content-Length"] = str(len(body))
+            await self._send(self.start_message)
+            self.start_message = None
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        body = self.encoder.compress(body) if body else b""
+        if not more_body:
+            body += self.encoder.finish()
+        if body or not more_body:
+            await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,77 @@
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+
+
+# Every stored document carries a revision, 1 on insert and bumped by each write
+REV_FIELD = "rev"
+
+# Collections whose documents are revisioned
+REVISIONED_COLLECTIONS = ("users", "projects", "resources", "milestones", "expenses", "documents")
+
+
+class RevisionConflict(Exception):
+    """The document exists but not at the revision the client said it had"""
+
+    def __init__(self, current: Optional[int]):
+        super().__init__(f"Document is at revision {current}")
+        self.current = current
+
+
+def etag(rev: int) -> str:
+    return f'"{rev}"'
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """The revision an If-Match header requires, or None when any revision will do"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value == "*":
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        rev = int(value.strip('"'))
+    except ValueError:
+        raise ValueError('If-Match must be a single revision ETag such as "3"')
+    if rev < 1:
+        raise ValueError("If-Match revision must be a positive integer")
+    return rev
+
+
+def bump(update: Dict[str, Any], field: str = REV_FIELD) -> Dict[str, Any]:
+    """The update with the revision increment folded in"""
+    return {**update, "$inc": {**update.get("$inc", {}), field: 1}}
+
+
+async def update_revision(collection, query: Dict[str, Any], update: Dict[str, Any], expected: Optional[int] = None, session=None):
+    """Apply update to the document matching query and return it as updated.
+
+    With expected set, the update only applies at that revision. The
+    existence check is folded into the same find_one_and_update; only a
+    miss costs a second read, to tell a missing document (LookupError) from
+    one at another revision (RevisionConflict).
+    """
+    conditional = {**query, REV_FIELD: expected} if expected is not None else query
+    doc = await collection.find_one_and_update(
+        conditional, bump(update), return_document=ReturnDocument.AFTER, session=session
+    )
+    if doc is not None:
+        return doc
+    if expected is not None:
+        current = await collection.find_one(query, {REV_FIELD: 1}, session=session)
+        if current is not None:
+            raise RevisionConflict(current.get(REV_FIELD))
+    raise LookupError("Document not found")
+
+
+async def backfill_revisions(db):
+    """Give documents written before revisions existed their first one"""
+    for name in REVISIONED_COLLECTIONS:
+        await db[name].update_many({REV_FIELD: {"$exists": False}}, {"$set": {REV_FIELD: 1}})
+    # Expenses embedded on resources carry their own
+    await db.resources.update_many(
+        {"expense": {"$type": "object"}, f"expense.{REV_FIELD}": {"$exists": False}},
+        {"$set": {f"expense.{REV_FIELD}": 1}}
+    )
@@ -0,0 +1,281 @@
+from collections import deque
+from functools import lru_cache
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from milestone_index import due_timestamp
+
+
+# Fields needed to schedule a project's milestones
+SCHEDULE_MILESTONE_FIELDS = {
+    "_id": 0, "id": 1, "title": 1, "due_date": 1, "completed": 1, "completed_date": 1,
+    "depends_on": 1, "duration_days": 1,
+}
+
+# Slack at or below this many days puts a milestone on the critical path
+CRITICAL_SLACK_DAYS = 1e-6
+
+SECONDS_PER_DAY = 86400.0
+
+
+def to_days(value) -> Optional[float]:
+    """Days since the epoch for an ISO string or datetime; None when missing or unparseable"""
+    timestamp = due_timestamp(value)
+    return None if timestamp is None else timestamp / SECONDS_PER_DAY
+
+
+# Projected dates repeat heavily across a project's milestones
+@lru_cache(maxsize=4096)
+def from_days(days: float) -> str:
+    return datetime.fromtimestamp(days * SECONDS_PER_DAY, timezone.utc).isoformat()
+
+
+def start_of(day: date) -> float:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() / SECONDS_PER_DAY
+
+
+class CycleError(ValueError):
+    def __init__(self, milestone_ids: List[str]):
+        super().__init__(f"Milestone dependencies form a cycle through: {sorted(milestone_ids)}")
+        self.milestone_ids = milestone_ids
+
+
+def successor_lists(predecessors: List[List[int]]) -> List[List[int]]:
+    successors: List[List[int]] = [[] for _ in predecessors]
+    for node, preds in enumerate(predecessors):
+        for pred in preds:
+            successors[pred].append(node)
+    return successors
+
+
+def topological_order(predecessors: List[List[int]], successors: Optional[List[List[int]]] = None) -> List[int]:
+    """Kahn's algorithm over node indexes; raises CycleError naming the nodes left on a cycle"""
+    count = len(predecessors)
+    if successors is None:
+        successors = successor_lists(predecessors)
+    remaining = [len(preds) for preds in predecessors]
+    ready = deque(node for node in range(count) if remaining[node] == 0)
+    order = []
+    while ready:
+        node = ready.popleft()
+        order.append(node)
+        for succ in successors[node]:
+            remaining[succ] -= 1
+            if remaining[succ] == 0:
+                ready.append(succ)
+    if len(order) != count:
+        raise CycleError([node for node in range(count) if remaining[node] > 0])
+    return order
+
+
+def find_cycle(milestones: Iterable[Dict[str, Any]]) -> Optional[List[str]]:
+    """Ids of milestones on a dependency cycle, or None"""
+    milestones = list(milestones)
+    index = {milestone["id"]: i for i, milestone in enumerate(milestones)}
+    predecessors = [[index[dep] for dep in milestone.get("depends_on") or [] if dep in index] for milestone in milestones]
+    try:
+        topological_order(predecessors)
+    except CycleError as e:
+        return [milestones[node]["id"] for node in e.milestone_ids]
+    return None
+
+
+class ProjectSchedule:
+    """Critical-path schedule of one project's milestones.
+
+    A milestone is reached duration_days after the last of its
+    dependencies; without an explicit duration it takes the gap between
+    its due date and its latest dependency's (or the project start). Open
+    milestones can't be reached before today; completed ones are fixed at
+    their completion date. A forward pass in topological order gives each
+    milestone its projected date, a backward pass from the projected
+    completion its latest date, and the difference is its slack.
+
+    The graph and topological order are built once. Completing a milestone
+    only re-runs the forward pass over its descendants, plus the backward
+    pass, which is a handful of list operations per node.
+    """
+
+    def __init__(self, milestones: List[Dict[str, Any]], project_start=None):
+        self.milestones = milestones
+        self.index = index = {milestone["id"]: i for i, milestone in enumerate(milestones)}
+        # Dependencies on deleted milestones are ignored
+        self.dependencies = [
+            [dep for dep in dict.fromkeys(milestone.get("depends_on") or []) if dep in index]
+            for milestone in milestones
+        ]
+        self.predecessors = [[index[dep] for dep in deps] for deps in self.dependencies]
+        self.successors = successor_lists(self.predecessors)
+        try:
+            self.order = topological_order(self.predecessors, self.successors)
+        except CycleError as e:
+            raise CycleError([milestones[node]["id"] for node in e.milestone_ids])
+        self.position = [0] * len(milestones)
+        for position, node in enumerate(self.order):
+            self.position[node] = position
+
+        self.due = [to_days(milestone.get("due_date")) for milestone in milestones]
+        self.completed_at = [
+            (to_days(milestone.get("completed_date")) or self.due[i]) if milestone.get("completed") else None
+            for i, milestone in enumerate(milestones)
+        ]
+        start = to_days(project_start)
+        self.duration = [self._duration(node, start) for node in range(len(milestones))]
+        self.finish: List[float] = [0.0] * len(milestones)
+        self.latest: List[Optional[float]] = [None] * len(milestones)
+        self.as_of: Optional[date] = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    def _duration(self, node: int, project_start: Optional[float]) -> float:
+        explicit = self.milestones[node].get("duration_days")
+        if explicit is not None:
+            return max(float(explicit), 0.0)
+        due = self.due[node]
+        anchors = [self.due[pred] for pred in self.predecessors[node] if self.due[pred] is not None]
+        anchor = max(anchors) if anchors else project_start
+        if due is None or anchor is None:
+            return 0.0
+        return max(due - anchor, 0.0)
+
+    def _forward(self, nodes: Iterable[int], today: float):
+        finish, completed_at = self.finish, self.completed_at
+        for node in nodes:
+            if completed_at[node] is not None:
+                finish[node] = completed_at[node]
+                continue
+            start = today
+            for pred in self.predecessors[node]:
+                if finish[pred] > start:
+                    start = finish[pred]
+            finish[node] = start + self.duration[node]
+
+    def _backward(self):
+        projected = max(self.finish, default=0.0)
+        latest, completed_at = self.latest, self.completed_at
+        for node in reversed(self.order):
+            if completed_at[node] is not None:
+                latest[node] = None
+                continue
+            bound = projected
+            for succ in self.successors[node]:
+                if completed_at[succ] is None:
+                    succ_start = latest[succ] - self.duration[succ]
+                    if succ_start < bound:
+                        bound = succ_start
+            latest[node] = bound
+
+    def compute(self, today: date):
+        self.as_of = today
+        self._result = None
+        self._forward(self.order, start_of(today))
+        self._backward()
+
+    def complete(self, milestone_id: str, completed_date) -> bool:
+        """Mark a milestone done and reschedule what depends on it; False if it isn't in this schedule"""
+        node = self.index.get(milestone_id)
+        if node is None:
+            return False
+        self.completed_at[node] = to_days(completed_date) or self.due[node] or 0.0
+        self._result = None
+        if self.as_of is None:
+            return True
+        # Only the milestone and its descendants can move forward
+        reached = {node}
+        queue = deque([node])
+        while queue:
+            for succ in self.successors[queue.popleft()]:
+                if succ not in reached:
+                    reached.add(succ)
+                    queue.append(succ)
+        self._forward(sorted(reached, key=self.position.__getitem__), start_of(self.as_of))
+        self._backward()
+        return True
+
+    def critical_path(self) -> List[str]:
+        """The chain of zero-slack open milestones that ends at the projected completion"""
+        open_nodes = [node for node in self.order if self.completed_at[node] is None]
+        if not open_nodes:
+            return []
+        node = max(open_nodes, key=lambda n: (self.finish[n], -self.position[n]))
+        path = [node]
+        while True:
+            start = self.finish[node] - self.duration[node]
+            binding = [
+                pred for pred in self.predecessors[node]
+                if self.completed_at[pred] is None and abs(self.finish[pred] - start) <= CRITICAL_SLACK_DAYS
+            ]
+            if not binding:
+                break
+            node = min(binding, key=self.position.__getitem__)
+            path.append(node)
+        return [self.milestones[node]["id"] for node in reversed(path)]
+
+    def result(self, today: date) -> Dict[str, Any]:
+        """The schedule as of today; kept until the next completion or day"""
+        if self.as_of != today:
+            self.compute(today)
+        if self._result is not None:
+            return self._result
+        rows = []
+        for node in self.order:
+            milestone = self.milestones[node]
+            done = self.completed_at[node] is not None
+            slack = None if done else max(self.latest[node] - self.finish[node], 0.0)
+            late = None if self.due[node] is None else self.finish[node] - self.due[node]
+            rows.append({
+                "id": milestone["id"],
+                "title": milestone.get("title"),
+                "depends_on": self.dependencies[node],
+                "completed": done,
+                "due_date": milestone.get("due_date"),
+                "projected_date": from_days(self.finish[node]),
+                "slack_days": None if slack is None else round(slack, 3),
+                "critical": slack is not None and slack <= CRITICAL_SLACK_DAYS,
+                "late_days": None if late is None else round(max(late, 0.0), 3),
+            })
+        self._result = {
+            "as_of": today.isoformat(),
+            "projected_completion": from_days(max(self.finish)) if self.finish else None,
+            "critical_path": self.critical_path(),
+            "milestones": rows,
+        }
+        return self._result
+
+
+class ScheduleCache:
+    """Per-project schedules, kept across requests.
+
+    complete() applies a milestone completion to the cached schedule
+    incrementally; any other change to a project's milestones or dates
+    drops it through invalidate(). Versions guard against a load that
+    raced with a write, as in the forecast cache.
+    """
+
+    def __init__(self):
+        self.schedules: Dict[str, ProjectSchedule] = {}
+        self.versions: Dict[str, int] = {}
+        self.epoch = 0
+
+    def version(self, project_id: str) -> tuple:
+        return (self.epoch, self.versions.get(project_id, 0))
+
+    def get(self, project_id: str) -> Optional[ProjectSchedule]:
+        return self.schedules.get(project_id)
+
+    def put(self, project_id: str, schedule: ProjectSchedule, version: tuple):
+        if self.version(project_id) == version:
+            self.schedules[project_id] = schedule
+
+    def complete(self, project_id: str, milestone_id: str, completed_date: str):
+        self.versions[project_id] = self.versions.get(project_id, 0) + 1
+        schedule = self.schedules.get(project_id)
+        if schedule is not None and not schedule.complete(milestone_id, completed_date):
+            self.schedules.pop(project_id, None)
+
+    def invalidate(self, project_id: str):
+        self.versions[project_id] = self.versions.get(project_id, 0) + 1
+        self.schedules.pop(project_id, None)
+
+    def clear(self):
+        self.epoch += 1
+        self.schedules.clear()
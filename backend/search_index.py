@@ -0,0 +1,363 @@
+import bisect
+import heapq
+import itertools
+import math
+import re
+from typing import Dict, List, Optional, Any, Iterable, Set, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Fields indexed per entity kind with their ranking boosts
+SEARCH_FIELDS = {
+    "project": {"name": 3.0, "description": 1.0},
+    "resource": {"name": 2.0, "description": 1.0},
+    "expense": {"description": 1.0},
+    "document": {"name": 2.0},
+}
+
+# Titles shown in results come from the first indexed field
+TITLE_FIELDS = {kind: next(iter(fields)) for kind, fields in SEARCH_FIELDS.items()}
+
+SEARCH_PROJECTIONS = {
+    "project": {"_id": 0, "id": 1, "name": 1, "description": 1},
+    "resource": {"_id": 0, "id": 1, "project_id": 1, "name": 1, "description": 1},
+    "expense": {"_id": 0, "id": 1, "project_id": 1, "resource_id": 1, "description": 1},
+    "document": {"_id": 0, "id": 1, "project_id": 1, "name": 1},
+}
+
+# A short prefix can match thousands of terms; only expand the most common ones
+MAX_PREFIX_EXPANSIONS = 64
+
+# Completions of a prefix score slightly below an exact match of the same term
+PREFIX_PENALTY = 0.8
+
+# Above this many tier combinations a multi-term query scores every candidate instead
+MAX_TIER_COMBINATIONS = 4096
+
+# Tier intersections larger than this are scanned lazily so they can stop at `limit`
+EAGER_INTERSECTION_SIZE = 20000
+
+# Counting a wide prefix exactly means unioning its postings; past this, report a lower bound
+MAX_EXACT_UNION = 50000
+
+# Attributes swapped wholesale when a rebuilt index is adopted
+INDEX_STATE = (
+    "postings", "vocabulary", "vocabulary_dirty", "docs", "doc_numbers",
+    "resource_expenses", "project_docs", "kind_docs", "tiers", "next_number",
+)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class SearchIndex:
+    """In-process inverted index over projects, resources, expenses and documents.
+
+    Postings map each term to {doc_number: weight}, where weight is the
+    field-boosted term frequency. Queries require every term to match, expand
+    the last term as a prefix over a sorted vocabulary and rank by a TF-IDF
+    sum. Each term also keeps its postings bucketed by weight ("tiers"), so
+    the top results are found by walking tier combinations in descending
+    score order and stopping at `limit`, rather than scoring every match.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.vocabulary: List[str] = []
+        self.vocabulary_dirty = False
+        # doc_number -> (kind, entity_id, project_id, title, terms, resource_id)
+        self.docs: Dict[int, Tuple[str, str, Optional[str], str, Tuple[str, ...], Optional[str]]] = {}
+        self.doc_numbers: Dict[Tuple[str, str], int] = {}
+        self.resource_expenses: Dict[str, Set[int]] = {}
+        self.project_docs: Dict[str, Set[int]] = {}
+        self.kind_docs: Dict[str, Set[int]] = {kind: set() for kind in SEARCH_FIELDS}
+        # term -> weight -> doc numbers with that weight
+        self.tiers: Dict[str, Dict[float, Set[int]]] = {}
+        self.next_number = 0
+        self.ready = False
+        self._replay: Optional[List[tuple]] = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    # Writes
+
+    def upsert(self, kind: str, entity: Dict[str, Any]):
+        if self._replay is not None:
+            self._replay.append(("upsert", kind, dict(entity)))
+        self._discard(kind, entity["id"])
+        self._insert(kind, entity)
+
+    def remove(self, kind: str, entity_id: str):
+        if self._replay is not None:
+            self._replay.append(("remove", kind, entity_id))
+        self._discard(kind, entity_id)
+
+    def remove_resource_expenses(self, resource_id: str):
+        """Drop expenses derived from a resource, mirroring delete_many on resource_id"""
+        if self._replay is not None:
+            self._replay.append(("remove_resource_expenses", resource_id))
+        for number in list(self.resource_expenses.get(resource_id, ())):
+            self._discard_number(number)
+
+    def _insert(self, kind: str, entity: Dict[str, Any]):
+        weights: Dict[str, float] = {}
+        for field, boost in SEARCH_FIELDS[kind].items():
+            for token in tokenize(entity.get(field)):
+                weights[token] = weights.get(token, 0.0) + boost
+        number = self.next_number
+        self.next_number += 1
+        project_id = entity["id"] if kind == "project" else entity.get("project_id")
+        title = entity.get(TITLE_FIELDS[kind]) or ""
+        resource_id = entity.get("resource_id") if kind == "expense" else None
+        self.docs[number] = (kind, entity["id"], project_id, title, tuple(weights), resource_id)
+        self.doc_numbers[(kind, entity["id"])] = number
+        self.kind_docs[kind].add(number)
+        if project_id:
+            self.project_docs.setdefault(project_id, set()).add(number)
+        if resource_id:
+            self.resource_expenses.setdefault(resource_id, set()).add(number)
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if not self.vocabulary_dirty:
+                    bisect.insort(self.vocabulary, token)
+            posting[number] = weight
+            self.tiers.setdefault(token, {}).setdefault(weight, set()).add(number)
+
+    def _discard(self, kind: str, entity_id: str):
+        number = self.doc_numbers.get((kind, entity_id))
+        if number is not None:
+            self._discard_number(number)
+
+    def _discard_number(self, number: int):
+        kind, entity_id, project_id, _, tokens, resource_id = self.docs.pop(number)
+        del self.doc_numbers[(kind, entity_id)]
+        self.kind_docs[kind].discard(number)
+        for links, key in ((self.project_docs, project_id), (self.resource_expenses, resource_id)):
+            linked = links.get(key) if key else None
+            if linked is not None:
+                linked.discard(number)
+                if not linked:
+                    del links[key]
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            weight = posting.pop(number, None)
+            if not posting:
+                del self.postings[token]
+                del self.tiers[token]
+                if not self.vocabulary_dirty:
+                    self.vocabulary.pop(bisect.bisect_left(self.vocabulary, token))
+                continue
+            tiers = self.tiers[token]
+            tiers[weight].discard(number)
+            if not tiers[weight]:
+                del tiers[weight]
+
+    # Rebuilds
+
+    def begin_rebuild(self):
+        """Start recording writes so they survive the swap in rebuild"""
+        self._replay = []
+
+    def abort_rebuild(self):
+        self._replay = None
+
+    @classmethod
+    def from_entities(cls, entities: Iterable[Tuple[str, Dict[str, Any]]]) -> "SearchIndex":
+        """Build a fresh index; safe to run off the event loop"""
+        index = cls()
+        # Sort the vocabulary once at the end instead of inserting term by term
+        index.vocabulary_dirty = True
+        for kind, entity in entities:
+            index._insert(kind, entity)
+        index._sorted_vocabulary()
+        index.ready = True
+        return index
+
+    def adopt(self, fresh: "SearchIndex"):
+        """Swap in a freshly built index and replay writes made while it was built"""
+        replay, self._replay = self._replay or [], None
+        for attribute in INDEX_STATE:
+            setattr(self, attribute, getattr(fresh, attribute))
+        for op in replay:
+            getattr(self, op[0])(*op[1:])
+        self.ready = True
+
+    def rebuild(self, entities: Iterable[Tuple[str, Dict[str, Any]]]):
+        self.adopt(self.from_entities(entities))
+
+    # Queries
+
+    def _sorted_vocabulary(self) -> List[str]:
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        return self.vocabulary
+
+    def _completions(self, term: str) -> List[str]:
+        """Every vocabulary term starting with term"""
+        vocabulary = self._sorted_vocabulary()
+        start = bisect.bisect_left(vocabulary, term)
+        end = bisect.bisect_left(vocabulary, term + "\uffff", start)
+        return vocabulary[start:end]
+
+    def _expand(self, term: str, prefix: bool) -> List[Tuple[str, Dict[int, float], float]]:
+        """(term, posting, IDF scale) for every vocabulary term a query term matches"""
+        if prefix:
+            matched = self._completions(term)
+            if len(matched) > MAX_PREFIX_EXPANSIONS:
+                matched = heapq.nlargest(MAX_PREFIX_EXPANSIONS, matched, key=lambda t: len(self.postings[t]))
+        else:
+            matched = [term] if term in self.postings else []
+
+        total = max(len(self.docs), 1)
+        expansions = []
+        for expanded in matched:
+            posting = self.postings[expanded]
+            scale = math.log(1 + total / len(posting)) * (1.0 if expanded == term else PREFIX_PENALTY)
+            expansions.append((expanded, posting, scale))
+        return expansions
+
+    def _candidates(self, groups, scopes: List[Set[int]]):
+        """Docs matching every query term and scope as (allowed, total, relation).
+
+        allowed is None when a single posting (or wide prefix) needs no
+        narrowing; the tier walk then reads the tiers directly.
+        """
+        exact = [group[0][1] for group in groups if len(group) == 1]
+        prefixes = [group for group in groups if len(group) > 1]
+        sources = sorted(exact + scopes, key=len)
+
+        if not sources:
+            postings = [posting for _, posting, _ in prefixes[0]]
+            if sum(len(posting) for posting in postings) > MAX_EXACT_UNION:
+                return None, max(len(posting) for posting in postings), "gte"
+            return None, len(set().union(*postings)), "eq"
+        if len(sources) == 1 and not prefixes:
+            return None, len(sources[0]), "eq"
+
+        allowed = set(sources[0])
+        for source in sources[1:]:
+            allowed.intersection_update(source)
+        for group in prefixes:
+            allowed = set().union(*(allowed.intersection(posting) for _, posting, _ in group))
+        return allowed, len(allowed), "eq"
+
+    def _levels(self, group) -> List[Tuple[float, Set[int]]]:
+        """(score, docs) for every weight tier of every expansion, best first"""
+        levels = [
+            (weight * scale, docs)
+            for term, _, scale in group
+            for weight, docs in self.tiers[term].items()
+        ]
+        levels.sort(key=lambda level: level[0], reverse=True)
+        return levels
+
+    def _top_by_tiers(self, groups, allowed: Optional[Set[int]], limit: int) -> Optional[Dict[int, float]]:
+        """Walk tier combinations in descending summed score until `limit` docs are found.
+
+        A doc first shows up in the combination of its best tier per term, which
+        is visited before any lower-scoring combination, so the first score
+        recorded for each doc is its exact score. Returns None when there are
+        too many combinations to enumerate.
+        """
+        level_lists = [self._levels(group) for group in groups]
+        if math.prod(len(levels) for levels in level_lists) > MAX_TIER_COMBINATIONS:
+            return None
+        combinations = sorted(
+            itertools.product(*level_lists),
+            key=lambda combination: sum(score for score, _ in combination),
+            reverse=True
+        )
+
+        results: Dict[int, float] = {}
+        for combination in combinations:
+            score = sum(level_score for level_score, _ in combination)
+            sets = [docs for _, docs in combination]
+            if allowed is not None:
+                sets.append(allowed)
+            sets.sort(key=len)
+            smallest, others = sets[0], sets[1:]
+            if not others:
+                hits = smallest
+            elif len(smallest) <= EAGER_INTERSECTION_SIZE:
+                hits = smallest.intersection(*others)
+            else:
+                hits = (n for n in smallest if all(n in docs for docs in others))
+            for number in hits:
+                if number not in results:
+                    results[number] = score
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def _score_all(self, groups, allowed: Set[int]) -> Dict[int, float]:
+        """Summed TF-IDF over every query term for each candidate doc"""
+        scores = dict.fromkeys(allowed, 0.0)
+        for group in groups:
+            if len(group) == 1:
+                _, posting, scale = group[0]
+                scores = {n: s + posting[n] * scale for n, s in scores.items()}
+                continue
+            best: Dict[int, float] = {}
+            for _, posting, scale in group:
+                for number in allowed.intersection(posting):
+                    score = posting[number] * scale
+                    if score > best.get(number, 0.0):
+                        best[number] = score
+            scores = {n: s + best[n] for n, s in scores.items()}
+        return scores
+
+    def search(self, query: str, project_id: Optional[str] = None, kinds: Optional[Set[str]] = None, limit: int = 20) -> Dict[str, Any]:
+        terms = tokenize(query)
+        empty = {"total": 0, "total_relation": "eq", "results": []}
+        if not terms:
+            return empty
+
+        # All terms must match; the last one also matches as a prefix while typing
+        groups = []
+        for i, term in enumerate(terms):
+            group = self._expand(term, prefix=(i == len(terms) - 1))
+            if not group:
+                return empty
+            groups.append(group)
+
+        scopes = []
+        if project_id:
+            scopes.append(self.project_docs.get(project_id, set()))
+        if kinds:
+            kind_sets = [self.kind_docs.get(kind, set()) for kind in kinds]
+            scopes.append(kind_sets[0] if len(kind_sets) == 1 else set().union(*kind_sets))
+        allowed, total, relation = self._candidates(groups, scopes)
+        if total == 0:
+            return empty
+        # Docs matching only the dropped completions are not counted
+        if len(groups[-1]) == MAX_PREFIX_EXPANSIONS and len(self._completions(terms[-1])) > MAX_PREFIX_EXPANSIONS:
+            relation = "gte"
+
+        scores = self._top_by_tiers(groups, allowed, limit)
+        if scores is None:
+            scores = self._score_all(groups, allowed)
+
+        docs = self.docs
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return {
+            "total": total,
+            "total_relation": relation,
+            "results": [
+                {
+                    "type": docs[number][0],
+                    "id": docs[number][1],
+                    "project_id": docs[number][2],
+                    "title": docs[number][3],
+                    "score": round(score, 4),
+                }
+                for number, score in top
+            ],
+        }
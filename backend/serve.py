@@ -0,0 +1,46 @@
+"""Run the API with one or more worker processes.
+
+    python serve.py --workers 4 --port 8001
+
+Each worker opens its own Mongo client on startup. With more than one
+worker, cache write events are shared through the database
+(CACHE_EVENTS_ENABLED=1) so every worker's in-process indexes stay in step.
+The same variable must be set when running under gunicorn instead:
+
+    CACHE_EVENTS_ENABLED=1 gunicorn server:app -k uvicorn.workers.UvicornWorker -w 4
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the project management API")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        # Inherited by the worker processes uvicorn spawns
+        os.environ["CACHE_EVENTS_ENABLED"] = "1"
+
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+if __name__ == "__main__":
+    main()
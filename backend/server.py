@@ -1,36 +1,210 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, date
+from datetime import datetime, timezone, date, timedelta
 from enum import Enum
-import shutil
+import hmac
+import importlib.util
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from analytics import (
+    PROJECT_ANALYTICS_FIELDS,
+    ExpenseArrayCache,
+    load_columns,
+    load_portfolio_expenses,
+    build_expense_arrays,
+    build_project_frame,
+    compute_portfolio,
+)
+from forecasting import (
+    EXPENSE_FORECAST_FIELDS,
+    DailySpend,
+    ForecastCache,
+    compute_forecast,
+    to_day,
+)
+from exports import (
+    EXPENSE_EXPORT_FIELDS,
+    EXPORT_BATCH_SIZE,
+    build_expense_export_query,
+    stream_csv,
+    stream_parquet,
+)
+from imports import (
+    IMPORT_CHUNK_SIZE,
+    ImportFileError,
+    ImportReport,
+    number_rows,
+    open_row_reader,
+    read_chunk,
+    validate_chunk,
+)
+from milestone_index import (
+    MILESTONE_INDEX_FIELDS,
+    DeadlineIndex,
+    parse_within,
+)
+from search_index import SEARCH_PROJECTIONS, SearchIndex
+from coordination import CacheEventBus
+from list_queries import MAX_LIST_LIMIT, ListQuery, ListQuerySpec
+from responses import APIResponse, CompressionMiddleware, ContentNegotiationMiddleware
+from idempotency import IdempotencyMiddleware, ensure_ttl_index
+from admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    AdmissionRule,
+    MemoryBucketStore,
+    MongoBucketStore,
+    ensure_bucket_ttl_index,
+    load_rules,
+    parse_proxies,
+)
+from transactions import TransactionRunner
+from expense_store import ExpenseStore, rejected_documents
+from revisions import RevisionConflict, backfill_revisions, bump, etag, parse_if_match, update_revision
+from trash import Trash
+from previews import PreviewPool, preview_kind, preview_path
+from storage import create_storage
+from folders import FolderIndex, normalize_folder, subtree_filter
+from document_versions import DocumentVersions, document_key
+from approvals import ApprovalWorkflow, awaiting
+from audit import ActorMiddleware, AuditLog
+from capacity import CAPACITY_TYPES, PROJECT_CAPACITY_FIELDS, RESOURCE_CAPACITY_FIELDS, CapacityTimeline
+from fx import DEFAULT_CURRENCY, FxRates, convert_columns, convert_spend, normalize_currency, spend_by_currency_pipeline
+from scheduling import SCHEDULE_MILESTONE_FIELDS, CycleError, ProjectSchedule, ScheduleCache, find_cycle
+from timestamps import backfill_utc, utc_iso
+from derivation import RESOURCE_EXPENSE_TYPES, backfill_derived_flags, derive_expense, derive_expenses, describe, resource_sync_updates
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection, opened per worker process on startup so no client crosses a fork
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def connect_database():
+    global client, db
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
 
-# Create uploads directory
-UPLOADS_DIR = ROOT_DIR / 'uploads'
-UPLOADS_DIR.mkdir(exist_ok=True)
+# Uploaded blobs: a directory shared by every worker, or an S3-compatible bucket shared by every node
+UPLOADS_DIR = Path(os.environ.get('UPLOADS_DIR', ROOT_DIR / 'uploads'))
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup and shutdown (start_worker / stop_worker below)"""
+    await start_worker()
+    try:
+        yield
+    finally:
+        await stop_worker()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", default_response_class=APIResponse)
+
+# With several workers, each keeps its own caches and replays the others' writes
+cache_events = CacheEventBus(enabled=os.environ.get('CACHE_EVENTS_ENABLED', '0') == '1')
+
+# Per-project budget forecast state, kept warm by the expense write paths
+forecast_cache = cache_events.share(
+    "forecast", ForecastCache(), ("record_expense", "invalidate"), replay_own=False,
+    replay_as={"record_expense": "record_remote_expense"}
+)
+
+# Encoded expense arrays behind /analytics/portfolio, rebuilt after any expense change
+portfolio_expenses = ExpenseArrayCache()
+
+# Exchange rates from local CSV files; cached forecasts hold converted amounts
+FX_RATES_DIR = Path(os.environ.get('FX_RATES_DIR', ROOT_DIR / 'fx_rates'))
+FX_BASE_CURRENCY = normalize_currency(os.environ.get('FX_BASE_CURRENCY', DEFAULT_CURRENCY))
+fx_rates = cache_events.share(
+    "fx_rates", FxRates(FX_RATES_DIR, FX_BASE_CURRENCY, on_reload=forecast_cache.clear), ("reload",), replay_own=False
+)
+
+# Open milestones sorted by due date, refreshed by a background scheduler
+deadline_index = cache_events.share("deadlines", DeadlineIndex(), ("add", "remove", "set_manager"))
+
+# Per-project critical-path schedules; completions update them in place
+schedule_cache = cache_events.share("schedule", ScheduleCache(), ("complete", "invalidate"), replay_own=False)
+MILESTONE_INDEX_REFRESH_SECONDS = int(os.environ.get('MILESTONE_INDEX_REFRESH_SECONDS', '300'))
+
+# Stored first responses for POST retries carrying an Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+
+# /api/admin endpoints take this as a bearer token and are disabled (404) without one
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Rate limits are per client address; X-Forwarded-For is believed only from these proxies
+TRUSTED_PROXIES = parse_proxies(os.environ.get('TRUSTED_PROXIES'))
+
+# Rate limits and concurrency caps; PUT /api/admin/limits changes them on every worker
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+admission = cache_events.share(
+    "admission",
+    AdmissionController(
+        load_rules(os.environ.get('ADMISSION_RULES')),
+        MongoBucketStore(lambda: db.rate_limits) if RATE_LIMIT_BACKEND == 'mongo' else MemoryBucketStore()
+    ),
+    ("configure",)
+)
+
+# Resource/expense writes spanning documents commit atomically where the deployment supports it
+transactions = TransactionRunner(lambda: client, os.environ.get('MONGO_TRANSACTIONS', 'auto'))
+
+# Deleted resources, expenses and milestones, restorable until purged by the sweeper
+TRASH_RETENTION_SECONDS = int(os.environ.get('TRASH_RETENTION_SECONDS', str(7 * 24 * 60 * 60)))
+TRASH_SWEEP_SECONDS = int(os.environ.get('TRASH_SWEEP_SECONDS', '3600'))
+trash = Trash(lambda: db, TRASH_RETENTION_SECONDS)
+
+# "embedded" keeps a resource's derived expense on the resource document itself
+expense_store = ExpenseStore(lambda: db, os.environ.get('RESOURCE_EXPENSE_STORAGE', 'collection'), trash)
+
+storage = create_storage(STORAGE_BACKEND, UPLOADS_DIR)
+
+# Thumbnails and text snippets for uploaded documents, rendered off the event loop
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', '1'))
+preview_pool = PreviewPool(PREVIEW_WORKERS)
+
+# Document folders, materialized as a path on each document
+folders = FolderIndex(lambda: db)
+
+# "1" stores superseded document versions as binary deltas against the next one
+DOCUMENT_DELTAS = os.environ.get('DOCUMENT_DELTAS', '0') == '1'
+document_versions = DocumentVersions(lambda: db, storage, preview_pool, DOCUMENT_DELTAS)
+
+# Multi-step document approval with per-approver queues
+approvals = ApprovalWorkflow(lambda: db)
+
+# Who changed what, buffered in memory and written in batches by a background task
+audit = AuditLog(
+    lambda: db,
+    flush_size=int(os.environ.get('AUDIT_FLUSH_SIZE', '500')),
+    flush_seconds=float(os.environ.get('AUDIT_FLUSH_SECONDS', '1')),
+    buffer_size=int(os.environ.get('AUDIT_BUFFER_SIZE', '10000'))
+)
+AUDIT_SHUTDOWN_FLUSH_SECONDS = 5
+
+# Inverted index behind /api/search, built at startup and kept current by write hooks
+search_index = cache_events.share("search", SearchIndex(), ("upsert", "remove", "remove_resource_expenses"))
 
 
 # Enums
@@ -63,11 +237,11 @@ class ExpenseType(str, Enum):
 
 # Helper functions
 def prepare_for_mongo(data):
-    """Convert datetime objects to ISO strings for MongoDB storage"""
+    """Convert datetime objects to ISO strings for MongoDB storage, in UTC so range filters compare instants"""
     if isinstance(data, dict):
         for key, value in data.items():
             if isinstance(value, datetime):
-                data[key] = value.isoformat()
+                data[key] = utc_iso(value)
             elif isinstance(value, date):
                 data[key] = value.isoformat()
             elif isinstance(value, dict):
@@ -89,12 +263,16 @@ def parse_from_mongo(item):
     return item
 
 # Models
+# ISO 4217 code, upper-cased; every create/update/import path validates through this
+Currency = Annotated[str, AfterValidator(normalize_currency)]
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     email: str
     role: str = "project_manager"
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    rev: int = 1
 
 class UserCreate(BaseModel):
     name: str
@@ -111,6 +289,7 @@ class Resource(BaseModel):
     allocated_amount: float = 0.0
     description: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    rev: int = 1
 
 class ResourceCreate(BaseModel):
     name: str
@@ -137,27 +316,40 @@ class Milestone(BaseModel):
     project_id: str
     completed: bool = False
     completed_date: Optional[datetime] = None
+    depends_on: List[str] = []
+    duration_days: Optional[float] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    rev: int = 1
 
 class MilestoneCreate(BaseModel):
     title: str
     description: Optional[str] = None
     due_date: datetime
     project_id: str
+    depends_on: List[str] = []
+    duration_days: Optional[float] = None
+
+class MilestoneDependencies(BaseModel):
+    depends_on: List[str]
 
 class Expense(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     description: str
     amount: float
+    currency: Optional[str] = None
     expense_type: ExpenseType
     project_id: str
     resource_id: Optional[str] = None
+    resource_name: Optional[str] = None
+    derived_from_resource: bool = False
     date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    rev: int = 1
 
 class ExpenseCreate(BaseModel):
     description: str
     amount: float
+    currency: Optional[Currency] = None
     expense_type: ExpenseType
     project_id: str
     resource_id: Optional[str] = None
@@ -166,8 +358,10 @@ class ExpenseCreate(BaseModel):
 class ExpenseUpdate(BaseModel):
     description: Optional[str] = None
     amount: Optional[float] = None
+    currency: Optional[Currency] = None
     expense_type: Optional[ExpenseType] = None
     resource_id: Optional[str] = None
+    resource_name: Optional[str] = None
     date: Optional[datetime] = None
 
 class Document(BaseModel):
@@ -184,6 +378,31 @@ class Document(BaseModel):
     uploaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     approved_by: Optional[str] = None
     approved_at: Optional[datetime] = None
+    preview_status: Optional[str] = None
+    is_latest: bool = True
+    delta_base_id: Optional[str] = None
+    stored_size: Optional[int] = None
+    approvers: List[str] = []
+    approval_step: int = 0
+    current_approver: Optional[str] = None
+    submitted_by: Optional[str] = None
+    submitted_at: Optional[datetime] = None
+    approval_history: List[Dict[str, Any]] = []
+    rev: int = 1
+
+class ApprovalSubmission(BaseModel):
+    approvers: List[str]
+    submitted_by: str
+
+class ApprovalBatch(BaseModel):
+    document_ids: List[str]
+    approver: str
+    decision: str
+    comment: Optional[str] = None
+
+class FolderMove(BaseModel):
+    from_path: str
+    to_path: str
 
 class Project(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -193,9 +412,11 @@ class Project(BaseModel):
     start_date: datetime
     end_date: datetime
     budget: float
+    currency: str = FX_BASE_CURRENCY
     manager_id: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    rev: int = 1
 
 class ProjectCreate(BaseModel):
     name: str
@@ -203,6 +424,7 @@ class ProjectCreate(BaseModel):
     start_date: datetime
     end_date: datetime
     budget: float
+    currency: Currency = FX_BASE_CURRENCY
     manager_id: str
 
 class ProjectUpdate(BaseModel):
@@ -212,6 +434,98 @@ class ProjectUpdate(BaseModel):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     budget: Optional[float] = None
+    currency: Optional[Currency] = None
+
+# List query specs: filters, sort keys and projectable fields per list endpoint
+PROJECT_LIST_SPEC = ListQuerySpec(
+    fields=list(Project.__fields__),
+    filters={"stage": "enum", "manager_id": "string", "budget": "number", "start_date": "datetime", "end_date": "datetime"},
+    choices={"stage": [stage.value for stage in ProjectStage]},
+)
+RESOURCE_LIST_SPEC = ListQuerySpec(
+    fields=list(Resource.__fields__),
+    filters={"type": "enum", "availability": "string", "cost_per_unit": "number", "allocated_amount": "number"},
+    choices={"type": [resource_type.value for resource_type in ResourceType]},
+)
+MILESTONE_LIST_SPEC = ListQuerySpec(
+    fields=list(Milestone.__fields__),
+    filters={"completed": "bool", "due_date": "datetime"},
+)
+APPROVAL_QUEUE_SPEC = ListQuerySpec(
+    fields=list(Document.__fields__),
+    filters={"project_id": "string", "submitted_at": "datetime"},
+    default_sort=[("submitted_at", 1), ("id", 1)],
+)
+EXPENSE_LIST_SPEC = ListQuerySpec(
+    fields=list(Expense.__fields__),
+    filters={"expense_type": "enum", "resource_id": "string", "amount": "number", "currency": "string", "date": "datetime"},
+    choices={"expense_type": [expense_type.value for expense_type in ExpenseType]},
+)
+
+# Compound indexes backing the pushed-down list filters and sorts
+LIST_INDEXES = {
+    "projects": [[("stage", 1)], [("manager_id", 1)]],
+    "resources": [[("project_id", 1), ("type", 1)]],
+    "milestones": [[("project_id", 1), ("due_date", 1)]],
+    "expenses": [[("project_id", 1), ("date", -1)], [("project_id", 1), ("expense_type", 1)]],
+}
+
+async def ensure_list_indexes():
+    try:
+        for collection, indexes in LIST_INDEXES.items():
+            for keys in indexes:
+                await db[collection].create_index(keys)
+    except Exception:
+        logger.exception("Failed to create list indexes")
+
+async def run_list_query(collection, spec: ListQuerySpec, request: Request, model, base: Optional[dict] = None):
+    """Run a filtered/sorted/projected list request; projected rows skip the response model"""
+    try:
+        list_query = ListQuery.parse(spec, request.query_params, base)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = await list_query.cursor(collection).to_list(list_query.limit)
+    if list_query.projection is not None:
+        return APIResponse(rows)
+    return [model(**parse_from_mongo(row)) for row in rows]
+
+# Revisions: every write bumps `rev`; If-Match makes an update conditional on it
+def required_revision(request: Request) -> Optional[int]:
+    try:
+        return parse_if_match(request.headers.get("if-match"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def revision_conflict(entity: str, current: Optional[int]) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail=f"{entity} was modified since revision requested by If-Match",
+        headers={"ETag": etag(current)} if current is not None else None
+    )
+
+def deletion_receipt(message: str, deletion_id: str) -> dict:
+    return {
+        "message": message,
+        "deletion_id": deletion_id,
+        "restorable_until": trash.restorable_until(datetime.now(timezone.utc)).isoformat()
+    }
+
+async def update_or_fail(collection, query: dict, update: dict, expected: Optional[int], entity: str, session=None) -> dict:
+    """Conditional update returning the new document; 404 when missing, 412 at another revision"""
+    try:
+        return await update_revision(collection, query, update, expected, session)
+    except LookupError:
+        raise HTTPException(status_code=404, detail=f"{entity} not found")
+    except RevisionConflict as e:
+        raise revision_conflict(entity, e.current)
+
+def record_spend(expense: "Expense"):
+    """Keep the forecast warm; an amount in another currency needs a conversion, so rebuild instead"""
+    if expense.currency is None:
+        forecast_cache.record_expense(expense.project_id, expense.date, expense.amount)
+    else:
+        forecast_cache.invalidate(expense.project_id)
 
 # API Routes
 
@@ -222,6 +536,7 @@ async def create_user(user: UserCreate):
     user_obj = User(**user_dict)
     user_data = prepare_for_mongo(user_obj.dict())
     await db.users.insert_one(user_data)
+    await audit.record("create", "user", user_obj.id, changes=user_data)
     return user_obj
 
 @api_router.get("/users", response_model=List[User])
@@ -236,132 +551,136 @@ async def create_project(project: ProjectCreate):
     project_obj = Project(**project_dict)
     project_data = prepare_for_mongo(project_obj.dict())
     await db.projects.insert_one(project_data)
+    deadline_index.set_manager(project_obj.id, project_obj.manager_id)
+    search_index.upsert("project", project_data)
+    await audit.record("create", "project", project_obj.id, project_obj.id, project_data)
     return project_obj
 
 @api_router.get("/projects", response_model=List[Project])
-async def get_projects():
-    projects = await db.projects.find().to_list(1000)
-    return [Project(**parse_from_mongo(project)) for project in projects]
+async def get_projects(request: Request):
+    return await run_list_query(db.projects, PROJECT_LIST_SPEC, request, Project)
 
 @api_router.get("/projects/{project_id}", response_model=Project)
-async def get_project(project_id: str):
+async def get_project(project_id: str, response: Response):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    return Project(**parse_from_mongo(project))
+    project_obj = Project(**parse_from_mongo(project))
+    response.headers["ETag"] = etag(project_obj.rev)
+    return project_obj
 
 @api_router.put("/projects/{project_id}", response_model=Project)
-async def update_project(project_id: str, project: ProjectUpdate):
+async def update_project(project_id: str, project: ProjectUpdate, request: Request, response: Response):
     update_data = {k: v for k, v in project.dict().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc)
     
+    # One round trip: the existence and If-Match checks are part of the update
     prepared_data = prepare_for_mongo(update_data)
-    result = await db.projects.update_one(
-        {"id": project_id}, 
-        {"$set": prepared_data}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    updated_project = await db.projects.find_one({"id": project_id})
+    expected = required_revision(request)
+    if "currency" in update_data:
+        async def work(session):
+            current = await db.projects.find_one({"id": project_id}, {"_id": 0, "currency": 1}, session=session)
+            if not current:
+                raise HTTPException(status_code=404, detail="Project not found")
+            updated = await update_or_fail(
+                db.projects, {"id": project_id}, {"$set": prepared_data}, expected, "Project", session=session
+            )
+            # Expenses without a currency were in the old one; keep them there instead of re-denominating them
+            previous = current.get("currency") or FX_BASE_CURRENCY
+            if previous != update_data["currency"]:
+                await expense_store.pin_currency(project_id, previous, session)
+            return updated
+
+        updated_project = await transactions.run(work)
+    else:
+        updated_project = await update_or_fail(db.projects, {"id": project_id}, {"$set": prepared_data}, expected, "Project")
+    search_index.upsert("project", updated_project)
+    if "start_date" in update_data:
+        schedule_cache.invalidate(project_id)
+    if "currency" in update_data:
+        forecast_cache.invalidate(project_id)
+    await audit.record("update", "project", project_id, project_id, prepared_data)
+    response.headers["ETag"] = etag(updated_project["rev"])
     return Project(**parse_from_mongo(updated_project))
 
 # Resources
+def build_resource_expense(resource_obj: Resource) -> Optional[Expense]:
+    """Expense auto-created for Vendors, Equipment and Materials with costs"""
+    derived = derive_expense(resource_obj.dict())
+    return Expense(**derived) if derived else None
+
 @api_router.post("/resources", response_model=Resource)
 async def create_resource(resource: ResourceCreate):
     resource_dict = resource.dict()
     resource_obj = Resource(**resource_dict)
     resource_data = prepare_for_mongo(resource_obj.dict())
-    await db.resources.insert_one(resource_data)
     
     # Auto-create expense for Vendors, Equipment and Materials with costs
-    if (resource_obj.type in [ResourceType.VENDOR, ResourceType.EQUIPMENT, ResourceType.MATERIAL] 
-        and resource_obj.cost_per_unit is not None 
-        and resource_obj.cost_per_unit > 0):
-        
-        # Map resource type to expense type
-        expense_type_mapping = {
-            ResourceType.VENDOR: ExpenseType.VENDOR,
-            ResourceType.EQUIPMENT: ExpenseType.EQUIPMENT,
-            ResourceType.MATERIAL: ExpenseType.MATERIAL
-        }
-        
-        expense_type = expense_type_mapping[resource_obj.type]
-        expense = Expense(
-            description=f"{resource_obj.type.value.replace('_', ' ').title()}: {resource_obj.name}",
-            amount=resource_obj.cost_per_unit * resource_obj.allocated_amount if resource_obj.allocated_amount > 0 else resource_obj.cost_per_unit,
-            expense_type=expense_type,
-            project_id=resource_obj.project_id,
-            resource_id=resource_obj.id
-        )
-        expense_data = prepare_for_mongo(expense.dict())
-        await db.expenses.insert_one(expense_data)
+    expense = build_resource_expense(resource_obj)
+    expense_data = prepare_for_mongo(expense.dict()) if expense else None
+    await transactions.run(lambda session: expense_store.insert_resource(resource_data, expense_data, session))
+    
+    search_index.upsert("resource", resource_data)
+    if expense:
+        record_spend(expense)
+        search_index.upsert("expense", expense_data)
+    await audit.record("create", "resource", resource_obj.id, resource_obj.project_id, resource_data)
     
     return resource_obj
 
 @api_router.get("/projects/{project_id}/resources", response_model=List[Resource])
-async def get_project_resources(project_id: str):
-    resources = await db.resources.find({"project_id": project_id}).to_list(1000)
-    return [Resource(**parse_from_mongo(resource)) for resource in resources]
+async def get_project_resources(project_id: str, request: Request):
+    return await run_list_query(db.resources, RESOURCE_LIST_SPEC, request, Resource, {"project_id": project_id})
 
 @api_router.get("/resources/{resource_id}", response_model=Resource)
-async def get_resource(resource_id: str):
+async def get_resource(resource_id: str, response: Response):
     resource = await db.resources.find_one({"id": resource_id})
     if not resource:
         raise HTTPException(status_code=404, detail="Resource not found")
-    return Resource(**parse_from_mongo(resource))
+    resource_obj = Resource(**parse_from_mongo(resource))
+    response.headers["ETag"] = etag(resource_obj.rev)
+    return resource_obj
 
 @api_router.put("/resources/{resource_id}", response_model=Resource)
-async def update_resource(resource_id: str, resource_update: ResourceUpdate):
-    # Get existing resource
-    existing_resource = await db.resources.find_one({"id": resource_id})
-    if not existing_resource:
-        raise HTTPException(status_code=404, detail="Resource not found")
-    
+async def update_resource(resource_id: str, resource_update: ResourceUpdate, request: Request, response: Response):
     # Prepare update data
     update_data = {k: v for k, v in resource_update.dict().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc)
-    
-    # Update resource
     prepared_data = prepare_for_mongo(update_data)
-    result = await db.resources.update_one(
-        {"id": resource_id}, 
-        {"$set": prepared_data}
-    )
+    expected = required_revision(request)
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Resource not found")
+    async def work(session):
+        # The existence and If-Match checks are part of the update itself
+        updated_resource = await update_or_fail(
+            db.resources, {"id": resource_id}, {"$set": prepared_data}, expected, "Resource", session
+        )
+        updated_resource_obj = Resource(**parse_from_mongo(dict(updated_resource)))
+        
+        # Cost changes replace the derived expense for Vendors, Equipment and Materials
+        repriced = "cost_per_unit" in update_data and updated_resource_obj.type.value in RESOURCE_EXPENSE_TYPES
+        expense_data = None
+        if repriced:
+            expense = build_resource_expense(updated_resource_obj)
+            expense_data = prepare_for_mongo(expense.dict()) if expense else None
+            await expense_store.replace_derived(resource_id, expense_data, session)
+        elif "name" in update_data or "type" in update_data:
+            # A derived expense is labelled with its resource's name and type
+            label = {"resource_name": updated_resource_obj.name}
+            if updated_resource_obj.type.value in RESOURCE_EXPENSE_TYPES:
+                label["description"] = describe(updated_resource_obj.type, updated_resource_obj.name)
+            await expense_store.relabel_derived(resource_id, label, session)
+        return updated_resource, updated_resource_obj, repriced, expense_data
     
-    # Get updated resource
-    updated_resource = await db.resources.find_one({"id": resource_id})
-    updated_resource_obj = Resource(**parse_from_mongo(updated_resource))
+    updated_resource, updated_resource_obj, repriced, expense_data = await transactions.run(work)
+    response.headers["ETag"] = etag(updated_resource_obj.rev)
     
-    # Handle expense updates for cost changes
-    if ("cost_per_unit" in update_data and 
-        updated_resource_obj.type in [ResourceType.VENDOR, ResourceType.EQUIPMENT, ResourceType.MATERIAL]):
-        
-        # Delete existing expense for this resource
-        await db.expenses.delete_many({"resource_id": resource_id})
-        
-        # Create new expense if cost is provided
-        if updated_resource_obj.cost_per_unit is not None and updated_resource_obj.cost_per_unit > 0:
-            expense_type_mapping = {
-                ResourceType.VENDOR: ExpenseType.VENDOR,
-                ResourceType.EQUIPMENT: ExpenseType.EQUIPMENT,
-                ResourceType.MATERIAL: ExpenseType.MATERIAL
-            }
-            
-            expense_type = expense_type_mapping[updated_resource_obj.type]
-            expense = Expense(
-                description=f"{updated_resource_obj.type.value.replace('_', ' ').title()}: {updated_resource_obj.name}",
-                amount=updated_resource_obj.cost_per_unit * updated_resource_obj.allocated_amount if updated_resource_obj.allocated_amount > 0 else updated_resource_obj.cost_per_unit,
-                expense_type=expense_type,
-                project_id=updated_resource_obj.project_id,
-                resource_id=updated_resource_obj.id
-            )
-            expense_data = prepare_for_mongo(expense.dict())
-            await db.expenses.insert_one(expense_data)
+    search_index.upsert("resource", updated_resource)
+    if repriced:
+        search_index.remove_resource_expenses(resource_id)
+        if expense_data:
+            search_index.upsert("expense", expense_data)
+        forecast_cache.invalidate(updated_resource_obj.project_id)
+    await audit.record("update", "resource", resource_id, updated_resource_obj.project_id, prepared_data)
     
     return updated_resource_obj
 
@@ -372,47 +691,179 @@ async def delete_resource(resource_id: str):
     if not resource:
         raise HTTPException(status_code=404, detail="Resource not found")
     
-    # Delete associated expenses
-    await db.expenses.delete_many({"resource_id": resource_id})
-    
-    # Delete resource
-    result = await db.resources.delete_one({"id": resource_id})
-    
-    if result.deleted_count == 0:
+    # Move the resource with its associated expenses to the trash
+    deletion_id = str(uuid.uuid4())
+    deleted = await transactions.run(lambda session: expense_store.delete_resource(resource_id, deletion_id, session))
+    if not deleted:
         raise HTTPException(status_code=404, detail="Resource not found")
     
-    return {"message": "Resource deleted successfully"}
+    forecast_cache.invalidate(resource["project_id"])
+    search_index.remove_resource_expenses(resource_id)
+    search_index.remove("resource", resource_id)
+    await audit.record("delete", "resource", resource_id, resource["project_id"], {"deletion_id": deletion_id})
+    
+    return deletion_receipt("Resource deleted successfully", deletion_id)
 
 # Milestones
+async def check_dependencies(project_id: str, depends_on: List[str], milestone_id: Optional[str] = None, session=None):
+    """400 unless every dependency is another milestone of the same project"""
+    if milestone_id in depends_on:
+        raise HTTPException(status_code=400, detail="A milestone cannot depend on itself")
+    found = await db.milestones.find(
+        {"id": {"$in": depends_on}, "project_id": project_id}, {"_id": 0, "id": 1}, session=session
+    ).to_list(None)
+    missing = sorted(set(depends_on) - {m["id"] for m in found})
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown milestones in depends_on for this project: {missing}")
+
 @api_router.post("/milestones", response_model=Milestone)
 async def create_milestone(milestone: MilestoneCreate):
     milestone_dict = milestone.dict()
+    milestone_dict["depends_on"] = list(dict.fromkeys(milestone_dict["depends_on"]))
+    if milestone_dict["depends_on"]:
+        await check_dependencies(milestone.project_id, milestone_dict["depends_on"])
     milestone_obj = Milestone(**milestone_dict)
     milestone_data = prepare_for_mongo(milestone_obj.dict())
     await db.milestones.insert_one(milestone_data)
+    deadline_index.add(milestone_data)
+    schedule_cache.invalidate(milestone_obj.project_id)
+    await audit.record("create", "milestone", milestone_obj.id, milestone_obj.project_id, milestone_data)
     return milestone_obj
 
 @api_router.get("/projects/{project_id}/milestones", response_model=List[Milestone])
-async def get_project_milestones(project_id: str):
-    milestones = await db.milestones.find({"project_id": project_id}).to_list(1000)
-    return [Milestone(**parse_from_mongo(milestone)) for milestone in milestones]
+async def get_project_milestones(project_id: str, request: Request):
+    return await run_list_query(db.milestones, MILESTONE_LIST_SPEC, request, Milestone, {"project_id": project_id})
 
 @api_router.put("/milestones/{milestone_id}/complete")
 async def complete_milestone(milestone_id: str):
-    result = await db.milestones.update_one(
-        {"id": milestone_id},
-        {"$set": {"completed": True, "completed_date": datetime.now(timezone.utc).isoformat()}}
+    changes = {"completed": True, "completed_date": datetime.now(timezone.utc).isoformat()}
+    milestone = await db.milestones.find_one_and_update(
+        {"id": milestone_id}, bump({"$set": changes}), {"project_id": 1}
     )
-    if result.matched_count == 0:
+    if milestone is None:
         raise HTTPException(status_code=404, detail="Milestone not found")
+    deadline_index.remove(milestone_id)
+    schedule_cache.complete(milestone.get("project_id"), milestone_id, changes["completed_date"])
+    await audit.record("update", "milestone", milestone_id, milestone.get("project_id"), changes)
     return {"message": "Milestone completed"}
 
+@api_router.put("/milestones/{milestone_id}/dependencies", response_model=Milestone)
+async def set_milestone_dependencies(milestone_id: str, dependencies: MilestoneDependencies, request: Request, response: Response):
+    milestone = await db.milestones.find_one({"id": milestone_id}, {"_id": 0, "project_id": 1})
+    if milestone is None:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    project_id = milestone["project_id"]
+    depends_on = list(dict.fromkeys(dependencies.depends_on))
+    expected = required_revision(request)
+    
+    async def work(session):
+        # Writing the project first makes concurrent dependency changes in it
+        # conflict, so the transaction retries and re-checks against the other's edges
+        await db.projects.update_one({"id": project_id}, {"$inc": {"dependencies_rev": 1}}, session=session)
+        await check_dependencies(project_id, depends_on, milestone_id, session)
+        siblings = await db.milestones.find(
+            {"project_id": project_id}, {"_id": 0, "id": 1, "depends_on": 1}, session=session
+        ).to_list(None)
+        for sibling in siblings:
+            if sibling["id"] == milestone_id:
+                sibling["depends_on"] = depends_on
+        cycle = find_cycle(siblings)
+        if cycle:
+            raise HTTPException(status_code=400, detail=f"Dependencies would form a cycle through: {sorted(cycle)}")
+        return await update_or_fail(
+            db.milestones, {"id": milestone_id}, {"$set": {"depends_on": depends_on}}, expected, "Milestone", session=session
+        )
+    
+    updated = await transactions.run(work)
+    schedule_cache.invalidate(project_id)
+    await audit.record("update", "milestone", milestone_id, project_id, {"depends_on": depends_on})
+    response.headers["ETag"] = etag(updated["rev"])
+    return Milestone(**parse_from_mongo(updated))
+
+@api_router.get("/projects/{project_id}/schedule")
+async def get_project_schedule(project_id: str):
+    """Critical path, per-milestone slack and projected completion from the dependency graph"""
+    schedule = schedule_cache.get(project_id)
+    if schedule is None:
+        version = schedule_cache.version(project_id)
+        project = await db.projects.find_one({"id": project_id}, {"_id": 0, "start_date": 1, "created_at": 1})
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        milestones = await db.milestones.find({"project_id": project_id}, SCHEDULE_MILESTONE_FIELDS).to_list(None)
+        try:
+            schedule = ProjectSchedule(milestones, project.get("start_date") or project.get("created_at"))
+        except CycleError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        schedule_cache.put(project_id, schedule, version)
+    
+    return {"project_id": project_id, **schedule.result(datetime.now(timezone.utc).date())}
+
 @api_router.delete("/milestones/{milestone_id}")
 async def delete_milestone(milestone_id: str):
-    result = await db.milestones.delete_one({"id": milestone_id})
-    if result.deleted_count == 0:
+    deletion_id = str(uuid.uuid4())
+    moved = await trash.move("milestones", {"id": milestone_id}, deletion_id)
+    if not moved:
         raise HTTPException(status_code=404, detail="Milestone not found")
-    return {"message": "Milestone deleted successfully"}
+    deadline_index.remove(milestone_id)
+    schedule_cache.invalidate(moved[0].get("project_id"))
+    await audit.record("delete", "milestone", milestone_id, moved[0].get("project_id"), {"deletion_id": deletion_id})
+    return deletion_receipt("Milestone deleted successfully", deletion_id)
+
+# One rebuild at a time: a second begin_rebuild() would drop the writes the first is recording
+deadline_rebuild_lock = asyncio.Lock()
+
+async def refresh_deadline_index():
+    """Rebuild the deadline index from a scan of open milestones"""
+    async with deadline_rebuild_lock:
+        deadline_index.begin_rebuild()
+        try:
+            milestones = await db.milestones.find({"completed": False}, MILESTONE_INDEX_FIELDS).to_list(None)
+            projects = await db.projects.find({}, {"_id": 0, "id": 1, "manager_id": 1}).to_list(None)
+        except Exception:
+            deadline_index.abort_rebuild()
+            raise
+        deadline_index.rebuild(milestones, {p["id"]: p.get("manager_id") for p in projects if p.get("manager_id")})
+
+async def run_deadline_scheduler():
+    # The first build happens during warm-up
+    while True:
+        await asyncio.sleep(MILESTONE_INDEX_REFRESH_SECONDS)
+        try:
+            await refresh_deadline_index()
+        except Exception:
+            logger.exception("Failed to refresh milestone deadline index")
+
+@api_router.get("/milestones/overdue")
+async def get_overdue_milestones(project_id: Optional[str] = None, manager_id: Optional[str] = None,
+                                 limit: int = Query(100, ge=1, le=1000)):
+    if not deadline_index.ready:
+        await refresh_deadline_index()
+    now = datetime.now(timezone.utc)
+    return {
+        "total": deadline_index.count_overdue(now, project_id, manager_id),
+        "milestones": deadline_index.overdue(now, project_id, manager_id, limit),
+        "index_refreshed_at": deadline_index.refreshed_at
+    }
+
+@api_router.get("/milestones/upcoming")
+async def get_upcoming_milestones(
+    within: str = "7d",
+    project_id: Optional[str] = None,
+    manager_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    try:
+        window = parse_within(within)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deadline_index.ready:
+        await refresh_deadline_index()
+    now = datetime.now(timezone.utc)
+    return {
+        "within": within,
+        "milestones": deadline_index.upcoming(now, window, project_id, manager_id, limit),
+        "index_refreshed_at": deadline_index.refreshed_at
+    }
 
 # Expenses
 class ExpenseWithResource(BaseModel):
@@ -427,29 +878,37 @@ async def create_expense(expense: ExpenseCreate):
     expense_obj = Expense(**expense_dict)
     expense_data = prepare_for_mongo(expense_obj.dict())
     await db.expenses.insert_one(expense_data)
+    record_spend(expense_obj)
+    search_index.upsert("expense", expense_data)
+    await audit.record("create", "expense", expense_obj.id, expense_obj.project_id, expense_data)
     return expense_obj
 
 @api_router.post("/expenses/with-resource")
 async def create_expense_with_resource(data: ExpenseWithResource):
     """Create an expense and link it to a new resource"""
     
-    # First create the resource
     resource_dict = data.resource.dict()
     resource_obj = Resource(**resource_dict)
     resource_data = prepare_for_mongo(resource_obj.dict())
-    await db.resources.insert_one(resource_data)
     
-    # Then create the expense linked to the resource
     expense_dict = data.expense.dict()
     if expense_dict.get('date') is None:
         expense_dict['date'] = datetime.now(timezone.utc)
     
     # Link the expense to the resource
     expense_dict['resource_id'] = resource_obj.id
+    expense_dict['resource_name'] = resource_obj.name
     
     expense_obj = Expense(**expense_dict)
     expense_data = prepare_for_mongo(expense_obj.dict())
-    await db.expenses.insert_one(expense_data)
+    
+    # Both documents are written together, or neither is
+    await transactions.run(lambda session: expense_store.insert_resource(resource_data, expense_data, session))
+    search_index.upsert("resource", resource_data)
+    record_spend(expense_obj)
+    search_index.upsert("expense", expense_data)
+    await audit.record("create", "resource", resource_obj.id, resource_obj.project_id, resource_data)
+    await audit.record("create", "expense", expense_obj.id, expense_obj.project_id, expense_data)
     
     return {
         "expense": expense_obj,
@@ -458,115 +917,103 @@ async def create_expense_with_resource(data: ExpenseWithResource):
     }
 
 @api_router.get("/projects/{project_id}/expenses", response_model=List[Expense])
-async def get_project_expenses(project_id: str):
-    expenses = await db.expenses.find({"project_id": project_id}).to_list(1000)
-    return [Expense(**parse_from_mongo(expense)) for expense in expenses]
+async def get_project_expenses(project_id: str, request: Request):
+    return await run_list_query(expense_store.reads(), EXPENSE_LIST_SPEC, request, Expense, {"project_id": project_id})
 
 @api_router.get("/expenses/{expense_id}", response_model=Expense)
-async def get_expense(expense_id: str):
-    expense = await db.expenses.find_one({"id": expense_id})
+async def get_expense(expense_id: str, response: Response):
+    expense = await expense_store.find_expense(expense_id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
-    return Expense(**parse_from_mongo(expense))
+    expense_obj = Expense(**parse_from_mongo(expense))
+    response.headers["ETag"] = etag(expense_obj.rev)
+    return expense_obj
 
 @api_router.put("/expenses/{expense_id}", response_model=Expense)
-async def update_expense(expense_id: str, expense_update: ExpenseUpdate):
-    # Get existing expense
-    existing_expense = await db.expenses.find_one({"id": expense_id})
-    if not existing_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    
+async def update_expense(expense_id: str, expense_update: ExpenseUpdate, request: Request, response: Response):
     # Prepare update data
     update_data = {k: v for k, v in expense_update.dict().items() if v is not None}
     update_data["updated_at"] = datetime.now(timezone.utc)
-    
-    # Update expense
     prepared_data = prepare_for_mongo(update_data)
-    result = await db.expenses.update_one(
-        {"id": expense_id}, 
-        {"$set": prepared_data}
-    )
+    expected = required_revision(request)
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Expense not found")
+    async def work(session):
+        # Read first: where the expense lives and what it syncs to its resource depend on it
+        existing_expense = await expense_store.find_expense(expense_id, session)
+        if not existing_expense:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        current = existing_expense.get("rev", 1)
+        if expected is not None and current != expected:
+            raise revision_conflict("Expense", current)
+        changes = dict(prepared_data)
+        
+        # If this expense is associated with a resource, sync all changes to the resource
+        resource, resource_updates = None, {}
+        resource_id = changes.get("resource_id", existing_expense.get("resource_id"))
+        if resource_id:
+            resource = await db.resources.find_one({"id": resource_id}, session=session)
+            if resource:
+                resource_updates = resource_sync_updates(existing_expense, update_data, resource)
+        if "name" in resource_updates:
+            changes["resource_name"] = resource_updates["name"]
+            # Renaming through resource_name relabels a derived expense
+            if existing_expense.get("derived_from_resource") and "description" not in changes:
+                resource_type = resource_updates.get("type", resource["type"])
+                if resource_type in RESOURCE_EXPENSE_TYPES:
+                    changes["description"] = describe(resource_type, resource_updates["name"])
+        if resource_updates:
+            resource_updates["updated_at"] = datetime.now(timezone.utc).isoformat()
+        updated_expense = {**existing_expense, **changes, "rev": current + 1}
+        updated_expense_obj = Expense(**parse_from_mongo(dict(updated_expense)))
+        
+        # Conditional on the revision read above, so a concurrent write in between is a conflict
+        if not await expense_store.update_expense(
+            existing_expense, changes, resource_updates, current, session, resource["id"] if resource else None
+        ):
+            # Deleted or rewritten since the read; say which, with the revision it is at now
+            latest = await expense_store.find_expense(expense_id, session)
+            if not latest:
+                raise HTTPException(status_code=404, detail="Expense not found")
+            raise revision_conflict("Expense", latest.get("rev", 1))
+        return updated_expense, updated_expense_obj, resource, resource_updates
+    
+    updated_expense, updated_expense_obj, resource, resource_updates = await transactions.run(work)
+    response.headers["ETag"] = etag(updated_expense_obj.rev)
     
-    # Get updated expense
-    updated_expense = await db.expenses.find_one({"id": expense_id})
-    updated_expense_obj = Expense(**parse_from_mongo(updated_expense))
-    
-    # If this expense is associated with a resource, sync all changes to the resource
-    if updated_expense_obj.resource_id:
-        resource = await db.resources.find_one({"id": updated_expense_obj.resource_id})
-        if resource:
-            resource_updates = {}
-            
-            # Update resource name if expense description changed
-            if "description" in update_data:
-                # Extract the resource name from expense description
-                # Format is usually "Type: Name" so we extract the name part
-                description = updated_expense_obj.description
-                if ": " in description:
-                    # Extract name after the colon and space
-                    resource_name = description.split(": ", 1)[1]
-                else:
-                    # Use the entire description as the name
-                    resource_name = description
-                resource_updates["name"] = resource_name
-            
-            # Update resource type if expense type changed
-            if "expense_type" in update_data:
-                # Map expense type to resource type
-                expense_to_resource_type = {
-                    "vendor": "vendor",
-                    "equipment": "equipment", 
-                    "material": "material"
-                }
-                if updated_expense_obj.expense_type in expense_to_resource_type:
-                    resource_updates["type"] = expense_to_resource_type[updated_expense_obj.expense_type]
-            
-            # Update resource cost if expense amount changed
-            if "amount" in update_data:
-                allocated_amount = resource.get("allocated_amount", 1.0)
-                if allocated_amount > 0:
-                    new_cost_per_unit = updated_expense_obj.amount / allocated_amount
-                else:
-                    new_cost_per_unit = updated_expense_obj.amount
-                resource_updates["cost_per_unit"] = new_cost_per_unit
-            
-            # Apply updates to resource if any changes were made
-            if resource_updates:
-                resource_updates["updated_at"] = datetime.now(timezone.utc).isoformat()
-                await db.resources.update_one(
-                    {"id": updated_expense_obj.resource_id},
-                    {"$set": resource_updates}
-                )
+    search_index.upsert("expense", updated_expense)
+    forecast_cache.invalidate(updated_expense_obj.project_id)
+    if resource_updates:
+        search_index.upsert("resource", {**resource, **resource_updates, "rev": resource.get("rev", 1) + 1})
+    await audit.record("update", "expense", expense_id, updated_expense_obj.project_id, prepared_data)
+    if resource_updates:
+        await audit.record("update", "resource", resource["id"], resource["project_id"], resource_updates)
     
     return updated_expense_obj
 
 @api_router.delete("/expenses/{expense_id}")
 async def delete_expense(expense_id: str):
     # Check if expense exists
-    expense = await db.expenses.find_one({"id": expense_id})
+    expense = await expense_store.find_expense(expense_id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    # If associated with resource, delete the entire resource
+    # If associated with resource, delete the entire resource with all of its expenses;
+    # everything goes to the trash under one deletion_id, so one undo brings it all back
+    deletion_id = str(uuid.uuid4())
     if expense.get("resource_id"):
-        resource_result = await db.resources.delete_one({"id": expense["resource_id"]})
-        if resource_result.deleted_count > 0:
-            # Also delete any other expenses associated with this resource
-            await db.expenses.delete_many({"resource_id": expense["resource_id"]})
-        else:
-            # If resource doesn't exist, still proceed with expense deletion
-            pass
-    
-    # Delete the main expense (if not already deleted above)
-    if not expense.get("resource_id"):
-        result = await db.expenses.delete_one({"id": expense_id})
-        if result.deleted_count == 0:
+        # If the resource doesn't exist the expense is left in place, as before
+        if await transactions.run(lambda session: expense_store.delete_resource(expense["resource_id"], deletion_id, session)):
+            search_index.remove("resource", expense["resource_id"])
+            search_index.remove_resource_expenses(expense["resource_id"])
+    else:
+        if not await expense_store.delete_expense(expense_id, deletion_id):
             raise HTTPException(status_code=404, detail="Expense not found")
+        search_index.remove("expense", expense_id)
+    # After the write, so a forecast loaded meanwhile can't be cached with the expense still in it
+    forecast_cache.invalidate(expense["project_id"])
+    await audit.record("delete", "expense", expense_id, expense["project_id"], {"deletion_id": deletion_id})
     
-    return {"message": "Expense and associated resource deleted successfully"}
+    return deletion_receipt("Expense and associated resource deleted successfully", deletion_id)
 
 @api_router.get("/projects/{project_id}/budget-summary")
 async def get_budget_summary(project_id: str):
@@ -574,22 +1021,83 @@ async def get_budget_summary(project_id: str):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    currency = project.get('currency') or FX_BASE_CURRENCY
     
-    # Get total expenses
-    expenses = await db.expenses.find({"project_id": project_id}).to_list(1000)
-    total_expenses = sum(expense.get('amount', 0) for expense in expenses)
+    # Mongo sums expenses per currency and day; those few rows are converted in one pass
+    groups = await expense_store.reads().aggregate(spend_by_currency_pipeline({"project_id": project_id})).to_list(None)
+    spend = convert_spend(groups, fx_rates.table, currency)
+    total_expenses = spend["total"]
     
     budget = project.get('budget', 0)
     remaining = budget - total_expenses
     
     return {
+        "currency": currency,
         "budget": budget,
         "total_expenses": total_expenses,
         "remaining": remaining,
-        "percentage_used": (total_expenses / budget * 100) if budget > 0 else 0
+        "percentage_used": (total_expenses / budget * 100) if budget > 0 else 0,
+        "unconverted": spend["unconverted"]
     }
 
+@api_router.get("/projects/{project_id}/forecast")
+async def get_budget_forecast(project_id: str):
+    """Projected spend curve, budget exhaustion date and confidence band"""
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    origin = to_day(project.get("start_date")) or to_day(project.get("created_at"))
+    end_day = to_day(project.get("end_date")) or origin
+    today = to_day(datetime.now(timezone.utc))
+    budget = project.get('budget', 0)
+    
+    # Rebuild daily buckets only when nothing is cached or the start date moved
+    spend = forecast_cache.get_spend(project_id)
+    if spend is None or spend.origin != origin:
+        version = forecast_cache.version(project_id)
+        columns = await load_columns(expense_store.reads(), {"project_id": project_id}, EXPENSE_FORECAST_FIELDS)
+        amounts = convert_columns(columns, fx_rates.table, project.get("currency") or FX_BASE_CURRENCY)
+        spend = DailySpend.from_columns(origin, amounts, columns["date"])
+        forecast_cache.put_spend(project_id, spend, version)
+    
+    cache_key = (str(today), budget, str(end_day))
+    forecast = forecast_cache.get_result(project_id, cache_key)
+    if forecast is None:
+        forecast = compute_forecast(spend, budget, end_day, today)
+        forecast_cache.put_result(project_id, cache_key, forecast)
+    
+    return {"project_id": project_id, **forecast}
+
 # Documents
+def folder_or_400(path: str) -> str:
+    try:
+        return normalize_folder(path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def next_document_version(project_id: str, folder_path: str, name: str) -> int:
+    """Atomically allocate the next version number for a document name.
+
+    The counter lives in Mongo so concurrent uploads on different workers
+    never get the same version. It is seeded from documents uploaded before
+    the counter existed.
+    """
+    counter_id = f"document_version:{project_id}:{folder_path}:{name}"
+    # Seed from the highest version, not the count: a folder move can bring in documents with any version
+    latest = await db.documents.find_one(
+        {"project_id": project_id, "folder_path": folder_path, "name": name},
+        {"version": 1},
+        sort=[("version", -1)]
+    )
+    await db.counters.update_one({"_id": counter_id}, {"$max": {"seq": latest["version"] if latest else 0}}, upsert=True)
+    counter = await db.counters.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"seq": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
 @api_router.post("/documents/upload")
 async def upload_document(
     file: UploadFile = File(...),
@@ -599,82 +1107,252 @@ async def upload_document(
 ):
     if not project_id:
         raise HTTPException(status_code=400, detail="Project ID is required")
-    
-    # Create project folder if it doesn't exist
-    project_folder = UPLOADS_DIR / project_id
-    project_folder.mkdir(exist_ok=True)
+    folder_path = folder_or_400(folder_path)
     
     # Generate unique filename
     file_extension = Path(file.filename).suffix
     unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = project_folder / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Get file size
-    file_size = os.path.getsize(file_path)
+    key = f"{project_id}/{unique_filename}"
     
-    # Check for existing document with same name to determine version
-    existing_docs = await db.documents.find({
-        "name": file.filename,
-        "project_id": project_id,
-        "folder_path": folder_path
-    }).to_list(1000)
+    # Stream the upload to storage; nothing can be served until it is complete
+    try:
+        file_size = await storage.save(file.file, key, file.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    version = len(existing_docs) + 1
+    version = await next_document_version(project_id, folder_path, file.filename)
     
     # Create document record
+    kind = preview_kind(file.filename)
     document = Document(
         name=file.filename,
         filename=unique_filename,
         version=version,
         project_id=project_id,
         folder_path=folder_path,
-        file_path=str(file_path),
+        file_path=storage.locator(key),
         file_size=file_size,
-        uploaded_by=uploaded_by
+        uploaded_by=uploaded_by,
+        preview_status="pending" if kind else None
     )
     
     document_data = prepare_for_mongo(document.dict())
     await db.documents.insert_one(document_data)
+    search_index.upsert("document", document_data)
+    await document_versions.mark_latest(document_data)
+    await audit.record("create", "document", document.id, project_id, document_data, actor=uploaded_by)
+    
+    # Render the preview and diff the previous version in the background; the upload doesn't wait for either
+    if kind:
+        start_preview(document_data, kind)
+    if document_versions.deltas and version > 1:
+        start_delta(document_data)
     
     return {"message": "File uploaded successfully", "document": document}
 
 @api_router.get("/projects/{project_id}/documents", response_model=List[Document])
-async def get_project_documents(project_id: str, folder_path: str = "/"):
-    documents = await db.documents.find({
-        "project_id": project_id,
-        "folder_path": folder_path
-    }).to_list(1000)
+async def get_project_documents(project_id: str, folder_path: str = "/", recursive: bool = False, all_versions: bool = False):
+    """Latest versions in a folder; recursive=true returns its whole subtree, ordered by folder, in one query"""
+    cursor = folders.documents(project_id, folder_or_400(folder_path), recursive, latest_only=not all_versions)
+    documents = await cursor.to_list(None)
     return [Document(**parse_from_mongo(doc)) for doc in documents]
 
-@api_router.put("/documents/{document_id}/approve")
-async def approve_document(document_id: str, approved_by: str):
-    result = await db.documents.update_one(
-        {"id": document_id},
-        {"$set": {
-            "status": DocumentStatus.APPROVED.value,
-            "approved_by": approved_by,
-            "approved_at": datetime.now(timezone.utc).isoformat()
-        }}
+@api_router.get("/projects/{project_id}/folders")
+async def get_project_folders(project_id: str, folder_path: str = "/"):
+    """Every folder under folder_path with its own and its subtree's document count and size"""
+    return await folders.tree(project_id, folder_or_400(folder_path))
+
+@api_router.post("/projects/{project_id}/folders/move")
+async def move_project_folder(project_id: str, move: FolderMove):
+    """Move or rename a folder and everything below it in one update"""
+    source, target = folder_or_400(move.from_path), folder_or_400(move.to_path)
+    try:
+        moved = await folders.move(project_id, source, target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if moved == 0:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    # Merging into an existing folder can put two versions of a name side by side
+    await document_versions.refresh_latest({"project_id": project_id, **subtree_filter(target)})
+    await audit.record("move", "folder", source, project_id, {"from_path": source, "to_path": target, "moved": moved})
+    return {"message": "Folder moved", "from_path": source, "to_path": target, "moved": moved}
+
+# Approval workflow
+@api_router.post("/documents/{document_id}/submit")
+async def submit_document(document_id: str, submission: ApprovalSubmission):
+    """Send a draft (or rejected) document through its approvers, in order"""
+    try:
+        submitted = await approvals.submit(document_id, submission.approvers, submission.submitted_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not submitted:
+        if not await db.documents.find_one({"id": document_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Document not found")
+        raise HTTPException(status_code=409, detail="Document is already pending approval or approved")
+    await audit.record(
+        "submit", "document", document_id, submitted.get("project_id"),
+        {"approvers": submission.approvers}, submission.submitted_by
     )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Document not found")
+    return {"message": "Document submitted for approval", "current_approver": submission.approvers[0]}
+
+async def decide_document(document_id: str, approver: str, decision: str, comment: Optional[str]):
+    outcome = await approvals.decide([document_id], approver, decision, comment)
+    if not outcome["skipped"]:
+        await audit.record(decision, "document", document_id, outcome["project_ids"][document_id], {"comment": comment}, approver)
+        return
+    # Documents never submitted are approved in one step, as before the workflow existed
+    approved = await approvals.approve_directly(document_id, approver, comment) if decision == "approve" else None
+    if not approved:
+        if not await db.documents.find_one({"id": document_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Document not found")
+        raise HTTPException(status_code=409, detail="Document is not awaiting approval by this user")
+    await audit.record(decision, "document", document_id, approved.get("project_id"), {"comment": comment}, approver)
+
+@api_router.put("/documents/{document_id}/approve")
+async def approve_document(document_id: str, approved_by: str, comment: Optional[str] = None):
+    """Approve the current step (the document is approved once its last approver does), or a never-submitted document outright"""
+    await decide_document(document_id, approved_by, "approve", comment)
     return {"message": "Document approved"}
 
+@api_router.put("/documents/{document_id}/reject")
+async def reject_document(document_id: str, rejected_by: str, comment: Optional[str] = None):
+    await decide_document(document_id, rejected_by, "reject", comment)
+    return {"message": "Document rejected"}
+
+@api_router.post("/approvals/batch")
+async def decide_documents(batch: ApprovalBatch):
+    """Approve or reject many documents at once; ones not waiting on the approver are reported as skipped"""
+    try:
+        outcome = await approvals.decide(batch.document_ids, batch.approver, batch.decision, batch.comment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    project_ids = outcome.pop("project_ids")
+    for document_id in outcome["decided"]:
+        await audit.record(
+            batch.decision, "document", document_id, project_ids[document_id], {"comment": batch.comment}, batch.approver
+        )
+    return outcome
+
+@api_router.get("/approvals/pending/{approver}", response_model=List[Document])
+async def get_pending_approvals(approver: str, request: Request):
+    """The approver's queue, oldest submission first, straight off the queue index"""
+    return await run_list_query(db.documents, APPROVAL_QUEUE_SPEC, request, Document, awaiting(approver))
+
+# Previews never change for a document id (a new upload is a new document), so clients may keep them
+PREVIEW_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# In-flight preview builds by document id, so a request for a preview that is still rendering waits for it
+preview_tasks: Dict[str, asyncio.Task] = {}
+
+async def build_preview(document: dict, kind: str) -> Optional[dict]:
+    """Render a blob's preview and store it beside the blob, under the blob's key plus a suffix"""
+    document_id = document["id"]
+    try:
+        async with document_versions.local_copy(document) as source:
+            preview = await preview_pool.generate(str(source), kind)
+            preview["key"] = preview_path(Path(document_key(document)), kind).as_posix()
+            await storage.put_file(preview["path"], preview["key"], preview["media_type"])
+    except Exception:
+        logger.exception("Failed to build preview for document %s", document_id)
+        await db.documents.update_one({"id": document_id}, bump({"$set": {"preview_status": "failed"}}))
+        return None
+    await db.documents.update_one({"id": document_id}, bump({"$set": {
+        "preview_status": "ready",
+        "preview_key": preview["key"],
+        "preview_media_type": preview["media_type"]
+    }}))
+    return preview
+
+def start_preview(document: dict, kind: str) -> asyncio.Task:
+    document_id = document["id"]
+    task = preview_tasks.get(document_id)
+    if task is None:
+        task = asyncio.create_task(build_preview(document, kind))
+        preview_tasks[document_id] = task
+        task.add_done_callback(lambda _: preview_tasks.pop(document_id, None))
+    return task
+
+# In-flight version diffs, kept referenced until they finish
+delta_tasks = set()
+
+async def store_previous_as_delta(document: dict):
+    previous = await document_versions.previous(document)
+    if previous is None:
+        return
+    # Its preview may still be rendering from the full blob
+    pending = preview_tasks.get(previous["id"])
+    if pending is not None:
+        await asyncio.shield(pending)
+    try:
+        await document_versions.deltify(previous, document)
+    except Exception:
+        logger.exception("Failed to store document %s as a delta", previous["id"])
+
+def start_delta(document: dict):
+    task = asyncio.create_task(store_previous_as_delta(document))
+    delta_tasks.add(task)
+    task.add_done_callback(delta_tasks.discard)
+
+@api_router.get("/documents/{document_id}/preview")
+async def preview_document(document_id: str):
+    """Thumbnail (images, PDF first page) or text snippet, with long cache headers"""
+    document = await db.documents.find_one({"id": document_id})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    kind = preview_kind(document["name"])
+    if kind is None:
+        raise HTTPException(status_code=404, detail="No preview available for this document type")
+    if document.get("preview_status") == "failed":
+        raise HTTPException(status_code=422, detail="Preview could not be generated for this document")
+    
+    key, media_type = document.get("preview_key"), document.get("preview_media_type")
+    if document.get("preview_status") != "ready":
+        # Still rendering, or uploaded before previews existed
+        if not document.get("delta_base_id") and not await storage.exists(document_key(document)):
+            raise HTTPException(status_code=404, detail="File not found")
+        preview = await asyncio.shield(start_preview(document, kind))
+        if preview is None:
+            raise HTTPException(status_code=422, detail="Preview could not be generated for this document")
+        key, media_type = preview["key"], preview["media_type"]
+    
+    try:
+        return await storage.serve(key, media_type=media_type, headers={"Cache-Control": PREVIEW_CACHE_CONTROL})
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Preview not found")
+
 @api_router.get("/documents/{document_id}/download")
 async def download_document(document_id: str):
+    """The file itself, or a redirect to a presigned URL when storage can serve it directly"""
     document = await db.documents.find_one({"id": document_id})
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    file_path = document["file_path"]
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    if not document.get("delta_base_id"):
+        try:
+            return await storage.serve(document_key(document), filename=document["name"])
+        except FileNotFoundError:
+            # Possibly diffed against a newer version since it was read
+            document = await db.documents.find_one({"id": document_id})
+            if not document or not document.get("delta_base_id"):
+                raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(file_path, filename=document["name"])
+    # Stored as a delta: rebuild it, and clean up once the response is sent
+    stack = AsyncExitStack()
+    try:
+        path = await stack.enter_async_context(document_versions.local_copy(document))
+    except Exception:
+        await stack.aclose()
+        logger.exception("Failed to rebuild document %s", document_id)
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path, filename=document["name"], background=BackgroundTask(stack.aclose))
+
+@api_router.get("/documents/{document_id}/versions", response_model=List[Document])
+async def get_document_versions(document_id: str):
+    """Every version of the document's file, newest first"""
+    document = await db.documents.find_one({"id": document_id})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return [Document(**parse_from_mongo(version)) for version in await document_versions.history(document)]
 
 # Dashboard Analytics
 @api_router.put("/projects/{project_id}/stage")
@@ -687,14 +1365,15 @@ async def update_project_stage(project_id: str, stage: str):
     
     result = await db.projects.update_one(
         {"id": project_id},
-        {"$set": {
+        bump({"$set": {
             "stage": stage,
             "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }})
     )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Project not found")
+    await audit.record("update", "project", project_id, project_id, {"stage": stage})
     
     return {"message": "Project stage updated successfully", "new_stage": stage}
 
@@ -702,36 +1381,414 @@ async def update_project_stage(project_id: str, stage: str):
 async def get_dashboard_stats():
     total_projects = await db.projects.count_documents({})
     active_projects = await db.projects.count_documents({"stage": {"$nin": ["closing", "closed"]}})
-    total_expenses = 0
     
-    # Get all expenses
-    all_expenses = await db.expenses.find().to_list(1000)
-    total_expenses = sum(expense.get('amount', 0) for expense in all_expenses)
+    # Every expense, in the base currency; Mongo sums them per project, currency and day first
+    projects = await db.projects.find({}, {"_id": 0, "id": 1, "currency": 1}).to_list(None)
+    project_currencies = {p["id"]: p.get("currency") or FX_BASE_CURRENCY for p in projects}
+    groups = await expense_store.reads().aggregate(spend_by_currency_pipeline({}, by_project=True)).to_list(None)
+    spend = convert_spend(groups, fx_rates.table, FX_BASE_CURRENCY, project_currencies)
     
-    # Get overdue milestones
+    # Get overdue milestones, from the deadline index once it has been built
     current_time = datetime.now(timezone.utc)
-    overdue_milestones = await db.milestones.count_documents({
-        "due_date": {"$lt": current_time.isoformat()},
-        "completed": False
-    })
+    if deadline_index.ready:
+        overdue_milestones = deadline_index.count_overdue(current_time)
+    else:
+        overdue_milestones = await db.milestones.count_documents({
+            "due_date": {"$lt": current_time.isoformat()},
+            "completed": False
+        })
     
     return {
         "total_projects": total_projects,
         "active_projects": active_projects,
-        "total_expenses": total_expenses,
+        "currency": FX_BASE_CURRENCY,
+        "total_expenses": spend["total"],
+        "unconverted": spend["unconverted"],
         "overdue_milestones": overdue_milestones
     }
 
+# Imports
+IMPORT_MODELS = {
+    "resources": ResourceCreate,
+    "expenses": ExpenseCreate,
+}
+# Audit entities are singular, as everywhere else
+IMPORT_AUDIT_ENTITIES = {"resources": "resource", "expenses": "expense"}
+
+@api_router.post("/imports/{entity}")
+async def import_rows(entity: str, file: UploadFile = File(...), project_id: str = None):
+    """Bulk import resources or expenses from a CSV/XLSX upload"""
+    if entity not in IMPORT_MODELS:
+        raise HTTPException(status_code=400, detail=f"Invalid import entity. Must be one of: {list(IMPORT_MODELS)}")
+    
+    try:
+        rows = open_row_reader(file.filename, file.file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Numbered as they appear in a spreadsheet; blank rows are skipped, not failed
+    numbered_rows = number_rows(rows)
+    defaults = {"project_id": project_id} if project_id else None
+    report = ImportReport(entity)
+    touched_projects = set()
+    
+    while True:
+        try:
+            chunk = await run_in_threadpool(read_chunk, numbered_rows, IMPORT_CHUNK_SIZE)
+        except ImportFileError as e:
+            detail = str(e)
+            if report.imported:
+                detail += f" (after {report.imported} rows were imported)"
+            raise HTTPException(status_code=400, detail=detail)
+        if not chunk:
+            break
+        report.total_rows += len(chunk)
+        valid, errors = await run_in_threadpool(validate_chunk, IMPORT_MODELS[entity], chunk, defaults)
+        report.add_errors(errors)
+        if not valid:
+            continue
+        
+        if entity == "resources":
+            resource_objs = [Resource(**item.dict()) for _, item in valid]
+            resource_docs = [prepare_for_mongo(r.dict()) for r in resource_objs]
+            expenses = [Expense(**fields) for fields in derive_expenses(resource_docs)]
+            expense_docs = [prepare_for_mongo(e.dict()) for e in expenses]
+            rejected = await expense_store.insert_resources(resource_docs, expense_docs)
+            written = {r["id"] for i, r in enumerate(resource_docs) if i not in rejected}
+            for resource_doc in resource_docs:
+                if resource_doc["id"] in written:
+                    search_index.upsert("resource", resource_doc)
+            written_expenses = [e for e in expense_docs if e["resource_id"] in written]
+            for expense_doc in written_expenses:
+                search_index.upsert("expense", expense_doc)
+            report.expenses_created += len(written_expenses)
+            touched_projects.update(r.project_id for r in resource_objs)
+        else:
+            expenses = []
+            for _, item in valid:
+                expense_dict = item.dict()
+                if expense_dict.get('date') is None:
+                    expense_dict['date'] = datetime.now(timezone.utc)
+                expenses.append(Expense(**expense_dict))
+            expense_docs = [prepare_for_mongo(e.dict()) for e in expenses]
+            try:
+                await db.expenses.insert_many(expense_docs, ordered=False)
+                rejected = {}
+            except BulkWriteError as e:
+                # Unordered: every other row was still written
+                rejected = rejected_documents(e)
+            for i, expense_doc in enumerate(expense_docs):
+                if i not in rejected:
+                    search_index.upsert("expense", expense_doc)
+            touched_projects.update(e.project_id for e in expenses)
+        report.add_rejected(rejected, valid)
+        report.imported += len(valid) - len(rejected)
+    
+    for touched_project_id in touched_projects:
+        forecast_cache.invalidate(touched_project_id)
+    result = report.as_dict()
+    await audit.record("import", IMPORT_AUDIT_ENTITIES[entity], None, project_id, {"filename": file.filename, "imported": report.imported})
+    
+    return result
+
+# Search
+SEARCH_COLLECTIONS = {
+    "project": "projects",
+    "resource": "resources",
+    "expense": "expenses",
+    "document": "documents",
+}
+
+# One rebuild at a time, as for the deadline index
+search_rebuild_lock = asyncio.Lock()
+
+async def refresh_search_index() -> bool:
+    """Rebuild the search index from a scan of every searchable collection; False if the build failed"""
+    async with search_rebuild_lock:
+        search_index.begin_rebuild()
+        try:
+            entities = []
+            for kind, collection in SEARCH_COLLECTIONS.items():
+                source = expense_store.reads() if kind == "expense" else db[collection]
+                docs = await source.find({}, SEARCH_PROJECTIONS[kind]).to_list(None)
+                entities.extend((kind, doc) for doc in docs)
+            fresh = await run_in_threadpool(SearchIndex.from_entities, entities)
+        except Exception:
+            search_index.abort_rebuild()
+            logger.exception("Failed to build search index")
+            return False
+        search_index.adopt(fresh)
+    logger.info("Search index built with %d entities", len(search_index))
+    return True
+
+async def build_search_index():
+    """First build of the search index, retried with backoff until it succeeds (/readyz waits on it)"""
+    delay = SEARCH_INDEX_RETRY_SECONDS
+    while not await refresh_search_index():
+        logger.warning("Retrying search index build in %d seconds", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, SEARCH_INDEX_RETRY_MAX_SECONDS)
+
+@api_router.get("/search")
+async def search(q: str, project_id: Optional[str] = None, types: Optional[str] = None, limit: int = 20):
+    """Ranked prefix search across projects, resources, expenses and documents"""
+    kinds = None
+    if types:
+        kinds = {t.strip() for t in types.split(",") if t.strip()}
+        invalid = kinds - set(SEARCH_COLLECTIONS)
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid types. Must be any of: {list(SEARCH_COLLECTIONS)}")
+    if not search_index.ready:
+        raise HTTPException(status_code=503, detail="Search index is still building", headers={"Retry-After": "5"})
+    
+    return {"query": q, **search_index.search(q, project_id=project_id, kinds=kinds, limit=min(max(limit, 1), 100))}
+
+# Exports
+@api_router.get("/exports/expenses")
+async def export_expenses(
+    format: str = "csv",
+    project_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    expense_type: Optional[ExpenseType] = None
+):
+    """Stream expenses as CSV or Parquet straight from the database cursor; a date-only end_date includes that day"""
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be one of: ['csv', 'parquet']")
+    if format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    
+    try:
+        query = build_expense_export_query(
+            project_id=project_id,
+            start_date=start_date,
+            end_date=end_date,
+            expense_type=expense_type.value if expense_type else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = expense_store.reads().find(query, EXPENSE_EXPORT_FIELDS).batch_size(EXPORT_BATCH_SIZE)
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    
+    if format == "parquet":
+        return StreamingResponse(
+            stream_parquet(cursor),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="expenses-{timestamp}.parquet"'}
+        )
+    return StreamingResponse(
+        stream_csv(cursor),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="expenses-{timestamp}.csv"'}
+    )
+
+@api_router.get("/analytics/portfolio")
+async def get_portfolio_analytics():
+    """Portfolio-wide burn rate, budget variance and spend breakdowns"""
+    project_columns = await load_columns(db.projects, {}, PROJECT_ANALYTICS_FIELDS)
+    # Expense writes all go through the forecast cache, so its change count versions the arrays
+    version = forecast_cache.changes
+    expenses = portfolio_expenses.get(version)
+    if expenses is None:
+        expense_columns = await load_portfolio_expenses(expense_store.reads())
+        expenses = await run_in_threadpool(build_expense_arrays, expense_columns)
+        portfolio_expenses.put(version, expenses)
+    return await run_in_threadpool(
+        lambda: compute_portfolio(build_project_frame(project_columns, FX_BASE_CURRENCY), expenses, fx=fx_rates.table)
+    )
+
+# Capacity planning
+# Utilization covers this many days from today unless a window is given
+CAPACITY_WINDOW_DAYS = 90
+
+def capacity_type_or_400(resource_type: Optional[str]) -> Optional[str]:
+    if resource_type is not None and resource_type not in CAPACITY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid type. Must be one of: {list(CAPACITY_TYPES)}")
+    return resource_type
+
+async def load_capacity() -> CapacityTimeline:
+    """Allocation timelines of every bookable resource across all projects, from two projected reads"""
+    resources = await db.resources.find({"type": {"$in": list(CAPACITY_TYPES)}}, RESOURCE_CAPACITY_FIELDS).to_list(None)
+    project_ids = list({resource["project_id"] for resource in resources})
+    projects = await db.projects.find({"id": {"$in": project_ids}}, PROJECT_CAPACITY_FIELDS).to_list(None)
+    return await run_in_threadpool(CapacityTimeline.build, resources, projects)
+
+@api_router.get("/capacity/conflicts")
+async def get_capacity_conflicts(resource_type: Optional[str] = Query(None, alias="type"),
+                                 start: Optional[date] = None, end: Optional[date] = None):
+    """Team members and equipment booked past full capacity across projects, with the bookings involved"""
+    resource_type = capacity_type_or_400(resource_type)
+    timeline = await load_capacity()
+    return timeline.conflicts(start, end, resource_type)
+
+@api_router.get("/capacity/utilization")
+async def get_capacity_utilization(resource_type: Optional[str] = Query(None, alias="type"),
+                                   start: Optional[date] = None, end: Optional[date] = None):
+    """Average and peak booked share per team member or machine over a window, busiest first"""
+    resource_type = capacity_type_or_400(resource_type)
+    start = start or datetime.now(timezone.utc).date()
+    end = end or start + timedelta(days=CAPACITY_WINDOW_DAYS - 1)
+    timeline = await load_capacity()
+    try:
+        utilization = timeline.utilization(start, end, resource_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"start": start, "end": end, "resources": utilization}
+
+@api_router.get("/resources/{resource_id}/capacity")
+async def get_resource_capacity(resource_id: str):
+    """Load over time of the person or machine behind a resource, summed over all its projects"""
+    resource = await db.resources.find_one({"id": resource_id}, RESOURCE_CAPACITY_FIELDS)
+    if not resource:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    if resource["type"] not in CAPACITY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Capacity is only tracked for types: {list(CAPACITY_TYPES)}")
+    timeline = await load_capacity()
+    return {
+        "resource": resource["name"],
+        "type": resource["type"],
+        "timeline": timeline.timeline(resource["type"], resource["name"]) or []
+    }
+
+# Deletions
+@api_router.post("/deletions/{deletion_id}/undo")
+async def undo_deletion(deletion_id: str):
+    """Restore everything removed by one delete, while it is still in the trash"""
+    try:
+        restored = await transactions.run(lambda session: trash.restore(deletion_id, session=session))
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Deletion not found or no longer restorable")
+    except (DuplicateKeyError, BulkWriteError) as e:
+        # insert_many reports a duplicate as a BulkWriteError
+        if isinstance(e, BulkWriteError) and any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        raise HTTPException(status_code=409, detail="A restored document already exists")
+    
+    for resource in restored.get("resources", []):
+        search_index.upsert("resource", resource)
+        if isinstance(resource.get("expense"), dict):
+            search_index.upsert("expense", resource["expense"])
+            forecast_cache.invalidate(resource["project_id"])
+    for expense in restored.get("expenses", []):
+        search_index.upsert("expense", expense)
+        forecast_cache.invalidate(expense["project_id"])
+    for milestone in restored.get("milestones", []):
+        schedule_cache.invalidate(milestone["project_id"])
+        if not milestone.get("completed"):
+            deadline_index.add(milestone)
+    
+    # A delete is one entity and what hangs off it, so everything restored belongs to one project
+    projects = {d.get("project_id") for docs in restored.values() for d in docs} - {None}
+    await audit.record(
+        "restore", "deletion", deletion_id, projects.pop() if len(projects) == 1 else None,
+        {c: [d.get("id") for d in docs] for c, docs in restored.items()}
+    )
+    
+    return {
+        "message": "Deletion undone",
+        "restored": {collection: len(docs) for collection, docs in restored.items()}
+    }
+
+async def run_trash_sweeper():
+    while True:
+        try:
+            purged = await trash.purge()
+            if purged:
+                logger.info("Purged %d expired trash entries", purged)
+        except Exception:
+            logger.exception("Failed to purge trash")
+        await asyncio.sleep(TRASH_SWEEP_SECONDS)
+
+# Audit log
+AUDIT_QUERY_DEFAULT_LIMIT = 100
+
+def audit_page(limit: int, before: Optional[datetime]):
+    if limit < 1 or limit > MAX_LIST_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Invalid limit. Must be between 1 and {MAX_LIST_LIMIT}")
+    if before is not None and before.tzinfo is None:
+        before = before.replace(tzinfo=timezone.utc)
+    return limit, before
+
+@api_router.get("/audit/{entity}/{entity_id}")
+async def get_entity_audit(entity: str, entity_id: str, limit: int = AUDIT_QUERY_DEFAULT_LIMIT, before: Optional[datetime] = None):
+    """Changes to one entity, newest first; pass the oldest `at` as `before` for the next page"""
+    limit, before = audit_page(limit, before)
+    return await audit.query({"entity": entity, "entity_id": entity_id}, limit, before)
+
+@api_router.get("/projects/{project_id}/audit")
+async def get_project_audit(project_id: str, entity: Optional[str] = None, limit: int = AUDIT_QUERY_DEFAULT_LIMIT, before: Optional[datetime] = None):
+    """Changes within a project, newest first"""
+    limit, before = audit_page(limit, before)
+    query = {"project_id": project_id}
+    if entity:
+        query["entity"] = entity
+    return await audit.query(query, limit, before)
+
+# Admin endpoints
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+# Exchange rates
+@api_router.get("/fx-rates")
+async def get_fx_rates():
+    return fx_rates.table.describe()
+
+@api_router.post("/admin/fx-rates/reload", dependencies=[Depends(require_admin)])
+async def reload_fx_rates():
+    """Re-read the rate files on every worker"""
+    table = fx_rates.reload()
+    await audit.record("update", "fx_rates", None, changes={"sources": list(table.sources)})
+    return table.describe()
+
+# Admission control
+@api_router.get("/admin/limits", response_model=List[AdmissionRule], dependencies=[Depends(require_admin)])
+async def get_admission_limits():
+    return admission.rules
+
+@api_router.put("/admin/limits", response_model=List[AdmissionRule], dependencies=[Depends(require_admin)])
+async def update_admission_limits(rules: List[AdmissionRule]):
+    """Replace the rate limit and concurrency rules on every worker"""
+    names = [rule.name for rule in rules]
+    if len(names) != len(set(names)):
+        raise HTTPException(status_code=400, detail="Rule names must be unique")
+    admission.configure([rule.model_dump() for rule in rules])
+    await audit.record("update", "admission_limits", None, changes={"rules": names})
+    return admission.rules
+
 # Include the router in the main app
 app.include_router(api_router)
 
+# Innermost, so stored responses are the uncompressed endpoint output
+app.add_middleware(
+    IdempotencyMiddleware,
+    collection=lambda: db.idempotency_keys,
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS
+)
+
+# Outside idempotency so rejected requests never claim a key
+app.add_middleware(AdmissionMiddleware, controller=admission, trusted_proxies=TRUSTED_PROXIES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get('COMPRESSION_MINIMUM_SIZE', '1024'))
 )
+app.add_middleware(ContentNegotiationMiddleware)
+
+# Outermost, so every other middleware and handler sees the actor
+app.add_middleware(ActorMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -740,6 +1797,136 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+background_tasks = []
+
+# Warm-up waits on Mongo with these; /readyz pings with the same timeout
+DATABASE_PING_TIMEOUT_SECONDS = float(os.environ.get('DATABASE_PING_TIMEOUT_SECONDS', '2'))
+WARM_UP_RETRY_SECONDS = 5
+SEARCH_INDEX_RETRY_SECONDS = 5
+SEARCH_INDEX_RETRY_MAX_SECONDS = 300
+warm_up_state = {"done": False}
+
+async def resync_caches():
+    forecast_cache.clear()
+    schedule_cache.clear()
+    await refresh_deadline_index()
+    await refresh_search_index()
+
+cache_events.on_resync(resync_caches)
+
+async def ping_database() -> bool:
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), DATABASE_PING_TIMEOUT_SECONDS)
+        return True
+    except Exception:
+        return False
+
+async def warm_up():
+    """Wait for Mongo, then build indexes and in-process caches"""
+    while not await ping_database():
+        logger.warning("Database not reachable, retrying in %d seconds", WARM_UP_RETRY_SECONDS)
+        await asyncio.sleep(WARM_UP_RETRY_SECONDS)
+    
+    try:
+        background_tasks.extend(await cache_events.start(db))
+    except Exception:
+        logger.exception("Failed to start cache event bus")
+    await ensure_list_indexes()
+    try:
+        await transactions.detect()
+        await expense_store.ensure_view()
+    except Exception:
+        logger.exception("Failed to prepare resource expense storage")
+    try:
+        await backfill_revisions(db)
+    except Exception:
+        logger.exception("Failed to backfill document revisions")
+    try:
+        await backfill_derived_flags(db)
+    except Exception:
+        logger.exception("Failed to backfill derived expense flags")
+    try:
+        await backfill_utc(db)
+    except Exception:
+        logger.exception("Failed to backfill UTC datetimes")
+    try:
+        await folders.ensure_indexes()
+        await folders.normalize_stored()
+        await document_versions.backfill()
+    except Exception:
+        logger.exception("Failed to prepare document folders")
+    try:
+        await run_in_threadpool(fx_rates.load)
+    except Exception:
+        logger.exception("Failed to load FX rates from %s", FX_RATES_DIR)
+    try:
+        await approvals.ensure_indexes()
+    except Exception:
+        logger.exception("Failed to create approval queue index")
+    try:
+        await trash.ensure_indexes()
+    except Exception:
+        logger.exception("Failed to create trash indexes")
+    background_tasks.append(asyncio.create_task(run_trash_sweeper()))
+    try:
+        await ensure_ttl_index(db.idempotency_keys, IDEMPOTENCY_TTL_SECONDS)
+        if RATE_LIMIT_BACKEND == 'mongo':
+            await ensure_bucket_ttl_index(db.rate_limits)
+    except Exception:
+        logger.exception("Failed to create TTL indexes")
+    try:
+        await refresh_deadline_index()
+    except Exception:
+        logger.exception("Failed to refresh milestone deadline index")
+    background_tasks.append(asyncio.create_task(run_deadline_scheduler()))
+    await build_search_index()
+    warm_up_state["done"] = True
+    logger.info("Warm-up complete")
+
+async def start_worker():
+    # Only cheap, local work here so the worker accepts connections (and
+    # answers /healthz) immediately; everything that touches Mongo is warm-up
+    connect_database()
+    if not TRUSTED_PROXIES and any(rule.rate for rule in admission.rules):
+        logger.warning("Rate limits are per client address but TRUSTED_PROXIES is unset; "
+                       "behind a proxy every client shares one bucket")
+    background_tasks.append(asyncio.create_task(audit.run()))
+    if STORAGE_BACKEND == 'local':
+        UPLOADS_DIR.mkdir(exist_ok=True)
+    background_tasks.append(asyncio.create_task(warm_up()))
+
+async def stop_worker():
+    for task in background_tasks:
+        task.cancel()
+    # Let the audit writer stop before flush() picks up the batch it held
+    if background_tasks:
+        await asyncio.wait(background_tasks, timeout=AUDIT_SHUTDOWN_FLUSH_SECONDS)
+    background_tasks.clear()
+    try:
+        await asyncio.wait_for(audit.flush(), AUDIT_SHUTDOWN_FLUSH_SECONDS)
+    except Exception:
+        logger.exception("Failed to flush the audit log")
+    preview_pool.shutdown()
+    if client is not None:
+        client.close()
+
+# Probes, outside /api so they bypass the API ingress
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: Mongo answers and warm-up has built the caches"""
+    checks = {
+        "database": await ping_database(),
+        "warm_up": warm_up_state["done"],
+        "search_index": search_index.ready,
+        "deadline_index": deadline_index.ready,
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks}
+    )
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, RedirectResponse, Response
+
+
+STORAGE_BACKENDS = ("local", "s3")
+
+# Presigned download links stay valid this long
+PRESIGN_EXPIRY_SECONDS = 300
+
+# Parts of this size are uploaded and downloaded in parallel; smaller files go in one request
+MULTIPART_CHUNK_BYTES = 8 * 1024 * 1024
+TRANSFER_CONCURRENCY = 4
+
+
+def content_disposition(filename: str) -> str:
+    return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+class _CountingReader:
+    """File-like wrapper that counts the bytes read through it"""
+
+    def __init__(self, source):
+        self.source = source
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.source.read(size)
+        self.size += len(chunk)
+        return chunk
+
+
+class LocalStorage:
+    """Blobs as files under one directory, on local disk or a shared mount"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Storage key escapes the storage root: {key}")
+        return path
+
+    def locator(self, key: str) -> str:
+        return str(self.path(key))
+
+    def _save(self, source, key: str) -> int:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Save under a temporary name and rename, so nobody can serve a partial file
+        partial_path = path.with_name(path.name + ".part")
+        with open(partial_path, "wb") as buffer:
+            shutil.copyfileobj(source, buffer, MULTIPART_CHUNK_BYTES)
+        os.replace(partial_path, path)
+        return path.stat().st_size
+
+    async def save(self, source, key: str, content_type: Optional[str] = None) -> int:
+        return await run_in_threadpool(self._save, source, key)
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self.path(key).is_file)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.path(key).unlink, True)
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        yield self.path(key)
+
+    async def put_file(self, path: str, key: str, content_type: Optional[str] = None):
+        target = self.path(key)
+        if Path(path).resolve() != target:
+            await run_in_threadpool(os.replace, path, target)
+
+    async def serve(self, key: str, filename: Optional[str] = None, media_type: Optional[str] = None,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+        path = self.path(key)
+        if not await run_in_threadpool(path.is_file):
+            raise FileNotFoundError(key)
+        return FileResponse(path, filename=filename, media_type=media_type, headers=headers)
+
+
+class S3Storage:
+    """Blobs in an S3-compatible bucket (AWS, MinIO, Ceph RGW).
+
+    Uploads stream the request body through boto3's managed transfer, which
+    switches to a multipart upload with parts sent in parallel above one
+    chunk. Downloads are redirects to presigned URLs, so the bytes go from
+    the bucket to the client without passing through the API.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 presign_seconds: int = PRESIGN_EXPIRY_SECONDS, client=None):
+        self.bucket = bucket
+        self.presign_seconds = presign_seconds
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        from boto3.s3.transfer import TransferConfig
+
+        self.transfer = TransferConfig(
+            multipart_threshold=MULTIPART_CHUNK_BYTES,
+            multipart_chunksize=MULTIPART_CHUNK_BYTES,
+            max_concurrency=TRANSFER_CONCURRENCY,
+        )
+
+    def locator(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def _save(self, source, key: str, content_type: Optional[str]) -> int:
+        reader = _CountingReader(source)
+        extra = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(reader, self.bucket, key, ExtraArgs=extra, Config=self.transfer)
+        return reader.size
+
+    async def save(self, source, key: str, content_type: Optional[str] = None) -> int:
+        return await run_in_threadpool(self._save, source, key, content_type)
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def exists(self, key: str) -> bool:
+        return await run_in_threadpool(self._exists, key)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    @asynccontextmanager
+    async def local_copy(self, key: str) -> AsyncIterator[Path]:
+        """Download to a temporary directory for work that needs a real file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / Path(key).name
+            await run_in_threadpool(self.client.download_file, self.bucket, key, str(path), Config=self.transfer)
+            yield path
+
+    async def put_file(self, path: str, key: str, content_type: Optional[str] = None):
+        extra = {"ContentType": content_type} if content_type else None
+        await run_in_threadpool(self.client.upload_file, str(path), self.bucket, key, ExtraArgs=extra, Config=self.transfer)
+
+    async def serve(self, key: str, filename: Optional[str] = None, media_type: Optional[str] = None,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        if media_type:
+            params["ResponseContentType"] = media_type
+        # The caller's headers describe the blob, so they go on the bucket's response
+        cache_control = (headers or {}).get("Cache-Control")
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        url = await run_in_threadpool(
+            self.client.generate_presigned_url, "get_object", Params=params, ExpiresIn=self.presign_seconds
+        )
+        # The link expires, so the redirect itself may only be reused well within that
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": f"private, max-age={self.presign_seconds // 2}"})
+
+
+def create_storage(backend: str, uploads_dir: Path, environ=os.environ):
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Invalid storage backend. Must be one of: {list(STORAGE_BACKENDS)}")
+    if backend == "local":
+        return LocalStorage(uploads_dir)
+    return S3Storage(
+        bucket=environ["S3_BUCKET"],
+        endpoint_url=environ.get("S3_ENDPOINT_URL"),
+        region=environ.get("S3_REGION"),
+        presign_seconds=int(environ.get("S3_PRESIGN_SECONDS", str(PRESIGN_EXPIRY_SECONDS))),
+    )
@@ -0,0 +1,74 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from revisions import REV_FIELD
+
+
+# Datetime fields stored as ISO strings, by collection. They are written in UTC
+# so that range filters, which compare the strings, compare instants.
+STORED_DATETIME_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at"],
+    "projects": ["start_date", "end_date", "created_at", "updated_at"],
+    "resources": ["created_at", "updated_at", "expense.date", "expense.created_at", "expense.updated_at"],
+    "milestones": ["due_date", "completed_date", "created_at", "updated_at"],
+    "expenses": ["date", "created_at", "updated_at"],
+    "documents": ["uploaded_at", "approved_at", "submitted_at", "updated_at"],
+}
+
+# Stored datetimes with a time part and an offset other than UTC's (or none)
+NOT_UTC = {"$type": "string", "$regex": "T", "$not": {"$regex": r"\+00:00$"}}
+
+
+def utc_iso(value: datetime) -> str:
+    """The stored form of a datetime; naive ones are taken to be UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def parse_iso(raw: str) -> datetime:
+    return datetime.fromisoformat(raw.strip().replace('Z', '+00:00'))
+
+
+def range_bound(raw: str, upper: bool) -> Tuple[str, str]:
+    """Mongo operator and stored-form value for one end of a date range.
+
+    A bare date means the whole day, so as an upper bound it is "before
+    the next day" rather than "up to its midnight". Raises ValueError for
+    anything that is not an ISO 8601 date or datetime.
+    """
+    value = parse_iso(raw)
+    if not upper:
+        return "$gte", utc_iso(value)
+    try:
+        date.fromisoformat(raw.strip())
+    except ValueError:
+        return "$lte", utc_iso(value)
+    return "$lt", utc_iso(value + timedelta(days=1))
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+
+async def backfill_utc(db, fields: Dict[str, List[str]] = STORED_DATETIME_FIELDS) -> int:
+    """Rewrite datetimes stored with a client's UTC offset (or none) in UTC; returns how many changed"""
+    changed = 0
+    for name, paths in fields.items():
+        for path in paths:
+            owner = path.rpartition(".")[0]
+            rev_path = f"{owner}.{REV_FIELD}" if owner else REV_FIELD
+            async for doc in db[name].find({path: NOT_UTC}, {path: 1}):
+                raw = _get(doc, path)
+                try:
+                    value = utc_iso(parse_iso(raw))
+                except ValueError:
+                    continue
+                # Conditional on the value read, so a write in between is left alone
+                result = await db[name].update_one(
+                    {"_id": doc["_id"], path: raw}, {"$set": {path: value}, "$inc": {rev_path: 1}}
+                )
+                changed += result.modified_count
+    return changed
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Optional
+
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
+
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_MODES = ("auto", "always", "never")
+
+# Attempts at the whole unit of work on TransientTransactionError
+TRANSACTION_ATTEMPTS = 5
+
+# Commit retries on UnknownTransactionCommitResult, which is safe to repeat
+COMMIT_ATTEMPTS = 5
+
+# Base for jittered exponential backoff between attempts
+RETRY_BACKOFF_SECONDS = 0.01
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+
+class TransactionRunner:
+    """Runs a unit of work in a MongoDB multi-document transaction.
+
+    The work is an async callable taking the session (None when
+    transactions are unavailable) and must do all of its reads and writes
+    through it. It may be run more than once, so side effects outside the
+    database belong after run() returns. Standalone servers have no
+    transactions; in "auto" mode detect() notices and the work runs
+    without one.
+    """
+
+    def __init__(self, client: Callable[[], Any], mode: str = "auto"):
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f"Invalid transaction mode. Must be one of: {list(TRANSACTION_MODES)}")
+        self.client = client
+        self.mode = mode
+        self.supported: Optional[bool] = None if mode == "auto" else mode == "always"
+        self.retries = 0
+
+    async def detect(self) -> bool:
+        """Transactions need a replica set member or a mongos"""
+        if self.supported is None:
+            hello = await self.client().admin.command("hello")
+            self.supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+            if not self.supported:
+                logger.warning("MongoDB is standalone; multi-document writes run without transactions")
+        return self.supported
+
+    async def run(self, work: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.supported is None:
+            try:
+                await self.detect()
+            except PyMongoError:
+                logger.exception("Could not detect transaction support")
+                return await work(None)
+        if not self.supported:
+            return await work(None)
+
+        async with await self.client().start_session() as session:
+            for attempt in range(TRANSACTION_ATTEMPTS):
+                session.start_transaction(write_concern=WriteConcern("majority"))
+                try:
+                    result = await work(session)
+                except BaseException as e:
+                    if session.in_transaction:
+                        await session.abort_transaction()
+                    if self._retryable(e, "TransientTransactionError", attempt):
+                        await asyncio.sleep(_backoff(attempt))
+                        continue
+                    raise
+                try:
+                    await self._commit(session)
+                except PyMongoError as e:
+                    if self._retryable(e, "TransientTransactionError", attempt):
+                        await asyncio.sleep(_backoff(attempt))
+                        continue
+                    raise
+                return result
+
+    async def _commit(self, session):
+        for attempt in range(COMMIT_ATTEMPTS):
+            try:
+                await session.commit_transaction()
+                return
+            except PyMongoError as e:
+                if not self._retryable(e, "UnknownTransactionCommitResult", attempt, COMMIT_ATTEMPTS):
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+
+    def _retryable(self, error: BaseException, label: str, attempt: int, attempts: int = TRANSACTION_ATTEMPTS) -> bool:
+        if attempt + 1 >= attempts:
+            return False
+        if isinstance(error, (ConnectionFailure, OperationFailure)) and error.has_error_label(label):
+            self.retries += 1
+            logger.info("Retrying transaction after %s (attempt %d)", label, attempt + 1)
+            return True
+        return False
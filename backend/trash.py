@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from revisions import REV_FIELD
+
+
+# Deleted documents are kept this long, and can be restored until then
+TRASH_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# Expired entries are purged this many at a time
+PURGE_BATCH_SIZE = 500
+
+TRASH_COLLECTION = "trash"
+
+
+def _aware(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class Trash:
+    """Deleted documents, moved aside whole so they can be put back.
+
+    A delete moves every document it removes (a resource, its expenses)
+    into one collection under a shared deletion_id and restore moves them
+    back. The live collections only ever hold live rows, so their queries
+    and indexes are exactly what they were before deletes were undoable.
+    Expired entries are purged in batches by purge().
+    """
+
+    def __init__(self, db: Callable[[], Any], retention_seconds: int = TRASH_RETENTION_SECONDS):
+        self.db = db
+        self.retention = timedelta(seconds=retention_seconds)
+
+    def restorable_until(self, deleted_at: datetime) -> datetime:
+        return _aware(deleted_at) + self.retention
+
+    async def ensure_indexes(self):
+        collection = self.db()[TRASH_COLLECTION]
+        await collection.create_index("deletion_id")
+        await collection.create_index("deleted_at")
+
+    async def move(self, collection: str, query: Dict[str, Any], deletion_id: str, session=None) -> List[dict]:
+        """Move the documents matching query into the trash; returns them"""
+        db = self.db()
+        docs = await db[collection].find(query, session=session).to_list(None)
+        if not docs:
+            return []
+        deleted_at = datetime.now(timezone.utc)
+        # Copy before deleting, so without a transaction a failure leaves a duplicate rather than a loss
+        await db[TRASH_COLLECTION].insert_many([
+            {"deletion_id": deletion_id, "collection": collection, "deleted_at": deleted_at, "doc": doc}
+            for doc in docs
+        ], session=session)
+        await db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}}, session=session)
+        return docs
+
+    async def restore(self, deletion_id: str, now: Optional[datetime] = None, session=None) -> Dict[str, List[dict]]:
+        """Put a deletion back; returns the restored documents by collection.
+
+        Raises LookupError when the deletion is unknown, already restored or
+        past the retention window.
+        """
+        now = now or datetime.now(timezone.utc)
+        db = self.db()
+        entries = await db[TRASH_COLLECTION].find({"deletion_id": deletion_id}, session=session).to_list(None)
+        if not entries or now > self.restorable_until(entries[0]["deleted_at"]):
+            raise LookupError(deletion_id)
+
+        restored = defaultdict(list)
+        for entry in entries:
+            doc = entry["doc"]
+            # Coming back is a write like any other
+            doc[REV_FIELD] = doc.get(REV_FIELD, 1) + 1
+            restored[entry["collection"]].append(doc)
+        for collection, docs in restored.items():
+            await db[collection].insert_many(docs, session=session)
+        await db[TRASH_COLLECTION].delete_many({"deletion_id": deletion_id}, session=session)
+        return dict(restored)
+
+    async def purge(self, now: Optional[datetime] = None) -> int:
+        """Delete expired entries in bounded batches; returns how many went"""
+        now = now or datetime.now(timezone.utc)
+        collection = self.db()[TRASH_COLLECTION]
+        purged = 0
+        while True:
+            batch = await collection.find({"deleted_at": {"$lt": now - self.retention}}, {"_id": 1}).limit(PURGE_BATCH_SIZE).to_list(PURGE_BATCH_SIZE)
+            if not batch:
+                return purged
+            result = await collection.delete_many({"_id": {"$in": [entry["_id"] for entry in batch]}})
+            purged += result.deleted_count
+            if len(batch) < PURGE_BATCH_SIZE:
+                return purged
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark capacity timelines over synthetic allocations
+
+Usage: python benchmarks/bench_capacity.py [resource_count]
+"""
+
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from capacity import CapacityTimeline  # noqa: E402
+
+BUDGET_MS = 1000
+
+AVAILABILITIES = ["Full-time", "Part-time", "50%", "20 hours/week", "Available", "On-demand"]
+
+
+def synthetic(resource_count, projects_per_resource=4, project_count=2000, seed=5):
+    rng = np.random.default_rng(seed)
+    first_day = date(2025, 1, 1)
+    starts = rng.integers(0, 730, project_count)
+    lengths = rng.integers(30, 365, project_count)
+    projects = [
+        {
+            "id": f"project-{i}",
+            "name": f"Project {i}",
+            "start_date": (first_day + timedelta(days=int(starts[i]))).isoformat() + "T00:00:00+00:00",
+            "end_date": (first_day + timedelta(days=int(starts[i] + lengths[i]))).isoformat() + "T00:00:00+00:00",
+        }
+        for i in range(project_count)
+    ]
+    resources = []
+    for person in range(resource_count):
+        kind = "team_member" if person % 5 else "equipment"
+        for project in rng.choice(project_count, projects_per_resource, replace=False):
+            resources.append({
+                "id": f"resource-{len(resources)}",
+                "name": f"{kind} {person}",
+                "type": kind,
+                "availability": AVAILABILITIES[int(rng.integers(len(AVAILABILITIES)))],
+                "project_id": f"project-{project}",
+            })
+    return resources, projects
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    resources, projects = synthetic(count)
+    print(f"{count:,} people and machines, {len(resources):,} allocations over {len(projects):,} projects")
+
+    build_ms, timeline = timed(lambda: CapacityTimeline.build(resources, projects))
+    conflicts_ms, conflicts = timed(timeline.conflicts)
+    utilization_ms, _ = timed(lambda: timeline.utilization(date(2025, 6, 1), date(2025, 8, 29)))
+    print(f"build        median={build_ms:8.1f} ms  segments={len(timeline.segments['load']):,}")
+    print(f"conflicts    median={conflicts_ms:8.1f} ms  found={len(conflicts):,}")
+    print(f"utilization  median={utilization_ms:8.1f} ms")
+    total = build_ms + max(conflicts_ms, utilization_ms)
+    print(f"slowest request {total:.1f} ms (budget {BUDGET_MS} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Benchmark the CSV import path (parse, validate, derive expenses) without a database
+
+Usage: python benchmarks/bench_import.py [row_count]
+"""
+
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from imports import IMPORT_CHUNK_SIZE, open_row_reader, read_chunk, validate_chunk  # noqa: E402
+from server import Resource, ResourceCreate, build_resource_expense, prepare_for_mongo  # noqa: E402
+
+
+def synthetic_csv(row_count):
+    types = ["team_member", "vendor", "equipment", "material"]
+    lines = ["name,type,cost_per_unit,availability,allocated_amount,description"]
+    for i in range(row_count):
+        lines.append(f"Resource {i},{types[i % 4]},{(i % 500) + 1}.25,available,{i % 10},Imported row {i}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    payload = synthetic_csv(row_count)
+
+    start = time.perf_counter()
+    numbered_rows = enumerate(open_row_reader("bench.csv", io.BytesIO(payload)), start=2)
+    imported = expenses = failed = 0
+    while True:
+        chunk = read_chunk(numbered_rows, IMPORT_CHUNK_SIZE)
+        if not chunk:
+            break
+        valid, errors = validate_chunk(ResourceCreate, chunk, {"project_id": "bench-project"})
+        failed += len(errors)
+        resources = [Resource(**item.dict()) for _, item in valid]
+        derived = [e for e in (build_resource_expense(r) for r in resources) if e]
+        [prepare_for_mongo(r.dict()) for r in resources]
+        [prepare_for_mongo(e.dict()) for e in derived]
+        imported += len(resources)
+        expenses += len(derived)
+    elapsed = time.perf_counter() - start
+
+    print(f"rows={row_count} imported={imported} expenses={expenses} failed={failed}")
+    print(f"elapsed: {elapsed:.2f} s ({row_count / elapsed:,.0f} rows/s, excluding database writes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Benchmark the /analytics/portfolio path over synthetic expense data
+
+Mongo's share (portfolio_expense_pipeline summing expenses per project,
+type, currency and day) is simulated up front with pandas and not timed.
+Everything the endpoint does with its output is: reading the packed
+documents into columns, encoding them, and the portfolio with FX
+conversion. The warm path is a request served from the cached arrays.
+
+Usage: python benchmarks/bench_portfolio.py [expense_count] [project_count]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from analytics import build_expense_arrays, build_project_frame, compute_portfolio, load_portfolio_expenses  # noqa: E402
+from fx import FxRateTable  # noqa: E402
+
+BUDGET_MS = 1000
+
+
+def synthetic_projects(project_count, rng):
+    return {
+        "id": [f"project-{i}" for i in range(project_count)],
+        "name": [f"Project {i}" for i in range(project_count)],
+        "stage": ["execution"] * project_count,
+        "budget": rng.uniform(1e5, 1e7, project_count).tolist(),
+        "currency": rng.choice(np.array(["USD", "EUR", None], dtype=object), project_count, p=[0.6, 0.2, 0.2]).tolist(),
+        "start_date": ["2023-01-01T00:00:00+00:00"] * project_count,
+        "end_date": ["2025-12-31T00:00:00+00:00"] * project_count,
+    }
+
+
+def synthetic_groups(expense_count, project_count, rng):
+    """The packed documents portfolio_expense_pipeline would return for these expenses"""
+    days = np.datetime64("2023-01-01") + rng.integers(0, 900, expense_count).astype("timedelta64[D]")
+    expenses = pd.DataFrame({
+        "project_id": pd.Categorical.from_codes(rng.integers(0, project_count, expense_count),
+                                                [f"project-{i}" for i in range(project_count)]),
+        "expense_type": rng.choice(["resource", "vendor", "equipment", "material", "other"], expense_count),
+        # Most expenses are in their project's currency
+        "currency": rng.choice(np.array(["", "EUR", "GBP"], dtype=object), expense_count, p=[0.8, 0.1, 0.1]),
+        "date": days.astype(str),
+        "amount": rng.uniform(10, 5000, expense_count).round(2),
+    })
+    rows = expenses.groupby(["project_id", "expense_type", "currency", "date"], observed=True).agg(
+        amount=("amount", "sum"), count=("amount", "size")
+    ).reset_index()
+    rows["currency"] = rows["currency"].replace("", None)
+    rows["month"] = rows["date"].str[:7]
+    docs = []
+    for (project_id, month), group in rows.groupby(["project_id", "month"], observed=True):
+        docs.append({
+            "_id": {"project_id": project_id, "month": month},
+            "expense_type": group["expense_type"].tolist(),
+            "currency": group["currency"].tolist(),
+            "date": group["date"].tolist(),
+            "amount": group["amount"].tolist(),
+            "count": group["count"].tolist(),
+        })
+    return docs, len(rows)
+
+
+def synthetic_rates(rng):
+    days = np.datetime64("2023-01-01") + np.arange(900).astype("timedelta64[D]")
+    dates = [str(day) for day in days] * 2
+    currencies = ["EUR"] * len(days) + ["GBP"] * len(days)
+    rates = rng.uniform(0.85, 0.95, len(days)).tolist() + rng.uniform(0.75, 0.8, len(days)).tolist()
+    return FxRateTable.from_quotes("USD", dates, currencies, rates)
+
+
+class PackedCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.position = 0
+
+    async def to_list(self, length):
+        batch = self.docs[self.position:self.position + length]
+        self.position += length
+        return batch
+
+
+class PackedCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def aggregate(self, pipeline, **kwargs):
+        return PackedCursor(self.docs)
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    expense_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    project_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = np.random.default_rng(7)
+    project_columns = synthetic_projects(project_count, rng)
+    docs, row_count = synthetic_groups(expense_count, project_count, rng)
+    fx = synthetic_rates(rng)
+    collection = PackedCollection(docs)
+    print(f"{expense_count:,} expenses, {project_count} projects -> {row_count:,} grouped rows in {len(docs):,} documents")
+
+    load_ms, columns = timed(lambda: asyncio.run(load_portfolio_expenses(collection)))
+    build_ms, expenses = timed(lambda: build_expense_arrays(columns))
+
+    def compute():
+        return compute_portfolio(build_project_frame(project_columns, "USD"), expenses, fx=fx)
+
+    compute_ms, result = timed(compute)
+    assert result["totals"]["expenses"] == expense_count
+    cold_ms = load_ms + build_ms + compute_ms
+    print(f"load         median={load_ms:8.1f} ms")
+    print(f"build        median={build_ms:8.1f} ms")
+    print(f"compute+fx   median={compute_ms:8.1f} ms  unconverted={result['totals']['unconverted_expenses']}")
+    print(f"cold request {cold_ms:.1f} ms (budget {BUDGET_MS} ms)")
+    print(f"warm request {compute_ms:.1f} ms (cached arrays)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Benchmark resource/expense write latency across storage and transaction modes
+
+Runs the create -> reprice -> delete cycle the API performs for a vendor
+resource with a derived expense, through ExpenseStore and TransactionRunner:
+
+  plain          separate collections, no transaction
+  transactional  separate collections inside a multi-document transaction
+  embedded       expense embedded on the resource, no transaction needed
+
+Transactions need a replica set (e.g. mongod --replSet rs0 after
+rs.initiate()); the transactional run is skipped on a standalone server.
+
+Usage: MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python benchmarks/bench_resource_writes.py [cycles]
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from expense_store import ExpenseStore
+from revisions import update_revision
+from transactions import TransactionRunner
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("BENCH_DB_NAME", "benchmark_resource_writes")
+
+
+def documents(project_id, cost):
+    resource_id = str(uuid.uuid4())
+    resource = {"id": resource_id, "name": "Crane", "type": "equipment", "project_id": project_id,
+                "cost_per_unit": cost, "allocated_amount": 2.0}
+    expense = {"id": str(uuid.uuid4()), "description": "Equipment: Crane", "amount": cost * 2,
+               "expense_type": "equipment", "project_id": project_id, "resource_id": resource_id}
+    return resource, expense
+
+
+async def cycle(store, runner, project_id):
+    """Milliseconds for create, reprice and delete of one resource"""
+    resource, expense = documents(project_id, 100.0)
+    timings = []
+
+    started = time.perf_counter()
+    await runner.run(lambda session: store.insert_resource(resource, expense, session))
+    timings.append(time.perf_counter() - started)
+
+    repriced = {**expense, "id": str(uuid.uuid4()), "amount": 300.0}
+
+    async def reprice(session):
+        await update_revision(store.db().resources, {"id": resource["id"]}, {"$set": {"cost_per_unit": 150.0}}, session=session)
+        await store.replace_derived(resource["id"], repriced, session)
+
+    started = time.perf_counter()
+    await runner.run(reprice)
+    timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await runner.run(lambda session: store.delete_resource(resource["id"], session=session))
+    timings.append(time.perf_counter() - started)
+    return [t * 1000 for t in timings]
+
+
+async def measure(client, mode, transaction_mode, cycles):
+    db = client[DB_NAME]
+    store = ExpenseStore(lambda: db, mode)
+    runner = TransactionRunner(lambda: client, transaction_mode)
+    project_id = str(uuid.uuid4())
+    for _ in range(20):
+        await cycle(store, runner, project_id)
+    results = [await cycle(store, runner, project_id) for _ in range(cycles)]
+    return [sorted(step) for step in zip(*results)], runner.retries
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[DB_NAME]
+    await db.resources.drop()
+    await db.expenses.drop()
+    # Collections must exist before a transaction writes to them on older servers
+    await db.create_collection("resources")
+    await db.create_collection("expenses")
+    await ExpenseStore(lambda: db, "embedded").ensure_view()
+
+    hello = await client.admin.command("hello")
+    replica_set = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    runs = [("plain", "collection", "never"), ("transactional", "collection", "always"), ("embedded", "embedded", "never")]
+    for label, mode, transaction_mode in runs:
+        if transaction_mode == "always" and not replica_set:
+            print(f"{label:<14} skipped: server is standalone")
+            continue
+        steps, retries = await measure(client, mode, transaction_mode, cycles)
+        line = "  ".join(
+            f"{name} p50 {statistics.median(step):6.2f} ms p99 {percentile(step, 0.99):6.2f} ms"
+            for name, step in zip(("create", "reprice", "delete"), steps)
+        )
+        print(f"{label:<14} {line}  retries {retries}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark response encoding and compression per list route
+
+Compares bytes on the wire and encode CPU for the stdlib JSON encoder
+FastAPI used before, orjson and MessagePack, then each negotiated
+compression codec on top of the orjson body.
+
+Usage: python benchmarks/bench_responses.py [rows_per_route]
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from starlette.responses import JSONResponse  # noqa: E402
+
+from responses import BrotliEncoder, GzipEncoder, ZstdEncoder, encode_json, encode_msgpack  # noqa: E402
+from server import Expense, Milestone, Project, Resource  # noqa: E402
+
+
+def synthetic_routes(rows):
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    words = ["steel", "concrete", "crane", "survey", "permit", "labour", "rebar", "glazing", "scaffold", "timber"]
+
+    def phrase(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    projects = [
+        Project(name=f"Project {i}", description=phrase(12), start_date=start, end_date=start + timedelta(days=365),
+                budget=rng.uniform(1e5, 5e6), manager_id=f"manager-{i % 20}")
+        for i in range(max(rows // 5, 1))
+    ]
+    resources = [
+        Resource(name=f"{phrase(2).title()} {i}", type=rng.choice(["team_member", "vendor", "equipment", "material"]),
+                 cost_per_unit=rng.uniform(10, 5000), availability="available", project_id="project-1",
+                 allocated_amount=rng.randint(0, 40), description=phrase(8))
+        for i in range(rows)
+    ]
+    milestones = [
+        Milestone(title=f"{phrase(3).title()}", description=phrase(10), due_date=start + timedelta(days=rng.randint(0, 365)),
+                  project_id="project-1", completed=rng.random() < 0.4)
+        for _ in range(rows)
+    ]
+    expenses = [
+        Expense(description=f"{phrase(2).title()}: invoice {i}", amount=round(rng.uniform(5, 25000), 2),
+                expense_type=rng.choice(["resource", "vendor", "equipment", "material", "other"]),
+                project_id="project-1", date=start + timedelta(days=rng.randint(0, 365)))
+        for i in range(rows)
+    ]
+    # Serialize the way FastAPI does before handing content to the response class
+    return {
+        "GET /projects": [p.model_dump(mode="json") for p in projects],
+        "GET /projects/{id}/resources": [r.model_dump(mode="json") for r in resources],
+        "GET /projects/{id}/milestones": [m.model_dump(mode="json") for m in milestones],
+        "GET /projects/{id}/expenses": [e.model_dump(mode="json") for e in expenses],
+    }
+
+
+def timed(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return result, samples[len(samples) // 2] * 1000
+
+
+def compress(encoder_class, body):
+    encoder = encoder_class()
+    return encoder.compress(body) + encoder.finish()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    stdlib = JSONResponse(None)
+
+    for route, content in synthetic_routes(rows).items():
+        print(f"{route}  ({len(content)} rows)")
+        encodings = [
+            ("json (stdlib)", lambda: stdlib.render(content)),
+            ("orjson", lambda: encode_json(content)),
+            ("msgpack", lambda: encode_msgpack(content)),
+        ]
+        baseline = None
+        for name, fn in encodings:
+            body, ms = timed(fn)
+            baseline = baseline or len(body)
+            print(f"  {name:<16} {len(body):>10,} bytes  {len(body) / baseline:6.1%}  encode {ms:7.2f} ms")
+
+        body = encode_json(content)
+        for encoder_class in (GzipEncoder, BrotliEncoder, ZstdEncoder):
+            compressed, ms = timed(lambda: compress(encoder_class, body))
+            print(f"  orjson+{encoder_class.name:<9} {len(compressed):>10,} bytes  {len(compressed) / baseline:6.1%}  compress {ms:5.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
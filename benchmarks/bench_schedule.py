@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark critical-path scheduling over a synthetic milestone graph
+
+Usage: python benchmarks/bench_schedule.py [milestone_count]
+"""
+
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from scheduling import ProjectSchedule  # noqa: E402
+
+BUDGET_MS = 100
+
+
+def synthetic(count, max_dependencies=3, seed=7):
+    """A random DAG: each milestone depends on up to a few earlier ones"""
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    milestones = []
+    for i in range(count):
+        depends_on = []
+        if i:
+            picks = rng.integers(max(0, i - 200), i, int(rng.integers(0, max_dependencies + 1)))
+            depends_on = [f"m{int(p)}" for p in dict.fromkeys(picks)]
+        milestones.append({
+            "id": f"m{i}",
+            "title": f"Milestone {i}",
+            "due_date": (start + timedelta(days=i // 10)).isoformat(),
+            "depends_on": depends_on,
+            "completed": False,
+            "duration_days": float(rng.integers(1, 10)),
+        })
+    return milestones
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - began) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    milestones = synthetic(count)
+    edges = sum(len(m["depends_on"]) for m in milestones)
+    print(f"{count:,} milestones, {edges:,} dependencies")
+    today = date(2026, 1, 1)
+
+    build_ms, schedule = timed(lambda: ProjectSchedule(milestones, "2026-01-01T00:00:00+00:00"))
+    compute_ms, _ = timed(lambda: schedule.compute(today))
+
+    def render():
+        schedule.compute(today)
+        return schedule.result(today)
+
+    result_ms, result = timed(render)
+    roots = iter(milestones[node]["id"] for node in schedule.order)
+    complete_ms, _ = timed(lambda: schedule.complete(next(roots), "2026-01-02T00:00:00+00:00"))
+    print(f"build        median={build_ms:8.1f} ms")
+    print(f"compute      median={compute_ms:8.1f} ms  critical path={len(result['critical_path']):,}")
+    print(f"result       median={result_ms:8.1f} ms  (compute and render)")
+    print(f"complete     median={complete_ms:8.1f} ms")
+    total = build_ms + result_ms
+    print(f"cold request {total:.1f} ms (budget {BUDGET_MS} ms)")
+
+
+if __name__ == "__main__":
+    main()
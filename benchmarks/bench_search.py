@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Benchmark search queries over a synthetic index
+
+Usage: python benchmarks/bench_search.py [entity_count]
+"""
+
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from search_index import SearchIndex  # noqa: E402
+
+BUDGET_MS = 50
+
+QUERIES = [
+    ("single common term", "steel", None),
+    ("single rare term", "w4821", None),
+    ("two terms", "acme concrete", None),
+    ("prefix while typing", "conc", None),
+    ("short prefix", "w1", None),
+    ("project scoped", "vendor", "project-17"),
+]
+
+
+def synthetic_entities(count, project_count=1000, vocabulary_size=50_000, seed=11):
+    rng = np.random.default_rng(seed)
+    common = ["steel", "concrete", "vendor", "acme", "supply", "rental", "labour", "timber", "glass", "cable"]
+    vocabulary = common + [f"w{i}" for i in range(vocabulary_size)]
+    # Zipf-like word frequencies, so a handful of terms appear in most rows
+    ranks = np.minimum(rng.zipf(1.3, size=count * 4), len(vocabulary)) - 1
+    projects = rng.integers(0, project_count, count)
+    kinds = rng.choice(["resource", "expense", "document"], count, p=[0.2, 0.7, 0.1])
+    for i in range(count):
+        words = " ".join(vocabulary[r] for r in ranks[i * 4:(i + 1) * 4])
+        kind = str(kinds[i])
+        entity = {"id": f"{kind}-{i}", "project_id": f"project-{projects[i]}"}
+        if kind == "expense":
+            entity["description"] = words
+        else:
+            entity["name"] = words
+        yield kind, entity
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    start = time.perf_counter()
+    index = SearchIndex.from_entities(synthetic_entities(count))
+    print(f"indexed {len(index):,} entities in {time.perf_counter() - start:.1f} s")
+
+    worst = 0.0
+    for label, query, project_id in QUERIES:
+        timings = []
+        for _ in range(5):
+            began = time.perf_counter()
+            result = index.search(query, project_id=project_id, limit=20)
+            timings.append((time.perf_counter() - began) * 1000)
+        median = statistics.median(timings)
+        worst = max(worst, median)
+        print(f"{label:22} {query!r:18} matches={result['total']:>8,} median={median:7.2f} ms")
+    print(f"slowest median {worst:.2f} ms (budget {BUDGET_MS} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Benchmark request throughput against the number of API worker processes
+
+Starts backend/serve.py with 1, 2, 4, ... workers (up to the core count),
+drives a list endpoint from separate client processes over keep-alive
+connections and reports requests per second and scaling efficiency.
+
+Needs a reachable MongoDB (MONGO_URL); seeds its own database. Client
+processes share the machine with the workers, so leave cores spare or run
+the clients elsewhere for a clean curve.
+
+Usage: python benchmarks/bench_workers.py [seconds_per_run]
+"""
+
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import MongoClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("BENCH_DB_NAME", "benchmark_workers")
+PORT = int(os.environ.get("BENCH_PORT", "8011"))
+EXPENSE_COUNT = 500
+
+
+def seed():
+    db = MongoClient(MONGO_URL)[DB_NAME]
+    db.projects.delete_many({})
+    db.expenses.delete_many({})
+    project_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc).isoformat()
+    db.projects.insert_one({
+        "id": project_id, "name": "Benchmark", "stage": "execution", "start_date": now,
+        "end_date": now, "budget": 1e6, "manager_id": "bench", "created_at": now, "updated_at": now,
+    })
+    db.expenses.insert_many([
+        {"id": str(uuid.uuid4()), "description": f"Invoice {i}", "amount": float(i), "expense_type": "vendor",
+         "project_id": project_id, "resource_id": None, "date": now, "created_at": now}
+        for i in range(EXPENSE_COUNT)
+    ])
+    return project_id
+
+
+def wait_until_up(timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            connection.request("GET", "/api/projects?limit=1")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+def client_loop(path, seconds, results):
+    connection = http.client.HTTPConnection("127.0.0.1", PORT)
+    count = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        connection.request("GET", path, headers={"Accept-Encoding": "identity"})
+        response = connection.getresponse()
+        response.read()
+        count += response.status == 200
+    results.put(count)
+
+
+def measure(workers, path, seconds):
+    env = {**os.environ, "MONGO_URL": MONGO_URL, "DB_NAME": DB_NAME}
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        wait_until_up()
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client_loop, args=(path, seconds, results)) for _ in range(workers * 2)]
+        for client in clients:
+            client.start()
+        total = sum(results.get() for _ in clients)
+        for client in clients:
+            client.join()
+        return total / seconds
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    project_id = seed()
+    path = f"/api/projects/{project_id}/expenses?limit={EXPENSE_COUNT}"
+
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+
+    baseline = None
+    for workers in counts:
+        rps = measure(workers, path, seconds)
+        baseline = baseline or rps
+        print(f"workers={workers:<3} {rps:9.1f} req/s  speedup {rps / baseline:5.2f}x  efficiency {rps / baseline / workers:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+import copy
+import itertools
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# server.py reads these at import time; Motor connects lazily so no database is needed
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+
+# In-memory Mongo: just enough of Motor's collection API, the query and update
+# languages and the aggregation expressions the backend's writes use
+MISSING = object()
+
+TYPE_NAMES = {
+    "object": dict, "array": list, "string": str, "bool": bool, "date": datetime,
+    "double": float, "int": int, "long": int, "number": (int, float),
+}
+
+
+def get_path(doc, path):
+    """A dotted field's value, MISSING when absent; arrays of documents yield a list of values"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and not part.isdigit():
+            value = [item.get(part, MISSING) for item in value if isinstance(item, dict)]
+            value = [item for item in value if item is not MISSING] or MISSING
+        elif isinstance(value, list):
+            value = value[int(part)] if int(part) < len(value) else MISSING
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def _candidates(value):
+    """The values a condition is tried against: the field itself and, for arrays, each element"""
+    if isinstance(value, list):
+        return [value, *value]
+    return [value]
+
+
+def _compare(value, operand, test):
+    try:
+        return any(candidate is not MISSING and candidate is not None and test(candidate, operand)
+                   for candidate in _candidates(value))
+    except TypeError:
+        return False
+
+
+def _equals(value, operand):
+    if operand is None:
+        return value is MISSING or value is None or (isinstance(value, list) and None in value)
+    return any(candidate == operand for candidate in _candidates(value))
+
+
+def _condition(value, condition):
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        return _equals(value, condition)
+    for operator, operand in condition.items():
+        if operator == "$eq":
+            ok = _equals(value, operand)
+        elif operator == "$ne":
+            ok = not _equals(value, operand)
+        elif operator == "$in":
+            ok = any(_equals(value, item) for item in operand)
+        elif operator == "$nin":
+            ok = not any(_equals(value, item) for item in operand)
+        elif operator == "$gt":
+            ok = _compare(value, operand, lambda a, b: a > b)
+        elif operator == "$gte":
+            ok = _compare(value, operand, lambda a, b: a >= b)
+        elif operator == "$lt":
+            ok = _compare(value, operand, lambda a, b: a < b)
+        elif operator == "$lte":
+            ok = _compare(value, operand, lambda a, b: a <= b)
+        elif operator == "$exists":
+            ok = (value is not MISSING) == bool(operand)
+        elif operator == "$type":
+            ok = value is not MISSING and isinstance(value, TYPE_NAMES[operand]) and not (
+                operand != "bool" and isinstance(value, bool))
+        elif operator == "$not":
+            ok = not _condition(value, operand)
+        elif operator == "$size":
+            ok = isinstance(value, list) and len(value) == operand
+        elif operator == "$elemMatch":
+            ok = isinstance(value, list) and any(isinstance(item, dict) and matches(item, operand) for item in value)
+        elif operator == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            ok = any(isinstance(candidate, str) and re.search(operand, candidate, flags)
+                     for candidate in _candidates(value))
+        elif operator == "$options":
+            ok = True
+        else:
+            raise NotImplementedError(f"Query operator {operator}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for field, condition in (query or {}).items():
+        if field == "$or":
+            ok = any(matches(doc, clause) for clause in condition)
+        elif field == "$and":
+            ok = all(matches(doc, clause) for clause in condition)
+        elif field == "$nor":
+            ok = not any(matches(doc, clause) for clause in condition)
+        else:
+            ok = _condition(get_path(doc, field), condition)
+        if not ok:
+            return False
+    return True
+
+
+def evaluate(expression, doc):
+    """Aggregation expressions, as used in pipeline updates"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_path(doc, expression[1:])
+        return None if value is MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1:
+        (operator, args), = expression.items()
+        if operator == "$literal":
+            return args
+        if operator.startswith("$"):
+            if operator == "$cond":
+                if isinstance(args, dict):
+                    args = [args["if"], args["then"], args["else"]]
+                return evaluate(args[1] if evaluate(args[0], doc) else args[2], doc)
+            values = evaluate(args, doc)
+            return EXPRESSIONS[operator](values)
+    return {key: evaluate(value, doc) for key, value in expression.items()}
+
+
+EXPRESSIONS = {
+    "$add": lambda values: sum(values),
+    "$subtract": lambda values: values[0] - values[1],
+    "$eq": lambda values: values[0] == values[1],
+    "$ne": lambda values: values[0] != values[1],
+    "$gt": lambda values: values[0] > values[1],
+    "$gte": lambda values: values[0] >= values[1],
+    "$lt": lambda values: values[0] < values[1],
+    "$lte": lambda values: values[0] <= values[1],
+    "$min": lambda values: min(values),
+    "$max": lambda values: max(values),
+    "$and": lambda values: all(values),
+    "$or": lambda values: any(values),
+    "$not": lambda values: not values[0],
+    "$size": lambda values: len(values),
+    "$arrayElemAt": lambda values: values[0][values[1]] if values[1] < len(values[0]) else None,
+    "$ifNull": lambda values: values[1] if values[0] is None else values[0],
+    "$concatArrays": lambda values: [item for array in values for item in array],
+    "$concat": lambda values: "".join(values),
+    "$substrCP": lambda values: values[0][values[1]:values[1] + values[2]],
+    "$strLenCP": lambda values: len(values),
+    "$mergeObjects": lambda values: {key: value for item in values if item for key, value in item.items()},
+}
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply an update document or pipeline to doc in place"""
+    if isinstance(update, list):
+        for stage in update:
+            (operator, fields), = stage.items()
+            if operator in ("$set", "$addFields"):
+                for path, value in evaluate(fields, doc).items():
+                    set_path(doc, path, value)
+            elif operator == "$unset":
+                for path in [fields] if isinstance(fields, str) else fields:
+                    unset_path(doc, path)
+            else:
+                raise NotImplementedError(f"Pipeline stage {operator}")
+        return
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            current = get_path(doc, path)
+            if operator == "$set":
+                set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                unset_path(doc, path)
+            elif operator == "$inc":
+                set_path(doc, path, (0 if current is MISSING else current) + value)
+            elif operator in ("$min", "$max"):
+                better = min if operator == "$min" else max
+                set_path(doc, path, value if current is MISSING else better(current, value))
+            elif operator in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                array = [] if current is MISSING else current
+                for item in items:
+                    if operator == "$push" or item not in array:
+                        array.append(copy.deepcopy(item))
+                set_path(doc, path, array)
+            elif operator == "$pull":
+                if current is not MISSING:
+                    set_path(doc, path, [item for item in current if not (
+                        matches(item, value) if isinstance(value, dict) and isinstance(item, dict) else _condition(item, value))])
+            else:
+                raise NotImplementedError(f"Update operator {operator}")
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    included = [field for field, keep in projection.items() if keep and field != "_id"]
+    if included:
+        projected = {}
+        for field in included:
+            value = get_path(doc, field)
+            if value is not MISSING:
+                set_path(projected, field, copy.deepcopy(value))
+        if projection.get("_id", 1) and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return projected
+    projected = copy.deepcopy(doc)
+    for field, keep in projection.items():
+        if not keep:
+            unset_path(projected, field)
+    return projected
+
+
+def _sort_key(value):
+    # Missing and null sort first, like Mongo
+    value = None if value is MISSING else value
+    return (value is not None, value if value is not None else 0)
+
+
+def sort_docs(docs, sort):
+    for field, direction in reversed(list(sort)):
+        docs.sort(key=lambda doc: _sort_key(get_path(doc, field)), reverse=direction < 0)
+    return docs
+
+
+class Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.position = 0
+
+    def sort(self, key, direction=None):
+        sort_docs(self.docs, [(key, direction or 1)] if isinstance(key, str) else key)
+        return self
+
+    def skip(self, n):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        end = len(self.docs) if length is None else self.position + length
+        batch = self.docs[self.position:end]
+        self.position += len(batch)
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.position >= len(self.docs):
+            raise StopAsyncIteration
+        self.position += 1
+        return self.docs[self.position - 1]
+
+
+class FakeCollection:
+    """A Motor collection over a list of dicts in `docs`.
+
+    Writes take (and ignore) a session. Indexes are recorded, and the
+    unique ones enforced; bulk_write takes (filter, update) pairs.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, docs=None):
+        self.docs = docs if docs is not None else []
+        self.indexes = []
+
+    def _find(self, query):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        # Documents a test put straight into `docs` get the _id an insert would have given them
+        for doc in found:
+            doc.setdefault("_id", next(self.ids))
+        return found
+
+    def _check_unique(self, doc, ignore=None):
+        keys = [["_id"]] + [fields for fields, options in self.indexes if options.get("unique")]
+        for fields in keys:
+            key = [get_path(doc, field) for field in fields]
+            if all(value is MISSING for value in key):
+                continue
+            for other in self.docs:
+                if other is not ignore and other is not doc and [get_path(other, field) for field in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error dup key: {dict(zip(fields, key))}", 11000)
+
+    async def create_index(self, keys, **options):
+        fields = [keys] if isinstance(keys, str) else [field for field, _ in keys]
+        self.indexes.append((fields, options))
+        return "_".join(fields)
+
+    def find(self, query=None, projection=None, session=None, sort=None, limit=0, skip=0, **kwargs):
+        cursor = FakeCursor([project(doc, projection) for doc in self._find(query)])
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, query=None, projection=None, session=None, sort=None, **kwargs):
+        found = await self.find(query, projection, sort=sort, limit=1).to_list(1)
+        return found[0] if found else None
+
+    async def count_documents(self, query, session=None, **kwargs):
+        return len(self._find(query))
+
+    async def distinct(self, field, query=None, session=None):
+        values = []
+        for doc in self._find(query):
+            value = get_path(doc, field)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not MISSING and item not in values:
+                    values.append(item)
+        return values
+
+    async def insert_one(self, doc, session=None):
+        doc.setdefault("_id", next(self.ids))
+        stored = copy.deepcopy(doc)
+        self._check_unique(stored)
+        self.docs.append(stored)
+        return Result(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True, session=None):
+        errors = []
+        for index, doc in enumerate(docs):
+            try:
+                await self.insert_one(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+        return Result(inserted_ids=[doc["_id"] for doc in docs])
+
+    def _update(self, doc, update):
+        before = copy.deepcopy(doc)
+        apply_update(doc, update)
+        try:
+            self._check_unique(doc)
+        except DuplicateKeyError:
+            doc.clear()
+            doc.update(before)
+            raise
+        return doc != before
+
+    def _upsert(self, query, update):
+        doc = {field: value for field, value in query.items() if not field.startswith("$") and not isinstance(value, dict)}
+        doc["_id"] = next(self.ids)
+        apply_update(doc, update, inserting=True)
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    async def update_one(self, query, update, upsert=False, session=None, **kwargs):
+        found = self._find(query)[:1]
+        if not found and upsert:
+            doc = self._upsert(query, update)
+            return Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        modified = sum(self._update(doc, update) for doc in found)
+        return Result(matched_count=len(found), modified_count=modified, upserted_id=None)
+
+    async def update_many(self, query, update, upsert=False, session=None, **kwargs):
+        found = self._find(query)
+        if not found and upsert:
+            doc = self._upsert(query, update)
+            return Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        modified = sum(self._update(doc, update) for doc in found)
+        return Result(matched_count=len(found), modified_count=modified, upserted_id=None)
+
+    async def replace_one(self, query, replacement, upsert=False, session=None):
+        found = self._find(query)[:1]
+        if not found:
+            if upsert:
+                await self.insert_one(dict(replacement))
+            return Result(matched_count=0, modified_count=0)
+        doc = found[0]
+        doc_id = doc["_id"]
+        doc.clear()
+        doc.update(copy.deepcopy(replacement), _id=doc_id)
+        return Result(matched_count=1, modified_count=1)
+
+    async def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False,
+                                  return_document=False, session=None, **kwargs):
+        found = self._find(query)
+        if sort:
+            sort_docs(found, sort)
+        if not found:
+            if not upsert:
+                return None
+            doc = self._upsert(query, update)
+            return project(doc, projection) if return_document else None
+        doc = found[0]
+        before = project(doc, projection)
+        self._update(doc, update)
+        return project(doc, projection) if return_document else before
+
+    async def find_one_and_delete(self, query, projection=None, sort=None, session=None, **kwargs):
+        found = self._find(query)
+        if sort:
+            sort_docs(found, sort)
+        if not found:
+            return None
+        self.docs.remove(found[0])
+        return project(found[0], projection)
+
+    async def delete_one(self, query, session=None):
+        found = self._find(query)[:1]
+        for doc in found:
+            self.docs.remove(doc)
+        return Result(deleted_count=len(found))
+
+    async def delete_many(self, query, session=None):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs[:] = kept
+        return Result(deleted_count=deleted)
+
+    async def bulk_write(self, requests, ordered=True, session=None):
+        modified = matched = 0
+        for query, update in requests:
+            result = await self.update_one(query, update)
+            matched += result.matched_count
+            modified += result.modified_count
+        return Result(matched_count=matched, modified_count=modified)
+
+
+class FakeDatabase(dict):
+    """Collections by name or attribute, created on first use"""
+
+    collection_class = FakeCollection
+
+    def __missing__(self, name):
+        self[name] = self.collection_class()
+        return self[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self, filter=None):
+        return list(self)
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    AdmissionRule,
+    ConcurrencyGate,
+    MemoryBucketStore,
+    client_identity,
+    load_rules,
+    parse_proxies,
+)
+
+
+def test_token_bucket_refills_at_the_configured_rate():
+    store = MemoryBucketStore()
+    rule = AdmissionRule(name="r", path="/api/*", rate=2, burst=3)
+
+    async def run():
+        waits = [await store.take(rule, "client-a", now=0.0) for _ in range(4)]
+        assert waits[:3] == [0, 0, 0] and waits[3] == pytest.approx(0.5)
+        # Buckets are per client
+        assert await store.take(rule, "client-b", now=0.0) == 0
+        assert await store.take(rule, "client-a", now=0.5) == 0
+        assert await store.take(rule, "client-a", now=0.5) > 0
+
+    asyncio.run(run())
+
+
+def test_concurrency_gate_queues_then_rejects():
+    async def run():
+        gate = ConcurrencyGate(limit=1, queue=1, timeout=0.05)
+        assert await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        # The one queue slot is taken, so the next request is turned away at once
+        assert not await gate.acquire()
+        gate.release()
+        assert await waiter
+        # A queued request gives up after the timeout
+        assert not await gate.acquire()
+
+    asyncio.run(run())
+
+
+def call(app, method="GET", path="/api/dashboard/stats", client="10.0.0.1", forwarded_for=None):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": b"",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else [], "client": (client, 5000),
+    }
+    asyncio.run(app(scope, receive, send))
+    return messages[0]["status"], dict(messages[0]["headers"])
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def test_middleware_returns_429_with_retry_after_and_can_be_reconfigured():
+    controller = AdmissionController([AdmissionRule(name="dashboard", path="/api/dashboard/*", methods=["GET"], rate=0.5, burst=2)])
+    app = AdmissionMiddleware(ok_app, controller)
+
+    assert [call(app)[0] for _ in range(2)] == [200, 200]
+    status, headers = call(app)
+    assert status == 429 and headers[b"retry-after"] == b"2"
+    assert call(app, client="10.0.0.2")[0] == 200
+    assert call(app, path="/api/projects")[0] == 200
+
+    controller.configure([{"name": "dashboard", "path": "/api/dashboard/*", "rate": 100, "burst": 100}])
+    assert call(app)[0] == 200
+
+
+def test_a_later_rejection_refunds_tokens_taken_by_earlier_rules():
+    controller = AdmissionController([
+        AdmissionRule(name="api", path="/api/*", rate=0.001, burst=2),
+        AdmissionRule(name="dashboard", path="/api/dashboard/*", rate=0.001, burst=1),
+    ])
+    app = AdmissionMiddleware(ok_app, controller)
+
+    assert call(app)[0] == 200
+    assert call(app)[0] == 429
+    # The dashboard rejection did not spend the second "api" token
+    assert call(app, path="/api/projects")[0] == 200
+
+
+def test_rules_load_from_json_or_defaults():
+    defaults = load_rules(None)
+    assert {rule.name for rule in defaults} >= {"uploads", "exports", "analytics"}
+    # Per-client rate limits are opt-in
+    assert not any(rule.rate for rule in defaults)
+    rules = load_rules('[{"name": "uploads", "path": "/api/documents/upload", "concurrency": 1}]')
+    assert rules[0].concurrency == 1 and rules[0].rate is None
+
+
+def test_client_identity_trusts_forwarded_addresses_only_from_proxies():
+    proxies = parse_proxies("10.0.0.0/24, 192.168.1.5")
+
+    def identity(peer, forwarded_for=None, trusted=proxies):
+        headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+        return client_identity({"client": (peer, 5000), "headers": headers}, trusted)
+
+    # Clients can't pick their own bucket
+    assert identity("203.0.113.9", "1.2.3.4") == "ip:203.0.113.9"
+    assert identity("10.0.0.1", "1.2.3.4", trusted=[]) == "ip:10.0.0.1"
+    # Behind proxies, the nearest hop they didn't add; what the client prepended is ignored
+    assert identity("10.0.0.1", "6.6.6.6, 198.51.100.7, 192.168.1.5") == "ip:198.51.100.7"
+    assert identity("10.0.0.1") == "ip:10.0.0.1"
+    assert client_identity({"headers": []}) == "ip:unknown"
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timezone
+
+from analytics import ExpenseArrayCache, build_expense_arrays, build_project_frame, compute_portfolio, load_portfolio_expenses
+
+
+def make_projects():
+    return build_project_frame({
+        "id": ["p1", "p2"],
+        "name": ["Alpha", "Beta"],
+        "stage": ["execution", "planning"],
+        "budget": [10000.0, 5000.0],
+        "start_date": ["2024-01-01T00:00:00+00:00", "2024-03-01T00:00:00+00:00"],
+        "end_date": ["2024-12-31T00:00:00+00:00", "2024-06-01T00:00:00+00:00"],
+    })
+
+
+def make_expenses():
+    return build_expense_arrays({
+        "project_id": ["p1", "p1", "p1", "p2"],
+        "amount": [1000.0, 500.0, 250.0, 6000.0],
+        "expense_type": ["vendor", "vendor", "material", "equipment"],
+        "date": [
+            "2024-01-15T00:00:00+00:00",
+            "2024-02-10T00:00:00+00:00",
+            "2024-02-20T00:00:00",
+            "2024-03-05T00:00:00+00:00",
+        ],
+    })
+
+
+def test_portfolio_totals_and_variance():
+    result = compute_portfolio(make_projects(), make_expenses(), now=datetime(2024, 3, 1, tzinfo=timezone.utc))
+    rows = {row["project_id"]: row for row in result["projects"]}
+
+    assert result["totals"]["total_expenses"] == 7750.0
+    assert rows["p1"]["total_expenses"] == 1750.0
+    assert rows["p1"]["budget_variance"] == 8250.0
+    assert rows["p2"]["budget_variance"] == -1000.0
+    assert rows["p2"]["percentage_used"] == 120.0
+
+
+def test_portfolio_spend_by_type_and_monthly():
+    result = compute_portfolio(make_projects(), make_expenses(), now=datetime(2024, 3, 1, tzinfo=timezone.utc))
+    rows = {row["project_id"]: row for row in result["projects"]}
+
+    assert rows["p1"]["spend_by_type"]["vendor"] == 1500.0
+    assert rows["p1"]["spend_by_type"]["material"] == 250.0
+    assert rows["p1"]["monthly_spend"] == [
+        {"month": "2024-01", "amount": 1000.0},
+        {"month": "2024-02", "amount": 750.0},
+    ]
+
+
+def test_burn_rate_uses_elapsed_days():
+    result = compute_portfolio(make_projects(), make_expenses(), now=datetime(2024, 1, 11, tzinfo=timezone.utc))
+    rows = {row["project_id"]: row for row in result["projects"]}
+
+    assert rows["p1"]["burn_rate_per_day"] == 175.0
+    # p2 has not started yet, so the burn rate falls back to total spend
+    assert rows["p2"]["burn_rate_per_day"] == 6000.0
+
+
+class PackedCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        return batch
+
+
+def test_grouped_expenses_unpack_and_count_every_expense():
+    # What portfolio_expense_pipeline returns: one document per project-month
+    docs = [
+        {"_id": {"project_id": "p1", "month": "2024-02"}, "expense_type": ["vendor", None], "currency": [None, None],
+         "date": ["2024-02-10", "2024-02-20"], "amount": [500.0, 250.0], "count": [3, 1]},
+        {"_id": {"project_id": "p2", "month": "2024-03"}, "expense_type": ["equipment"], "currency": [None],
+         "date": ["2024-03-05"], "amount": [6000.0], "count": [2]},
+    ]
+    collection = type("Expenses", (), {"aggregate": lambda self, pipeline, **kwargs: PackedCursor(docs)})()
+    columns = asyncio.run(load_portfolio_expenses(collection, batch_size=1))
+    assert columns["project_id"] == ["p1", "p1", "p2"]
+
+    result = compute_portfolio(make_projects(), build_expense_arrays(columns), now=datetime(2024, 3, 1, tzinfo=timezone.utc))
+    rows = {row["project_id"]: row for row in result["projects"]}
+    assert result["totals"]["expenses"] == 6
+    assert rows["p1"]["spend_by_type"] == {"vendor": 500.0, "other": 250.0}
+    assert rows["p2"]["monthly_spend"] == [{"month": "2024-03", "amount": 6000.0}]
+
+
+def test_array_cache_serves_only_its_version():
+    cache = ExpenseArrayCache()
+    arrays = make_expenses()
+    assert cache.get(0) is None
+    cache.put(0, arrays)
+    assert cache.get(0) is arrays
+    assert cache.get(1) is None
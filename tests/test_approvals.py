@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import approvals as approvals_module
+from approvals import ApprovalWorkflow, approve_update, reject_update
+
+from tests.conftest import FakeCollection, FakeDatabase
+
+
+@pytest.fixture(autouse=True)
+def plain_updates(monkeypatch):
+    """pymongo keeps an UpdateOne's filter and update private; make them plain pairs"""
+    monkeypatch.setattr(approvals_module, "UpdateOne", lambda query, update: (query, update))
+
+
+class CountingDocuments(FakeCollection):
+    bulk_writes = 0
+
+    async def bulk_write(self, requests, ordered=True, session=None):
+        self.bulk_writes += 1
+        return await super().bulk_write(requests, ordered, session)
+
+
+def workflow(*docs):
+    documents = CountingDocuments([{"id": doc_id, "project_id": "p1", "status": "draft", "rev": 1} for doc_id in docs])
+    db = FakeDatabase(documents=documents)
+    return ApprovalWorkflow(lambda: db), documents
+
+
+def test_multi_step_approval_moves_through_the_chain():
+    approvals, documents = workflow("d1")
+    assert asyncio.run(approvals.submit("d1", ["lead", "director"], "author"))
+    assert not asyncio.run(approvals.submit("d1", ["lead"], "author"))
+    doc = documents.docs[0]
+
+    assert asyncio.run(approvals.decide(["d1"], "director", "approve"))["skipped"] == ["d1"]
+    assert asyncio.run(approvals.decide(["d1"], "lead", "approve"))["decided"] == ["d1"]
+    assert (doc["status"], doc["current_approver"], doc["approved_by"]) == ("pending_approval", "director", None)
+
+    asyncio.run(approvals.decide(["d1"], "director", "approve", comment="$ fine"))
+    assert (doc["status"], doc["current_approver"], doc["approved_by"]) == ("approved", None, "director")
+    assert [(e["action"], e["by"], e["step"]) for e in doc["approval_history"]] == [
+        ("submitted", "author", 0), ("approved", "lead", 0), ("approved", "director", 1)
+    ]
+    assert doc["approval_history"][-1]["comment"] == "$ fine"
+    assert doc["rev"] == 4
+
+
+def test_batch_decisions_go_out_in_one_bulk_write():
+    approvals, documents = workflow("d1", "d2", "d3")
+    for doc_id in ("d1", "d2"):
+        asyncio.run(approvals.submit(doc_id, ["lead"], "author"))
+    outcome = asyncio.run(approvals.decide(["d1", "d2", "d3", "d1"], "lead", "reject", "missing drawings"))
+    assert outcome == {"decided": ["d1", "d2"], "skipped": ["d3"], "project_ids": {"d1": "p1", "d2": "p1"}}
+    assert documents.bulk_writes == 1
+    assert [d["status"] for d in documents.docs] == ["rejected", "rejected", "draft"]
+
+    # A rejected document can be resubmitted and starts over
+    assert asyncio.run(approvals.submit("d1", ["lead"], "author"))
+    assert documents.docs[0]["current_approver"] == "lead"
+
+
+def test_documents_never_submitted_are_approved_directly():
+    approvals, documents = workflow("d1", "d2")
+    assert asyncio.run(approvals.approve_directly("d1", "lead", "ok")) == {"id": "d1", "project_id": "p1"}
+    doc = documents.docs[0]
+    assert (doc["status"], doc["approved_by"], doc["rev"]) == ("approved", "lead", 2)
+    assert [(e["action"], e["by"], e["comment"]) for e in doc["approval_history"]] == [("approved", "lead", "ok")]
+    # Approved documents and ones with a chain go through decide() instead
+    assert asyncio.run(approvals.approve_directly("d1", "lead")) is None
+    asyncio.run(approvals.submit("d2", ["lead", "director"], "author"))
+    assert asyncio.run(approvals.approve_directly("d2", "lead")) is None
+    assert documents.docs[1]["status"] == "pending_approval"
+
+
+def test_invalid_requests():
+    approvals, _ = workflow("d1")
+    with pytest.raises(ValueError):
+        asyncio.run(approvals.submit("d1", [], "author"))
+    with pytest.raises(ValueError):
+        asyncio.run(approvals.decide(["d1"], "lead", "maybe"))
+    with pytest.raises(ValueError):
+        asyncio.run(approvals.decide([], "lead", "approve"))
+
+
+def test_decision_updates_are_pipelines():
+    assert isinstance(approve_update("lead", "t"), list)
+    assert reject_update("lead", "t")[0]["$set"]["status"] == "rejected"
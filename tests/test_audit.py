@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timezone
+
+import audit as audit_module
+from audit import AuditLog, current_actor, partition_name
+
+from tests.conftest import FakeCollection, FakeDatabase as BaseDatabase
+
+
+class FakePartition(FakeCollection):
+    inserts = 0
+    fail_next = False
+
+    async def insert_many(self, docs, ordered=True, session=None):
+        self.inserts += 1
+        if self.fail_next:
+            # Failing after the driver assigned _ids, as a lost connection would
+            for doc in docs:
+                doc.setdefault("_id", next(self.ids))
+            self.fail_next = False
+            raise ConnectionError("primary stepped down")
+        return await super().insert_many(docs, ordered, session)
+
+
+class FakeDatabase(BaseDatabase):
+    collection_class = FakePartition
+
+
+def test_events_are_written_in_batches_on_size_or_time():
+    db = FakeDatabase()
+    log = AuditLog(lambda: db, flush_size=3, flush_seconds=0.05)
+
+    async def scenario():
+        writer = asyncio.create_task(log.run())
+        token = current_actor.set("u1")
+        for n in range(4):
+            await log.record("update", "project", f"p{n}", f"p{n}", {"budget": n, "_id": "x"})
+        current_actor.reset(token)
+        await asyncio.sleep(0.01)
+        written_on_size = log.written
+        await asyncio.sleep(0.1)
+        writer.cancel()
+        return written_on_size
+
+    assert asyncio.run(scenario()) == 3
+    partition = db[partition_name(datetime.now(timezone.utc))]
+    assert partition.inserts == 2 and len(partition.docs) == 4
+    assert partition.docs[0]["actor"] == "u1"
+    assert partition.docs[0]["changes"] == {"budget": 0}
+    assert len(partition.indexes) == len(audit_module.AUDIT_INDEXES)
+
+
+def test_full_buffer_pushes_back_then_drops(monkeypatch):
+    monkeypatch.setattr(audit_module, "AUDIT_ENQUEUE_TIMEOUT_SECONDS", 0.01)
+    log = AuditLog(lambda: FakeDatabase(), buffer_size=2)
+
+    async def scenario():
+        for n in range(3):
+            await log.record("create", "expense", f"e{n}")
+
+    asyncio.run(scenario())
+    assert log.queue.qsize() == 2 and log.dropped == 1
+
+
+def test_failed_batch_is_retried_without_duplicates(monkeypatch):
+    monkeypatch.setattr(audit_module, "AUDIT_RETRY_SECONDS", 0)
+    db = FakeDatabase()
+    log = AuditLog(lambda: db, flush_size=2, flush_seconds=0)
+    partition = db[partition_name(datetime.now(timezone.utc))]
+    partition.fail_next = True
+
+    async def scenario():
+        writer = asyncio.create_task(log.run())
+        await log.record("create", "resource", "r1")
+        await log.record("create", "resource", "r2")
+        await asyncio.sleep(0.05)
+        writer.cancel()
+
+    asyncio.run(scenario())
+    assert partition.inserts == 2
+    assert [doc["entity_id"] for doc in partition.docs] == ["r1", "r2"]
+
+
+def test_query_walks_partitions_newest_first():
+    db = FakeDatabase()
+    log = AuditLog(lambda: db)
+    old = datetime(2026, 8, 31, tzinfo=timezone.utc)
+    new = datetime(2026, 9, 2, tzinfo=timezone.utc)
+    db[partition_name(old)].docs = [{"at": old, "entity": "project", "entity_id": "p1", "n": 1}]
+    db[partition_name(new)].docs = [{"at": new, "entity": "project", "entity_id": "p1", "n": 2}]
+
+    events = asyncio.run(log.query({"entity": "project", "entity_id": "p1"}, 10))
+    assert [event["n"] for event in events] == [2, 1]
+    assert [event["n"] for event in asyncio.run(log.query({"entity_id": "p1"}, 1))] == [2]
+    assert [event["n"] for event in asyncio.run(log.query({"entity_id": "p1"}, 10, before=new))] == [1]
+
+
+def test_flush_writes_the_batch_a_cancelled_writer_held():
+    db = FakeDatabase()
+    log = AuditLog(lambda: db, flush_size=10, flush_seconds=5)
+
+    async def scenario():
+        writer = asyncio.create_task(log.run())
+        await log.record("create", "milestone", "m1")
+        await log.record("create", "milestone", "m2")
+        await asyncio.sleep(0.01)
+        writer.cancel()
+        await log.flush()
+
+    asyncio.run(scenario())
+    partition = db[partition_name(datetime.now(timezone.utc))]
+    assert [doc["entity_id"] for doc in partition.docs] == ["m1", "m2"]
+
+
+def test_non_transient_failure_drops_the_batch(monkeypatch):
+    monkeypatch.setattr(audit_module, "AUDIT_RETRY_SECONDS", 0)
+    db = FakeDatabase()
+    log = AuditLog(lambda: db, flush_size=1, flush_seconds=0)
+    partition = db[partition_name(datetime.now(timezone.utc))]
+
+    async def refuse(docs, ordered=True):
+        partition.inserts += 1
+        raise ValueError("cannot encode object")
+    partition.insert_many = refuse
+
+    async def scenario():
+        writer = asyncio.create_task(log.run())
+        await log.record("create", "resource", "r1")
+        await log.record("create", "resource", "r2")
+        await asyncio.sleep(0.05)
+        writer.cancel()
+
+    asyncio.run(scenario())
+    assert partition.inserts == 2 and log.dropped == 2
@@ -0,0 +1,82 @@
+from datetime import date
+
+import pytest
+
+from capacity import CapacityTimeline, allocation_share
+
+
+PROJECTS = [
+    {"id": "p1", "name": "Depot", "start_date": "2026-01-01T00:00:00+00:00", "end_date": "2026-03-31T00:00:00+00:00"},
+    {"id": "p2", "name": "Bridge", "start_date": "2026-03-01T00:00:00+00:00", "end_date": "2026-04-30T00:00:00+00:00"},
+    {"id": "p3", "name": "Undated", "start_date": None, "end_date": None},
+]
+
+
+def resource(resource_id, name, project_id, availability="Full-time", resource_type="team_member"):
+    return {"id": resource_id, "name": name, "type": resource_type, "availability": availability, "project_id": project_id}
+
+
+def test_allocation_share_parses_free_form_availability():
+    assert allocation_share("Full-time") == 1.0
+    assert allocation_share("Available") == 1.0
+    assert allocation_share("Part-time") == 0.5
+    assert allocation_share("60%") == 0.6
+    assert allocation_share("20 hours/week") == 0.5
+    assert allocation_share("0.25") == 0.25
+    assert allocation_share("On-demand") == 0.0
+    assert allocation_share(None) == 1.0
+
+
+def test_allocation_share_units_and_dates():
+    assert allocation_share("2 days/week") == 0.4
+    assert allocation_share("1 day/week") == 0.2
+    assert allocation_share("8 hours/day") == 1.0
+    assert allocation_share("3 hrs per week") == 0.075
+    # Numbers in dates and times are not amounts
+    assert allocation_share("Available until 2025-12-31") == 1.0
+    assert allocation_share("from 9:00") == 1.0
+    assert allocation_share("50% until 2026-01-01") == 0.5
+    assert allocation_share("Part-time until 31.12.2025") == 0.5
+
+
+def test_overlapping_projects_conflict_for_the_same_person():
+    timeline = CapacityTimeline.build([
+        resource("r1", "Jane Doe", "p1"),
+        resource("r2", " jane  doe ", "p2", "50%"),
+        resource("r3", "Jane Doe", "p3"),
+        resource("r4", "Sam", "p1", "Part-time"),
+    ], PROJECTS)
+
+    (conflict,) = timeline.conflicts()
+    assert (conflict["resource"], conflict["start"], conflict["end"], conflict["load"]) == ("Jane Doe", "2026-03-01", "2026-03-31", 1.5)
+    assert [a["resource_id"] for a in conflict["allocations"]] == ["r1", "r2"]
+    assert timeline.conflicts(start=date(2026, 4, 1)) == []
+    # A window clips the reported period
+    assert timeline.conflicts(start=date(2026, 3, 10), end=date(2026, 3, 20))[0]["start"] == "2026-03-10"
+
+    assert timeline.timeline("team_member", "JANE DOE") == [
+        {"start": "2026-01-01", "end": "2026-02-28", "load": 1.0},
+        {"start": "2026-03-01", "end": "2026-03-31", "load": 1.5},
+        {"start": "2026-04-01", "end": "2026-04-30", "load": 0.5},
+    ]
+    assert timeline.timeline("equipment", "Jane Doe") is None
+
+
+def test_utilization_is_time_weighted_and_sorted():
+    timeline = CapacityTimeline.build([
+        resource("r1", "Crane", "p1", "Available", "equipment"),
+        resource("r2", "Sam", "p2", "Part-time"),
+    ], PROJECTS)
+    rows = timeline.utilization(date(2026, 3, 1), date(2026, 3, 31))
+    assert [(r["resource"], r["utilization"], r["peak_load"]) for r in rows] == [("Crane", 1.0, 1.0), ("Sam", 0.5, 0.5)]
+    assert [r["resource"] for r in timeline.utilization(date(2026, 3, 1), date(2026, 3, 31), "team_member")] == ["Sam"]
+    # The crane's project ends in March
+    assert timeline.utilization(date(2026, 4, 1), date(2026, 4, 30))[1]["utilization"] == 0.0
+    with pytest.raises(ValueError):
+        timeline.utilization(date(2026, 4, 2), date(2026, 4, 1))
+
+
+def test_no_allocations():
+    timeline = CapacityTimeline.build([], PROJECTS)
+    assert timeline.conflicts() == []
+    assert timeline.utilization(date(2026, 1, 1), date(2026, 1, 31)) == []
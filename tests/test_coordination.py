@@ -0,0 +1,73 @@
+import numpy as np
+
+from coordination import CacheEventBus, SharedCache
+from forecasting import DailySpend, ForecastCache, to_day
+from search_index import SearchIndex
+
+
+def test_disabled_bus_returns_the_cache_itself():
+    bus = CacheEventBus(enabled=False)
+    index = SearchIndex()
+    assert bus.share("search", index, ("upsert",)) is index
+
+
+def test_workers_converge_on_log_order():
+    a, b = CacheEventBus(enabled=True), CacheEventBus(enabled=True)
+    index_a = a.share("search", SearchIndex(), ("upsert", "remove"))
+    index_b = b.share("search", SearchIndex(), ("upsert", "remove"))
+    assert isinstance(index_a, SharedCache)
+
+    # Both workers rename the same project at once; each sees its own write first
+    index_a.upsert("project", {"id": "p1", "name": "Harbor"})
+    index_b.upsert("project", {"id": "p1", "name": "Bridge"})
+    assert index_a.search("harbor")["total"] == 1 and index_b.search("bridge")["total"] == 1
+
+    log = [a.pending[0], b.pending[0]]
+    for event in log:
+        a.apply(event)
+        b.apply(event)
+
+    for index in (index_a, index_b):
+        assert len(index) == 1
+        assert index.search("bridge")["total"] == 1
+        assert index.search("harbor")["total"] == 0
+
+
+def test_non_idempotent_events_skip_their_own_echo():
+    a, b = CacheEventBus(enabled=True), CacheEventBus(enabled=True)
+    caches = []
+    for bus in (a, b):
+        cache = bus.share(
+            "forecast", ForecastCache(), ("record_expense", "invalidate"), replay_own=False,
+            replay_as={"record_expense": "record_remote_expense"}
+        )
+        cache.put_spend("p1", DailySpend(to_day("2024-01-01")), cache.version("p1"))
+        caches.append(cache)
+
+    caches[0].record_expense("p1", "2024-01-02", 100.0)
+    for bus in (a, b):
+        bus.apply(a.pending[0])
+
+    assert caches[0].get_spend("p1").amounts.sum() == 100.0
+    # The other worker may have loaded buckets that already include it, so it reloads instead
+    assert caches[1].get_spend("p1") is None
+
+
+def test_remote_expense_after_a_fresh_load_is_not_counted_twice():
+    bus = CacheEventBus(enabled=True)
+    cache = bus.share(
+        "forecast", ForecastCache(), ("record_expense", "invalidate"), replay_own=False,
+        replay_as={"record_expense": "record_remote_expense"}
+    )
+    # Loaded from Mongo after the other worker's insert committed
+    cache.put_spend("p1", DailySpend(to_day("2024-01-01"), np.array([0.0, 100.0])), cache.version("p1"))
+    bus.apply({"worker": "other", "cache": "forecast", "method": "record_expense", "args": ["p1", "2024-01-02", 100.0], "kwargs": {}})
+    assert cache.get_spend("p1") is None
+
+
+def test_forecast_clear_rejects_loads_in_flight():
+    cache = ForecastCache()
+    version = cache.version("p1")
+    cache.clear()
+    cache.put_spend("p1", DailySpend(to_day("2024-01-01")), version)
+    assert cache.get_spend("p1") is None
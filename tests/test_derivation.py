@@ -0,0 +1,77 @@
+from derivation import backfill_derived_flags, derive_expense, derive_expenses, describe, resource_name_for, resource_sync_updates
+
+
+def resource(resource_id, resource_type="equipment", cost=100.0, allocated=0.0, name="Crane"):
+    return {"id": resource_id, "name": name, "type": resource_type, "cost_per_unit": cost,
+            "allocated_amount": allocated, "project_id": "p1"}
+
+
+def test_batch_derivation_matches_single_derivation():
+    resources = [
+        resource("r1", cost=100.0, allocated=3.0),
+        resource("r2", resource_type="human", cost=50.0),
+        resource("r3", resource_type="vendor", cost=None),
+        resource("r4", resource_type="material", cost=0.0),
+        resource("r5", resource_type="vendor", cost=20.0, name="Acme"),
+    ]
+    derived = derive_expenses(resources)
+    assert [d["resource_id"] for d in derived] == ["r1", "r5"]
+    assert derived == [d for d in (derive_expense(r) for r in resources) if d]
+    assert derived[0]["amount"] == 300.0
+    assert derived[1]["amount"] == 20.0
+
+
+def test_derived_expense_carries_link_and_structured_name():
+    derived = derive_expense(resource("r1", resource_type="vendor", name="Acme: North"))
+    assert derived["description"] == "Vendor: Acme: North"
+    assert derived["expense_type"] == "vendor"
+    assert derived["derived_from_resource"] is True
+    assert derived["resource_name"] == "Acme: North"
+    assert derive_expenses([]) == []
+
+
+def test_renames_strip_only_the_derived_type_prefix():
+    derived = {"derived_from_resource": True, "expense_type": "equipment"}
+    assert resource_name_for(derived, {"description": describe("equipment", "Crane: 40t")}) == "Crane: 40t"
+    # A derived description carrying another prefix renames the resource verbatim
+    assert resource_name_for({"expense_type": "vendor"}, {"description": "Note: paid late"}) == "Note: paid late"
+    # A hand-written one names it after its first ": ", as it always has
+    manual = {"derived_from_resource": False, "expense_type": "other"}
+    assert resource_name_for(manual, {"description": "Hire: Crane: 40t"}) == "Crane: 40t"
+    assert resource_name_for(manual, {"description": "Crane"}) == "Crane"
+    assert resource_name_for(derived, {"resource_name": "Hoist", "description": "ignored"}) == "Hoist"
+    assert resource_name_for(derived, {"amount": 5.0}) is None
+
+
+def test_sync_updates_follow_type_and_amount():
+    expense = {"derived_from_resource": True, "expense_type": "vendor"}
+    updates = resource_sync_updates(expense, {"expense_type": "material", "amount": 90.0}, {"allocated_amount": 3.0})
+    assert updates == {"type": "material", "cost_per_unit": 30.0}
+    assert resource_sync_updates(expense, {"expense_type": "other"}, {}) == {}
+
+
+def test_legacy_expense_without_flag_strips_its_own_prefix():
+    legacy = {"expense_type": "vendor", "resource_id": "r1"}
+    assert resource_name_for(legacy, {"description": "Vendor: Acme"}) == "Acme"
+    assert resource_name_for(legacy, {"description": "Lease: Acme"}) == "Lease: Acme"
+
+
+def test_backfill_flags_prefixed_linked_expenses():
+    import asyncio
+
+    class Collection:
+        def __init__(self):
+            self.updates = []
+
+        async def update_many(self, query, update):
+            self.updates.append((query, update))
+
+    class Database:
+        expenses = Collection()
+        resources = Collection()
+
+    asyncio.run(backfill_derived_flags(Database))
+    first_query, first_update = Database.expenses.updates[0]
+    assert first_query["description"] == {"$regex": "^Vendor:\\ "} and first_update == {"$set": {"derived_from_resource": True}}
+    assert Database.expenses.updates[-1][1] == {"$set": {"derived_from_resource": False}}
+    assert "expense.derived_from_resource" in Database.resources.updates[-1][0]
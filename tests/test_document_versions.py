@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+from document_versions import DELTA_SUFFIX, DocumentVersions, apply_delta, document_key, make_delta
+from storage import LocalStorage
+
+from tests.conftest import FakeCollection, FakeDatabase
+
+
+class InlinePool:
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+def version(n, content, storage, **fields):
+    doc = {"id": f"d{n}", "project_id": "p1", "folder_path": "/plans", "name": "spec.txt",
+           "filename": f"blob{n}.txt", "version": n, "is_latest": True, **fields}
+    storage.path(document_key(doc)).parent.mkdir(parents=True, exist_ok=True)
+    storage.path(document_key(doc)).write_bytes(content)
+    return doc
+
+
+def test_delta_round_trip_and_incompressible_content(tmp_path):
+    base, target = tmp_path / "base", tmp_path / "target"
+    base.write_bytes(b"line of the spec\n" * 2000 + b"new clause\n")
+    target.write_bytes(b"line of the spec\n" * 2000)
+    size = make_delta(str(base), str(target), str(tmp_path / "delta"))
+    assert size is not None and size < target.stat().st_size / 10
+    apply_delta(str(base), str(tmp_path / "delta"), str(tmp_path / "rebuilt"))
+    assert (tmp_path / "rebuilt").read_bytes() == target.read_bytes()
+
+    target.write_bytes(os.urandom(20000))
+    assert make_delta(str(base), str(target), str(tmp_path / "delta2")) is None
+
+
+def test_mark_latest_keeps_the_highest_version_regardless_of_order(tmp_path):
+    storage = LocalStorage(tmp_path)
+    documents = FakeCollection()
+    db = FakeDatabase(documents=documents)
+    versions = DocumentVersions(lambda: db, storage, InlinePool())
+    for n in (1, 3, 2):
+        doc = version(n, b"x", storage)
+        documents.docs.append(doc)
+        asyncio.run(versions.mark_latest(doc))
+    assert {d["id"]: d["is_latest"] for d in documents.docs} == {"d1": False, "d2": False, "d3": True}
+
+
+def test_old_versions_become_deltas_and_are_rebuilt(tmp_path):
+    storage = LocalStorage(tmp_path)
+    documents = FakeCollection()
+    db = FakeDatabase(documents=documents)
+    versions = DocumentVersions(lambda: db, storage, InlinePool(), deltas=True)
+    contents = [b"clause %d\n" % i * 3000 + b"revision %d\n" % n for n, i in enumerate(range(3), start=1)]
+    for n, content in enumerate(contents, start=1):
+        doc = version(n, content, storage)
+        documents.docs.append(doc)
+        previous = asyncio.run(versions.previous(doc))
+        if previous:
+            assert asyncio.run(versions.deltify(previous, doc))
+
+    assert [d.get("delta_base_id") for d in documents.docs] == ["d2", "d3", None]
+    assert not storage.path("p1/blob1.txt").exists()
+    assert storage.path("p1/blob1.txt" + DELTA_SUFFIX).exists()
+
+    async def rebuilt(doc):
+        async with versions.local_copy(doc) as path:
+            return path.read_bytes()
+
+    assert [asyncio.run(rebuilt(d)) for d in documents.docs] == contents
+    # A version already stored as a delta is left alone
+    assert asyncio.run(versions.deltify(documents.docs[0], documents.docs[2])) is None
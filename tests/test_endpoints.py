@@ -0,0 +1,219 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from expense_store import EMBEDDED_FIELD
+
+from tests.conftest import FakeDatabase
+
+NOW = "2024-03-01T00:00:00+00:00"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """The app against an in-memory database, without transactions"""
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server.transactions, "supported", False)
+    drain_audit()
+    yield db
+    drain_audit()
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(server.app)
+
+
+def drain_audit():
+    """Audit events recorded since the last call, as (action, entity, entity_id)"""
+    events = []
+    while not server.audit.queue.empty():
+        event = server.audit.queue.get_nowait()
+        events.append((event["action"], event["entity"], event["entity_id"]))
+    return events
+
+
+def by_id(collection, doc_id):
+    return next(doc for doc in collection.docs if doc.get("id") == doc_id)
+
+
+def resource(resource_id, **fields):
+    return {
+        "id": resource_id, "name": "Acme", "type": "vendor", "cost_per_unit": 100.0, "availability": "available",
+        "project_id": "p1", "allocated_amount": 2.0, "created_at": NOW, "rev": 1, **fields,
+    }
+
+
+def expense(expense_id, **fields):
+    return {
+        "id": expense_id, "description": "Vendor: Acme", "amount": 200.0, "expense_type": "vendor", "project_id": "p1",
+        "resource_id": "r1", "resource_name": "Acme", "derived_from_resource": True, "date": NOW, "created_at": NOW,
+        "rev": 1, **fields,
+    }
+
+
+def test_update_expense_syncs_its_resource_at_the_if_match_revision(db, client):
+    db.resources.docs.append(resource("r1"))
+    db.expenses.docs.append(expense("e1"))
+
+    response = client.put("/api/expenses/e1", json={"amount": 300}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"' and response.json()["amount"] == 300
+    assert by_id(db.resources, "r1")["cost_per_unit"] == 150 and by_id(db.resources, "r1")["rev"] == 2
+    assert drain_audit() == [("update", "expense", "e1"), ("update", "resource", "r1")]
+
+    stale = client.put("/api/expenses/e1", json={"amount": 400}, headers={"If-Match": '"1"'})
+    assert stale.status_code == 412 and stale.headers["etag"] == '"2"'
+    assert by_id(db.expenses, "e1")["amount"] == 300
+    assert client.put("/api/expenses/missing", json={"amount": 1}).status_code == 404
+
+
+def test_update_expense_moves_a_relinked_embedded_expense(db, client, monkeypatch):
+    monkeypatch.setattr(server.expense_store, "mode", "embedded")
+    db.resources.docs.extend([
+        resource("r1", **{EMBEDDED_FIELD: expense("e1")}),
+        resource("r2", name="Bolt", allocated_amount=1.0),
+    ])
+
+    response = client.put("/api/expenses/e1", json={"resource_id": "r2"})
+    assert response.status_code == 200 and response.json()["resource_id"] == "r2"
+    assert EMBEDDED_FIELD not in by_id(db.resources, "r1")
+    moved = by_id(db.resources, "r2")[EMBEDDED_FIELD]
+    assert (moved["id"], moved["resource_id"], moved["rev"]) == ("e1", "r2", 2)
+    assert not db.expenses.docs
+
+
+def upload(client, entity, rows, **params):
+    csv = "\n".join(rows).encode()
+    return client.post(f"/api/imports/{entity}", params=params, files={"file": (f"{entity}.csv", csv, "text/csv")})
+
+
+def test_import_resources_writes_their_derived_expenses_and_reports_bad_rows(db, client):
+    response = upload(client, "resources", [
+        "name,type,cost_per_unit,availability,allocated_amount",
+        "Acme,vendor,50,available,2",
+        "Dana,team_member,,available,1",
+        "Warp drive,spaceship,1,available,1",
+    ], project_id="p1")
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["total_rows"], report["imported"], report["failed"], report["expenses_created"]) == (3, 2, 1, 1)
+    assert report["errors"][0]["row"] == 4
+    assert sorted(doc["name"] for doc in db.resources.docs) == ["Acme", "Dana"]
+    acme = next(doc for doc in db.resources.docs if doc["name"] == "Acme")
+    (derived,) = db.expenses.docs
+    assert (derived["resource_id"], derived["amount"], derived["derived_from_resource"]) == (acme["id"], 100, True)
+    assert ("import", "resource", None) in drain_audit()
+
+
+def test_import_expenses_and_unsupported_files(db, client):
+    response = upload(client, "expenses", [
+        "description,amount,expense_type,currency",
+        "Permit,120.5,other,eur",
+        "Lunch,lots,other,",
+    ], project_id="p1")
+    assert response.json()["imported"] == 1
+    (row,) = db.expenses.docs
+    assert (row["project_id"], row["amount"], row["currency"]) == ("p1", 120.5, "EUR")
+
+    assert upload(client, "milestones", ["title"]).status_code == 400
+    bad = client.post("/api/imports/expenses", files={"file": ("notes.txt", b"x", "text/plain")})
+    assert bad.status_code == 400
+
+
+def test_deleted_resource_comes_back_with_its_expenses_on_undo(db, client):
+    db.resources.docs.append(resource("r1"))
+    db.expenses.docs.extend([expense("e1"), expense("e2", resource_id=None, derived_from_resource=False)])
+
+    deletion_id = client.delete("/api/resources/r1").json()["deletion_id"]
+    assert not db.resources.docs and [doc["id"] for doc in db.expenses.docs] == ["e2"]
+    assert len(db.trash.docs) == 2
+
+    response = client.post(f"/api/deletions/{deletion_id}/undo")
+    assert response.status_code == 200 and response.json()["restored"] == {"resources": 1, "expenses": 1}
+    assert by_id(db.resources, "r1")["rev"] == 2 and by_id(db.expenses, "e1")["rev"] == 2
+    assert not db.trash.docs
+    assert ("restore", "deletion", deletion_id) in drain_audit()
+    assert client.post(f"/api/deletions/{deletion_id}/undo").status_code == 404
+
+
+def test_deleting_a_resource_that_vanished_meanwhile_leaves_the_caches_alone(db, client, monkeypatch):
+    db.resources.docs.append(resource("r1"))
+    removed = []
+    monkeypatch.setattr(server.search_index, "remove", lambda kind, doc_id: removed.append((kind, doc_id)))
+
+    async def lost_race(resource_id, deletion_id=None, session=None):
+        return False
+    monkeypatch.setattr(server.expense_store, "delete_resource", lost_race)
+    assert client.delete("/api/resources/r1").status_code == 404
+    assert not removed and not drain_audit()
+
+
+def test_undo_refuses_to_overwrite_a_document_recreated_since(db, client):
+    asyncio.run(db.resources.create_index("id", unique=True))
+    db.resources.docs.append(resource("r1"))
+    deletion_id = client.delete("/api/resources/r1").json()["deletion_id"]
+    db.resources.docs.append(resource("r1", name="Recreated"))
+
+    assert client.post(f"/api/deletions/{deletion_id}/undo").status_code == 409
+    assert [doc["name"] for doc in db.resources.docs] == ["Recreated"]
+
+
+def project(project_id, **fields):
+    return {
+        "id": project_id, "name": "Depot", "start_date": NOW, "end_date": "2025-03-01T00:00:00+00:00", "budget": 1e6,
+        "manager_id": "u1", "created_at": NOW, "updated_at": NOW, "rev": 1, **fields,
+    }
+
+
+def test_changing_a_project_currency_pins_its_expenses_to_the_old_one(db, client):
+    db.projects.docs.append(project("p1", currency="USD"))
+    db.expenses.docs.extend([expense("e1", currency=None), expense("e2", currency="GBP"), expense("e3", project_id="p2")])
+    db.resources.docs.append(resource("r1", **{EMBEDDED_FIELD: expense("e4")}))
+
+    response = client.put("/api/projects/p1", json={"currency": "eur"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200 and response.json()["currency"] == "EUR"
+    assert [by_id(db.expenses, e)["currency"] for e in ("e1", "e2")] == ["USD", "GBP"]
+    assert by_id(db.expenses, "e3").get("currency") is None
+    assert by_id(db.resources, "r1")[EMBEDDED_FIELD]["currency"] == "USD"
+
+    # Expenses pinned once stay where they are on the next change
+    client.put("/api/projects/p1", json={"currency": "GBP"})
+    assert by_id(db.expenses, "e1")["currency"] == "USD"
+    assert client.put("/api/projects/p1", json={"currency": "CHF"}, headers={"If-Match": '"1"'}).status_code == 412
+    assert client.put("/api/projects/missing", json={"currency": "EUR"}).status_code == 404
+
+
+def milestone(milestone_id, project_id="p1", **fields):
+    return {
+        "id": milestone_id, "title": milestone_id.upper(), "due_date": NOW, "project_id": project_id, "completed": False,
+        "depends_on": [], "created_at": NOW, "rev": 1, **fields,
+    }
+
+
+def test_milestone_dependencies_are_validated_and_cycles_refused(db, client):
+    db.projects.docs.append(project("p1"))
+    db.milestones.docs.extend([milestone("m1"), milestone("m2"), milestone("m3", depends_on=["m2"]), milestone("x1", "p2")])
+
+    response = client.put("/api/milestones/m2/dependencies", json={"depends_on": ["m1", "m1"]}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.json()["depends_on"] == ["m1"] and response.headers["etag"] == '"2"'
+    assert by_id(db.projects, "p1")["dependencies_rev"] == 1
+
+    # m1 -> m3 -> m2 -> m1
+    cycle = client.put("/api/milestones/m1/dependencies", json={"depends_on": ["m3"]})
+    assert cycle.status_code == 400 and "cycle" in cycle.json()["detail"]
+    assert by_id(db.milestones, "m1")["depends_on"] == []
+    for depends_on in (["m1"], ["x1"], ["nope"]):
+        assert client.put("/api/milestones/m1/dependencies", json={"depends_on": depends_on}).status_code == 400
+    assert client.put("/api/milestones/m2/dependencies", json={"depends_on": []}, headers={"If-Match": '"1"'}).status_code == 412
+    assert client.put("/api/milestones/missing/dependencies", json={"depends_on": []}).status_code == 404
+
+
+def test_deadline_listings_bound_their_limit(db, client):
+    assert client.get("/api/milestones/overdue", params={"limit": 0}).status_code == 422
+    assert client.get("/api/milestones/overdue", params={"limit": 1001}).status_code == 422
+    assert client.get("/api/milestones/upcoming", params={"limit": -1}).status_code == 422
@@ -0,0 +1,69 @@
+import asyncio
+import csv
+import io
+
+import pytest
+
+from exports import build_expense_export_query, stream_csv, stream_parquet
+
+from tests.conftest import FakeCursor
+
+
+def make_rows(count):
+    return [
+        {
+            "id": f"e{i}",
+            "project_id": "p1",
+            "resource_id": None,
+            "expense_type": "vendor",
+            "description": f"Expense, number {i}",
+            "amount": float(i),
+            "date": "2024-01-01T00:00:00+00:00",
+            "created_at": "2024-01-01T00:00:00+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_export_query_filters():
+    query = build_expense_export_query(
+        project_id="p1",
+        start_date="2024-01-01T02:00:00+02:00",
+        end_date="2024-02-01T12:00:00Z",
+        expense_type="vendor",
+    )
+    assert query == {
+        "project_id": "p1",
+        "expense_type": "vendor",
+        "date": {"$gte": "2024-01-01T00:00:00+00:00", "$lte": "2024-02-01T12:00:00+00:00"},
+    }
+    # A date-only end includes that whole day
+    assert build_expense_export_query(end_date="2024-02-01")["date"] == {"$lt": "2024-02-02T00:00:00+00:00"}
+    with pytest.raises(ValueError):
+        build_expense_export_query(start_date="last week")
+
+
+def test_csv_streams_one_chunk_per_batch():
+    chunks = asyncio.run(collect(stream_csv(FakeCursor(make_rows(25)), batch_size=10)))
+    assert len(chunks) == 4
+
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0][0] == "id"
+    assert len(rows) == 26
+    assert rows[1][4] == "Expense, number 0"
+
+
+def test_parquet_writes_bounded_row_groups():
+    pq = pytest.importorskip("pyarrow.parquet")
+    chunks = asyncio.run(collect(stream_parquet(FakeCursor(make_rows(25)), batch_size=10, row_group_size=10)))
+    assert len(chunks) == 3
+    assert all(chunks)
+
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    assert parquet.metadata.num_rows == 25
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().column("amount").to_pylist()[-1] == 24.0
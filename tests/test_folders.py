@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from folders import FolderIndex, folder_tree, normalize_folder, subtree_filter
+
+from tests.conftest import FakeCollection, FakeCursor, FakeDatabase, matches
+
+
+def in_subtree(path, query):
+    return matches({"folder_path": path}, query)
+
+
+def test_normalize_folder():
+    assert normalize_folder("") == "/"
+    assert normalize_folder("/") == "/"
+    assert normalize_folder("plans/") == "/plans"
+    assert normalize_folder("//plans/./site\\a//") == "/plans/site/a"
+    with pytest.raises(ValueError):
+        normalize_folder("/plans/../secrets")
+
+
+def test_subtree_filter_excludes_sibling_prefixes():
+    query = subtree_filter("/plans")
+    assert in_subtree("/plans", query)
+    assert in_subtree("/plans/site/a", query)
+    assert not in_subtree("/plans-old", query)
+    assert not in_subtree("/plansx/a", query)
+    assert subtree_filter("/") == {}
+
+
+def test_folder_tree_rolls_totals_up_to_ancestors():
+    rows = [
+        {"_id": "/", "count": 1, "size": 5},
+        {"_id": "/plans", "count": 2, "size": 10},
+        {"_id": "/plans/site/a", "count": 3, "size": 30},
+    ]
+    tree = {entry["path"]: entry for entry in folder_tree("/", rows)}
+    assert list(tree) == ["/", "/plans", "/plans/site", "/plans/site/a"]
+    assert tree["/"]["total_document_count"] == 6 and tree["/"]["total_size"] == 45
+    assert tree["/plans/site"]["document_count"] == 0 and tree["/plans/site"]["total_size"] == 30
+    assert tree["/plans/site/a"]["name"] == "a"
+
+    subtree = folder_tree("/plans/site", rows[2:])
+    assert [entry["path"] for entry in subtree] == ["/plans/site", "/plans/site/a"]
+
+
+def test_tree_counts_only_the_latest_versions():
+    class GroupingDocuments(FakeCollection):
+        def aggregate(self, pipeline):
+            match = pipeline[0]["$match"]
+            rows = {}
+            for doc in self.docs:
+                if matches(doc, match):
+                    row = rows.setdefault(doc["folder_path"], {"_id": doc["folder_path"], "count": 0, "size": 0})
+                    row["count"] += 1
+                    row["size"] += doc.get("file_size") or 0
+            return FakeCursor(list(rows.values()))
+
+    docs = [
+        {"project_id": "p1", "folder_path": "/plans", "file_size": 10, "is_latest": False},
+        {"project_id": "p1", "folder_path": "/plans", "file_size": 12, "is_latest": True},
+        {"project_id": "p1", "folder_path": "/plans/site", "file_size": None, "is_latest": True},
+    ]
+    folders = FolderIndex(lambda: FakeDatabase(documents=GroupingDocuments(docs)))
+    tree = {entry["path"]: entry for entry in asyncio.run(folders.tree("p1"))}
+    assert tree["/plans"]["document_count"] == 1 and tree["/plans"]["total_size"] == 12
+    assert tree["/"]["total_document_count"] == 2
+
+
+def test_move_rewrites_the_subtree_only():
+    docs = [
+        {"project_id": "p1", "folder_path": "/plans"},
+        {"project_id": "p1", "folder_path": "/plans/site"},
+        {"project_id": "p1", "folder_path": "/plans-old"},
+        {"project_id": "p2", "folder_path": "/plans"},
+    ]
+    db = FakeDatabase(documents=FakeCollection(docs))
+    folders = FolderIndex(lambda: db)
+    assert asyncio.run(folders.move("p1", "/plans", "/archive/2024")) == 2
+    assert [d["folder_path"] for d in docs] == ["/archive/2024", "/archive/2024/site", "/plans-old", "/plans"]
+    assert docs[0]["rev"] == 2
+
+    for source, target in (("/", "/x"), ("/archive", "/"), ("/archive", "/archive/inner")):
+        with pytest.raises(ValueError):
+            asyncio.run(folders.move("p1", source, target))
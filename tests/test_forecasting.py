@@ -0,0 +1,63 @@
+import numpy as np
+
+from forecasting import DailySpend, ForecastCache, compute_forecast, fit_cumulative
+
+
+def day(value):
+    return np.datetime64(value, "D")
+
+
+def test_daily_spend_buckets_from_columns():
+    spend = DailySpend.from_columns(
+        day("2024-01-01"),
+        [100.0, 50.0, 25.0, 10.0],
+        ["2024-01-01T09:00:00+00:00", "2024-01-03T00:00:00+00:00", "2023-12-25T00:00:00+00:00", None],
+    )
+    assert spend.amounts.tolist() == [135.0, 0.0, 50.0]
+
+
+def test_fit_cumulative_recovers_linear_burn():
+    cumulative = np.cumsum(np.full(30, 100.0))
+    intercept, slope, sigma, _, _ = fit_cumulative(cumulative)
+    assert np.isclose(slope, 100.0)
+    assert np.isclose(intercept, 100.0)
+    assert np.isclose(sigma, 0.0)
+
+
+def test_forecast_estimates_exhaustion_date():
+    spend = DailySpend(day("2024-01-01"), np.full(10, 100.0))
+    result = compute_forecast(spend, 2000.0, day("2024-01-31"), day("2024-01-10"))
+
+    assert result["total_expenses"] == 1000.0
+    assert np.isclose(result["daily_burn_rate"], 100.0)
+    assert result["estimated_exhaustion_date"] == "2024-01-20"
+    assert len(result["curve"]) == 31
+    assert result["curve"][9]["actual"] == 1000.0
+    assert result["curve"][10]["actual"] is None
+
+
+def test_forecast_extrapolates_past_project_end():
+    spend = DailySpend(day("2024-01-01"), np.full(10, 10.0))
+    result = compute_forecast(spend, 1000.0, day("2024-01-31"), day("2024-01-10"))
+    assert result["estimated_exhaustion_date"] == "2024-04-09"
+    assert result["exhaustion_window"]["latest"] is None
+
+
+def test_cache_records_new_expenses_incrementally():
+    cache = ForecastCache()
+    version = cache.version("p1")
+    cache.put_spend("p1", DailySpend(day("2024-01-01"), np.zeros(5)), version)
+    cache.put_result("p1", ("key",), {"total_expenses": 0.0})
+
+    cache.record_expense("p1", "2024-01-03T12:00:00+00:00", 75.0)
+
+    assert cache.get_result("p1", ("key",)) is None
+    assert cache.get_spend("p1").amounts[2] == 75.0
+
+
+def test_cache_skips_buckets_loaded_during_a_write():
+    cache = ForecastCache()
+    version = cache.version("p1")
+    cache.record_expense("p1", "2024-01-03T00:00:00+00:00", 75.0)
+    cache.put_spend("p1", DailySpend(day("2024-01-01")), version)
+    assert cache.get_spend("p1") is None
@@ -0,0 +1,103 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from analytics import build_expense_arrays, build_project_frame, compute_portfolio
+from fx import FxRateTable, convert_spend, normalize_currency
+
+
+def days(*values):
+    return np.array(values, dtype="datetime64[D]")
+
+
+def make_table():
+    # EUR is quoted on the 1st and 4th, GBP only on the 3rd
+    return FxRateTable.from_quotes(
+        "USD",
+        ["2026-01-01", "2026-01-04", "2026-01-03", "not a date"],
+        ["EUR", "EUR", "GBP", "EUR"],
+        [0.8, 0.9, 0.5, 1.0],
+    )
+
+
+def test_normalize_currency():
+    assert normalize_currency(" eur ") == "EUR"
+    assert normalize_currency(None) is None
+    with pytest.raises(ValueError):
+        normalize_currency("euro")
+
+
+def test_rates_carry_forward_and_clip_to_the_table():
+    table = make_table()
+    assert table.currencies == ["USD", "EUR", "GBP"]
+    assert table.describe()["last_day"] == "2026-01-04"
+    converted, unconverted = table.convert(
+        [80.0, 80.0, 90.0, 10.0, 10.0],
+        ["EUR", "EUR", "EUR", "GBP", "EUR"],
+        days("2025-12-01", "2026-01-03", "NaT", "2026-01-01", "2026-01-04"),
+        ["USD", "USD", "USD", "USD", "GBP"],
+    )
+    # Before the table, on a gap day and undated; GBP's first quote covers earlier days
+    np.testing.assert_allclose(converted, [100.0, 100.0, 100.0, 20.0, 10.0 * 0.5 / 0.9])
+    assert not unconverted.any()
+
+
+def test_missing_currency_is_already_in_the_target_and_unknown_is_reported():
+    table = make_table()
+    converted, unconverted = table.convert([5.0, 7.0, 9.0], [None, "JPY", "usd"], days("2026-01-02", "2026-01-02", "NaT"), "EUR")
+    np.testing.assert_allclose(converted, [5.0, 0.0, 9.0 * 0.9])
+    assert unconverted.tolist() == [False, True, False]
+
+    summary = convert_spend([
+        {"_id": {"currency": "EUR", "day": "2026-01-01"}, "amount": 80.0},
+        {"_id": {"currency": None, "day": "2026-01-02"}, "amount": 20.0},
+        {"_id": {"currency": "JPY", "day": None}, "amount": 1000.0},
+    ], table, "USD")
+    assert summary == {"total": 120.0, "unconverted": {"JPY": 1000.0}}
+
+    # Across projects, rows without a currency are in their project's
+    summary = convert_spend([
+        {"_id": {"project_id": "p1", "currency": None, "day": "2026-01-01"}, "amount": 80.0},
+        {"_id": {"project_id": "p2", "currency": None, "day": "2026-01-01"}, "amount": 30.0},
+    ], table, "USD", {"p1": "EUR", "p2": "USD"})
+    assert summary == {"total": 130.0, "unconverted": {}}
+
+
+def test_load_reads_every_rate_file(tmp_path):
+    (tmp_path / "2025.csv").write_text("date,currency,rate\n2025-12-31,EUR,0.8\n2025-12-31,GBP,bad\n")
+    (tmp_path / "2026.csv").write_text("date,currency,rate\n2026-01-02,eur,0.5\n")
+    (tmp_path / "notes.csv").write_text("day,value\n2026-01-01,1\n")
+    table = FxRateTable.load(tmp_path, "USD")
+    assert table.sources == ("2025.csv", "2026.csv")
+    assert table.rates[table.row_index["EUR"]].tolist() == [0.8, 0.8, 0.5]
+    assert FxRateTable.load(tmp_path / "missing").currencies == ["USD"]
+
+
+def test_portfolio_converts_into_project_and_base_currencies():
+    projects = build_project_frame({
+        "id": ["p1", "p2"],
+        "name": ["Depot", "Bridge"],
+        "stage": ["execution", "execution"],
+        "budget": [1000.0, 800.0],
+        "currency": [None, "EUR"],
+        "start_date": ["2026-01-01T00:00:00+00:00"] * 2,
+        "end_date": ["2026-12-31T00:00:00+00:00"] * 2,
+    }, "USD")
+    expenses = build_expense_arrays({
+        "project_id": ["p1", "p1", "p2", "p2"],
+        "amount": [100.0, 90.0, 80.0, 5.0],
+        "currency": [None, "EUR", None, "JPY"],
+        "expense_type": ["vendor"] * 4,
+        "date": ["2026-01-04T00:00:00+00:00", "2026-01-04T00:00:00+00:00", "2026-01-01T00:00:00+00:00", None],
+    })
+    result = compute_portfolio(projects, expenses, now=datetime(2026, 2, 1, tzinfo=timezone.utc), fx=make_table())
+    depot, bridge = result["projects"]
+    assert (depot["currency"], depot["total_expenses"]) == ("USD", pytest.approx(200.0))
+    assert (bridge["currency"], bridge["total_expenses"], bridge["unconverted_expenses"]) == ("EUR", 80.0, 1)
+    totals = result["totals"]
+    # EUR budget at the latest rate, EUR spend at its day's rate
+    assert totals["currency"] == "USD"
+    assert totals["budget"] == pytest.approx(1000.0 + 800.0 / 0.9)
+    assert totals["total_expenses"] == pytest.approx(300.0)
+    assert totals["unconverted_expenses"] == 1
@@ -0,0 +1,165 @@
+import asyncio
+import json
+from datetime import datetime, timezone, timedelta
+
+import msgpack
+
+from idempotency import IdempotencyMiddleware
+from responses import ContentNegotiationMiddleware
+
+from tests.conftest import FakeCollection
+
+
+def records(collection):
+    return {doc["_id"]: doc for doc in collection.docs}
+
+
+def make_app(status=201):
+    calls = []
+
+    async def app(scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        calls.append(body)
+        payload = json.dumps({"id": f"row-{len(calls)}"}).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    return app, calls
+
+
+def post(app, body=b'{"name": "A"}', key="key-1", path="/api/projects", query=b"", headers=()):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    headers = [(b"content-type", b"application/json"), *headers]
+    if key is not None:
+        headers.append((b"idempotency-key", key.encode()))
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers, "query_string": query}
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def test_retries_replay_the_first_response():
+    collection = FakeCollection()
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+
+    first = post(app)
+    replay = post(app)
+    assert len(calls) == 1
+    assert first[0] == replay[0] == 201
+    assert first[2] == replay[2] == b'{"id": "row-1"}'
+    assert replay[1][b"idempotent-replayed"] == b"true"
+
+    # Other keys, paths and key-less requests run normally
+    post(app, key="key-2")
+    post(app, path="/api/resources")
+    post(app, key=None)
+    assert len(calls) == 4
+
+
+def test_key_reuse_with_a_different_body_or_in_flight_is_rejected():
+    collection = FakeCollection()
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+
+    post(app)
+    assert post(app, body=b'{"name": "B"}')[0] == 422
+
+    collection.docs.append({"_id": "anonymous POST /api/projects busy", "state": "in_progress", "created_at": datetime.now(timezone.utc)})
+    status, headers, _ = post(app, key="busy")
+    assert status == 409 and headers[b"retry-after"] == b"1"
+    assert len(calls) == 1
+
+
+def test_failures_release_the_key_and_stale_claims_are_taken_over():
+    collection = FakeCollection()
+    inner, calls = make_app(status=503)
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+    post(app)
+    post(app)
+    assert len(calls) == 2 and not collection.docs
+
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection, ttl_seconds=60)
+    collection.docs.append({
+        "_id": "anonymous POST /api/projects key-1", "state": "in_progress",
+        "created_at": datetime.now(timezone.utc) - timedelta(minutes=5),
+    })
+    assert post(app)[0] == 201
+    assert len(calls) == 1
+    assert records(collection)["anonymous POST /api/projects key-1"]["state"] == "completed"
+
+
+def test_keys_are_scoped_to_the_query_string():
+    collection = FakeCollection()
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+    post(app, query=b"dry_run=true")
+    assert post(app, query=b"dry_run=true")[1][b"idempotent-replayed"] == b"true"
+    assert post(app, query=b"dry_run=false")[0] == 201
+    assert len(calls) == 2
+    assert "anonymous POST /api/projects?dry_run=false key-1" in records(collection)
+
+
+def test_keys_are_scoped_to_the_client():
+    collection = FakeCollection()
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+    alice = [(b"x-user-id", b"alice")]
+    post(app, headers=alice)
+    assert post(app, headers=alice)[1][b"idempotent-replayed"] == b"true"
+    # Another user's request with the same key runs instead of getting alice's response
+    assert post(app, headers=[(b"x-user-id", b"bob")])[2] == b'{"id": "row-2"}'
+    assert post(app, headers=[(b"authorization", b"Bearer secret")])[2] == b'{"id": "row-3"}'
+    assert len(calls) == 3
+    assert not any("secret" in record_id for record_id in records(collection))
+
+
+def test_replays_follow_the_retry_accept_header():
+    collection = FakeCollection()
+    inner, calls = make_app()
+    app = ContentNegotiationMiddleware(IdempotencyMiddleware(inner, collection=lambda: collection))
+    post(app)
+    status, headers, body = post(app, headers=[(b"accept", b"application/msgpack")])
+    assert len(calls) == 1
+    assert headers[b"content-type"] == b"application/msgpack"
+    assert msgpack.unpackb(body) == {"id": "row-1"}
+
+
+def test_long_requests_renew_their_claim():
+    collection = FakeCollection()
+    record_id = "anonymous POST /api/projects key-1"
+
+    async def slow(scope, receive, send):
+        await receive()
+        await asyncio.sleep(0.05)
+        record = records(collection)[record_id]
+        assert record["renewed_at"] > record["created_at"]
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    app = IdempotencyMiddleware(slow, collection=lambda: collection, lock_seconds=0.02)
+    assert post(app)[0] == 201
+
+    # A claim renewed recently is still owned, however old it is
+    inner, calls = make_app()
+    app = IdempotencyMiddleware(inner, collection=lambda: collection)
+    now = datetime.now(timezone.utc)
+    collection.docs.append({
+        "_id": "anonymous POST /api/projects busy", "state": "in_progress",
+        "created_at": now - timedelta(minutes=5), "renewed_at": now,
+    })
+    assert post(app, key="busy")[0] == 409
+    assert not calls
@@ -0,0 +1,96 @@
+import io
+
+import pytest
+
+from imports import ImportFileError, ImportReport, number_rows, open_row_reader, read_chunk, validate_chunk
+from server import ResourceCreate, ExpenseCreate
+
+
+RESOURCE_CSV = (
+    "﻿name,type,cost_per_unit,availability,allocated_amount,description\n"
+    "Acme Supplies,vendor,250.5,available,2,\n"
+    "Excavator,equipment,,on-site,,Rented\n"
+    "Bad Row,spaceship,10,available,1,\n"
+)
+
+
+def test_csv_rows_are_cleaned():
+    rows = list(open_row_reader("resources.csv", io.BytesIO(RESOURCE_CSV.encode("utf-8"))))
+    assert rows[0] == {
+        "name": "Acme Supplies",
+        "type": "vendor",
+        "cost_per_unit": "250.5",
+        "availability": "available",
+        "allocated_amount": "2",
+    }
+    assert "cost_per_unit" not in rows[1]
+
+
+def test_xlsx_rows_stream_from_first_sheet():
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["description", "amount", "expense_type"])
+    sheet.append(["Catering", 120.0, "other"])
+    sheet.append([None, None, None])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+
+    rows = list(open_row_reader("expenses.XLSX", buffer))
+    assert rows == [{"description": "Catering", "amount": 120.0, "expense_type": "other"}, {}]
+
+
+def test_unsupported_extension_is_rejected():
+    with pytest.raises(ValueError):
+        open_row_reader("resources.json", io.BytesIO(b"[]"))
+
+
+def test_validate_chunk_reports_row_numbers():
+    rows = open_row_reader("resources.csv", io.BytesIO(RESOURCE_CSV.encode("utf-8")))
+    chunk = read_chunk(enumerate(rows, start=2), 10)
+    valid, errors = validate_chunk(ResourceCreate, chunk, {"project_id": "p1"})
+
+    assert [row for row, _ in valid] == [2, 3]
+    assert valid[0][1].cost_per_unit == 250.5
+    assert valid[0][1].project_id == "p1"
+    assert errors[0]["row"] == 4
+    assert errors[0]["errors"][0]["field"] == "type"
+
+
+def test_read_chunk_is_bounded():
+    numbered = enumerate(({"n": i} for i in range(5)), start=2)
+    assert len(read_chunk(numbered, 3)) == 3
+    assert len(read_chunk(numbered, 3)) == 2
+    assert read_chunk(numbered, 3) == []
+
+
+def test_report_truncates_errors(monkeypatch):
+    monkeypatch.setattr("imports.MAX_REPORTED_ERRORS", 2)
+    report = ImportReport("expenses")
+    valid, errors = validate_chunk(ExpenseCreate, [(i, {}) for i in range(2, 6)])
+    report.add_errors(errors)
+
+    result = report.as_dict()
+    assert result["failed"] == 4
+    assert len(result["errors"]) == 2
+    assert result["errors_truncated"] is True
+
+
+def test_unreadable_files_raise_import_file_errors():
+    with pytest.raises(ImportFileError):
+        list(open_row_reader("resources.csv", io.BytesIO("name\nCaf\u00e9\n".encode("latin-1"))))
+    pytest.importorskip("openpyxl")
+    with pytest.raises(ImportFileError):
+        list(open_row_reader("resources.xlsx", io.BytesIO(b"not a workbook")))
+
+
+def test_blank_rows_are_skipped_but_keep_row_numbers():
+    assert list(number_rows(iter([{"n": 1}, {}, {"n": 3}]))) == [(2, {"n": 1}), (4, {"n": 3})]
+
+
+def test_report_counts_rows_the_database_rejected():
+    report = ImportReport("expenses")
+    report.add_rejected({1: "duplicate key"}, [(2, "a"), (5, "b")])
+    assert report.as_dict()["errors"] == [{"row": 5, "errors": [{"field": "row", "message": "duplicate key"}]}]
+    assert report.failed == 1
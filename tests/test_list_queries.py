@@ -0,0 +1,83 @@
+import pytest
+
+from list_queries import ListQuery, ListQuerySpec, build_filter, parse_fields, parse_sort
+
+
+SPEC = ListQuerySpec(
+    fields=["id", "description", "amount", "expense_type", "date", "completed"],
+    filters={"expense_type": "enum", "amount": "number", "date": "datetime", "completed": "bool"},
+    choices={"expense_type": ["vendor", "material", "other"]},
+)
+
+
+def test_filters_translate_to_mongo_operators():
+    query = build_filter(SPEC, {
+        "expense_type": "vendor,material",
+        "amount_min": "100",
+        "amount_max": "250.5",
+        "date_from": "2024-01-01T01:00:00+01:00",
+        "date_to": "2024-01-31",
+        "completed": "false",
+    }, base={"project_id": "p1"})
+    assert query == {
+        "project_id": "p1",
+        "expense_type": {"$in": ["vendor", "material"]},
+        "amount": {"$gte": 100.0, "$lte": 250.5},
+        "date": {"$gte": "2024-01-01T00:00:00+00:00", "$lt": "2024-02-01T00:00:00+00:00"},
+        "completed": False,
+    }
+
+
+@pytest.mark.parametrize("params", [
+    {"expense_type": "travel"},
+    {"amount_min": "lots"},
+    {"date_to": "yesterday"},
+    {"completed": "maybe"},
+])
+def test_invalid_filters_are_rejected(params):
+    with pytest.raises(ValueError):
+        build_filter(SPEC, params, base={"project_id": "p1"})
+
+
+def test_unknown_params_are_ignored_and_never_override_the_base():
+    query = build_filter(SPEC, {"project_id": "p2", "_": "1712345678", "amount_min": "5"}, base={"project_id": "p1"})
+    assert query == {"project_id": "p1", "amount": {"$gte": 5.0}}
+
+
+def test_sort_and_projection():
+    assert parse_sort(SPEC, "-date, amount,-date") == [("date", -1), ("amount", 1), ("id", 1)]
+    assert parse_sort(SPEC, None) == []
+    with pytest.raises(ValueError):
+        parse_sort(SPEC, "password")
+
+    assert parse_fields(SPEC, "amount,date") == {"_id": 0, "id": 1, "amount": 1, "date": 1}
+    assert parse_fields(SPEC, "") is None
+    with pytest.raises(ValueError):
+        parse_fields(SPEC, "amount,secret")
+
+
+def test_list_query_is_pushed_into_the_cursor():
+    calls = []
+
+    class FakeCursor:
+        def __getattr__(self, name):
+            def record(*args):
+                calls.append((name, args))
+                return self
+            return record
+
+    class FakeCollection:
+        def find(self, query, projection):
+            calls.append(("find", (query, projection)))
+            return FakeCursor()
+
+    list_query = ListQuery.parse(SPEC, {"sort": "-amount", "fields": "amount", "limit": "50", "skip": "100"})
+    list_query.cursor(FakeCollection())
+    assert calls == [
+        ("find", ({}, {"_id": 0, "id": 1, "amount": 1})),
+        ("sort", ([("amount", -1), ("id", 1)],)),
+        ("skip", (100,)),
+        ("limit", (50,)),
+    ]
+    with pytest.raises(ValueError):
+        ListQuery.parse(SPEC, {"limit": "5000"})
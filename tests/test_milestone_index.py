@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from milestone_index import DeadlineIndex, parse_within
+
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def milestone(milestone_id, project_id, due):
+    return {"id": milestone_id, "title": milestone_id.upper(), "project_id": project_id, "due_date": due.isoformat()}
+
+
+def build_index():
+    index = DeadlineIndex()
+    index.rebuild(
+        [
+            milestone("m1", "p1", NOW - timedelta(days=10)),
+            milestone("m2", "p2", NOW - timedelta(days=1)),
+            milestone("m3", "p1", NOW + timedelta(days=2)),
+            milestone("m4", "p2", NOW + timedelta(days=20)),
+        ],
+        {"p1": "alice", "p2": "bob"},
+    )
+    return index
+
+
+def test_parse_within():
+    assert parse_within("7d") == timedelta(days=7)
+    assert parse_within("12h") == timedelta(hours=12)
+    assert parse_within("2w") == timedelta(weeks=2)
+    assert parse_within("3") == timedelta(days=3)
+    with pytest.raises(ValueError):
+        parse_within("soon")
+
+
+def test_overdue_is_sorted_and_scoped():
+    index = build_index()
+    assert [m["id"] for m in index.overdue(NOW)] == ["m1", "m2"]
+    assert [m["id"] for m in index.overdue(NOW, project_id="p2")] == ["m2"]
+    assert [m["id"] for m in index.overdue(NOW, manager_id="alice")] == ["m1"]
+    assert index.count_overdue(NOW) == 2
+    assert [m["id"] for m in index.overdue(NOW, limit=1)] == ["m1"]
+
+
+def test_upcoming_window():
+    index = build_index()
+    assert [m["id"] for m in index.upcoming(NOW, timedelta(days=7))] == ["m3"]
+    assert [m["id"] for m in index.upcoming(NOW, timedelta(days=30), manager_id="bob")] == ["m4"]
+    assert index.upcoming(NOW, timedelta(days=7))[0]["days_until_due"] == 2.0
+
+
+def test_writes_update_the_index():
+    index = build_index()
+    index.remove("m1")
+    index.set_manager("p3", "carol")
+    index.add(milestone("m5", "p3", NOW - timedelta(days=3)))
+
+    assert [m["id"] for m in index.overdue(NOW)] == ["m5", "m2"]
+    assert index.overdue(NOW, manager_id="carol")[0]["manager_id"] == "carol"
+
+
+def test_writes_during_rebuild_are_replayed():
+    index = build_index()
+    index.begin_rebuild()
+    index.add(milestone("m6", "p1", NOW - timedelta(days=30)))
+    index.remove("m2")
+    # The scan started before both writes, so it still has m2 and not m6
+    index.rebuild([milestone("m2", "p2", NOW - timedelta(days=1))], {"p1": "alice", "p2": "bob"})
+
+    assert [m["id"] for m in index.overdue(NOW)] == ["m6"]
+
+
+def test_concurrent_refreshes_keep_writes_made_during_them(monkeypatch):
+    import server
+
+    stored = []
+
+    class Collection:
+        def __init__(self, docs):
+            self.docs = docs
+
+        def find(self, *args, **kwargs):
+            snapshot = list(self.docs)
+
+            async def to_list(length):
+                await asyncio.sleep(0.01)
+                return snapshot
+            return SimpleNamespace(to_list=to_list)
+
+    index = DeadlineIndex()
+    monkeypatch.setattr(server, "db", SimpleNamespace(milestones=Collection(stored), projects=Collection([])))
+    monkeypatch.setattr(server, "deadline_index", index)
+    monkeypatch.setattr(server, "deadline_rebuild_lock", asyncio.Lock())
+
+    async def run():
+        refreshes = [asyncio.create_task(server.refresh_deadline_index()) for _ in range(2)]
+        await asyncio.sleep(0)
+        # Written after the first scan started; neither refresh may lose it
+        created = milestone("m9", "p1", NOW)
+        stored.append(created)
+        index.add(created)
+        await asyncio.gather(*refreshes)
+
+    asyncio.run(run())
+    assert [row["id"] for row in index.overdue(NOW + timedelta(days=1))] == ["m9"]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from previews import TEXT_SNIPPET_BYTES, PreviewPool, generate_preview, preview_kind, preview_path
+
+
+def test_preview_kind_by_extension():
+    assert preview_kind("site.JPG") == "image"
+    assert preview_kind("plan.pdf") == "pdf"
+    assert preview_kind("notes.md") == "text"
+    assert preview_kind("model.dwg") is None
+    assert preview_kind("no_extension") is None
+
+
+def test_image_thumbnail_is_bounded_jpeg(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "photo.png"
+    Image.new("RGBA", (2000, 1000), (255, 0, 0, 128)).save(source)
+
+    preview = generate_preview(str(source), "image")
+    assert preview["path"] == str(preview_path(source, "image"))
+    assert preview["media_type"] == "image/jpeg"
+    with Image.open(preview["path"]) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert thumbnail.size == (320, 160)
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".part")] == []
+
+
+def test_pdf_first_page_render(tmp_path):
+    pdfium = pytest.importorskip("pypdfium2")
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "drawing.pdf"
+    pdf = pdfium.PdfDocument.new()
+    pdf.new_page(612, 792)
+    pdf.new_page(612, 792)
+    pdf.save(str(source))
+    pdf.close()
+
+    preview = generate_preview(str(source), "pdf")
+    with Image.open(preview["path"]) as thumbnail:
+        assert max(thumbnail.size) <= 320
+        assert thumbnail.size[1] > thumbnail.size[0]
+
+
+def test_text_snippet_cuts_at_a_line_break(tmp_path):
+    source = tmp_path / "log.txt"
+    line = "x" * 99 + "\n"
+    source.write_text(line * 100)
+    preview = generate_preview(str(source), "text")
+    snippet = open(preview["path"], encoding="utf-8").read()
+    assert len(snippet) <= TEXT_SNIPPET_BYTES
+    assert snippet.endswith("\n") and snippet == line * (len(snippet) // 100)
+
+
+def test_pool_renders_in_another_process(tmp_path):
+    source = tmp_path / "readme.txt"
+    source.write_text("hello\n")
+    pool = PreviewPool(1)
+
+    async def run():
+        try:
+            return await pool.generate(str(source), "text")
+        finally:
+            pool.shutdown()
+
+    preview = asyncio.run(run())
+    assert open(preview["path"], encoding="utf-8").read() == "hello\n"
@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+from datetime import datetime, timezone
+
+import brotli
+import msgpack
+import orjson
+import zstandard
+
+from responses import (
+    APIResponse,
+    BrotliEncoder,
+    CompressionMiddleware,
+    ContentNegotiationMiddleware,
+    GzipEncoder,
+    ZstdEncoder,
+    choose_encoder,
+    wants_msgpack,
+)
+
+
+ROWS = [{"id": f"e{i}", "amount": i * 1.5, "date": "2024-03-01T00:00:00+00:00"} for i in range(200)]
+
+
+def call(app, headers):
+    """Run an ASGI app for one GET request and return (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, body
+
+
+def api_app(content):
+    async def app(scope, receive, send):
+        await APIResponse(content)(scope, receive, send)
+    return ContentNegotiationMiddleware(CompressionMiddleware(app, minimum_size=1024))
+
+
+def test_encoding_negotiation():
+    encoders = [ZstdEncoder, BrotliEncoder, GzipEncoder]
+    assert choose_encoder("gzip, deflate, br, zstd", encoders) is ZstdEncoder
+    assert choose_encoder("gzip;q=1, br;q=0.5", encoders) is GzipEncoder
+    assert choose_encoder("identity", encoders) is None
+    assert choose_encoder("*", encoders) is ZstdEncoder
+    assert choose_encoder("br;q=0, *;q=0.1", [BrotliEncoder, GzipEncoder]) is GzipEncoder
+
+    assert wants_msgpack("application/msgpack")
+    assert not wants_msgpack("application/json, application/msgpack;q=0.5")
+    assert not wants_msgpack("*/*")
+
+
+def test_json_responses_are_compressed_past_the_threshold():
+    decoders = {"gzip": gzip.decompress, "br": brotli.decompress, "zstd": zstandard.ZstdDecompressor().decompressobj().decompress}
+    for coding, decode in decoders.items():
+        status, headers, body = call(api_app(ROWS), {"accept-encoding": coding})
+        assert status == 200
+        assert headers["content-encoding"] == coding
+        assert headers["content-length"] == str(len(body))
+        assert "Accept-Encoding" in headers["vary"]
+        assert orjson.loads(decode(body)) == ROWS
+
+    _, headers, body = call(api_app({"ok": True}), {"accept-encoding": "gzip"})
+    assert "content-encoding" not in headers
+    assert orjson.loads(body) == {"ok": True}
+
+
+def test_msgpack_is_negotiated_from_accept():
+    content = {"rows": ROWS[:3], "at": datetime(2024, 3, 1, tzinfo=timezone.utc)}
+    _, headers, body = call(api_app(content), {"accept": "application/msgpack"})
+    assert headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(body) == {"rows": ROWS[:3], "at": "2024-03-01T00:00:00+00:00"}
+
+
+def test_streamed_bodies_are_compressed_per_chunk():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/csv")]})
+        for i in range(3):
+            await send({"type": "http.response.body", "body": f"row {i}\n".encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    _, headers, body = call(CompressionMiddleware(app), {"accept-encoding": "gzip"})
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert gzip.decompress(body) == b"row 0\nrow 1\nrow 2\n"
+
+    async def parquet(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/vnd.apache.parquet")]})
+        await send({"type": "http.response.body", "body": b"PAR1" * 1000, "more_body": False})
+
+    _, headers, body = call(CompressionMiddleware(parquet), {"accept-encoding": "gzip"})
+    assert "content-encoding" not in headers and body == b"PAR1" * 1000
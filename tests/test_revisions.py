@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from revisions import RevisionConflict, bump, etag, parse_if_match, update_revision
+
+from tests.conftest import FakeCollection as BaseCollection
+
+
+class FakeCollection(BaseCollection):
+    reads = 0
+
+    async def find_one(self, query=None, projection=None, session=None, **kwargs):
+        self.reads += 1
+        return await super().find_one(query, projection, session, **kwargs)
+
+
+def test_if_match_parsing():
+    assert parse_if_match(None) is None
+    assert parse_if_match("*") is None
+    assert parse_if_match('"3"') == 3
+    assert parse_if_match('W/"4"') == 4
+    assert parse_if_match(etag(7)) == 7
+    for bad in ('"abc"', '"0"', '"1", "2"'):
+        with pytest.raises(ValueError):
+            parse_if_match(bad)
+
+
+def test_bump_merges_into_existing_increments():
+    assert bump({"$set": {"a": 1}}) == {"$set": {"a": 1}, "$inc": {"rev": 1}}
+    assert bump({"$inc": {"n": 2}}, "expense.rev") == {"$inc": {"n": 2, "expense.rev": 1}}
+
+
+def test_conditional_update_bumps_revision_without_a_pre_read():
+    collection = FakeCollection([{"id": "p1", "name": "A", "rev": 2}])
+    doc = asyncio.run(update_revision(collection, {"id": "p1"}, {"$set": {"name": "B"}}, expected=2))
+    assert doc["rev"] == 3 and doc["name"] == "B"
+    assert collection.reads == 0
+    doc = asyncio.run(update_revision(collection, {"id": "p1"}, {"$set": {"name": "C"}}))
+    assert doc["rev"] == 4
+
+
+def test_stale_revision_conflicts_and_missing_document_is_not_found():
+    collection = FakeCollection([{"id": "p1", "name": "A", "rev": 5}])
+    with pytest.raises(RevisionConflict) as conflict:
+        asyncio.run(update_revision(collection, {"id": "p1"}, {"$set": {"name": "B"}}, expected=4))
+    assert conflict.value.current == 5
+    assert collection.docs[0]["name"] == "A"
+    with pytest.raises(LookupError):
+        asyncio.run(update_revision(collection, {"id": "p2"}, {"$set": {"name": "B"}}, expected=1))
+    with pytest.raises(LookupError):
+        asyncio.run(update_revision(collection, {"id": "p2"}, {"$set": {"name": "B"}}))
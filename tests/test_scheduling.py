@@ -0,0 +1,107 @@
+from datetime import date
+
+import pytest
+
+from scheduling import CycleError, ProjectSchedule, ScheduleCache, find_cycle, topological_order
+
+
+TODAY = date(2026, 3, 1)
+START = "2026-03-01T00:00:00+00:00"
+
+
+def milestone(milestone_id, due, depends_on=(), completed_date=None, duration_days=None):
+    return {
+        "id": milestone_id, "title": milestone_id.title(), "due_date": f"2026-{due}T00:00:00+00:00",
+        "depends_on": list(depends_on), "completed": completed_date is not None,
+        "completed_date": completed_date and f"2026-{completed_date}T00:00:00+00:00", "duration_days": duration_days,
+    }
+
+
+def rows(result):
+    return {row["id"]: row for row in result["milestones"]}
+
+
+def test_topological_order_and_cycles():
+    assert topological_order([[], [0], [0], [1, 2]]) == [0, 1, 2, 3]
+    with pytest.raises(CycleError) as e:
+        topological_order([[], [2], [1]])
+    assert e.value.milestone_ids == [1, 2]
+    assert find_cycle([{"id": "a", "depends_on": ["b"]}, {"id": "b", "depends_on": ["a"]}]) == ["a", "b"]
+    assert find_cycle([{"id": "a", "depends_on": ["gone"]}, {"id": "b", "depends_on": ["a"]}]) is None
+
+
+def test_critical_path_and_slack():
+    schedule = ProjectSchedule([
+        milestone("design", "03-11"),
+        milestone("permits", "03-06"),
+        milestone("build", "03-31", ["design", "permits"]),
+        milestone("signage", "03-15", ["permits"]),
+    ], START)
+    result = schedule.result(TODAY)
+    by_id = rows(result)
+
+    assert result["critical_path"] == ["design", "build"]
+    assert result["projected_completion"] == "2026-03-31T00:00:00+00:00"
+    assert by_id["design"]["slack_days"] == 0 and by_id["build"]["critical"]
+    # Permits take 5 days of design's 10; signage finishes on the 15th of a project that ends on the 31st
+    assert by_id["permits"]["slack_days"] == 5
+    assert by_id["signage"]["slack_days"] == 16
+    assert by_id["signage"]["projected_date"] == "2026-03-15T00:00:00+00:00"
+    assert by_id["build"]["late_days"] == 0
+
+
+def test_open_work_cannot_start_before_today():
+    schedule = ProjectSchedule([
+        milestone("survey", "02-10"),
+        milestone("report", "02-20", ["survey"], duration_days=3),
+    ], "2026-02-01T00:00:00+00:00")
+    by_id = rows(schedule.result(TODAY))
+    assert by_id["survey"]["projected_date"] == "2026-03-10T00:00:00+00:00"
+    assert by_id["report"]["projected_date"] == "2026-03-13T00:00:00+00:00"
+    assert by_id["report"]["late_days"] == 21
+
+
+def test_completion_reschedules_descendants_incrementally():
+    schedule = ProjectSchedule([
+        milestone("design", "03-11"),
+        milestone("build", "03-31", ["design"]),
+        milestone("handover", "04-05", ["build"]),
+        milestone("marketing", "03-20"),
+    ], START)
+    schedule.result(TODAY)
+
+    assert schedule.complete("design", "2026-03-04T00:00:00+00:00")
+    result = schedule.result(TODAY)
+    by_id = rows(result)
+    assert by_id["design"]["completed"] and by_id["design"]["slack_days"] is None
+    assert by_id["build"]["projected_date"] == "2026-03-24T00:00:00+00:00"
+    assert result["projected_completion"] == "2026-03-29T00:00:00+00:00"
+    assert result["critical_path"] == ["build", "handover"]
+
+    # Matches a schedule built from scratch with the same state
+    rebuilt = ProjectSchedule([
+        milestone("design", "03-11", completed_date="03-04"),
+        milestone("build", "03-31", ["design"]),
+        milestone("handover", "04-05", ["build"]),
+        milestone("marketing", "03-20"),
+    ], START)
+    assert rebuilt.result(TODAY) == result
+    assert not schedule.complete("unknown", "2026-03-04T00:00:00+00:00")
+
+
+def test_cache_applies_completions_and_drops_stale_loads():
+    cache = ScheduleCache()
+    version = cache.version("p1")
+    schedule = ProjectSchedule([milestone("a", "03-05"), milestone("b", "03-09", ["a"])], START)
+    cache.put("p1", schedule, version)
+    cache.complete("p1", "a", "2026-03-02T00:00:00+00:00")
+    assert cache.get("p1") is schedule and schedule.completed_at[0] is not None
+
+    # A load that started before a write is not cached
+    stale = cache.version("p1")
+    cache.invalidate("p1")
+    cache.put("p1", schedule, stale)
+    assert cache.get("p1") is None
+    cache.put("p1", schedule, cache.version("p1"))
+    cache.clear()
+    assert cache.get("p1") is None
@@ -0,0 +1,87 @@
+from search_index import MAX_PREFIX_EXPANSIONS, SearchIndex, tokenize
+
+
+def build_index():
+    return SearchIndex.from_entities([
+        ("project", {"id": "p1", "name": "Harbor Bridge Renovation", "description": "Steel deck replacement"}),
+        ("project", {"id": "p2", "name": "Office Fitout", "description": "Interior works for the harbor office"}),
+        ("resource", {"id": "r1", "project_id": "p1", "name": "Acme Steel", "description": "Structural steel vendor"}),
+        ("expense", {"id": "e1", "project_id": "p1", "resource_id": "r1", "description": "Vendor: Acme Steel"}),
+        ("expense", {"id": "e2", "project_id": "p2", "description": "Carpet tiles"}),
+        ("document", {"id": "d1", "project_id": "p1", "name": "steel-spec.pdf"}),
+    ])
+
+
+def result_ids(result):
+    return [(r["type"], r["id"]) for r in result["results"]]
+
+
+def test_tokenize():
+    assert tokenize("Vendor: Acme-Steel v2") == ["vendor", "acme", "steel", "v2"]
+    assert tokenize(None) == []
+
+
+def test_ranking_prefers_boosted_fields():
+    result = build_index().search("harbor")
+    assert result_ids(result) == [("project", "p1"), ("project", "p2")]
+
+
+def test_all_terms_must_match_and_last_term_is_a_prefix():
+    index = build_index()
+    assert result_ids(index.search("acme ste")) == [("resource", "r1"), ("expense", "e1")]
+    assert index.search("acme carpet")["total"] == 0
+
+
+def test_capped_prefix_expansion_reports_a_lower_bound():
+    index = SearchIndex.from_entities(
+        ("expense", {"id": f"e{i}", "project_id": "p1", "description": f"part{i:03d}"})
+        for i in range(MAX_PREFIX_EXPANSIONS + 1)
+    )
+    assert index.search("part")["total_relation"] == "gte"
+    assert index.search("part", project_id="p1")["total_relation"] == "gte"
+    assert index.search("part00")["total_relation"] == "eq"
+
+
+def test_project_and_type_scoping():
+    index = build_index()
+    assert {r["project_id"] for r in index.search("steel", project_id="p1")["results"]} == {"p1"}
+    assert result_ids(index.search("steel", kinds={"document"})) == [("document", "d1")]
+
+
+def test_incremental_writes():
+    index = build_index()
+    index.upsert("expense", {"id": "e2", "project_id": "p2", "description": "Granite flooring"})
+    assert index.search("carpet")["total"] == 0
+    assert result_ids(index.search("gran")) == [("expense", "e2")]
+
+    index.remove_resource_expenses("r1")
+    index.remove("resource", "r1")
+    assert result_ids(index.search("acme")) == []
+
+
+def test_writes_during_rebuild_are_replayed():
+    index = build_index()
+    index.begin_rebuild()
+    index.upsert("document", {"id": "d2", "project_id": "p2", "name": "floorplan.dwg"})
+    index.adopt(SearchIndex.from_entities([]))
+
+    assert len(index) == 1
+    assert result_ids(index.search("floorplan")) == [("document", "d2")]
+
+
+def test_tier_walk_matches_exhaustive_scoring():
+    words = ["alpha", "beta", "gamma", "delta"]
+    entities = [
+        ("expense", {"id": f"e{i}", "project_id": f"p{i % 3}", "description": " ".join(words[j] for j in range(4) if (i >> j) & 1)})
+        for i in range(1, 64)
+    ] + [("resource", {"id": f"r{i}", "project_id": "p0", "name": words[i % 4], "description": words[(i + 1) % 4]}) for i in range(8)]
+    index = SearchIndex.from_entities(entities)
+
+    for query in ["alpha", "alpha beta", "gamma d", "beta al"]:
+        groups = [index._expand(term, prefix=(i == len(query.split()) - 1)) for i, term in enumerate(query.split())]
+        allowed, total, _ = index._candidates(groups, [])
+        exhaustive = index._score_all(groups, allowed if allowed is not None else set(groups[0][0][1]))
+        best = sorted(exhaustive.values(), reverse=True)[:5]
+        result = index.search(query, limit=5)
+        assert result["total"] == total == len(exhaustive)
+        assert [r["score"] for r in result["results"]] == [round(s, 4) for s in best]
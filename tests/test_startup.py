@@ -0,0 +1,72 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+# Measured around 0.6 s to import and under 5 ms to start; the budgets leave headroom for slower machines
+IMPORT_BUDGET_SECONDS = 1.5
+STARTUP_BUDGET_SECONDS = 0.25
+
+# Optional heavy dependencies that only specific endpoints need
+LAZY_MODULES = ["pandas", "pyarrow", "openpyxl"]
+
+
+def test_server_import_is_lazy_and_within_budget():
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import server\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+    )
+    env = {**os.environ, "MONGO_URL": "mongodb://127.0.0.1:1", "DB_NAME": "test_database"}
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+
+    assert output[1] == "", f"imported eagerly: {output[1]}"
+    assert float(output[0]) < IMPORT_BUDGET_SECONDS
+
+
+def test_startup_does_not_wait_for_the_database(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "mongo_url", "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100")
+    # Startup connects a client that shutdown closes; put back whatever other tests see
+    monkeypatch.setattr(server, "client", server.client)
+    monkeypatch.setattr(server, "db", server.db)
+
+    async def run():
+        start = time.perf_counter()
+        async with server.lifespan(server.app):
+            elapsed = time.perf_counter() - start
+            assert await server.healthz() == {"status": "ok"}
+            response = await server.readyz()
+            assert response.status_code == 503
+        return elapsed
+
+    assert asyncio.run(run()) < STARTUP_BUDGET_SECONDS
+
+
+def test_search_index_build_is_retried_until_it_succeeds(monkeypatch):
+    import server
+
+    outcomes = [False, False, True]
+    sleeps = []
+
+    async def refresh():
+        return outcomes.pop(0)
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(server, "refresh_search_index", refresh)
+    monkeypatch.setattr(server.asyncio, "sleep", sleep)
+    asyncio.run(server.build_search_index())
+    assert outcomes == []
+    assert sleeps == [server.SEARCH_INDEX_RETRY_SECONDS, server.SEARCH_INDEX_RETRY_SECONDS * 2]
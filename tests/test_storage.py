@@ -0,0 +1,105 @@
+import asyncio
+import io
+from pathlib import Path
+
+import pytest
+
+from storage import MULTIPART_CHUNK_BYTES, LocalStorage, S3Storage, create_storage
+
+
+def test_local_save_serve_and_key_guard(tmp_path):
+    storage = LocalStorage(tmp_path)
+    size = asyncio.run(storage.save(io.BytesIO(b"hello"), "p1/a.txt"))
+    assert size == 5
+    assert (tmp_path / "p1" / "a.txt").read_bytes() == b"hello"
+    assert not (tmp_path / "p1" / "a.txt.part").exists()
+    assert asyncio.run(storage.exists("p1/a.txt"))
+
+    response = asyncio.run(storage.serve("p1/a.txt", filename="a.txt"))
+    assert response.status_code == 200
+    assert Path(response.path) == tmp_path / "p1" / "a.txt"
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(storage.serve("p1/missing.txt"))
+    with pytest.raises(ValueError):
+        storage.path("../outside.txt")
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.configs = []
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        self.configs.append(Config)
+        data = b""
+        while True:
+            chunk = fileobj.read(1024)
+            if not chunk:
+                break
+            data += chunk
+        self.objects[key] = data
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None, Config=None):
+        self.objects[key] = Path(path).read_bytes()
+
+    def download_file(self, bucket, key, path, Config=None):
+        Path(path).write_bytes(self.objects[key])
+
+    def generate_presigned_url(self, operation, Params=None, ExpiresIn=None):
+        self.presigned = Params
+        return f"https://s3.example/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}&cd={Params.get('ResponseContentDisposition', '')}"
+
+
+def test_s3_streams_uploads_with_parallel_multipart_transfer():
+    client = FakeS3Client()
+    storage = S3Storage("docs", client=client)
+    size = asyncio.run(storage.save(io.BytesIO(b"x" * 5000), "p1/b.pdf", "application/pdf"))
+    assert size == 5000
+    assert client.objects["p1/b.pdf"] == b"x" * 5000
+    config = client.configs[0]
+    assert config.multipart_chunksize == MULTIPART_CHUNK_BYTES
+    assert config.max_concurrency > 1
+    assert storage.locator("p1/b.pdf") == "s3://docs/p1/b.pdf"
+
+
+def test_s3_downloads_redirect_to_presigned_urls():
+    storage = S3Storage("docs", client=FakeS3Client(), presign_seconds=120)
+    response = asyncio.run(storage.serve("p1/b.pdf", filename="plan v2.pdf"))
+    assert response.status_code == 307
+    location = response.headers["location"]
+    assert location.startswith("https://s3.example/docs/p1/b.pdf?expires=120")
+    assert "plan%20v2.pdf" in location
+    assert response.headers["cache-control"] == "private, max-age=60"
+
+
+def test_s3_download_headers_go_on_the_bucket_response():
+    client = FakeS3Client()
+    storage = S3Storage("docs", client=client, presign_seconds=120)
+    response = asyncio.run(storage.serve("p1/b.pdf.preview.png", media_type="image/png",
+                                         headers={"Cache-Control": "private, max-age=86400, immutable"}))
+    assert client.presigned["ResponseCacheControl"] == "private, max-age=86400, immutable"
+    assert client.presigned["ResponseContentType"] == "image/png"
+    assert response.headers["cache-control"] == "private, max-age=60"
+
+
+def test_s3_local_copy_round_trip():
+    client = FakeS3Client()
+    client.objects["p1/c.txt"] = b"notes"
+    storage = S3Storage("docs", client=client)
+
+    async def run():
+        async with storage.local_copy("p1/c.txt") as path:
+            assert path.read_bytes() == b"notes"
+            preview = path.with_name("c.txt.preview.txt")
+            preview.write_text("no")
+            await storage.put_file(str(preview), "p1/c.txt.preview.txt")
+        return path
+
+    path = asyncio.run(run())
+    assert not path.exists()
+    assert client.objects["p1/c.txt.preview.txt"] == b"no"
+
+
+def test_unknown_backend_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_storage("ftp", tmp_path)
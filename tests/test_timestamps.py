@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from timestamps import backfill_utc, range_bound, utc_iso
+
+from tests.conftest import FakeDatabase
+
+
+def test_stored_form_is_utc():
+    assert utc_iso(datetime(2024, 3, 1, 8, tzinfo=timezone(timedelta(hours=5)))) == "2024-03-01T03:00:00+00:00"
+    assert utc_iso(datetime(2024, 3, 1)) == "2024-03-01T00:00:00+00:00"
+
+
+def test_range_bounds():
+    assert range_bound("2024-03-01", upper=False) == ("$gte", "2024-03-01T00:00:00+00:00")
+    assert range_bound("2024-03-01", upper=True) == ("$lt", "2024-03-02T00:00:00+00:00")
+    assert range_bound("2024-03-01T23:00:00-02:00", upper=True) == ("$lte", "2024-03-02T01:00:00+00:00")
+
+
+def test_backfill_rewrites_offsets_in_utc():
+    db = FakeDatabase()
+    db.expenses.docs.extend([
+        {"id": "e1", "date": "2024-03-01T23:30:00-05:00", "rev": 1},
+        {"id": "e2", "date": "2024-03-01T10:00:00+00:00", "rev": 1},
+        {"id": "e3", "date": "2024-03-01T10:00:00", "rev": 1},
+    ])
+    db.resources.docs.append({"id": "r1", "created_at": "2024-03-01T00:00:00Z", "expense": {"date": "2024-03-01T09:00:00+09:00", "rev": 1}, "rev": 1})
+
+    assert asyncio.run(backfill_utc(db)) == 4
+    assert [doc["date"] for doc in db.expenses.docs] == [
+        "2024-03-02T04:30:00+00:00", "2024-03-01T10:00:00+00:00", "2024-03-01T10:00:00+00:00",
+    ]
+    assert [doc["rev"] for doc in db.expenses.docs] == [2, 1, 2]
+    resource = db.resources.docs[0]
+    assert (resource["created_at"], resource["rev"]) == ("2024-03-01T00:00:00+00:00", 2)
+    assert (resource["expense"]["date"], resource["expense"]["rev"]) == ("2024-03-01T00:00:00+00:00", 2)
+    assert asyncio.run(backfill_utc(db)) == 0
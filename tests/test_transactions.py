@@ -0,0 +1,268 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError, OperationFailure
+
+import transactions
+from expense_store import EMBEDDED_FIELD, ExpenseStore
+from transactions import TransactionRunner
+
+
+class FakeSession:
+    def __init__(self, commit_errors=()):
+        self.in_transaction = False
+        self.commit_errors = list(commit_errors)
+        self.started = self.committed = self.aborted = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def start_transaction(self, **kwargs):
+        self.in_transaction = True
+        self.started += 1
+
+    async def commit_transaction(self):
+        if self.commit_errors:
+            raise self.commit_errors.pop(0)
+        self.in_transaction = False
+        self.committed += 1
+
+    async def abort_transaction(self):
+        self.in_transaction = False
+        self.aborted += 1
+
+
+class FakeAdmin:
+    def __init__(self, hello):
+        self.hello = hello
+
+    async def command(self, name):
+        return self.hello
+
+
+class FakeClient:
+    def __init__(self, session=None, hello=None):
+        self.session = session or FakeSession()
+        self.admin = FakeAdmin(hello or {"setName": "rs0"})
+
+    async def start_session(self):
+        return self.session
+
+
+def labelled(label):
+    error = OperationFailure("write conflict", code=112)
+    error._add_error_label(label)
+    return error
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(transactions, "RETRY_BACKOFF_SECONDS", 0)
+
+
+def test_transient_errors_rerun_the_work():
+    client = FakeClient()
+    runner = TransactionRunner(lambda: client)
+    calls = []
+
+    async def work(session):
+        calls.append(session)
+        if len(calls) < 3:
+            raise labelled("TransientTransactionError")
+        return "done"
+
+    assert asyncio.run(runner.run(work)) == "done"
+    assert calls == [client.session] * 3
+    assert client.session.aborted == 2
+    assert client.session.committed == 1
+    assert runner.retries == 2
+
+
+def test_unknown_commit_result_retries_only_the_commit():
+    session = FakeSession(commit_errors=[labelled("UnknownTransactionCommitResult")])
+    runner = TransactionRunner(lambda: FakeClient(session))
+    calls = []
+
+    async def work(session):
+        calls.append(session)
+
+    asyncio.run(runner.run(work))
+    assert len(calls) == 1
+    assert session.committed == 1
+
+
+def test_other_errors_abort_and_propagate():
+    client = FakeClient()
+    runner = TransactionRunner(lambda: client)
+
+    async def work(session):
+        raise ValueError("not found")
+
+    with pytest.raises(ValueError):
+        asyncio.run(runner.run(work))
+    assert client.session.started == 1
+    assert client.session.aborted == 1
+
+
+def test_standalone_server_runs_without_a_session():
+    runner = TransactionRunner(lambda: FakeClient(hello={"ismaster": True}))
+    seen = []
+
+    async def work(session):
+        seen.append(session)
+
+    asyncio.run(runner.run(work))
+    assert seen == [None]
+    assert runner.supported is False
+
+
+def test_invalid_mode_is_rejected():
+    with pytest.raises(ValueError):
+        TransactionRunner(lambda: None, "sometimes")
+
+
+class RecordingCollection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def __getattr__(self, method):
+        async def call(*args, **kwargs):
+            self.calls.append((self.name, method, args, kwargs))
+            return type("Result", (), {"matched_count": 1, "deleted_count": 1})()
+        return call
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return RecordingCollection(name, self.calls)
+
+
+def test_embedded_mode_writes_resource_and_expense_as_one_document():
+    db = RecordingDatabase()
+    store = ExpenseStore(lambda: db, "embedded")
+    asyncio.run(store.insert_resource({"id": "r1"}, {"id": "e1", "resource_id": "r1"}, session="s"))
+    assert db.calls == [("resources", "insert_one", ({"id": "r1", EMBEDDED_FIELD: {"id": "e1", "resource_id": "r1"}},), {"session": "s"})]
+
+    db.calls.clear()
+    collection_store = ExpenseStore(lambda: db, "collection")
+    asyncio.run(collection_store.insert_resource({"id": "r1"}, {"id": "e1", "resource_id": "r1"}, session="s"))
+    assert [(name, method) for name, method, _, _ in db.calls] == [("resources", "insert_one"), ("expenses", "insert_one")]
+
+
+def test_embedded_expense_update_also_syncs_the_resource_in_one_write():
+    db = RecordingDatabase()
+    store = ExpenseStore(lambda: db, "embedded")
+    expense = {"id": "e1", "resource_id": "r1", "embedded": True}
+    asyncio.run(store.update_expense(expense, {"amount": 10.0}, {"cost_per_unit": 5.0}, expected=3))
+    assert db.calls == [(
+        "resources", "update_one",
+        (
+            {f"{EMBEDDED_FIELD}.id": "e1", f"{EMBEDDED_FIELD}.rev": 3},
+            {"$set": {f"{EMBEDDED_FIELD}.amount": 10.0, "cost_per_unit": 5.0}, "$inc": {f"{EMBEDDED_FIELD}.rev": 1, "rev": 1}},
+        ),
+        {"session": None},
+    )]
+
+
+def test_relinked_expense_syncs_the_new_resource():
+    db = RecordingDatabase()
+    store = ExpenseStore(lambda: db, "collection")
+    expense = {"id": "e1", "resource_id": None}
+    asyncio.run(store.update_expense(expense, {"resource_id": "r2"}, {"cost_per_unit": 5.0}, resource_id="r2"))
+    assert [(name, args[0]) for name, method, args, _ in db.calls] == [("expenses", {"id": "e1"}), ("resources", {"id": "r2"})]
+
+
+def test_pinning_a_currency_covers_both_storage_modes():
+    db = RecordingDatabase()
+    asyncio.run(ExpenseStore(lambda: db, "collection").pin_currency("p1", "EUR", session="s"))
+    assert [(name, args[0]) for name, method, args, _ in db.calls] == [
+        ("expenses", {"project_id": "p1", "currency": None}),
+        ("resources", {"project_id": "p1", EMBEDDED_FIELD: {"$type": "object"}, f"{EMBEDDED_FIELD}.currency": None}),
+    ]
+    assert db.calls[1][2][1] == {"$set": {f"{EMBEDDED_FIELD}.currency": "EUR"}, "$inc": {f"{EMBEDDED_FIELD}.rev": 1}}
+    assert all(kwargs == {"session": "s"} for _, _, _, kwargs in db.calls)
+
+
+class RejectingCollection(RecordingCollection):
+    """Unordered insert_many that refuses the documents at the given indexes"""
+
+    def __init__(self, name, calls, rejects):
+        super().__init__(name, calls)
+        self.rejects = rejects
+
+    async def insert_many(self, docs, ordered=True):
+        self.calls.append((self.name, "insert_many", ([doc["id"] for doc in docs],), {}))
+        raise BulkWriteError({"writeErrors": [{"index": i, "errmsg": message} for i, message in self.rejects.items()]})
+
+
+def test_bulk_resource_insert_reports_rows_it_could_not_write():
+    db = RecordingDatabase()
+    db.resources = RejectingCollection("resources", db.calls, {1: "duplicate key"})
+    db.expenses = RejectingCollection("expenses", db.calls, {1: "document too large"})
+    store = ExpenseStore(lambda: db, "collection")
+    resources = [{"id": "r1"}, {"id": "r2"}, {"id": "r3"}]
+    expenses = [{"id": f"e{i}", "resource_id": f"r{i}"} for i in (1, 2, 3)]
+    rejected = asyncio.run(store.insert_resources(resources, expenses))
+
+    # r2 never made it, so neither does its expense; r3's expense failed, so r3 is taken out again
+    assert rejected == {1: "duplicate key", 2: "document too large"}
+    assert db.calls == [
+        ("resources", "insert_many", (["r1", "r2", "r3"],), {}),
+        ("expenses", "insert_many", (["e1", "e3"],), {}),
+        ("resources", "delete_many", ({"id": {"$in": ["r3"]}},), {}),
+    ]
+
+
+class EmbeddingResources(RecordingCollection):
+    """Resources where r1 holds e1 and the listed resources already hold an expense of their own"""
+
+    def __init__(self, calls, occupied=()):
+        super().__init__("resources", calls)
+        self.occupied = set(occupied)
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.calls.append(("resources", "find_one_and_update", (query, update), {"session": kwargs["session"]}))
+        return {EMBEDDED_FIELD: {"id": "e1", "resource_id": "r1", "amount": 5.0, "rev": 2}}
+
+    async def update_one(self, query, update, session=None):
+        self.calls.append(("resources", "update_one", (query, update), {"session": session}))
+        matched = not (EMBEDDED_FIELD in query and query["id"] in self.occupied)
+        return type("Result", (), {"matched_count": int(matched)})()
+
+
+def test_relinked_embedded_expense_moves_to_the_new_resource():
+    db = RecordingDatabase()
+    db.resources = EmbeddingResources(db.calls)
+    store = ExpenseStore(lambda: db, "embedded")
+    expense = {"id": "e1", "resource_id": "r1", "embedded": True}
+    assert asyncio.run(store.update_expense(expense, {"resource_id": "r2"}, {"cost_per_unit": 5.0}, 2, "s", "r2"))
+
+    taken, placed = db.calls
+    assert taken[2][0] == {f"{EMBEDDED_FIELD}.id": "e1", f"{EMBEDDED_FIELD}.rev": 2}
+    assert taken[2][1]["$unset"] == {EMBEDDED_FIELD: ""}
+    assert placed[2][0]["id"] == "r2"
+    assert placed[2][1]["$set"] == {
+        EMBEDDED_FIELD: {"id": "e1", "resource_id": "r2", "amount": 5.0, "rev": 3}, "cost_per_unit": 5.0,
+    }
+    assert all(kwargs == {"session": "s"} for _, _, _, kwargs in db.calls)
+
+
+def test_relinked_embedded_expense_becomes_a_row_when_the_new_resource_has_one():
+    db = RecordingDatabase()
+    db.resources = EmbeddingResources(db.calls, occupied={"r2"})
+    store = ExpenseStore(lambda: db, "embedded")
+    expense = {"id": "e1", "resource_id": "r1", "embedded": True}
+    assert asyncio.run(store.update_expense(expense, {"resource_id": "r2"}, {"cost_per_unit": 5.0}, resource_id="r2"))
+
+    assert [(name, method) for name, method, _, _ in db.calls] == [
+        ("resources", "find_one_and_update"), ("resources", "update_one"), ("resources", "update_one"), ("expenses", "insert_one"),
+    ]
+    assert db.calls[2][2][0] == {"id": "r2"}
+    assert db.calls[3][2][0] == {"id": "e1", "resource_id": "r2", "amount": 5.0, "rev": 3}
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import trash as trash_module
+from expense_store import ExpenseStore
+from trash import TRASH_COLLECTION, Trash
+
+from tests.conftest import FakeDatabase
+
+
+def seeded():
+    db = FakeDatabase()
+    asyncio.run(db.resources.insert_many([{"id": "r1", "project_id": "p1", "rev": 2}, {"id": "r2", "project_id": "p1", "rev": 1}]))
+    asyncio.run(db.expenses.insert_many([
+        {"id": "e1", "resource_id": "r1", "project_id": "p1", "rev": 1},
+        {"id": "e2", "resource_id": "r1", "project_id": "p1", "rev": 1},
+        {"id": "e3", "resource_id": None, "project_id": "p1", "rev": 1},
+    ]))
+    return db
+
+
+def test_cascade_goes_to_trash_and_undo_restores_it():
+    db = seeded()
+    store = ExpenseStore(lambda: db, trash=Trash(lambda: db))
+    assert asyncio.run(store.delete_resource("r1", "d1"))
+    assert [d["id"] for d in db.resources.docs] == ["r2"]
+    assert [d["id"] for d in db.expenses.docs] == ["e3"]
+    assert len(db[TRASH_COLLECTION].docs) == 3
+
+    restored = asyncio.run(store.trash.restore("d1"))
+    assert {c: sorted(d["id"] for d in docs) for c, docs in restored.items()} == {"resources": ["r1"], "expenses": ["e1", "e2"]}
+    assert sorted(d["id"] for d in db.expenses.docs) == ["e1", "e2", "e3"]
+    assert next(d for d in db.resources.docs if d["id"] == "r1")["rev"] == 3
+    assert db[TRASH_COLLECTION].docs == []
+    with pytest.raises(LookupError):
+        asyncio.run(store.trash.restore("d1"))
+
+
+def test_without_a_deletion_id_deletes_for_good():
+    db = seeded()
+    store = ExpenseStore(lambda: db, trash=Trash(lambda: db))
+    assert asyncio.run(store.delete_expense("e3"))
+    assert db[TRASH_COLLECTION].docs == []
+    assert not asyncio.run(store.delete_expense("missing", "d2"))
+
+
+def test_expired_deletions_cannot_be_undone_and_are_purged_in_batches(monkeypatch):
+    monkeypatch.setattr(trash_module, "PURGE_BATCH_SIZE", 2)
+    db = seeded()
+    trash = Trash(lambda: db, retention_seconds=60)
+    asyncio.run(trash.move("expenses", {"project_id": "p1"}, "d1"))
+    asyncio.run(trash.move("resources", {"id": "r2"}, "d2"))
+    later = datetime.now(timezone.utc) + timedelta(seconds=61)
+    with pytest.raises(LookupError):
+        asyncio.run(trash.restore("d1", now=later))
+
+    assert asyncio.run(trash.purge(now=datetime.now(timezone.utc))) == 0
+    assert asyncio.run(trash.purge(now=later)) == 4
+    assert db[TRASH_COLLECTION].docs == []